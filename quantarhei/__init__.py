@@ -99,6 +99,8 @@
         PDBFile ....... reader and writter of structures from PDB format
         Disorder ...... class managing static disorder of molecular transition
                         energies
+        DisorderEnsemble ... ensemble of realizations of a disordered 
+                             aggregate
          
         Core classes
         ------------
@@ -214,6 +216,7 @@ from .builders.aggregates import Aggregate
 from .builders.aggregate_test import TestAggregate
 from .builders.pdb import PDBFile
 from .builders.disorder import Disorder
+from .builders.disorder import DisorderEnsemble
 
 #
 # Core classes
@@ -320,6 +323,7 @@ from .qm import UnityOperator
 # Propagators
 #
 from .qm.propagators.poppropagator import PopulationPropagator
+from .qm.propagators.poppropagator import SecularPropagator
 from .qm.propagators.svpropagator import StateVectorPropagator
 from .qm import ReducedDensityMatrixPropagator
 
@@ -378,6 +382,8 @@ from .utils.timing import timeit
 from .utils.timing import untimeit
 from .utils.timing import finished_in
 from .utils.timing import done_in
+from .utils.timing import profiler
+from .utils.timing import profiled
 
 from .wizard.input.input import Input
 
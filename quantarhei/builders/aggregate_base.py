@@ -10,11 +10,15 @@ an interface to various methods of open quantum systems theory.
 """
 
 import numpy
+import scipy.sparse
 #import h5py
 
 from ..core.managers import UnitsManaged
 #from ..core.units import cm2int
 from .interactions import dipole_dipole_interaction
+from .interactions import dipole_dipole_coupling_matrix
+from .interactions import transition_charge_coupling_matrix
+from .interactions import extended_dipole_charges
 
 from ..qm.oscillators.ho import fcstorage
 from ..qm.oscillators.ho import operator_factory
@@ -39,7 +43,9 @@ from .aggregate_states import VibronicState
 #from ..core.managers import energy_units
 #from .molecules import Molecule
 from ..core.managers import Manager
+from ..core.basiscache import unitary_inverse
 from ..core.saveable import Saveable
+from ..utils.timing import profiled
 
 import quantarhei as qr
 
@@ -110,6 +116,7 @@ class AggregateBase(UnitsManaged, Saveable):
 
         self.vibindices = []
         self.which_band = None
+        self._vibtrace_map = None
         self.elsigs = None
 
         self.HH = None
@@ -238,21 +245,82 @@ class AggregateBase(UnitsManaged, Saveable):
         # TESTED
 
 
-    def set_coupling_by_dipole_dipole(self, epsr=1.0):
+    def set_coupling_by_dipole_dipole(self, epsr=1.0, cutoff=None):
         """Sets resonance coupling by dipole-dipole interaction
 
+        Couplings of all pairs of molecules are calculated at once. 
+        If `cutoff` is specified, only molecules closer than the cutoff 
+        distance are coupled.
+        
+        """
+        (pos, dip) = self._get_positions_and_dipoles()
+        JJ = dipole_dipole_coupling_matrix(pos, dip, epsr=epsr, 
+                                           cutoff=cutoff)
+        self._set_coupling_matrix(JJ)
+        #
+        # TESTED
+
+
+    def set_coupling_by_extended_dipole(self, length, epsr=1.0, cutoff=None):
+        """Sets resonance coupling by extended dipole interaction
+
+        Transition dipoles are represented by pairs of opposite charges
+        separated by the distance `length` along the dipole.
+        
+        """
+        (pos, dip) = self._get_positions_and_dipoles()
+        (rq, qq) = extended_dipole_charges(pos, dip, length)
+        JJ = transition_charge_coupling_matrix(rq, qq, centers=pos, 
+                                               epsr=epsr, cutoff=cutoff)
+        self._set_coupling_matrix(JJ)
+
+
+    def set_coupling_by_transition_charges(self, charge_positions, charges,
+                                           epsr=1.0, cutoff=None):
+        """Sets resonance coupling by interaction of transition charges
+        
+        Parameters
+        ----------
+        
+        charge_positions : array like
+            Positions of the charges, shape (Nmol, Nq, 3). Molecules with
+            less than Nq charges are padded by zero charges.
+            
+        charges : array like
+            Transition charges, shape (Nmol, Nq)
+        
         """
+        (pos, dip) = self._get_positions_and_dipoles()
+        JJ = transition_charge_coupling_matrix(charge_positions, charges,
+                                               centers=pos, epsr=epsr,
+                                               cutoff=cutoff)
+        self._set_coupling_matrix(JJ)
 
+        
+    def _get_positions_and_dipoles(self):
+        """Returns stacked positions and transition dipoles of the molecules
+        
+        """
+        #FIXME: this works only for first excited states of two-level molecules
+        pos = numpy.array([m.position for m in self.monomers])
+        dip = numpy.array([m.dmoments[0,1,:] for m in self.monomers])
+        return (pos, dip)
+    
+    
+    def _set_coupling_matrix(self, JJ):
+        """Sets off-diagonal elements of the coupling matrix 
+        
+        Coupling matrix in internal units is accepted either as 
+        numpy.ndarray or as a scipy sparse matrix
+        
+        """
         if not self.coupling_initiated:
             self.init_coupling_matrix()
-        for kk in range(self.nmono):
-            for ll in range(kk+1,self.nmono):
-                cc = self.dipole_dipole_coupling(kk,ll,epsr=epsr)
-                c1 = self.convert_energy_2_internal_u(cc)
-                self.resonance_coupling[kk,ll] = c1
-                self.resonance_coupling[ll,kk] = c1
-        #
-        # TESTED
+        if scipy.sparse.issparse(JJ):
+            JJ = JJ.toarray()
+        dg = numpy.diag(self.resonance_coupling).copy()
+        self.resonance_coupling = numpy.array(JJ, dtype=numpy.float64)
+        numpy.fill_diagonal(self.resonance_coupling, dg)
 
 
     def calculate_resonance_coupling(self, method="dipole-dipole",
@@ -269,7 +337,12 @@ class AggregateBase(UnitsManaged, Saveable):
 
         if method == "dipole-dipole":
             epsr = params["epsr"]
-            self.set_coupling_by_dipole_dipole(epsr=epsr)
+            self.set_coupling_by_dipole_dipole(epsr=epsr, 
+                                               cutoff=params.get("cutoff"))
+        elif method == "extended-dipole":
+            self.set_coupling_by_extended_dipole(params["length"],
+                                                 epsr=params.get("epsr", 1.0),
+                                                 cutoff=params.get("cutoff"))
         else:
             raise Exception("Unknown method for calculation"+
                             " of resonance coupling")
@@ -360,15 +433,17 @@ class AggregateBase(UnitsManaged, Saveable):
         """
         tol = 1.0e-3
         rmin = 1.0e20
-        r1 = molecule.position
         mmin = None
-        for m in self.monomers:
-            r2 = m.position
-            r = r1 - r2
-            dist = numpy.sqrt(numpy.dot(r,r))
-            if (dist > tol) and (dist < rmin):
-                mmin = m
-                rmin = dist
+        pos = numpy.array([m.position for m in self.monomers])
+        if pos.shape[0] == 0:
+            return mmin, rmin
+        
+        dist = numpy.sqrt(numpy.sum((pos - molecule.position)**2, axis=1))
+        dist[dist <= tol] = rmin
+        imin = numpy.argmin(dist)
+        if dist[imin] < rmin:
+            mmin = self.monomers[imin]
+            rmin = dist[imin]
 
         return mmin, rmin
 
@@ -1282,6 +1357,7 @@ class AggregateBase(UnitsManaged, Saveable):
     #
     ###########################################################################
 
+    @profiled()
     def build(self, mult=1, sbi_for_higher_ex=False,
               vibgen_approx=None, Nvib=None, vibenergy_cutoff=None,
               fem_full=False):
@@ -1644,12 +1720,18 @@ class AggregateBase(UnitsManaged, Saveable):
                 # a monomer corresponds to one single excited state starting
                 # with electronic index 1 (0 is the ground state)
                 # ASSUMPTION: Two-level molecules
+                # here we make a projector on a given electronic state |i>
+                # ASSUMPTION: Oscillator is represented by its eigenstates
+                elprojs = numpy.zeros((Nop, Nop+1, Nop+1), dtype=qr.REAL)
                 for i in range(1, Nop+1):
+                    elprojs[i-1, i, i] = 1.0
+                vprojs = self._expand_electronic_operators(elprojs,
+                                                    fc_weighted=False,
+                                                    sparse=True)
+                for vproj in vprojs:
                     op1 = Operator(dim=self.HH.shape[0],real=True)
-                    # here we make a projector on a given electronic state |i>
-                    # ASSUMPTION: Oscillator is represented by its eigenstates
-                    for j in self.vibindices[i]:
-                        op1.data[j,j] = 1.0
+                    vproj = vproj.tocoo()
+                    op1.data[vproj.row, vproj.col] = vproj.data
                     iops.append(op1)
 
             # standard case with only electronic states
@@ -1671,6 +1753,7 @@ class AggregateBase(UnitsManaged, Saveable):
             # system-bath interaction is not present
             pass
 
+        self._vibtrace_map = None
         self._built = True
 
         manager.unset_current_units("energy")
@@ -1694,6 +1777,195 @@ class AggregateBase(UnitsManaged, Saveable):
     #
     ###########################################################################
 
+    def _get_electronic_indices(self):
+        """Returns the electronic state of each vibronic state
+
+        """
+        elind = numpy.zeros(self.Ntot, dtype=numpy.int64)
+        for n in range(self.Nel):
+            elind[self.vibindices[n]] = n
+        return elind
+
+
+    def _get_vibrational_codes(self):
+        """Returns an integer code of the vibrational signature of each state
+
+        States with the same code have the same vibrational quantum numbers
+        (regardless of their electronic state)
+
+        """
+        codes = dict()
+        return numpy.array([codes.setdefault(self.vibsigs[a][1], len(codes))
+                            for a in range(self.Ntot)], dtype=numpy.int64)
+
+
+    def get_vibronic_operators(self, operators, fc_weighted=True,
+                               sparse=False):
+        """Expands electronic operators into the vibronic basis
+
+        Element (n, m) of an electronic operator is expanded into the block
+        of the vibronic states belonging to the electronic states n and m.
+        The block is either formed by the Franck-Condon factors between
+        the vibrational states, or it is the vibrational identity. Only
+        the blocks corresponding to non-zero electronic elements are
+        constructed.
+
+        Parameters
+        ----------
+
+        operators : array
+            Electronic operator(s) of the shape (N, N) or (Nop, N, N),
+            where N is not larger than the number of electronic states of
+            the aggregate. The first N electronic states are assumed.
+
+        fc_weighted : bool
+            If True, the blocks are weighted by Franck-Condon factors,
+            otherwise vibrational identity is used
+
+        sparse : bool
+            If True, scipy.sparse.csr_matrix is returned for each operator
+
+        Returns
+        -------
+
+        numpy.ndarray of the shape (Ntot, Ntot) or (Nop, Ntot, Ntot),
+        or a scipy.sparse.csr_matrix or a list of them if `sparse` is True
+
+        """
+        if not self._built:
+            raise Exception("Aggregate has to be built first")
+
+        return self._expand_electronic_operators(operators, fc_weighted,
+                                                 sparse)
+
+
+    def _expand_electronic_operators(self, operators, fc_weighted, sparse):
+        """Expansion of electronic operators into the vibronic basis
+
+        See get_vibronic_operators. Can be used during the build, once
+        the vibronic states and Franck-Condon factors are known.
+
+        """
+        ops = numpy.asarray(operators)
+        single = (ops.ndim == 2)
+        if single:
+            ops = ops[numpy.newaxis,:,:]
+        (Nop, N, _) = ops.shape
+        if N > self.Nel:
+            raise Exception("Operators have more states than there are"+
+                            " electronic states in the aggregate")
+        dtype = numpy.result_type(ops.dtype, numpy.float64)
+
+        if not fc_weighted:
+            vcodes = self._get_vibrational_codes()
+
+        if sparse:
+
+            # loop over non-zero electronic blocks only
+            rows = []
+            cols = []
+            wgts = []
+            blks = []
+            nonzero = numpy.any(ops != 0, axis=0)
+            for (n, m) in zip(*numpy.nonzero(nonzero)):
+                II = numpy.asarray(self.vibindices[n], dtype=numpy.int64)
+                JJ = numpy.asarray(self.vibindices[m], dtype=numpy.int64)
+                if fc_weighted:
+                    ww = self.FCf[numpy.ix_(II, JJ)]
+                else:
+                    ww = (vcodes[II][:,None] == vcodes[JJ][None,:])
+                (ii, jj) = numpy.nonzero(ww)
+                rows.append(II[ii])
+                cols.append(JJ[jj])
+                wgts.append(ww[ii, jj])
+                blks.append(numpy.full(len(ii), n*N + m, dtype=numpy.int64))
+
+            if len(rows) > 0:
+                rows = numpy.concatenate(rows)
+                cols = numpy.concatenate(cols)
+                wgts = numpy.concatenate(wgts).astype(numpy.float64)
+                blks = numpy.concatenate(blks)
+
+            out = []
+            for k in range(Nop):
+                vals = wgts*ops[k].ravel()[blks] if len(rows) > 0 else []
+                mat = scipy.sparse.csr_matrix((vals, (rows, cols)),
+                                              shape=(self.Ntot, self.Ntot),
+                                              dtype=dtype)
+                mat.eliminate_zeros()
+                out.append(mat)
+
+            if single:
+                return out[0]
+            return out
+
+        # dense operators by block index arrays
+        elind = self._get_electronic_indices()
+        inside = numpy.nonzero(elind < N)[0]
+        eli = elind[inside]
+        if fc_weighted:
+            ww = self.FCf[numpy.ix_(inside, inside)]
+        else:
+            ww = (vcodes[inside][:,None] == vcodes[inside][None,:])
+
+        out = numpy.zeros((Nop, self.Ntot, self.Ntot), dtype=dtype)
+        for k in range(Nop):
+            out[k][numpy.ix_(inside, inside)] = \
+                ops[k][numpy.ix_(eli, eli)]*ww
+
+        if single:
+            return out[0]
+        return out
+
+
+    def _get_vibrational_trace_map(self):
+        """Returns the data needed to trace out vibrational states
+
+        Returns a projector of the shape (Nel, Ntot) from vibronic states
+        onto the electronic states, and a matrix converting vibronic
+        density matrix elements to the representation by ground-state
+        oscillator. Both are calculated only once after the aggregate
+        is built.
+
+        """
+        if getattr(self, "_vibtrace_map", None) is not None:
+            return self._vibtrace_map
+
+        # FIXME: This limitation might not be necessary
+        # in the ground states of all monomers, there must be the same
+        # or greater number of levels than in the excited state
+
+        # over all monomers
+        for k in range(self.nmono):
+            mono = self.monomers[k]
+            # over all modes
+            n_mod = mono.get_number_of_modes()
+            for i in range(n_mod):
+                mod = mono.get_Mode(i)
+                n_g = mod.get_nmax(0)
+                # over all excited states
+                # FIXME: this should be mono.Nel as in Aggregate
+                for j in range(1, mono.nel):
+                    n_e = mod.get_nmax(j)
+                    if n_e > n_g:
+                        raise Exception("Number of levels"+
+                " in the excited state of a molecule has to be \n"+
+                "the same or smaller than in the ground state")
+
+        # electronic state of each vibronic state
+        proj = numpy.zeros((self.Nel, self.Ntot), dtype=numpy.float64)
+        for n in range(self.Nel):
+            proj[n, self.vibindices[n]] = 1.0
+
+        # sum over ground state vibrational states
+        Ng = self.Nb[0]
+        FcProd = numpy.dot(self.FCf[:Ng,:].T, self.FCf[:,:Ng].T)
+
+        self._vibtrace_map = (proj, FcProd)
+
+        return self._vibtrace_map
+
+
     def trace_over_vibrations(self, operator, Nt=None):
         """Average an operator over vibrational degrees of freedom
 
@@ -1735,76 +2007,21 @@ class AggregateBase(UnitsManaged, Saveable):
 
             if n_indices == 2:
 
-                # convert to representation by ground-state oscillator
-
-                # FIXME: This limitation might not be necessary
-                # in the ground states of all monomers, there must be the same
-                # or greater number of levels than in the excited state
-
-                # over all monomers
-                for k in range(self.nmono):
-                    mono = self.monomers[k]
-                    # over all modes
-                    n_mod = mono.get_number_of_modes()
-                    for i in range(n_mod):
-                        mod = mono.get_Mode(i)
-                        n_g = mod.get_nmax(0)
-                        # over all excited states
-                        # FIXME: this should be mono.Nel as in Aggregate
-                        for j in range(mono.nel):
-                            if (j > 0):
-                                n_e = mod.get_nmax(j)
-                                if n_e > n_g:
-                                    raise Exception("Number of levels"+
-                        " in the excited state of a molecule has to be \n"+
-                        "the same or smaller than in the ground state")
-
-
-                # do the conversion
-
-                #
-                # ground state vibrational states
-                #
-                stgs = []
-                for i_g in self.vibindices[0]:
-                    vs_g = self.vibsigs[i_g]
-                    stg = self.get_VibronicState(vs_g[0],
-                                                vs_g[1])
-                    stgs.append(stg)
-
-                FcProd = numpy.zeros_like(self.FCf)
-                for i in range(FcProd.shape[0]):
-                    for j in range(FcProd.shape[1]):
-                        for i_g in range(self.Nb[0]):
-                            FcProd[i, j] += self.FCf[i_g, i]*self.FCf[j, i_g]
+                # projector on electronic states and the conversion
+                # to representation by ground-state oscillator
+                (proj, FcProd) = self._get_vibrational_trace_map()
 
                 if evolution:
                     if whole:
-                        # loop over electronic states n, m
-                        for n in range(self.Nel):
-                            for i_n in self.vibindices[n]:
-                                for m in range(self.Nel):
-                                    for i_m in self.vibindices[m]:
-                                        nop._data[:, n, m] += \
-                                            operator._data[:, i_n, i_m]*FcProd[i_n, i_m]
+                        nop._data[:,:,:] = \
+                            proj @ (operator._data*FcProd) @ proj.T
 
                     else:
-                        # loop over electronic states n, m
-                        for n in range(self.Nel):
-                            for i_n in self.vibindices[n]:
-                                for m in range(self.Nel):
-                                    for i_m in self.vibindices[m]:
-                                        nop._data[n,m] += \
-                                            operator._data[Nt, i_n, i_m]*FcProd[i_n, i_m]
+                        nop._data[:,:] = \
+                            proj @ (operator._data[Nt,:,:]*FcProd) @ proj.T
 
                 else:
-                    # loop over electronic states n, m
-                    for n in range(self.Nel):
-                        for i_n in self.vibindices[n]:
-                            for m in range(self.Nel):
-                                for i_m in self.vibindices[m]:
-                                    nop._data[n,m] += \
-                                        operator._data[i_n, i_m]*FcProd[i_n, i_m]
+                    nop._data[:,:] = proj @ (operator._data*FcProd) @ proj.T
 
             else:
                 raise Exception("Cannot trace over this object: "+
@@ -1859,6 +2076,7 @@ class AggregateBase(UnitsManaged, Saveable):
         return esum/Nn
 
 
+    @profiled()
     def get_RelaxationTensor(self, timeaxis,
                        relaxation_theory=None,
                        time_dependent=False,
@@ -1886,6 +2104,13 @@ class AggregateBase(UnitsManaged, Saveable):
         secular_relaxation :
             Should the tensor be secular?
 
+        recalculate : bool
+            If set False and the disk cache is switched on
+            (see Manager.set_disk_cache), the tensor is loaded from the
+            cache when it was calculated before with the same Hamiltonian,
+            system-bath interaction and options. Calculated tensors are
+            always stored in the cache when it is on.
+
 
         Returns
         -------
@@ -1898,6 +2123,70 @@ class AggregateBase(UnitsManaged, Saveable):
             the system-bath interaction
 
 
+        """
+        from ..core.diskcache import fingerprint
+
+        cache = Manager().disk_cache
+
+        # cached objects are stored in the site basis
+        if (cache is None) or (Manager().get_current_basis() != 0):
+            return self._calculate_RelaxationTensor(timeaxis,
+                                relaxation_theory=relaxation_theory,
+                                time_dependent=time_dependent,
+                                secular_relaxation=secular_relaxation,
+                                relaxation_cutoff_time=relaxation_cutoff_time,
+                                coupling_cutoff=coupling_cutoff,
+                                recalculate=recalculate,
+                                as_operators=as_operators)
+
+        if self._built:
+            ham = self.get_Hamiltonian()
+            sbi = self.get_SystemBathInteraction()
+        else:
+            raise Exception()
+
+        key = fingerprint("RelaxationTensor", ham, sbi, timeaxis,
+                          relaxation_theory, time_dependent,
+                          secular_relaxation, relaxation_cutoff_time,
+                          coupling_cutoff, as_operators)
+
+        if not recalculate:
+            value = cache.get(key, context=(ham, sbi))
+            if value is not None:
+                (relaxT, rham, theory) = value
+                self.RelaxationTensor = relaxT
+                self.RelaxationHamiltonian = rham
+                self._has_relaxation_tensor = True
+                self._relaxation_theory = theory
+                return relaxT, rham
+
+        relaxT, rham = self._calculate_RelaxationTensor(timeaxis,
+                                relaxation_theory=relaxation_theory,
+                                time_dependent=time_dependent,
+                                secular_relaxation=secular_relaxation,
+                                relaxation_cutoff_time=relaxation_cutoff_time,
+                                coupling_cutoff=coupling_cutoff,
+                                recalculate=recalculate,
+                                as_operators=as_operators)
+
+        cache.put(key, (relaxT, rham, self._relaxation_theory),
+                  context=(ham, sbi))
+
+        return relaxT, rham
+
+
+    def _calculate_RelaxationTensor(self, timeaxis,
+                       relaxation_theory=None,
+                       time_dependent=False,
+                       secular_relaxation=False,
+                       relaxation_cutoff_time=None,
+                       coupling_cutoff=None,
+                       recalculate=True,
+                       as_operators=False):
+        """Calculates a relaxation tensor corresponding to the aggregate
+
+        See get_RelaxationTensor for the description of the parameters.
+
         """
 
         from ..qm import RedfieldRelaxationTensor
@@ -2187,8 +2476,18 @@ class AggregateBase(UnitsManaged, Saveable):
 
 
     #FIXME: There must be a general theory here
-    def get_RedfieldRateMatrix(self):
+    @profiled()
+    def get_RedfieldRateMatrix(self, recalculate=True):
+        """Returns Redfield rate matrix of the aggregate
+
+        Parameters
+        ----------
 
+        recalculate : bool
+            If set False, the rate matrix is loaded from the disk cache
+            when available (see get_RelaxationTensor)
+
+        """
         from ..qm import RedfieldRateMatrix
         from ..core.managers import eigenbasis_of
 
@@ -2198,16 +2497,29 @@ class AggregateBase(UnitsManaged, Saveable):
         else:
             raise Exception()
 
-        ham.protect_basis()
-        with eigenbasis_of(ham):
-            RR = RedfieldRateMatrix(ham, sbi)
-        ham.unprotect_basis()
+        def _calculate():
+            ham.protect_basis()
+            with eigenbasis_of(ham):
+                RR = RedfieldRateMatrix(ham, sbi)
+            ham.unprotect_basis()
+            return RR
 
-        return RR
+        return self._cached_rate_matrix("RedfieldRateMatrix", ham, sbi,
+                                        _calculate, recalculate)
     
     
-    def get_FoersterRateMatrix(self):
-        
+    @profiled()
+    def get_FoersterRateMatrix(self, recalculate=True):
+        """Returns Foerster rate matrix of the aggregate
+
+        Parameters
+        ----------
+
+        recalculate : bool
+            If set False, the rate matrix is loaded from the disk cache
+            when available (see get_RelaxationTensor)
+
+        """
         from ..qm import FoersterRateMatrix
         
         if self._built:        
@@ -2216,7 +2528,31 @@ class AggregateBase(UnitsManaged, Saveable):
         else:
             raise Exception()
 
-        return FoersterRateMatrix(ham, sbi)
+        return self._cached_rate_matrix("FoersterRateMatrix", ham, sbi,
+                                        lambda: FoersterRateMatrix(ham, sbi),
+                                        recalculate)
+
+
+    def _cached_rate_matrix(self, name, ham, sbi, calculate, recalculate):
+        """Calculates a rate matrix or loads it from the disk cache
+
+        """
+        from ..core.diskcache import fingerprint
+
+        cache = Manager().disk_cache
+        if (cache is None) or (Manager().get_current_basis() != 0):
+            return calculate()
+
+        key = fingerprint(name, ham, sbi)
+        if not recalculate:
+            RR = cache.get(key, context=(ham, sbi))
+            if RR is not None:
+                return RR
+
+        RR = calculate()
+        cache.put(key, RR, context=(ham, sbi))
+
+        return RR
 
 
     def diagonalize(self):
@@ -2233,13 +2569,13 @@ class AggregateBase(UnitsManaged, Saveable):
         #for i in range(self.HH.shape[0]):
         #    print(self.HH[i,i])
 
-        ee,SS = numpy.linalg.eigh(self.HH)
+        ee,SS = Manager().basis_cache.eigh(self.HH)
         
         self.Hs = self.HH.copy()
 
         self.HD = ee
         self.SS = SS
-        self.S1 = numpy.linalg.inv(SS)
+        self.S1 = unitary_inverse(SS)
 
         self.HH = numpy.dot(self.S1,numpy.dot(self.HH,self.SS))
 
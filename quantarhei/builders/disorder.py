@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 import numpy
 
+from ..core.managers import EnergyUnitsManaged
+from ..core.units import kB_int
+
 
 class Disorder:
     
@@ -60,3 +63,239 @@ class Disorder:
         else:
             
             raise Exception("Unknown distribution")
+
+
+
+class DisorderEnsemble(EnergyUnitsManaged):
+    """Ensemble of realizations of a statically disordered aggregate
+    
+    All realizations of the single exciton Hamiltonian of the aggregate
+    are stored as one array of the shape (Nreal, N, N), where N is the
+    number of molecules, and they are diagonalized in one batched call.
+    Excitonic properties of all realizations (energies, transition dipole
+    moments, lineshape weights etc.) are then available as arrays with
+    the realization index first. Spectra averaged over the ensemble are
+    calculated by the `calculate_ensemble` methods of the linear spectra
+    calculators.
+    
+    Only aggregates of two-level molecules (electronic states only)
+    are supported.
+    
+    Parameters
+    ----------
+    
+    aggregate : Aggregate
+        Built aggregate whose Hamiltonian (in site basis) defines the mean
+        values of the site energies and couplings
+        
+    Nreal : int
+        Number of realizations
+        
+    width : float
+        Width of the distribution of site energies (in current energy units).
+        The same convention as in the Disorder class is used, i.e. the
+        standard deviation is width/sqrt(2 ln 2).
+        
+    coupling_width : float
+        Width of the distribution of resonance couplings (in current energy
+        units). Only non-zero couplings are disordered.
+        
+    distribution : str
+        Type of the distribution. Only "Gaussian" is available
+        
+    seed : int
+        Seed of the random number generator
+        
+        
+    Examples
+    --------
+    
+    >>> import quantarhei as qr
+    >>> agg = qr.TestAggregate(name="dimer-2-env")
+    >>> agg.build()
+    >>> with qr.energy_units("1/cm"):
+    ...     ens = DisorderEnsemble(agg, 1000, width=100.0, seed=1)
+    >>> ens.HH.shape
+    (1000, 2, 2)
+    >>> ens.energies.shape
+    (1000, 2)
+    
+    """
+    
+    def __init__(self, aggregate, Nreal, width=None, coupling_width=None,
+                 distribution="Gaussian", seed=None):
+        
+        if distribution != "Gaussian":
+            raise Exception("Unknown distribution")
+        
+        self.aggregate = aggregate
+        self.Nreal = Nreal
+        self.distribution = distribution
+        
+        if width is None:
+            width = 0.0
+        if coupling_width is None:
+            coupling_width = 0.0
+        self.width = self.convert_2_internal_u(width)
+        self.coupling_width = self.convert_2_internal_u(coupling_width)
+        
+        if seed is not None:
+            numpy.random.seed(seed)
+            
+        HH = aggregate.get_Hamiltonian()
+        N = aggregate.nmono
+        if HH.dim < N + 1:
+            raise Exception("Aggregate has to be built at least with"
+                            + " single exciton states")
+        # mean single exciton Hamiltonian in site basis
+        self.E0 = HH._data[0,0]
+        self.H0 = numpy.real(HH._data[1:N+1,1:N+1]).copy()
+        if aggregate.Ntot != aggregate.Nel:
+            raise Exception("Only purely electronic aggregates are supported")
+        self.N = N
+        
+        self.generate()
+        self.diagonalize()
+        
+        
+    def generate(self):
+        """Generates new realizations of the disordered Hamiltonian
+        
+        """
+        N = self.N
+        Nreal = self.Nreal
+        
+        HH = numpy.zeros((Nreal, N, N), dtype=numpy.float64)
+        HH[:,:,:] = self.H0
+        
+        idx = numpy.arange(N)
+        if self.width > 0.0:
+            sigma = self.width/numpy.sqrt(2.0*numpy.log(2))
+            HH[:, idx, idx] += numpy.random.normal(0.0, sigma, (Nreal, N))
+        
+        if self.coupling_width > 0.0:
+            sigma = self.coupling_width/numpy.sqrt(2.0*numpy.log(2))
+            dj = numpy.random.normal(0.0, sigma, (Nreal, N, N))
+            dj = numpy.triu(dj, k=1)
+            dj = dj + numpy.swapaxes(dj, 1, 2)
+            mask = (self.H0 != 0.0)
+            mask[idx, idx] = False
+            HH += dj*mask
+            
+        self.HH = HH
+        
+        
+    def diagonalize(self):
+        """Diagonalizes all realizations in one batched call
+        
+        Sets the `energies` (Nreal, N) attribute with the transition
+        energies from the ground state and the `SS` (Nreal, N, N)
+        attribute with the expansion coefficients of the excitonic states
+        into site states (in columns).
+        
+        """
+        ee, SS = numpy.linalg.eigh(self.HH)
+        self.energies = ee - self.E0
+        self.SS = SS
+        
+        
+    def get_site_dipoles(self):
+        """Returns transition dipole moments of the molecules (N, 3)
+        
+        """
+        DD = self.aggregate.get_TransitionDipoleMoment()
+        return numpy.real(DD._data[0,1:self.N+1,:])
+        
+        
+    def get_transition_dipoles(self):
+        """Returns excitonic transition dipole moments (Nreal, N, 3)
+        
+        """
+        dd = self.get_site_dipoles()
+        return numpy.einsum("rkn,ki->rni", self.SS, dd)
+        
+        
+    def get_dipole_strengths(self):
+        """Returns excitonic dipole strengths (Nreal, N)
+        
+        """
+        dn = self.get_transition_dipoles()
+        return numpy.einsum("rni,rni->rn", dn, dn)
+    
+    
+    def get_rotatory_strengths(self):
+        """Returns excitonic rotatory strengths (Nreal, N)
+        
+        The same definition as in the circular dichroism calculator
+        is used.
+        
+        """
+        N = self.N
+        pos = numpy.array([self.aggregate.monomers[kk].position 
+                           for kk in range(N)])
+        dd = self.get_site_dipoles()
+        
+        # (r_l - r_k).(d_l x d_k) for all pairs k < l
+        displ = pos[None,:,:] - pos[:,None,:]
+        cross = numpy.cross(dd[None,:,:], dd[:,None,:])
+        geom = numpy.triu(numpy.einsum("kli,kli->kl", displ, cross), k=1)
+        
+        return numpy.einsum("rkn,rln,kl->rn", self.SS, self.SS, geom)
+    
+    
+    def get_lineshape_weights(self):
+        """Returns weights of the site lineshape functions (Nreal, N, Nf)
+        
+        See `excitonic_lineshape_weights` in the spectroscopy.linearresponse
+        module.
+        
+        """
+        from ..spectroscopy.linearresponse import excitonic_lineshape_weights
+        
+        cfm = self.aggregate.get_SystemBathInteraction().CC
+        return excitonic_lineshape_weights(self.SS, cfm.cpointer,
+                                           Nf=cfm.nof+1)
+    
+    
+    def get_reorganization_energies(self):
+        """Returns excitonic reorganization energies (Nreal, N)
+        
+        """
+        cfm = self.aggregate.get_SystemBathInteraction().CC
+        lambdas = numpy.array([cfm.get_reorganization_energy(kk, kk)
+                               for kk in range(self.N)])
+        return numpy.einsum("rkn,k->rn", self.SS**4, lambdas)
+    
+    
+    def get_thermal_populations(self, temperature):
+        """Returns canonical populations of excitonic states (Nreal, N)
+        
+        Parameters
+        ----------
+        
+        temperature : float
+            Temperature in Kelvins
+        
+        """
+        if temperature <= 0.0:
+            pops = numpy.zeros(self.energies.shape)
+            pops[:,0] = 1.0
+            return pops
+        
+        ee = self.energies - self.energies[:,0:1]
+        pops = numpy.exp(-ee/(kB_int*temperature))
+        return pops/numpy.sum(pops, axis=1)[:,None]
+    
+    
+    def get_lineshape_functions(self):
+        """Returns lineshape functions of the sites (Nf, Nt)
+        
+        Lineshape functions are calculated by the CorrelationFunctionMatrix
+        of the aggregate (only once) and they correspond to the weights 
+        returned by `get_lineshape_weights`.
+        
+        """
+        cfm = self.aggregate.get_SystemBathInteraction().CC
+        if getattr(cfm, "_gofts", None) is None:
+            cfm.create_double_integral()
+        return cfm._gofts
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 
 import scipy.constants as const
+import scipy.sparse
+from scipy.spatial import cKDTree
 from ..core.units import eps0_int
 import numpy as np
 
@@ -41,6 +43,199 @@ def dipole_dipole_interaction(r1, r2, d1, d2, epsr):
     return prf*cc/epsr    
     
 
+def _pairs_of_sites(positions, cutoff=None, chunk_size=1000000):
+    """Generator of chunks of pairs (i,j), i < j, of interacting sites
+    
+    Without a cutoff, all pairs are generated. With a cutoff, only pairs
+    closer than the cutoff distance are found using a KD-tree.
+    
+    """
+    N = positions.shape[0]
+    if cutoff is None:
+        rows = max(1, chunk_size//max(N, 1))
+        cols = np.arange(N)
+        for i0 in range(0, N, rows):
+            i1 = min(i0 + rows, N)
+            ii, jj = np.nonzero(cols[np.newaxis,:]
+                                > np.arange(i0, i1)[:,np.newaxis])
+            yield (ii + i0, jj)
+    else:
+        tree = cKDTree(positions)
+        pairs = tree.query_pairs(cutoff, output_type="ndarray")
+        for i0 in range(0, pairs.shape[0], chunk_size):
+            yield (pairs[i0:i0+chunk_size,0], pairs[i0:i0+chunk_size,1])
+
+
+def _coupling_matrix(kernel, positions, cutoff, chunk_size):
+    """Symmetric coupling matrix from a kernel evaluated on pairs of sites
+    
+    """
+    N = positions.shape[0]
+    if cutoff is None:
+        JJ = np.zeros((N, N), dtype=np.float64)
+        for (ii, jj) in _pairs_of_sites(positions, chunk_size=chunk_size):
+            val = kernel(ii, jj)
+            JJ[ii, jj] = val
+            JJ[jj, ii] = val
+        return JJ
+
+    iis = []
+    jjs = []
+    vals = []
+    for (ii, jj) in _pairs_of_sites(positions, cutoff=cutoff,
+                                    chunk_size=chunk_size):
+        iis.append(ii)
+        jjs.append(jj)
+        vals.append(kernel(ii, jj))
+    if len(vals) > 0:
+        ii = np.concatenate(iis)
+        jj = np.concatenate(jjs)
+        val = np.concatenate(vals)
+    else:
+        ii = jj = np.zeros(0, dtype=int)
+        val = np.zeros(0, dtype=np.float64)
+
+    return scipy.sparse.coo_matrix((np.concatenate([val, val]),
+                                    (np.concatenate([ii, jj]),
+                                     np.concatenate([jj, ii]))),
+                                   shape=(N, N)).tocsr()
+
+
+def dipole_dipole_coupling_matrix(positions, dipoles, epsr=1.0, cutoff=None,
+                                  chunk_size=1000000):
+    """Dipole-dipole couplings between all pairs of molecules
+    
+    All couplings are calculated at once from stacked positions and 
+    transition dipole moments. The values are the same as those of the
+    `dipole_dipole_interaction` function.
+    
+    Parameters
+    ----------
+    
+    positions : array like
+        Positions of the molecules, shape (N, 3)
+        
+    dipoles : array like
+        Transition dipole moments of the molecules, shape (N, 3)
+        
+    epsr : float
+        relative permitivity of the environment
+        
+    cutoff : float
+        If specified, only couplings between molecules closer than
+        the cutoff distance are calculated (with the help of a KD-tree)
+        and a sparse matrix is returned
+        
+    chunk_size : int
+        Maximum number of pairs of molecules treated at once
+        
+    Returns
+    -------
+    
+    numpy.ndarray of the shape (N, N), or scipy.sparse.csr_matrix when
+    cutoff is specified. Diagonal elements are zero.
+    
+    """
+    pos = np.asarray(positions, dtype=np.float64)
+    dip = np.asarray(dipoles, dtype=np.float64)
+    prf = 1.0/(4.0*const.pi*eps0_int)
+    
+    def kernel(ii, jj):
+        R = pos[ii,:] - pos[jj,:]
+        RR2 = np.sum(R**2, axis=1)
+        RR = np.sqrt(RR2)
+        d1 = dip[ii,:]
+        d2 = dip[jj,:]
+        cc = (np.sum(d1*d2, axis=1)
+              - 3.0*np.sum(d1*R, axis=1)*np.sum(d2*R, axis=1)/RR2)/(RR2*RR)
+        return prf*cc/epsr
+    
+    return _coupling_matrix(kernel, pos, cutoff, chunk_size)
+
+
+def transition_charge_coupling_matrix(charge_positions, charges, 
+                                      centers=None, epsr=1.0, cutoff=None,
+                                      chunk_size=1000000):
+    """Couplings between all pairs of molecules represented by point charges
+    
+    Each molecule is represented by the same number of (transition) point
+    charges. Molecules with fewer charges can be padded by zero charges.
+    
+    Parameters
+    ----------
+    
+    charge_positions : array like
+        Positions of the charges, shape (N, Nq, 3)
+        
+    charges : array like
+        Values of the charges, shape (N, Nq)
+        
+    centers : array like
+        Positions of the molecules used with the cutoff, shape (N, 3). 
+        By default, the centers of the absolute values of the charges 
+        are used.
+        
+    epsr : float
+        relative permitivity of the environment
+        
+    cutoff : float
+        If specified, only couplings between molecules whose centers
+        are closer than the cutoff distance are calculated and a sparse 
+        matrix is returned
+        
+    chunk_size : int
+        Maximum number of charge pairs treated at once
+        
+    """
+    rq = np.asarray(charge_positions, dtype=np.float64)
+    qq = np.asarray(charges, dtype=np.float64)
+    Nq = qq.shape[1]
+    prf = 1.0/(4.0*const.pi*eps0_int)
+    
+    if centers is None:
+        wq = np.abs(qq)
+        centers = np.einsum("nq,nqi->ni", wq, rq) \
+                  /np.sum(wq, axis=1)[:,np.newaxis]
+    centers = np.asarray(centers, dtype=np.float64)
+
+    def kernel(ii, jj):
+        R = rq[ii,:,np.newaxis,:] - rq[jj,np.newaxis,:,:]
+        RR = np.sqrt(np.sum(R**2, axis=3))
+        q12 = qq[ii,:,np.newaxis]*qq[jj,np.newaxis,:]
+        cc = np.divide(q12, RR, out=np.zeros_like(q12), where=(q12 != 0.0))
+        return prf*np.sum(cc, axis=(1,2))/epsr
+
+    return _coupling_matrix(kernel, centers, cutoff, 
+                            max(1, chunk_size//(Nq*Nq)))
+
+
+def extended_dipole_charges(positions, dipoles, length):
+    """Point charges representing extended transition dipoles
+    
+    Each transition dipole d is represented by the charges +q and -q
+    placed at the distance `length` along the dipole, symmetrically 
+    around the position of the molecule, with q = |d|/length.
+    
+    Returns
+    -------
+    
+    Tuple (charge_positions, charges) of the shapes (N, 2, 3) and (N, 2)
+    to be used with `transition_charge_coupling_matrix`
+    
+    """
+    pos = np.asarray(positions, dtype=np.float64)
+    dip = np.asarray(dipoles, dtype=np.float64)
+    dnorm = np.sqrt(np.sum(dip**2, axis=1))
+    unit = np.zeros_like(dip)
+    nonzero = dnorm > 0.0
+    unit[nonzero,:] = dip[nonzero,:]/dnorm[nonzero,np.newaxis]
+    
+    rq = np.stack([pos + 0.5*length*unit, pos - 0.5*length*unit], axis=1)
+    qq = np.stack([dnorm/length, -dnorm/length], axis=1)
+    
+    return (rq, qq)
+    
+
 def dipole_dipole(center1,dipole1,center2,dipole2,*args):
     ''' Calculates interaction between two dipoles
     
@@ -3,6 +3,12 @@
 
 PDB File representation
 
+Coordinate records (ATOM and HETATM) of the file are parsed once, when
+the file is loaded, into a numpy structured array with the fields
+`line` (index of the line in the file), `recName`, `atmName`, `altLoc`,
+`resName`, `chainId`, `resSeq` and `xyz`. All selections of atoms
+and residues are then performed on this array.
+
 """
 import numpy
 
@@ -13,6 +19,18 @@ _resSeq_max = 26
 _chainId_min = 21
 _chainId_max = 22
 
+# columns of the coordinate records which we parse
+_record_length = 54
+_atom_dtype = numpy.dtype([("line", numpy.int64),
+                           ("recName", "U6"),
+                           ("atmName", "U4"),
+                           ("altLoc", "U1"),
+                           ("resName", "U3"),
+                           ("chainId", "U1"),
+                           ("resSeq", numpy.int64),
+                           ("xyz", numpy.float64, (3,))])
+
+
 class PDBFile:
     """Represents a PDB file with a protein-pigment complex structure
 
@@ -20,15 +38,16 @@ class PDBFile:
 
     def __init__(self, fname=None):
 
-        self.lines = []
         self.linecount = 0
-        
-        self.molecules = []
+        self.atoms = numpy.zeros(0, dtype=_atom_dtype)
+
+        # content of the file and positions of its lines
+        self._raw = b""
+        self._starts = numpy.zeros(0, dtype=numpy.int64)
+        self._ends = numpy.zeros(0, dtype=numpy.int64)
+        self._lines = None
 
-        self._resSeqs = []
-        self._uniqueIds = []
-        self._res_lines = dict()
-        self._unique_lines = dict()
+        self.molecules = []
 
         if fname is not None:
             #load file
@@ -36,105 +55,135 @@ class PDBFile:
         else:
             return
 
-    def _reset_helpers(self):
-        self._resSeqs = []
-        self._uniqueIds = []
-        self._res_lines = dict()
-        self._unique_lines = dict()       
-            
+
+    @property
+    def lines(self):
+        """Lines of the file
+
+        The list of lines is created only when it is requested.
+
+        """
+        if self._lines is None:
+            self._lines = [self._line(k) for k in range(len(self._starts))]
+        return self._lines
+
+
+    def _line(self, k):
+        """Returns k-th line of the file
+
+        """
+        return self._raw[self._starts[k]:self._ends[k]].decode(
+                errors="replace").replace("\r\n", "\n")
+
+
     def load_file(self, fname):
         """Loads a PDB file
 
         """
-        with open(fname) as file:
-            k = 0
-            for line in file:
-                self.lines.append(line)
-                k += 1
-        return k
+        with open(fname, "rb") as file:
+            raw = file.read()
+
+        # coordinates are parsed directly from the bytes of the file
+        buff = numpy.frombuffer(raw, dtype=numpy.uint8)
+        ends = numpy.flatnonzero(buff == 10) + 1
+        if len(buff) > (ends[-1] if len(ends) > 0 else 0):
+            ends = numpy.append(ends, len(buff))
+        starts = numpy.concatenate(([0], ends[:-1]))
+
+        atoms = _parse_records(buff, starts, ends,
+                               first_line=len(self._starts))
+
+        offset = len(self._raw)
+        self._raw += raw
+        self._starts = numpy.concatenate((self._starts, starts + offset))
+        self._ends = numpy.concatenate((self._ends, ends + offset))
+        self._lines = None
+        if len(self.atoms) == 0:
+            self.atoms = atoms
+        else:
+            self.atoms = numpy.concatenate((self.atoms, atoms))
+
+        return len(starts)
+
+
+    def select_atoms(self, by_recName=None,
+                     by_resName=None,
+                     by_chainId=None,
+                     by_resSeq=None,
+                     by_atmName=None):
+        """Returns atom records matching all specified patterns
 
+        Returns a structured array (a subset of the `atoms` attribute)
+        in the order in which the records appear in the file.
 
-    def get_Molecules(self, model=None):    
+        """
+        return self.atoms[_atoms_mask(self.atoms, by_recName=by_recName,
+                                      by_resName=by_resName,
+                                      by_chainId=by_chainId,
+                                      by_resSeq=by_resSeq,
+                                      by_atmName=by_atmName)]
+
+
+    def get_Molecules(self, model=None):
         """Returns all molecules corresponding to a given model
 
+        Molecules are identified by the chain identifier and
+        the residue sequence number of the HETATM records with the residue
+        name given by the model. Positions and transition dipoles of all
+        molecules are calculated by the model at once.
+
         """
 
         if model is None:
             return self.molecules
 
-        else:
-            
-            molecules = []
-            
-            #
-            #  residue name identifying the molecule in pdb file
-            #
-            res_name = model.pdbname
-            
-            #
-            # Get all lines with molecules matching residue name
-            #
-            mollines = self._match_lines(by_recName="HETATM",
-                                         by_resName=res_name)
-                                      #by_resSeq=378, by_atmName="ND")
-
-            #    return line[_resSeq_min:_resSeq_max]
-            # Get resSeq - residue sequence number 
-            # (sometimes enough to identify uniquely the molechaincule)
-            #)
-            for mols in mollines:
-                rseq = int(line_resSeq(mols))
-                if rseq not in self._resSeqs:
-                    # if the sequence numeber not in a list of number
-                    self._resSeqs.append(rseq) # append it
-                    self._res_lines[rseq] = [] # make a new list of lines 
-                self._res_lines[rseq].append(mols) # append line to a list
-                                                   # according to a sequence nr
-                                                   
-            # check if there is one molecule in the list of lines
-
-                
-            count = -1
-            for mols in mollines:
-                rseq = int(line_resSeq(mols))
-                chainId = line_chainId(mols)
-                comb = chainId+str(rseq)
-                if comb not in self._uniqueIds:
-                    count += 1
-                    self._uniqueIds.append(comb)
-                    self._unique_lines[comb] = []
-                self._unique_lines[comb].append(mols)
-
-#            # Create a molecule from given lines
-#            for rseq in self._resSeqs:
-#                m = Molecule(name=str(rseq), elenergies=model.default_energies)
-#                r = model.position_of_center(data_type="PDB",
-#                                             data=self._res_lines[rseq])
-#                m.position = r
-#                d = model.transition_dipole(data_type="PDB",
-#                                            data=self._res_lines[rseq])
-#                m.set_dipole(0,1,d)
-#                self.molecules.append(m)
-
-            # Create a molecule from given unique lines
-            for rseq in self._uniqueIds:
-                m = Molecule(name=str(rseq), elenergies=model.default_energies)
-                r = model.position_of_center(data_type="PDB",
-                                             data=self._unique_lines[rseq])
-                m.position = r
-                d = model.transition_dipole(data_type="PDB",
-                                            data=self._unique_lines[rseq])
-                m.set_dipole(0,1,d)
-                m.model = self
-                m.data = self._unique_lines[rseq]
-                molecules.append(m)
-                
-        self._reset_helpers()
+        #
+        #  Get all atoms of the molecules matching residue name
+        #  identifying the molecule in pdb file
+        #
+        atoms = self.select_atoms(by_recName="HETATM",
+                                  by_resName=model.pdbname)
+
+        #
+        # Molecules are identified by the combination of chainId
+        # and resSeq
+        #
+        names, residues = residue_index(atoms)
+
+        pos = model.position_of_center(data_type="PDB", data=atoms,
+                                       residues=residues)
+        dip = model.transition_dipole(data_type="PDB", data=atoms,
+                                      residues=residues)
+
+        # atoms belonging to individual molecules
+        order = numpy.argsort(residues, kind="stable")
+        splits = numpy.cumsum(numpy.bincount(residues,
+                                             minlength=len(names)))[:-1]
+        res_atoms = numpy.split(atoms[order], splits)
+
+        # Create a molecule from given unique residues
+        molecules = []
+        for (k, name) in enumerate(names):
+            m = Molecule(name=name, elenergies=model.default_energies)
+            m.position = pos[k,:]
+            m.set_dipole(0,1,dip[k,:])
+            m.model = self
+            m.data = res_atoms[k]
+            m._data_type = "PDB"
+            molecules.append(m)
+
         self.molecules = molecules
-                
+
         return molecules
 
+
     def get_chainId(self,molecule):
+        if isinstance(molecule.data, numpy.ndarray):
+            cids = numpy.unique(molecule.data["chainId"])
+            if len(cids) != 1:
+                raise Exception("No unique chainId")
+            return str(cids[0])
+
         lines = molecule.data
         save = None
         for l in lines:
@@ -145,10 +194,12 @@ class PDBFile:
             else:
                 save = cid
         return save
-                
+
+
     def clear_Molecules(self):
         self.molecules = []
-        
+
+
     def _match_lines(self, by_recName=None,
                      by_resName=None,
                      by_resSeq=None,
@@ -156,17 +207,250 @@ class PDBFile:
         """Matches a line with a given pattern
 
         """
+        atoms = self.select_atoms(by_recName=by_recName,
+                                  by_resName=by_resName,
+                                  by_resSeq=by_resSeq,
+                                  by_atmName=by_atmName)
+        return [self._line(i) for i in atoms["line"]]
+
+
+def atoms_from_lines(lines, first_line=0):
+    """Parses coordinate records from lines of a PDB file
+
+    Parameters
+    ----------
+
+    lines : list
+        Lines of a PDB file
+
+    first_line : int
+        Index of the first line in the file; it is used to set the `line`
+        field of the records
+
+    Returns
+    -------
+
+    Structured numpy array with one item per ATOM or HETATM record
+
+    """
+    buff = numpy.frombuffer("".join(lines).encode("latin-1",
+                                                  errors="replace"),
+                            dtype=numpy.uint8)
+    lengths = numpy.fromiter(map(len, lines), dtype=numpy.int64,
+                             count=len(lines))
+    ends = numpy.cumsum(lengths)
+
+    return _parse_records(buff, ends - lengths, ends, first_line)
+
+
+def _parse_records(buff, starts, ends, first_line=0, chunk_size=100000):
+    """Parses coordinate records from the characters of a PDB file
+
+    Parameters
+    ----------
+
+    buff : numpy.ndarray
+        Characters (uint8) of the file
+
+    starts, ends : numpy.ndarray
+        Positions of the beginnings and ends of the lines in `buff`
+
+    """
+    atoms = numpy.zeros(0, dtype=_atom_dtype)
+    if len(buff) == 0:
+        return atoms
+    last = len(buff) - 1
+
+    def columns(rows, cmin, cmax):
+        """Characters in columns cmin:cmax, blank after the end of line
+
+        """
+        pos = starts[rows][:,None] + numpy.arange(cmin, cmax)
+        chars = buff[numpy.minimum(pos, last)]
+        chars[pos >= ends[rows][:,None]] = 32
+        chars[(chars == 10) | (chars == 13)] = 32
+        return chars
+
+    # files with all lines of the same length are viewed as a table
+    lengths = ends - starts
+    Nl = len(lengths)
+    if (lengths[0] > _record_length) and numpy.all(lengths == lengths[0]):
+        table = buff[:Nl*lengths[0]].reshape(Nl, lengths[0])
+    else:
+        table = None
+
+    # record names of all lines
+    if table is not None:
+        rec = table[:,0:6]
+    else:
+        rec = numpy.zeros((Nl, 6), dtype=numpy.uint8)
+        for k in range(0, Nl, chunk_size):
+            rec[k:k+chunk_size,:] = columns(slice(k, k+chunk_size), 0, 6)
+    is_het = numpy.all(rec == numpy.frombuffer(b"HETATM", numpy.uint8),
+                       axis=1)
+    is_atm = numpy.all(rec[:,:4] == numpy.frombuffer(b"ATOM", numpy.uint8),
+                       axis=1)
+    rows = numpy.nonzero(is_het | is_atm)[0]
+    del rec
+
+    atoms = numpy.zeros(len(rows), dtype=_atom_dtype)
+    if len(rows) == 0:
+        return atoms
+
+    # fixed width columns of the coordinate records
+    if table is not None:
+        chars = table[rows,0:_record_length]
+    else:
+        chars = numpy.zeros((len(rows), _record_length), dtype=numpy.uint8)
+        for k in range(0, len(rows), chunk_size):
+            chars[k:k+chunk_size,:] = columns(rows[k:k+chunk_size],
+                                              0, _record_length)
+
+    atoms["line"] = rows + first_line
+    atoms["recName"] = numpy.where(is_het[rows], "HETATM", "ATOM")
+    atoms["atmName"] = _strings(chars[:,12:16], strip=True)
+    atoms["altLoc"] = _strings(chars[:,16:17])
+    atoms["resName"] = _strings(chars[:,17:20])
+    atoms["chainId"] = _strings(chars[:,_chainId_min:_chainId_max])
+    atoms["resSeq"] = _numbers(chars[:,_resSeq_min:_resSeq_max],
+                               numpy.int64)
+    for (k, cmin) in enumerate([30, 38, 46]):
+        atoms["xyz"][:,k] = _numbers(chars[:,cmin:cmin+8], numpy.float64)
+
+    return atoms
+
+
+def _strings(chars, strip=False):
+    """Converts fixed width columns of characters to strings
+
+    Each distinct value is decoded only once.
+
+    """
+    (Na, width) = chars.shape
+    keys = numpy.zeros((Na, 8), dtype=numpy.uint8)
+    keys[:,:width] = chars
+    (_, first, inverse) = numpy.unique(keys.view(numpy.uint64)[:,0],
+                                       return_index=True,
+                                       return_inverse=True)
+    values = [chars[k].tobytes().decode("latin-1") for k in first]
+    if strip:
+        values = [val.strip() for val in values]
+
+    return numpy.array(values, dtype="U"+str(width))[inverse.ravel()]
+
+
+def _numbers(chars, dtype):
+    """Converts fixed width columns of characters to numbers
+
+    """
+    (Na, width) = chars.shape
+    text = numpy.full((Na, width + 1), 32, dtype=numpy.uint8)
+    text[:,:width] = chars
+    vals = numpy.fromstring(text.tobytes().decode("latin-1"), dtype=dtype,
+                            sep=" ")
+    if len(vals) != Na:
+        raise Exception("Invalid numerical field in PDB coordinate records")
+
+    return vals
+
+
+def residue_index(atoms):
+    """Assigns atoms to residues
+
+    Residues are identified by the combination of chainId and resSeq
+    and they are numbered in the order of their first appearance.
+
+    Returns
+    -------
 
-        matched_lines = []
-        k = 0
-        for line in self.lines:
-            if line_matches(line, by_recName=by_recName,
-                            by_resName=by_resName, by_resSeq=by_resSeq,
-                            by_atmName=by_atmName):
-                matched_lines.append(line)
-                k += 1
-        #print("matched", k, "lines")
-        return matched_lines
+    names : list
+        Names of the residues (chainId + resSeq, e.g. "A371")
+
+    residues : numpy.ndarray
+        Index of the residue for each atom
+
+    """
+    chain = numpy.ascontiguousarray(atoms["chainId"]).view(numpy.uint32)
+    keys = (chain.astype(numpy.int64) << 32) + atoms["resSeq"]
+    (_, first, inverse) = numpy.unique(keys, return_index=True,
+                                       return_inverse=True)
+    perm = numpy.argsort(first)
+    rank = numpy.empty(len(perm), dtype=numpy.int64)
+    rank[perm] = numpy.arange(len(perm))
+
+    names = [atoms["chainId"][k]+str(atoms["resSeq"][k]) for k in first[perm]]
+    return names, rank[inverse.ravel()]
+
+
+def residue_atoms_xyz(data, atmNames, residues=None):
+    """Returns coordinates of given atoms in each residue
+
+    When an atom is found more than once in a residue (e.g. with
+    alternate locations), its last occurrence is taken.
+
+    Parameters
+    ----------
+
+    data : numpy.ndarray or list
+        Structured array of atom records or a list of PDB lines
+
+    atmNames : list
+        Names of the atoms
+
+    residues : numpy.ndarray
+        Index of the residue for each atom. If None, all atoms are assumed
+        to belong to one residue
+
+    Returns
+    -------
+
+    xyz : numpy.ndarray
+        Coordinates of the shape (len(atmNames), Nres, 3)
+
+    found : numpy.ndarray
+        Boolean array of the shape (len(atmNames), Nres) telling which
+        atoms were found
+
+    """
+    if not isinstance(data, numpy.ndarray):
+        data = atoms_from_lines(data)
+    if residues is None:
+        residues = numpy.zeros(len(data), dtype=numpy.int64)
+        Nres = 1
+    else:
+        Nres = numpy.max(residues) + 1 if len(residues) > 0 else 0
+
+    xyz = numpy.zeros((len(atmNames), Nres, 3), dtype=numpy.float64)
+    found = numpy.zeros((len(atmNames), Nres), dtype=bool)
+    for (k, name) in enumerate(atmNames):
+        sel = numpy.nonzero(data["atmName"] == name)[0][::-1]
+        (res, last) = numpy.unique(residues[sel], return_index=True)
+        xyz[k,res,:] = data["xyz"][sel[last]]
+        found[k,res] = True
+
+    return xyz, found
+
+
+def _atoms_mask(atoms, by_recName=None,
+                by_resName=None,
+                by_chainId=None,
+                by_resSeq=None,
+                by_atmName=None):
+    """Boolean mask of atom records matching given patterns
+
+    """
+    mask = numpy.ones(len(atoms), dtype=bool)
+    if by_recName is not None:
+        mask &= (atoms["recName"] == by_recName.strip())
+    if by_atmName is not None:
+        mask &= (atoms["atmName"] == by_atmName.strip())
+    if by_resName is not None:
+        mask &= (atoms["resName"] == by_resName)
+    if by_chainId is not None:
+        mask &= (atoms["chainId"] == by_chainId)
+    if by_resSeq is not None:
+        mask &= (atoms["resSeq"] == int(by_resSeq))
+    return mask
 
 
 def line_resSeq(line):
@@ -174,13 +458,13 @@ def line_resSeq(line):
 
     """
     return line[_resSeq_min:_resSeq_max]
-    
+
 def line_chainId(line):
     """Returns chainId of a given line
-    
+
     """
     return line[_chainId_min:_chainId_max]
-    
+
 def line_xyz(line):
     """Returns coordinates of the line
 
@@ -191,7 +475,7 @@ def line_xyz(line):
     return numpy.array([x,y,z])
 
 
-def line_matches(line, 
+def line_matches(line,
                  by_recName=None,
                  by_resName=None,
                  by_chainId=None,
@@ -233,4 +517,3 @@ def line_matches(line,
             else:
                 return False
         return ret
-
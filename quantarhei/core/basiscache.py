@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+    Cache of eigen-decompositions used for basis transformations
+
+
+    Entering the eigenbasis of an operator (e.g. with the `eigenbasis_of`
+    context manager) requires diagonalization of its matrix. In spectroscopy
+    loops the same Hamiltonian is diagonalized many times. The BasisCache
+    memoizes the eigen-decompositions by the version of the matrix, so that
+    the O(N^3) diagonalization is performed only once for every distinct
+    matrix.
+
+    Matrices can be identified in two ways. When an `owner` object (e.g.
+    a Hamiltonian) is specified, the decomposition is stored with the object
+    and it is reused as long as the matrix of the object did not change
+    (up to the numerical noise accumulated by transformations into other
+    bases and back). Without an owner, the matrix is identified by its
+    content only.
+
+    The cache is owned by the Manager and it is accessible as
+
+    >>> from quantarhei.core.managers import Manager
+    >>> cache = Manager().basis_cache
+
+
+    Class Details
+    -------------
+
+"""
+import hashlib
+import weakref
+from collections import OrderedDict
+
+import numpy
+
+
+class BasisCache:
+    """Least-recently-used cache of eigen-decompositions of matrices
+
+    Parameters
+    ----------
+
+    maxsize : int
+        Maximum number of eigen-decompositions held by the cache
+
+    rtol : float
+        Relative tolerance with which the matrix of an owner object is
+        considered unchanged
+
+
+    Examples
+    --------
+
+    >>> import numpy
+    >>> cache = BasisCache(maxsize=2)
+    >>> A = numpy.array([[0.0, 1.0], [1.0, 0.0]])
+    >>> dd, SS = cache.eigh(A)
+    >>> cache.hits, cache.misses
+    (0, 1)
+    >>> dd, SS = cache.eigh(A.copy())
+    >>> cache.hits, cache.misses
+    (1, 1)
+
+    """
+
+    def __init__(self, maxsize=16, rtol=1.0e-12):
+        self.maxsize = maxsize
+        self.rtol = rtol
+        self.enabled = True
+        self._storage = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def _key(self, data, owner):
+        """Returns a key identifying the matrix
+
+        """
+        if owner is not None:
+            return ("owner", id(owner))
+        hsh = hashlib.sha1(numpy.ascontiguousarray(data).data)
+        return (data.shape, data.dtype.str, hsh.hexdigest())
+
+
+    def _is_same(self, orig, data, owner, ref):
+        """Checks that the stored matrix corresponds to the submitted one
+
+        """
+        if orig.shape != data.shape:
+            return False
+        if owner is None:
+            # protection against hash collisions
+            return numpy.array_equal(orig, data)
+
+        # the id of a dead object could have been reused
+        if ref is None or ref() is not owner:
+            return False
+        atol = self.rtol*numpy.max(numpy.abs(orig))
+        return numpy.allclose(orig, data, rtol=0.0, atol=atol)
+
+
+    def eigh(self, data, owner=None):
+        """Returns eigenvalues and eigenvectors of a self-adjoint matrix
+
+        The result is taken from the cache if the same matrix was
+        diagonalized before. Copies of the stored arrays are returned,
+        so they can be safely modified by the caller.
+
+        Parameters
+        ----------
+
+        data : numpy.ndarray
+            Self-adjoint matrix
+
+        owner : object, optional
+            Object whose matrix is diagonalized
+
+        Returns
+        -------
+
+        dd : numpy.ndarray
+            Eigenvalues in ascending order
+
+        SS : numpy.ndarray
+            Unitary (orthogonal) matrix of eigenvectors (in columns)
+
+        """
+        if not self.enabled:
+            return numpy.linalg.eigh(data)
+
+        key = self._key(data, owner)
+        try:
+            orig, ref, dd, SS = self._storage[key]
+            if self._is_same(orig, data, owner, ref):
+                self._storage.move_to_end(key)
+                self.hits += 1
+                return dd.copy(), SS.copy()
+        except KeyError:
+            pass
+
+        self.misses += 1
+        dd, SS = numpy.linalg.eigh(data)
+
+        ref = None
+        if owner is not None:
+            try:
+                ref = weakref.ref(owner)
+            except TypeError:
+                key = self._key(data, None)
+
+        self._storage[key] = (numpy.array(data), ref, dd, SS)
+        self._storage.move_to_end(key)
+        if len(self._storage) > self.maxsize:
+            self._storage.popitem(last=False)
+
+        return dd.copy(), SS.copy()
+
+
+    def clear(self):
+        """Removes all stored eigen-decompositions
+
+        """
+        self._storage.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self):
+        return len(self._storage)
+
+
+
+def unitary_inverse(SS):
+    """Returns the inverse of a unitary (orthogonal) transformation matrix
+
+    For matrices of eigenvectors of self-adjoint operators the inverse is
+    just the conjugate transpose, and no explicit inversion is needed.
+
+    """
+    if numpy.iscomplexobj(SS):
+        return numpy.conj(SS.T)
+    return SS.T
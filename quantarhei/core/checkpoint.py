@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+    Checkpoints of long calculations
+
+
+    Long propagations (e.g. of the density matrix or of the hierarchy of
+    auxiliary density operators) and calculations of evolution
+    superoperators keep all their progress in memory. The Checkpoint class
+    allows them to save their state periodically, so that a calculation
+    which was killed can be resumed from the last checkpoint.
+
+    A checkpoint consists of two files in a specified directory. The output
+    of the calculation (e.g. the density matrix at all times) is written
+    incrementally into a `.npy` array file, and the state of the calculation
+    needed to continue (e.g. the current state of the hierarchy and the time
+    index) is stored in a `.npz` file. The state file is replaced atomically,
+    so that a checkpoint is never left incomplete. The state is stored
+    exactly, and a resumed calculation gives results which are bitwise
+    identical to those of an uninterrupted calculation.
+
+    A checkpoint is submitted to the methods which support it, e.g.
+
+    >>> import tempfile
+    >>> import quantarhei as qr
+    >>> agg = qr.TestAggregate(name="dimer-2-env")
+    >>> agg.build()
+    >>> time = agg.get_SystemBathInteraction().TimeAxis
+    >>> prop = agg.get_ReducedDensityMatrixPropagator(time,
+    ...                                          relaxation_theory="stR")
+    >>> rhoi = qr.ReducedDensityMatrix(dim=3)
+    >>> rhoi.data[2,2] = 1.0
+    >>> chk = Checkpoint(tempfile.mkdtemp(), every=100)
+    >>> rhot = prop.propagate(rhoi, checkpoint=chk)
+
+    When the same propagation is started again with a checkpoint in the same
+    directory, it continues from the last saved time step. A checkpoint
+    belonging to a different calculation is ignored and overwritten.
+
+
+    Class Details
+    -------------
+
+"""
+import os
+
+import numpy
+
+
+class Checkpoint:
+    """Periodic checkpoints of a calculation stored in a directory
+
+    Parameters
+    ----------
+
+    directory : str
+        Directory where the checkpoint files are stored. It is created
+        if it does not exist.
+
+    every : int
+        Number of time steps between two checkpoints
+
+    name : str
+        Name of the checkpoint files. Different calculations checkpointed
+        in the same directory have to use different names.
+
+    resume : bool
+        If False, existing checkpoint files are ignored and the calculation
+        starts from the beginning
+
+
+    Examples
+    --------
+
+    >>> import tempfile
+    >>> import numpy
+    >>> chk = Checkpoint(tempfile.mkdtemp(), every=2)
+    >>> out = numpy.zeros(5)
+    >>> (index, state) = chk.begin("calculation", out)
+    >>> index, state is None
+    (0, True)
+    >>> for ii in range(1, 4):
+    ...     out[ii] = ii
+    ...     chk.step(ii, 5, out, value=ii)
+
+    The calculation was interrupted after the time step 3, but the last
+    checkpoint was saved at the time step 2
+
+    >>> out = numpy.zeros(5)
+    >>> (index, state) = chk.begin("calculation", out)
+    >>> print(index, state["value"], out)
+    2 2 [ 0.  1.  2.  0.  0.]
+
+    """
+
+    def __init__(self, directory, every=100, name="checkpoint", resume=True):
+        self.directory = os.path.abspath(directory)
+        self.every = every
+        self.name = name
+        self.resume = resume
+        self.saved = 0
+        self._key = None
+        self._output = None
+        self._stored = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+
+    @property
+    def output_file(self):
+        return os.path.join(self.directory, self.name+".npy")
+
+
+    @property
+    def state_file(self):
+        return os.path.join(self.directory, self.name+".state.npz")
+
+
+    def _load_state(self, key, output):
+        """Returns the stored index and state if they belong to the key
+
+        """
+        try:
+            with numpy.load(self.state_file) as fl:
+                stored = {k: fl[k] for k in fl.files}
+        except (OSError, ValueError):
+            return None
+        if str(stored.pop("key")) != key:
+            return None
+
+        if output is not None:
+            try:
+                self._output = numpy.lib.format.open_memmap(self.output_file,
+                                                            mode="r+")
+            except (OSError, ValueError):
+                return None
+            if ((self._output.shape != output.shape)
+                or (self._output.dtype != output.dtype)):
+                self._output = None
+                return None
+
+        index = int(stored.pop("index"))
+        return (index, stored)
+
+
+    def begin(self, key, output=None):
+        """Starts or resumes the checkpointed calculation
+
+        Parameters
+        ----------
+
+        key : str
+            String identifying the calculation (usually a fingerprint of its
+            input, see quantarhei.core.diskcache.fingerprint)
+
+        output : numpy.ndarray
+            Array into which the calculation writes its output along
+            the first (time) axis. On resume, the output stored in
+            the checkpoint is copied into this array.
+
+        Returns
+        -------
+
+        index : int
+            Time index of the last saved checkpoint (0 if the calculation
+            starts from the beginning)
+
+        state : dict
+            Arrays of the state saved with the last checkpoint, or None if
+            the calculation starts from the beginning
+
+        """
+        self._key = key
+        self._output = None
+        self._stored = 0
+
+        if self.resume:
+            loaded = self._load_state(key, output)
+            if loaded is not None:
+                (index, state) = loaded
+                if output is not None:
+                    output[:index+1] = self._output[:index+1]
+                self._stored = index + 1
+                return (index, state)
+
+        # state of a previous calculation must not refer to the new output
+        if os.path.exists(self.state_file):
+            os.remove(self.state_file)
+        if output is not None:
+            self._output = numpy.lib.format.open_memmap(self.output_file,
+                                    mode="w+", dtype=output.dtype,
+                                    shape=output.shape)
+        return (0, None)
+
+
+    def is_due(self, index, length):
+        """Returns True if a checkpoint should be saved after the time step
+
+        """
+        return (index % self.every == 0) or (index == length-1)
+
+
+    def save(self, index, output=None, **state):
+        """Saves the output up to the time index and the state
+
+        Parameters
+        ----------
+
+        index : int
+            Time index of the last calculated time step
+
+        output : numpy.ndarray
+            Output of the calculation. Only the time steps which were not
+            saved before are written.
+
+        state : dict
+            Arrays needed to continue the calculation
+
+        """
+        if self._key is None:
+            raise Exception("Checkpoint has to be started by begin()")
+
+        if (output is not None) and (index+1 > self._stored):
+            self._output[self._stored:index+1] = output[self._stored:index+1]
+            self._output.flush()
+            self._stored = index + 1
+
+        tmp = self.state_file+".tmp"
+        with open(tmp, "wb") as f:
+            numpy.savez(f, key=self._key, index=index, **state)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.state_file)
+        self.saved += 1
+
+
+    def step(self, index, length, output=None, **state):
+        """Saves the checkpoint if it is due after this time step
+
+        Parameters
+        ----------
+
+        index : int
+            Time index of the last calculated time step
+
+        length : int
+            Total number of time steps of the calculation. The checkpoint
+            is always saved after the last one.
+
+        output, state :
+            See the save method
+
+        """
+        if self.is_due(index, length):
+            self.save(index, output, **state)
+
+
+    def clear(self):
+        """Removes the checkpoint files
+
+        """
+        self._output = None
+        for fname in [self.output_file, self.state_file]:
+            if os.path.exists(fname):
+                os.remove(fname)
@@ -119,7 +119,6 @@ from .. import REAL
 
 
 #FIXME Check the posibility to set a derivative of the spline at the edges
-#FIXME Enable vectorial arguments and values
 class DFunction(Saveable, DataSaveable):
     """Discrete function with interpolation
 
@@ -244,20 +243,16 @@ class DFunction(Saveable, DataSaveable):
             
             # we trim to the new axis
             ndata = numpy.zeros(axis.length, dtype=self.data.dtype)
-            for ii in range(axis.length):
-                ndata[ii] = self.at(axis.data[ii])
+            ndata[:] = self.at(axis.data)
                 
             self.__init__(x=axis, y=ndata)
                 
         elif self.axis.is_subsection_of(axis):
             # we zero pad the values
             ndata = numpy.zeros(axis.length, dtype=self.data.dtype)
-            for ii in range(axis.length):
-                x = axis.data[ii]
-                if (x >= self.axis.min) and (x <= self.axis.max):
-                    ndata[ii] = self.at(axis.data[ii])
-                else:
-                    ndata[ii] = 0.0
+            inside = (axis.data >= self.axis.min) \
+                   & (axis.data <= self.axis.max)
+            ndata[inside] = self.at(axis.data[inside])
                 
             self.__init__(x=axis, y=ndata)
         
@@ -307,31 +302,14 @@ class DFunction(Saveable, DataSaveable):
     def _get_linear_approx(self, x_in):
         """Returns linear interpolation of the function
 
+        The argument can be a number or an array of any shape. All values
+        are interpolated at once.
+
         """
-        # FIXME: we need qr.FLOAT or more flexible, here
-        try:
-            ln = len(x_in)
-        except:
-            ln = 0
-        
-        if ln > 0:
-                
-            val = numpy.zeros(len(x_in), dtype=self.data.dtype)
-            k_i = 0
-            for x in x_in:
-#                n,dval = self.axis.locate(x)
-#                if n+1 >= self.axis.length:
-#                    val[k_i] = self.data[n] \
-#                    + dval/self.axis.step*(self.data[n]-self.data[n-1])
-#                else:
-#                    val[k_i] = self.data[n] \
-#                    + dval/self.axis.step*(self.data[n+1]-self.data[n])
-                val[k_i] = self._approx_point(x)
-                k_i += 1
-        else:
-            val = self._approx_point(x_in)
-            
-        return val
+        if numpy.ndim(x_in) == 0:
+            return self._approx_point(x_in)
+
+        return _linear_approx(self.axis, self.data, numpy.asarray(x_in))
 
 
     def _approx_point(self, x):
@@ -357,15 +335,20 @@ class DFunction(Saveable, DataSaveable):
     def _set_splines(self):
         """Calculates the spline representation of the function
 
+        Real and imaginary parts of the function are interpolated by
+        a single complex cubic spline (with the same knots as an
+        interpolating `UnivariateSpline`). Splines of the real and imaginary
+        parts share its coefficients.
 
         """
-        self._spline_r = \
-               scipy.interpolate.UnivariateSpline(
-                  self.axis.data, numpy.real(self.data),s=0)
+        self._spline = scipy.interpolate.make_interp_spline(self.axis.data,
+                                                            self.data, k=3)
         if self._has_imag:
-            self._spline_i = \
-               scipy.interpolate.UnivariateSpline(
-                  self.axis.data, numpy.imag(self.data),s=0)
+            (t, c, k) = self._spline.tck
+            self._spline_r = scipy.interpolate.BSpline(t, numpy.real(c), k)
+            self._spline_i = scipy.interpolate.BSpline(t, numpy.imag(c), k)
+        else:
+            self._spline_r = self._spline
 
         self._splines_initialized = True
         #print("Calculating splines")
@@ -374,10 +357,9 @@ class DFunction(Saveable, DataSaveable):
         """Returns the splie interpolated value of the function
 
         """
-        if self._has_imag:
-            ret = self._spline_r(x) + 1j*self._spline_i(x)
-        else:
-            ret = self._spline_r(x)
+        ret = self._spline(x)
+        if numpy.ndim(x) == 0:
+            return ret[()]
         return ret
 
     def __add__(self, other):
@@ -903,3 +885,74 @@ def _n_gaussians(x, *params):
     else:
         raise Exception("Inconsistend number of parameters")        
 
+
+def _linear_approx(axis, data, x):
+    """Linear interpolation of data on a ValueAxis at an array of points
+    
+    The same as DFunction._approx_point, but for all points at once. 
+    `data` can have leading dimensions (several functions on the same axis),
+    the last dimension has to correspond to the axis.
+    
+    """
+    nsni = numpy.floor((x - axis.start)/axis.step).astype(int)
+    if numpy.any(nsni < 0) or numpy.any(nsni >= axis.length):
+        raise Exception("Value out of bounds")
+    
+    dval = x - axis.data[nsni]
+    # at the last point, the previous interval is extrapolated
+    n0 = numpy.where(nsni+1 >= axis.length, nsni-1, nsni)
+    
+    return data[..., nsni] \
+         + dval/axis.step*(data[..., n0+1] - data[..., n0])
+
+
+def at_many(functions, x, approx="default"):
+    """Values of many DFunctions at the same arguments
+
+    Parameters
+    ----------
+
+    functions : list of DFunction
+        Functions to evaluate
+
+    x : array like
+        Arguments of the functions
+
+    approx : string {"default","linear","spline"}
+        Type of interpolation. With "default", the default interpolation
+        of each function is used.
+
+    Returns
+    -------
+
+    numpy.ndarray of the shape (len(functions),) + numpy.shape(x)
+
+    Functions interpolated linearly and defined on the same axis are 
+    evaluated together in a single pass.
+
+    """
+    if approx not in DFunction.allowed_interp_types:
+        raise Exception("Unknown interpolation type")
+    
+    x = numpy.asarray(x)
+    functions = list(functions)
+    if len(functions) == 0:
+        return numpy.zeros((0,)+x.shape)
+    
+    def is_linear(fce):
+        if approx == "default":
+            return not fce._splines_initialized
+        return approx == "linear"
+
+    linear = all(is_linear(fce) for fce in functions)
+    axis = functions[0].axis
+    same_axis = all((fce.axis.start == axis.start) 
+                    and (fce.axis.step == axis.step)
+                    and (fce.axis.length == axis.length)
+                    for fce in functions)
+
+    if linear and same_axis:
+        data = numpy.array([fce.data for fce in functions])
+        return _linear_approx(axis, data, x)
+    
+    return numpy.array([fce.at(x, approx=approx) for fce in functions])
@@ -0,0 +1,408 @@
+# -*- coding: utf-8 -*-
+"""
+    Persistent cache of expensive results
+
+
+    Relaxation tensors, rate matrices and evolution superoperators are
+    expensive to calculate, and scripts which scan parameters often
+    recalculate exactly the same objects on every run. The DiskCache stores
+    such results on disk under a key which is a stable hash (fingerprint)
+    of everything the result depends on, i.e. the Hamiltonian, the
+    system-bath interaction with its correlation functions, the time axis
+    and the options of the theory. The fingerprint depends only on the
+    content of the objects, so that it is the same in different runs of
+    the same script.
+
+    The results are pickled with `dill`. Large numpy arrays are stored
+    separately and they are memory-mapped when a result is loaded from the
+    cache. Their data are therefore read from disk only when they are used.
+    The memory-mapping is copy-on-write, i.e. modifications of the loaded
+    arrays never change the cache. The total size of the cache is bounded;
+    the least recently used entries are removed when the limit is reached.
+
+    The cache is switched off by default. It is switched on by the Manager
+
+    >>> import tempfile
+    >>> from quantarhei.core.managers import Manager
+    >>> cdir = tempfile.mkdtemp()
+    >>> cache = Manager().set_disk_cache(cdir, maxsize=2**28)
+
+    Afterwards, the cache is used by the methods which accept the argument
+    `recalculate`, when it is set to False, e.g.
+
+    >>> import quantarhei as qr
+    >>> agg = qr.TestAggregate(name="dimer-2-env")
+    >>> agg.build()
+    >>> time = agg.get_SystemBathInteraction().TimeAxis
+    >>> RR, HH = agg.get_RelaxationTensor(time, relaxation_theory="stR",
+    ...                                   recalculate=False)
+    >>> RR, HH = agg.get_RelaxationTensor(time, relaxation_theory="stR",
+    ...                                   recalculate=False)
+    >>> cache.hits, cache.misses
+    (1, 1)
+
+    >>> Manager().unset_disk_cache()
+
+
+    Class Details
+    -------------
+
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import types
+
+import numpy
+import dill
+
+from .managers import Manager
+from .managers import BasisManaged
+
+
+def fingerprint(*objects):
+    """Returns a stable hash of the content of the submitted objects
+
+    Numbers, strings, numpy arrays, lists, tuples and dictionaries are
+    hashed by their content. Other objects are hashed by their class and
+    by their public attributes. Private attributes (starting with an
+    underscore) usually hold data derived from the public ones and they
+    are ignored, with the exception of the basis managed data of operators,
+    which are hashed in the current basis. A class can exclude further
+    attributes by listing their names in its `_fingerprint_excluded`
+    attribute.
+
+    Parameters
+    ----------
+
+    objects : tuple
+        Objects on which a result depends
+
+    Returns
+    -------
+
+    str
+        Hexadecimal SHA-256 digest of the objects and of the version
+        of Quantarhei
+
+
+    Examples
+    --------
+
+    >>> import numpy
+    >>> a = fingerprint("Redfield", numpy.ones(3), dict(secular=True))
+    >>> b = fingerprint("Redfield", numpy.ones(3), dict(secular=True))
+    >>> c = fingerprint("Redfield", numpy.ones(3), dict(secular=False))
+    >>> a == b, a == c
+    (True, False)
+
+    """
+    hsh = hashlib.sha256()
+    hsh.update(Manager().version.encode())
+    path = set()
+    for obj in objects:
+        _update(hsh, obj, path)
+    return hsh.hexdigest()
+
+
+def _update(hsh, obj, path):
+    """Feeds the content of an object into the hash
+
+    """
+    if obj is None or isinstance(obj, (bool, int, float, complex, str, bytes,
+                                       numpy.generic)):
+        hsh.update(repr((type(obj).__name__, obj)).encode())
+
+    elif isinstance(obj, numpy.ndarray):
+        hsh.update(repr(("ndarray", obj.dtype.str, obj.shape)).encode())
+        if obj.dtype.hasobject:
+            for val in obj.flat:
+                _update(hsh, val, path)
+        else:
+            hsh.update(numpy.ascontiguousarray(obj).data)
+
+    elif isinstance(obj, (list, tuple)):
+        hsh.update(repr((type(obj).__name__, len(obj))).encode())
+        for val in obj:
+            _update(hsh, val, path)
+
+    elif isinstance(obj, dict):
+        hsh.update(repr(("dict", len(obj))).encode())
+        for key in sorted(obj, key=repr):
+            _update(hsh, key, path)
+            _update(hsh, obj[key], path)
+
+    elif isinstance(obj, (types.FunctionType, types.BuiltinFunctionType,
+                          type)):
+        hsh.update(repr((obj.__module__, obj.__qualname__)).encode())
+
+    else:
+        # protection against reference cycles
+        if id(obj) in path:
+            hsh.update(b"<cycle>")
+            return
+        path.add(id(obj))
+
+        cls = type(obj)
+        hsh.update((cls.__module__+"."+cls.__qualname__).encode())
+        attrs = getattr(obj, "__dict__", {})
+        if isinstance(obj, BasisManaged) and ("_data" in attrs):
+            _update(hsh, obj.data, path)
+
+        excluded = getattr(obj, "_fingerprint_excluded", ())
+        for name in sorted(attrs):
+            if name.startswith("_") or (name in excluded):
+                continue
+            hsh.update(name.encode())
+            _update(hsh, attrs[name], path)
+
+        path.discard(id(obj))
+
+
+class _Pickler(dill.Pickler):
+    """Pickler storing large arrays and context objects outside the pickle
+
+    """
+
+    def __init__(self, file, entry, context, threshold):
+        super().__init__(file)
+        self._entry = entry
+        self._context = context
+        self._threshold = threshold
+        self._narrays = 0
+
+
+    def persistent_id(self, obj):
+
+        for (k, ctx) in enumerate(self._context):
+            if obj is ctx:
+                return ("context", k)
+
+        if (isinstance(obj, numpy.ndarray) and (not obj.dtype.hasobject)
+            and (obj.nbytes >= self._threshold)):
+            fname = "array_"+str(self._narrays)+".npy"
+            numpy.save(os.path.join(self._entry, fname),
+                       numpy.ascontiguousarray(obj))
+            self._narrays += 1
+            return ("array", fname)
+
+        return None
+
+
+class _Unpickler(dill.Unpickler):
+    """Unpickler memory-mapping the separately stored arrays
+
+    """
+
+    def __init__(self, file, entry, context):
+        super().__init__(file)
+        self._entry = entry
+        self._context = context
+
+
+    def persistent_load(self, pid):
+
+        (kind, val) = pid
+        if kind == "context":
+            return self._context[val]
+        elif kind == "array":
+            return numpy.load(os.path.join(self._entry, val), mmap_mode="c")
+
+        raise Exception("Unknown persistent object in the cache")
+
+
+class DiskCache:
+    """Least-recently-used cache of pickled results stored on disk
+
+    Every entry is a directory named by the key of the entry. It contains
+    a `dill` pickle of the value and `.npy` files of its large arrays.
+    Entries are written into a temporary directory first and renamed
+    afterwards, so that an interrupted run never leaves an incomplete
+    entry behind.
+
+    Parameters
+    ----------
+
+    directory : str
+        Directory where the cache is stored. It is created if it does
+        not exist.
+
+    maxsize : int
+        Maximum size of the cache in bytes. The least recently used
+        entries are removed when the size is exceeded. The most recently
+        stored entry is always kept.
+
+    mmap_threshold : int
+        Arrays with at least this number of bytes are stored in separate
+        files and memory-mapped on load
+
+
+    Examples
+    --------
+
+    >>> import tempfile
+    >>> import numpy
+    >>> cache = DiskCache(tempfile.mkdtemp(), maxsize=2**20)
+    >>> key = fingerprint("example", 1)
+    >>> cache.get(key) is None
+    True
+    >>> cache.put(key, dict(rates=numpy.ones(3)))
+    >>> value = cache.get(key)
+    >>> print(value["rates"].sum())
+    3.0
+    >>> cache.hits, cache.misses
+    (1, 1)
+
+    """
+
+    _value_file = "value.pkl"
+
+    def __init__(self, directory, maxsize=2**30, mmap_threshold=2**20):
+        self.directory = os.path.abspath(directory)
+        self.maxsize = maxsize
+        self.mmap_threshold = mmap_threshold
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key)
+
+
+    def get(self, key, context=()):
+        """Returns the value stored under the key or None
+
+        Parameters
+        ----------
+
+        key : str
+            Key of the entry, usually obtained from the `fingerprint`
+            function
+
+        context : tuple
+            Live objects which were referenced by the value when it was
+            stored. The loaded value references these objects instead
+            of their copies. They have to be submitted in the same order
+            as to the `put` method.
+
+        """
+        entry = self._entry(key)
+        fname = os.path.join(entry, self._value_file)
+        try:
+            with open(fname, "rb") as f:
+                value = _Unpickler(f, entry, context).load()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception:
+            # damaged (or outdated) entry is removed
+            shutil.rmtree(entry, ignore_errors=True)
+            self.misses += 1
+            return None
+
+        # mark the entry as recently used
+        os.utime(entry)
+        self.hits += 1
+        return value
+
+
+    def put(self, key, value, context=()):
+        """Stores a value under the key
+
+        Parameters
+        ----------
+
+        key : str
+            Key of the entry, usually obtained from the `fingerprint`
+            function
+
+        value : object
+            Any object which can be pickled by `dill`
+
+        context : tuple
+            Live objects referenced by the value which are not to be
+            stored in the cache (see the `get` method)
+
+        """
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+        try:
+            with open(os.path.join(tmp, self._value_file), "wb") as f:
+                _Pickler(f, tmp, context, self.mmap_threshold).dump(value)
+
+            entry = self._entry(key)
+            if os.path.isdir(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            os.rename(tmp, entry)
+        finally:
+            if os.path.isdir(tmp):
+                shutil.rmtree(tmp, ignore_errors=True)
+
+        self.evict(keep=key)
+
+
+    def _entries(self):
+        """Returns (last use, size, key) of all entries
+
+        """
+        out = []
+        for key in os.listdir(self.directory):
+            if key.startswith("."):
+                continue
+            entry = self._entry(key)
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, fl))
+                           for fl in os.listdir(entry))
+                out.append((os.path.getmtime(entry), size, key))
+            except OSError:
+                # entry removed concurrently
+                pass
+        return out
+
+
+    def size(self):
+        """Returns the total size of the cached entries in bytes
+
+        """
+        return sum(sz for (tm, sz, key) in self._entries())
+
+
+    def evict(self, keep=None):
+        """Removes the least recently used entries exceeding the size limit
+
+        Parameters
+        ----------
+
+        keep : str
+            Key of an entry which is never removed
+
+        """
+        entries = sorted(self._entries())
+        total = sum(sz for (tm, sz, key) in entries)
+        for (tm, sz, key) in entries:
+            if total <= self.maxsize:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= sz
+
+
+    def clear(self):
+        """Removes all entries of the cache
+
+        """
+        for key in os.listdir(self.directory):
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+        self.hits = 0
+        self.misses = 0
+
+
+    def __contains__(self, key):
+        return os.path.isfile(os.path.join(self._entry(key),
+                                           self._value_file))
+
+
+    def __len__(self):
+        return len(self._entries())
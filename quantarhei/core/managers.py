@@ -71,6 +71,8 @@ from .units import conversion_facs_energy
 from .units import conversion_facs_length
 
 from .singleton import Singleton
+from .basiscache import BasisCache
+from .basiscache import unitary_inverse
 
 from .numconf import NumConf
 from .logconf import LogConf
@@ -259,8 +261,16 @@ class Manager(metaclass=Singleton):
         self.basis_stack.append(0)
         self.basis_transformations = []
         self.basis_transformations.append(1)
+        self.basis_inverse_transformations = []
+        self.basis_inverse_transformations.append(1)
         self.basis_registered = {}
         
+        # cache of eigen-decompositions of basis defining operators
+        self.basis_cache = BasisCache()
+
+        # persistent cache of expensive results (off by default)
+        self.disk_cache = None
+        
         self.warn_about_basis_change = False
         self.warn_about_basis_changing_objects = False
         
@@ -718,7 +728,43 @@ class Manager(metaclass=Singleton):
     
     def commit_implementation(self,imp_point,prefix,asint=None):
         pass
-    
+
+    def set_disk_cache(self, directory, maxsize=2**30, mmap_threshold=2**20):
+        """Switches on the persistent cache of expensive results
+
+        Parameters
+        ----------
+
+        directory : str
+            Directory where the cache is stored
+
+        maxsize : int
+            Maximum size of the cache in bytes
+
+        mmap_threshold : int
+            Arrays with at least this number of bytes are memory-mapped
+            when loaded from the cache
+
+        Returns
+        -------
+
+        DiskCache
+            The cache used from now on
+
+        """
+        from .diskcache import DiskCache
+        self.disk_cache = DiskCache(directory, maxsize=maxsize,
+                                    mmap_threshold=mmap_threshold)
+        return self.disk_cache
+
+    def unset_disk_cache(self):
+        """Switches off the persistent cache of expensive results
+
+        The stored results remain on disk.
+
+        """
+        self.disk_cache = None
+
     def get_current_basis(self):
         """Returns the current basis id
         
@@ -726,10 +772,26 @@ class Manager(metaclass=Singleton):
         l = len(self.basis_stack)
         return self.basis_stack[l-1]
         
-    def set_new_basis(self,SS):
+    def set_new_basis(self, SS, inv=None):
+        """Puts a new basis on the stack
+        
+        Parameters
+        ----------
+        
+        SS : numpy.ndarray
+            Transformation matrix from the current basis to the new one
+            
+        inv : numpy.ndarray, optional
+            Inverse of the transformation matrix. If not specified, it is
+            calculated by explicit inversion.
+            
+        """
+        if inv is None:
+            inv = numpy.linalg.inv(SS)
         nb = self.get_current_basis() + 1
         self.basis_stack.append(nb)
         self.basis_transformations.append(SS)
+        self.basis_inverse_transformations.append(inv)
         self.basis_registered[nb] = []
         return nb
         
@@ -758,6 +820,7 @@ class Manager(metaclass=Singleton):
         if ob != cb:
                             
             SS = numpy.diag(numpy.ones(operator.dim))
+            S1 = numpy.diag(numpy.ones(operator.dim))
             # find out if current basis of the object is in the stack (i.e. it 
             # was used sometime in the past)
             if ob in self.basis_stack:
@@ -767,16 +830,19 @@ class Manager(metaclass=Singleton):
 
                     # take the basis transformation to the earlier used basis
                     ZZ = self.basis_transformations[sl-k]
+                    Z1 = self.basis_inverse_transformations[sl-k]
 
                     # included it into the transformation matrix
-                    SS = numpy.dot(ZZ,SS)                
+                    # (and its inverse)
+                    SS = numpy.dot(ZZ,SS)
+                    S1 = numpy.dot(S1,Z1)
                     # if the basis is found, break away from the loop
                     if self.basis_stack[sl-k-1] == ob:
                         break
             else:
                 raise Exception("Basis of the object is not on stack.")
             
-            operator.transform(SS)
+            operator.transform(SS, inv=S1)
             operator.set_current_basis(cb)
             self.register_with_basis(cb,operator)
         
@@ -888,6 +954,9 @@ class BasisManaged(Managed):
     """
     _current_basis = Manager().get_current_basis()
     is_basis_protected = False
+
+    # the protection is temporary, it does not change the object
+    _fingerprint_excluded = ("is_basis_protected",)
     
     def get_current_basis(self):
         return self._current_basis
@@ -1025,7 +1094,9 @@ class eigenbasis_of(basis_context_manager):
         
         #SS = self.op.diagonalize()
         SS = self.op.get_diagonalization_matrix()
-        self.manager.set_new_basis(SS)
+        # eigenvectors of a self-adjoint operator form a unitary matrix,
+        # its inverse is just the conjugate transpose
+        self.manager.set_new_basis(SS, inv=unitary_inverse(SS))
 
         #self.manager.register_with_basis(nb,self.op)
         #self.op.set_current_basis(nb)
@@ -1044,13 +1115,12 @@ class eigenbasis_of(basis_context_manager):
         bb = self.manager.basis_stack.pop()
         # this is the transformation we got here with
         SS = self.manager.basis_transformations.pop()
+        # inverse of the transformation matrix
+        S1 = self.manager.basis_inverse_transformations.pop()
         # This is the new basis
         bss = len(self.manager.basis_stack)
         nb = self.manager.basis_stack[bss-1]
         
-        # inverse of the transformation matrix
-        S1 = numpy.linalg.inv(SS)     
-        
         # transform all registered objects
         operators = self.manager.basis_registered[bb]
         
@@ -7,6 +7,8 @@ import sys
 import numpy
 
 from .. import COMPLEX
+from ..utils.timing import profiler
+from ..utils.timing import profiled
 
 
 def call_finish():
@@ -132,6 +134,7 @@ class DistributedConfiguration:
                 print(txt)
             
                 
+    @profiled()
     def reduce(self, A, operation="sum"):
         """ Performs a reduction operation on an array
         
@@ -155,6 +158,7 @@ class DistributedConfiguration:
             raise Exception("Unknown reduction operation")
             
             
+    @profiled()
     def allreduce(self, A, operation="sum"):
         """ Performs a reduction operation on an array
         
@@ -178,6 +182,7 @@ class DistributedConfiguration:
         else:
             raise Exception("Unknown reduction operation")      
             
+    @profiled()
     def bcast(self, value, root=0):
         #if self.parallel_level != 1:
         #    return value
@@ -194,6 +199,7 @@ def start_parallel_region():
     """
     from .managers import Manager
     dc = Manager().get_DistributedConfiguration()
+    profiler.enter("parallel region")
     #dc.start_parallel_region()
     if dc.rank != 0:
         Manager().log_conf.verbosity -= 2
@@ -209,6 +215,7 @@ def close_parallel_region():
     """     
     from .managers import Manager
     dc = Manager().get_DistributedConfiguration()
+    profiler.exit("parallel region")
     #dc.finish_parallel_region()
     if dc.rank != 0:
         Manager().log_conf.verbosity += 2
@@ -348,6 +355,7 @@ def block_distributed_array(array, return_index=False):
             return array
 
 
+@profiled()
 def collect_block_distributed_data(containers, setter_function,
                                   retriever_function, tags=None):
     """Collects distributed data into a container container on rank 0 nod
@@ -1,10 +1,10 @@
 # -*- coding: utf-8 -*-
+import numpy
 
 from ..core.units import cm2int
 from ..core.managers import EnergyUnitsManaged
 from .molecularmodel import MolecularModel
 from ..builders import pdb
-from ..utils.vectors import normalize2
 
 class BacterioChlorophyll(MolecularModel, EnergyUnitsManaged):
     
@@ -30,70 +30,60 @@ class BacterioChlorophyll(MolecularModel, EnergyUnitsManaged):
         
        
     
-    def transition_dipole(self, transition=(0,1), data_type=None, data=None):
+    def transition_dipole(self, transition=(0,1), data_type=None, data=None,
+                          residues=None):
         """ Returns transition dipole moment vector
         
+        With data_type="PDB", `data` is either a list of PDB lines
+        of one molecule or a structured array of atom records
+        (see quantarhei.builders.pdb). If `residues` (index of the molecule
+        for each atom record) is specified, dipoles of all molecules are 
+        returned as an array of the shape (Nmol, 3).
+        
         """
         
         data_type = self._check_data_type(data_type)
         
         if data_type == "PDB":
-            k1 = 0
-            k2 = 0
-            for line in data:
-                if pdb.line_matches(line, by_atmName="ND"):
-                    xyz1 = pdb.line_xyz(line)
-                    k1 += 1
-                if pdb.line_matches(line, by_atmName="NB"):
-                    xyz2 = pdb.line_xyz(line)
-                    k2 += 1
+            xyz, found = pdb.residue_atoms_xyz(data, ["ND", "NB"], residues)
             # FIXME: what to do with alternate locations???
-            if (k1 >= 1) and (k2 >= 1):
-                d = xyz1 - xyz2
-                d = normalize2(d, norm=self.default_dipole_lengths[0,1])
+            if numpy.all(found):
+                d = xyz[0] - xyz[1]
+                d = self.default_dipole_lengths[0,1]*d \
+                   /numpy.sqrt(numpy.sum(d**2, axis=1))[:,None]
             else:
-                #print(k1,k2)
                 raise Exception("No unique direction of"
                                 +" a molecule's dipole found")
         else:
             raise Exception("Unknown data type")
 
+        if residues is None:
+            return d[0]
         return d   
                                 
         
-    def position_of_center(self, data_type=None, data=None):
+    def position_of_center(self, data_type=None, data=None, residues=None):
         """ Returns the position of the molecular center 
         
+        Data are specified in the same way as for the `transition_dipole`
+        method.
+        
         """
         
         data_type = self._check_data_type(data_type)
         
         if data_type == "PDB":
-            k1 = 0
-            k2 = 0
-            k3 = 0
-            k4 = 0
-            for line in data:
-                if pdb.line_matches(line, by_atmName="NA"):
-                    xyz1 = pdb.line_xyz(line)
-                    k1 += 1
-                if pdb.line_matches(line, by_atmName="NB"):
-                    xyz2 = pdb.line_xyz(line)
-                    k2 += 1
-                if pdb.line_matches(line, by_atmName="NC"):
-                    xyz3 = pdb.line_xyz(line)
-                    k3 += 1
-                if pdb.line_matches(line, by_atmName="ND"):
-                    xyz4 = pdb.line_xyz(line)
-                    k4 += 1
-            if (k1 >= 1) and (k2 >= 1) and (k3 >= 1) and (k4 >= 1):
-                pos = (xyz1 + xyz2 + xyz3 + xyz4)/4.0
+            xyz, found = pdb.residue_atoms_xyz(data, ["NA", "NB", "NC", "ND"],
+                                               residues)
+            if numpy.all(found):
+                pos = (xyz[0] + xyz[1] + xyz[2] + xyz[3])/4.0
             else:
-                #print(k1, k2, k3, k4)
                 raise Exception("No unique possition of a molecule found")
         else:
             raise Exception("Unknown data type")
 
+        if residues is None:
+            return pos[0]
         return pos   
         
         
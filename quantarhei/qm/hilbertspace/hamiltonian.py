@@ -148,7 +148,7 @@ class Hamiltonian(SelfAdjointOperator, BasisManaged, EnergyUnitsManaged):
         else:
             self.remove_cutoff_coupling(coupling_cutoff)
             # diagonalize the strong coupling part
-            dd,SS = numpy.linalg.eigh(self.data)
+            dd,SS = self.manager.basis_cache.eigh(self.data, owner=self)
             self.data = numpy.zeros(self.data.shape,dtype=numpy.float64)
             for ii in range(0,self.data.shape[0]):
                 self.data[ii,ii] = dd[ii]
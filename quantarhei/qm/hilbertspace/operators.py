@@ -169,14 +169,14 @@ class SelfAdjointOperator(Operator):
         
     def diagonalize(self):
         # first use is of "data", the rest of "_data"
-        dd,SS = numpy.linalg.eigh(self.data)
+        dd,SS = self.manager.basis_cache.eigh(self.data, owner=self)
         self._data = numpy.zeros(self._data.shape)
         for ii in range(self._data.shape[0]):
             self._data[ii,ii] = dd[ii]
         return SS
         
     def get_diagonalization_matrix(self):
-        dd, SS = numpy.linalg.eigh(self._data)
+        dd, SS = self.manager.basis_cache.eigh(self._data, owner=self)
         return SS        
     
     def __str__(self):
@@ -200,6 +200,9 @@ from ...core.saveable import Saveable
 from .superoperator import SuperOperator
 from ...core.time import TimeDependent
 from ... import COMPLEX
+from ...core.basiscache import unitary_inverse
+from ...core.diskcache import fingerprint
+from ...utils.timing import profiled
 import matplotlib.pyplot as plt
 
 import quantarhei as qr
@@ -368,7 +371,9 @@ class EvolutionSuperOperator(SuperOperator, TimeDependent, Saveable):
         
         
 
-    def calculate(self, show_progress=False):
+    @profiled()
+    def calculate(self, show_progress=False, recalculate=True,
+                  checkpoint=None):
         """Calculates the data of the evolution superoperator
         
         
@@ -378,14 +383,60 @@ class EvolutionSuperOperator(SuperOperator, TimeDependent, Saveable):
         show_progress : bool
             When set True, reports on its progress and elapsed time
         
+        recalculate : bool
+            If set False and the disk cache is switched on
+            (see Manager.set_disk_cache), the data are loaded from the cache
+            when they were calculated before with the same Hamiltonian,
+            relaxation tensor, pure dephasing and time axes. Calculated
+            data are always stored in the cache when it is on.
+        
+        checkpoint : Checkpoint
+            If specified, the calculated time steps are saved periodically
+            and the calculation resumes from the last saved time step of
+            the same calculation (see quantarhei.core.checkpoint)
         
         """
         if self.mode != "all":
             raise Exception("This method (calculate()) can be used only"+
                             " with mode='all'")
+
+        cache = self.manager.disk_cache
+        if cache is None:
+            self._calculate(show_progress, checkpoint)
+            return
+
+        key = self._fingerprint()
+        if not recalculate:
+            data = cache.get(key)
+            if data is not None:
+                self.data = data
+                return
+
+        self._calculate(show_progress, checkpoint)
+        cache.put(key, self.data)
+
+
+    def _fingerprint(self, *options):
+        """Returns a fingerprint of the input of the calculation
+
+        """
+        return fingerprint("EvolutionSuperOperator", self.time,
+                           self.dense_time, self.ham, self.relt, self.pdeph,
+                           *options)
+
+
+    def _calculate(self, show_progress=False, checkpoint=None):
+        """Calculates the data of the evolution superoperator
+
+        """
         Nt = self.time.length
         
         self._initialize_data()
+        
+        start = 1
+        if checkpoint is not None:
+            (index, state) = checkpoint.begin(self._fingerprint(), self.data)
+            start = index + 1
             
         if show_progress:
             print("Calculating evolution superoperator ")
@@ -400,7 +451,7 @@ class EvolutionSuperOperator(SuperOperator, TimeDependent, Saveable):
             #
             # We calculate every interval completely
             #
-            for ti in range(1, Nt):
+            for ti in range(start, Nt):
                 
                 t0 = self.time.data[ti-1] # initial time of the propagation
 
@@ -411,26 +462,34 @@ class EvolutionSuperOperator(SuperOperator, TimeDependent, Saveable):
                     
                 if show_progress:
                     print("propagation: ", ti, "of", Nt)            
+                    
+                if checkpoint is not None:
+                    checkpoint.step(ti, Nt, self.data)
                 
         else:
             
             #
             # We calculate the first step of the first interval
             #
-            t0 = 0.0
+            if start == 1:
+                t0 = 0.0
 
-            self.data[1,:,:,:,:] = self._one_step_with_dense_TimeIndep(t0,
+                self.data[1,:,:,:,:] = self._one_step_with_dense_TimeIndep(t0,
                                                     self.dense_time.length,
                                                     self.dense_time.step,
                                                     Nt,
                                                     show_progress) 
-            
+                if checkpoint is not None:
+                    checkpoint.step(1, Nt, self.data)
+                start = 2
             
             #
             # repeat propagation over the longer interval
             #
             self._calculate_remainig_using_first_interval(Nt,
-                                                          show_progress)
+                                                          show_progress,
+                                                          start=start,
+                                                          checkpoint=checkpoint)
 
         if show_progress:
             print("...done")
@@ -440,6 +499,10 @@ class EvolutionSuperOperator(SuperOperator, TimeDependent, Saveable):
         """Single elemental step of propagation with the dense time step
         
         """
+        if (self.relt is not None) and self.relt.secular_compact \
+           and (self.pdeph is None):
+            return self._elemental_step_secular()
+        
         dim = self.ham.dim        
         one_step_time = TimeAxis(t0, 2, self.dense_time.step)
         prop = ReducedDensityMatrixPropagator(one_step_time, self.ham, 
@@ -459,6 +522,46 @@ class EvolutionSuperOperator(SuperOperator, TimeDependent, Saveable):
         return Ut1
 
 
+    def _elemental_step_secular(self, L=4):
+        """Single elemental step with compact secular relaxation tensor
+        
+        All elementary density matrices |n><m| are propagated at once
+        in the basis in which the relaxation tensor was secularized. 
+        The same short exponential expansion as in the propagator is used.
+        
+        """
+        dim = self.ham.dim
+        RT = self.relt
+        dt = self.dense_time.step
+        
+        if self.ham.has_rwa:
+            HH = self.ham.get_RWA_data()
+        else:
+            HH = self.ham.data
+            
+        # rho2[n,m,:,:] = |n><m|
+        rho2 = numpy.eye(dim**2, dtype=COMPLEX).reshape(dim, dim, dim, dim)
+        
+        SS = RT.get_secular_transformation()
+        if SS is not None:
+            S1 = unitary_inverse(SS)
+            HH = numpy.dot(S1, numpy.dot(HH, SS))
+            rho2 = numpy.matmul(S1, numpy.matmul(rho2, SS))
+        rho1 = rho2
+        
+        indxR = 1 if RT.secular_time_dependent else None
+        for ll in range(1, L+1):
+            rho1 = - (1j*dt/ll)*(numpy.matmul(HH, rho1) 
+                                 - numpy.matmul(rho1, HH)) \
+                   + (dt/ll)*RT._apply(rho1, indxR)
+            rho2 = rho2 + rho1
+            
+        if SS is not None:
+            rho2 = numpy.matmul(SS, numpy.matmul(rho2, S1))
+            
+        return numpy.transpose(rho2, (2, 3, 0, 1))
+
+
     def _elemental_step_TimeDependent(self, t0):
         """Single step of propagation with the dense time step 
         
@@ -505,23 +608,41 @@ class EvolutionSuperOperator(SuperOperator, TimeDependent, Saveable):
 
         
     def _calculate_remainig_using_first_interval(self, Nt,
-                                                 show_progress=False):
+                                                 show_progress=False,
+                                                 start=2, checkpoint=None):
         """Calculate the rest of the superoperator with known first interval
         
         
         """
         Udt = self.data[1,:,:,:,:]
         
-        for ti in range(2, Nt):
+        for ti in range(start, Nt):
             if show_progress:
                 print("Self propagation: ", ti, "of", Nt)            
             self.data[ti,:,:,:,:] = \
                 numpy.tensordot(Udt, self.data[ti-1,:,:,:,:])        
+            if checkpoint is not None:
+                checkpoint.step(ti, Nt, self.data)
 
 
-    def calculate_next(self, save=False):
+    @profiled()
+    def calculate_next(self, save=False, checkpoint=None):
         """Calculates one point of data of the superopetor
         
+        Parameters
+        ----------
+        
+        save : bool
+            If True, all calculated time steps are stored
+            
+        checkpoint : Checkpoint
+            If specified, the state of the calculation is saved periodically.
+            When the first point is requested (the attribute `now` is 0),
+            the calculation resumes from the last saved state of the same
+            calculation. Calculations which are resumed should therefore
+            be driven by the value of `now`, e.g. 
+            `while eSO.now < Nt-1: eSO.calculate_next(checkpoint=chk)`.
+        
         """
         
         if self.mode != "jit":
@@ -529,6 +650,9 @@ class EvolutionSuperOperator(SuperOperator, TimeDependent, Saveable):
                             " with mode='jit'")
             
         Nt = self.time.length
+        
+        if (checkpoint is not None) and (self.now == 0):
+            self._resume_next(checkpoint, save)
 
         if (self.pdeph is not None) and (self.pdeph.dtype == "Gaussian"):
 
@@ -599,6 +723,40 @@ class EvolutionSuperOperator(SuperOperator, TimeDependent, Saveable):
                 
                 self.now += 1
 
+        if checkpoint is not None:
+            self._checkpoint_next(checkpoint, save)
+
+
+    def _resume_next(self, checkpoint, save):
+        """Restores the state of a calculation in the "jit" mode
+
+        """
+        self._initialize_data(save=save)
+        output = self.data if save else None
+        (index, state) = checkpoint.begin(self._fingerprint("jit", save),
+                                          output)
+        if state is not None:
+            self.now = index
+            if not save:
+                self.data[:,:,:,:] = state["data"]
+            if "Udt" in state:
+                self.Udt = state["Udt"]
+
+
+    def _checkpoint_next(self, checkpoint, save):
+        """Saves the state of a calculation in the "jit" mode if it is due
+
+        """
+        state = dict()
+        if not save:
+            state["data"] = self.data
+        if hasattr(self, "Udt"):
+            state["Udt"] = self.Udt
+        if save:
+            checkpoint.step(self.now, self.time.length, self.data, **state)
+        else:
+            checkpoint.step(self.now, self.time.length, **state)
+
 
     def at(self, time=None):
         """Retruns evolution superoperator tensor at a given time
@@ -8,6 +8,7 @@ from .relaxationtensor import RelaxationTensor
 from .rates.foersterrates import FoersterRateMatrix
 #from ..corfunctions.correlationfunctions import c2g
 from ...core.managers import energy_units
+from ...utils.timing import profiled
 
 class FoersterRelaxationTensor(RelaxationTensor):
     """Weak resonance coupling relaxation tensor by Foerster theory
@@ -15,6 +16,7 @@ class FoersterRelaxationTensor(RelaxationTensor):
     
     
     """
+    @profiled()
     def __init__(self, ham, sbi, initialize=True, cutoff_time=None):
         
         #super().__init__()
@@ -11,6 +11,8 @@ from ..hilbertspace.operators import ReducedDensityMatrix
 from ..hilbertspace.operators import UnityOperator
 from ...core.units import kB_int
 from ..corfunctions.correlationfunctions import CorrelationFunction
+from ...core.diskcache import fingerprint
+from ...utils.timing import profiled
 
 class KTHierarchy:
     """ Kubo-Tanimura Hierarchy
@@ -97,6 +99,9 @@ class KTHierarchy:
     
     """
     
+    # the state of the hierarchy changes during propagation
+    _fingerprint_excluded = ("ado", "hpop")
+    
     def __init__(self, ham, sbi, depth=2):
         
         self.ham = ham
@@ -372,83 +377,96 @@ class KTHierarchy:
     def get_kernel(self, timeaxis):
         """Returns integration kernel for the time-non-local equation
         
+        The reduced density matrix (the zeroth tier of the hierarchy)
+        obeys the equation
+        
+        d rho/dt = -i[H, rho] - int_0^t K(tau) rho(t-tau) dtau
+        
+        with the kernel K(t) = - PHQ G(t) QHP. Here, QHP lifts the density
+        matrix into the first tier of the hierarchy, G(t) is the propagator
+        of the hierarchy with the zeroth tier excluded, and PHQ returns
+        the first tier ADOs into the equation for the density matrix.
+        
+        All N^2 elementary density matrices are propagated at once
+        as one batched hierarchy state.
+        
+        Parameters
+        ----------
+        
+        timeaxis : TimeAxis
+            Time axis on which the kernel is calculated
+            
+        Returns
+        -------
+        
+        numpy.ndarray of the shape (Nt, N, N, N, N)
+        
         """
         N = self.dim
-        Nt = timeaxis.length
-        kernel = numpy.zeros((Nt,N,N,N,N), dtype=COMPLEX)
-        
-        khprop = KTHierarchyPropagator(timeaxis, self)
         
-        rhoi = ReducedDensityMatrix(dim=self.dim)
-        for ii in range(N):
-            for jj in range(N):
-                print("Starting:", ii, jj)
-                rhoi = ReducedDensityMatrix(dim=self.dim)
-                rhoi.data[ii,jj] = 1.0
-                
-                rhot = khprop.propagate(rhoi, free_hierarchy=True)
-                kernel[:,:,:,ii,jj] = -rhot.data[:,:,:]
-
-                print("... finished.")
-                
         qhp = self._QHPsop()
         phq = self._PHQsop()
-        for tk in range(Nt):
-            k1 = numpy.tensordot(kernel[tk,:,:,:,:], qhp)
-            kernel[tk,:,:,:,:] = numpy.tensordot(phq, k1)
+
+        # indices of the first tier ADOs (one per bath)
+        tier1 = self.np1[0,:]
+        
+        # QHP applied to all elementary density matrices |k><l|; 
+        # the batch indices (k,l) precede the indices of the ADOs
+        ado = numpy.zeros((self.hsize, N, N, N, N), dtype=COMPLEX)
+        ado[tier1,...] = numpy.transpose(qhp, (0, 3, 4, 1, 2))
+        
+        khprop = KTHierarchyPropagator(timeaxis, self)
+        
+        # propagation without the zeroth tier (slevel=1)
+        adot = khprop._propagate_ados(ado, slevel=1, store=tier1)
+        
+        kernel = -numpy.einsum("qijab,tqklab->tijkl", phq, adot)
         
         return kernel
 
 
     def _QHPsop(self):
+        """Superoperators lifting the density matrix to the first tier
         
+        Returns array of the shape (nbath, N, N, N, N), the first index 
+        corresponds to the first tier ADO of a given bath.
+        
+        """
         N = self.dim
-        delta = UnityOperator(dim=N).data
-        qhp = numpy.zeros((N, N, N, N), dtype=COMPLEX)
+        unity = numpy.eye(N, dtype=COMPLEX)
+        qhp = numpy.zeros((self.nbath, N**2, N**2), dtype=COMPLEX)
         
         for kk in range(self.nbath):
-                
-            # Theta+ and Psi+
-            nk = self.hinds[1,kk]
-            jj = self.nm1[1,kk]
             
-            print(kk, nk, jj)
-
-            if nk*jj > 0:
-
-                print("Calculating QHP:")
-                for ii_i in range(N):
-                    for jj_i in range(N):
-                        for kk_i in range(N):
-                            for ll_i in range(N):
-                                # Theta
-                                qhp[ii_i,jj_i,kk_i,ll_i] += \
-                                nk*self.lam[kk]*self.gamma[kk]*\
-                                (self.Vs[kk,ii_i,kk_i]*delta[jj_i,ll_i]
-                                 + delta[kk_i,ii_i]*self.Vs[kk,ll_i,jj_i])
-                                # Psi
-                                qhp[ii_i,jj_i,kk_i,ll_i] += \
-                                1j*2.0*nk*self.lam[kk]*self.kBT* \
-                                (self.Vs[kk,ii_i,kk_i]*delta[jj_i,ll_i]
-                                 - delta[kk_i,ii_i]*self.Vs[kk,ll_i,jj_i])
-                         
-                print(" ...done")
+            # V rho and rho V as superoperators
+            Vl = numpy.kron(self.Vs[kk,:,:], unity)
+            Vr = numpy.kron(unity, self.Vs[kk,:,:].T)
+            
+            # Theta+ and Psi+
+            qhp[kk,:,:] = self.lam[kk]*self.gamma[kk]*(Vl + Vr) \
+                        + 1j*2.0*self.lam[kk]*self.kBT*(Vl - Vr)
                 
-        return qhp                
+        return qhp.reshape(self.nbath, N, N, N, N)
 
 
     def _PHQsop(self):
+        """Superoperators returning the first tier into the zeroth one
+        
+        Returns array of the shape (nbath, N, N, N, N), the first index 
+        corresponds to the first tier ADO of a given bath.
         
+        """
         N = self.dim
-        delta = UnityOperator(dim=N).data
-        phq = numpy.zeros((N, N, N, N), dtype=COMPLEX)
-        for ii in range(N):
-            for jj in range(N):
-                for kk in range(N):
-                    for ll in range(N):
-                        phq[ii,jj,kk,ll] = delta[ii,kk]*delta[jj,ll]
+        unity = numpy.eye(N, dtype=COMPLEX)
+        phq = numpy.zeros((self.nbath, N**2, N**2), dtype=COMPLEX)
+        
+        for kk in range(self.nbath):
+            
+            # Psi-
+            phq[kk,:,:] = 1j*(numpy.kron(self.Vs[kk,:,:], unity)
+                              - numpy.kron(unity, self.Vs[kk,:,:].T))
                     
-        return phq        
+        return phq.reshape(self.nbath, N, N, N, N)
 
 
         
@@ -523,10 +541,19 @@ class KTHierarchyPropagator:
             self.HOmega = HOmega        
     
     
+    @profiled()
     def propagate(self, rhoi, L=4, report_hierarchy=False,
-                                   free_hierarchy=False):
+                                   free_hierarchy=False, checkpoint=None):
         """Propagates the Kubo-Tanimura Hierarchy including the RDO
         
+        Parameters
+        ----------
+        
+        checkpoint : Checkpoint
+            If specified, the state of the hierarchy is saved periodically
+            and the propagation resumes from the last saved state of
+            the same propagation (see quantarhei.core.checkpoint)
+        
         """
         rhot = DensityMatrixEvolution(timeaxis=self.timeaxis, rhoi=rhoi)
         
@@ -562,8 +589,26 @@ class KTHierarchyPropagator:
             for kk in range(self.hy.hsize):
                 self.hy.hpop[0,kk] = numpy.trace(self.hy.ado[kk,:,:])
 
-        indx = 1
-        for ii in self.timeaxis.data[1:self.Nt]:
+        if free_hierarchy:
+            output = ker
+        else:
+            output = rhot.data
+            
+        start = 1
+        if checkpoint is not None:
+            key = fingerprint("KTHierarchyPropagator", self.timeaxis, L,
+                              self.hy, rhoi.data, free_hierarchy,
+                              report_hierarchy)
+            (index, state) = checkpoint.begin(key, output)
+            if state is not None:
+                start = index + 1
+                ado2 = state["ado"]
+                ado1 = ado2
+                self.hy.ado = ado2
+                if report_hierarchy:
+                    self.hy.hpop[:start,:] = state["hpop"][:start,:]
+        
+        for indx in range(start, self.Nt):
 
             for jj in range(0,self.Nref):
 
@@ -587,11 +632,65 @@ class KTHierarchyPropagator:
                 # we report population of hierarchy ADO
                 for kk in range(self.hy.hsize):
                     self.hy.hpop[indx, kk] = numpy.trace(ado2[kk,:,:])                       
-            indx += 1             
+                    
+            if checkpoint is not None:
+                if report_hierarchy:
+                    checkpoint.step(indx, self.Nt, output, ado=ado2,
+                                    hpop=self.hy.hpop)
+                else:
+                    checkpoint.step(indx, self.Nt, output, ado=ado2)
             
         return rhot
 
 
+    def _propagate_ados(self, ado, slevel=0, store=None):
+        """Propagates a (batched) state of the hierarchy
+        
+        The ADOs are stored in an array of the shape (hsize, ..., N, N)
+        where the dimensions between the first and the last two index
+        independent initial conditions.
+        
+        Parameters
+        ----------
+        
+        ado : numpy.ndarray
+            Initial state of the hierarchy
+            
+        slevel : int
+            ADOs with indices lower than slevel are not propagated
+            
+        store : list of int
+            Indices of the ADOs which are returned at all times
+            
+        Returns
+        -------
+        
+        numpy.ndarray of the shape (Nt, len(store), ..., N, N)
+        
+        """
+        store = numpy.asarray(store)
+        adot = numpy.zeros((self.Nt, store.shape[0])+ado.shape[1:],
+                           dtype=COMPLEX)
+        adot[0,...] = ado[store,...]
+        
+        L = 4
+        ado1 = ado
+        ado2 = ado
+        for indx in range(1, self.Nt):
+            
+            for ll in range(1,L+1):
+
+                ado1 = self._ado_cros_rhs(ado1, (self.dt/ll), slevel) \
+                     + self._ado_self_rhs(ado1, (self.dt/ll), slevel)
+
+                ado2 = ado2 + ado1      
+            ado1 = ado2
+            
+            adot[indx,...] = ado2[store,...]
+            
+        return adot
+    
+
     def _ado_self_rhs(self, ado1, dt, slevel=0):
         """Self contribution of the equation for the hierarchy ADOs
 
@@ -603,61 +702,55 @@ class KTHierarchyPropagator:
         else:
             HH = self.hy.ham.data
         
-        for nn in range(slevel, self.hy.hsize):
-            
-            # 
-            ado3[nn,:,:] = -dt*(1j*(numpy.dot(HH, ado1[nn,:,:])
-                                  - numpy.dot(ado1[nn,:,:],HH)) 
-                                + self.hy.Gamma[nn]*ado1[nn,:,:])
-           
+        ados = ado1[slevel:,...]
+        gam = self.hy.Gamma[slevel:].reshape((-1,)+(1,)*(ado1.ndim-1))
+        ado3[slevel:,...] = -dt*(1j*(numpy.matmul(HH, ados)
+                                     - numpy.matmul(ados, HH)) 
+                                 + gam*ados)
                            
         return ado3
 
     
-    
     def _ado_cros_rhs(self, ado1, dt, slevel=0):
         """All cross-terms of the Hierarchy 
         
         """
         
         ado3 = numpy.zeros(ado1.shape, dtype=ado1.dtype)
-        rl = numpy.zeros((ado1.shape[1],ado1.shape[2]), dtype=ado1.dtype)
-        rr = numpy.zeros((ado1.shape[1],ado1.shape[2]), dtype=ado1.dtype)
-        
+        shp = (-1,)+(1,)*(ado1.ndim-1)
+        nns = numpy.arange(self.hy.hsize)
         
-        for nn in range(slevel, self.hy.hsize):
-            for kk in range(self.hy.nbath):
+        for kk in range(self.hy.nbath):
+            
+            VV = self.hy.Vs[kk,:,:]
+            
+            # Theta+ and Psi+
+            nk = self.hy.hinds[:,kk]
+            sel = nns[(nns >= slevel) & (nk > 0)]
+            if sel.shape[0] > 0:
                 
-                # Theta+ and Psi+
-                nk = self.hy.hinds[nn,kk]   
-                jj = self.hy.nm1[nn,kk]
+                src = ado1[self.hy.nm1[sel,kk],...]
+                rr = numpy.matmul(VV, src)
+                rl = numpy.matmul(src, VV)
                 
+                fk = (dt*nk[sel]).reshape(shp)
                 
-                if nk*jj >= 0:
-                    
-                    
-                    rr = numpy.dot(self.hy.Vs[kk,:,:], ado1[jj,:,:])
-                    rl = numpy.dot(ado1[jj,:,:],self.hy.Vs[kk,:,:])
-                    
-                    # Theta
-                    ado3[nn,:,:] += dt*nk*self.hy.lam[kk]*self.hy.gamma[kk]* \
-                                    (rr+rl)
-                        
-                            
-                    # Psi
-                    ado3[nn,:,:] += (1j*dt)*2.0*nk* \
-                                    self.hy.lam[kk]*self.hy.kBT* \
-                                    (rr-rl)
-                    
-                # Psi-
-                jj = self.hy.np1[nn,kk]
+                # Theta
+                ado3[sel,...] += fk*self.hy.lam[kk]*self.hy.gamma[kk]*(rr+rl)
+                # Psi
+                ado3[sel,...] += (1j*fk)*2.0*self.hy.lam[kk]*self.hy.kBT* \
+                                 (rr-rl)
                 
-                if jj > 0:
-   
-                    rr = numpy.dot(self.hy.Vs[kk,:,:], ado1[jj, :,:])
-                    rl = numpy.dot(ado1[jj,:,:],self.hy.Vs[kk,:,:])
-                    
-                    ado3[nn,:,:] += (1j*dt)*(rr-rl)
+            # Psi-
+            jj = self.hy.np1[:,kk]
+            sel = nns[(nns >= slevel) & (jj > 0)]
+            if sel.shape[0] > 0:
+                
+                src = ado1[jj[sel],...]
+                rr = numpy.matmul(VV, src)
+                rl = numpy.matmul(src, VV)
+                
+                ado3[sel,...] += (1j*dt)*(rr-rl)
                     
         return ado3
 
@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 import numpy
+import scipy.linalg
 
 from ...propagators.dmevolution import ReducedDensityMatrixEvolution
 from ...liouvillespace.liouvillian import Liouvillian
 from ...liouvillespace.supopunity import SOpUnity
 from .... import COMPLEX, REAL
 
+_methods = ["resolvent", "solve", "direct", "exponential"]
+
 class IntegrodiffPropagator:
     """Solver of integrodifferential equations
     
@@ -49,13 +52,38 @@ class IntegrodiffPropagator:
     
     correction_length : float
         How long the correction should be (from zero)
+        
+    method : str
+        Method of the solution. "resolvent" (default if fft is True) 
+        stores the inverted resolvent superoperator for all FFT frequencies. 
+        "solve" calculates the FFT solution by solving linear equations 
+        for the submitted initial condition only, without explicit matrix
+        inversions and without storing the resolvent. "direct" (default if
+        fft is False) integrates the equation in time domain with the full
+        memory of the kernel. "exponential" fits the kernel by a sum of 
+        exponentials and propagates a time-local equation for the density
+        matrix and auxiliary memory variables. If specified, the method
+        overrides the fft argument.
+        
+    nexp : int
+        Number of exponentials used to fit the kernel in the "exponential"
+        method. Default value is 8.
 
     """
     
     def __init__(self, timeaxis, ham, kernel=None, cutoff_time=-1,
                  inhom=None, fft=True, save_fft_kernel=False,
                  timefac=3, decay_fraction=2.0,
-                 correct_short_time=False, correction_length=0.0):
+                 correct_short_time=False, correction_length=0.0,
+                 method=None, nexp=8):
+        
+        if method is None:
+            method = "resolvent" if fft else "direct"
+        if method not in _methods:
+            raise Exception("Unknown method: "+str(method))
+        
+        self.method = method
+        fft = method in ["resolvent", "solve"]
         
         self.timeaxis = timeaxis
         self.ham = ham
@@ -108,7 +136,14 @@ class IntegrodiffPropagator:
             else:
                 with_kernel = False
                 
-            if with_kernel:
+            if with_kernel and (self.method == "solve") \
+               and (not save_fft_kernel):
+                
+                # FFT of the kernel is calculated by chunks of frequencies
+                # during the solution (see _solve_resolvent)
+                self.fftKernel = None
+                
+            elif with_kernel:
                 
                 # if kernel is present, we use it for calculation
                 MM = numpy.zeros((tlen, N1, N1, N1, N1), dtype=COMPLEX)
@@ -122,14 +157,20 @@ class IntegrodiffPropagator:
                 if save_fft_kernel:
                     self.fftKernel = MM
                     
-                # this is now going over frequencies 
-                self.resolv = numpy.zeros(MM.shape, COMPLEX)
-                for io in range(len(tt)):
-                    self.resolv[io,:,:,:,:] = (-1j*om[io] + gamma)*unity \
-                                               +1j*LL + MM[io,:,:,:,:]
-                    A = self.resolv[io,:,:,:,:].reshape(N1**2, N1**2)
-                    A = numpy.linalg.inv(A)                          
-                    self.resolv[io,:,:,:,:] = A.reshape(N1, N1, N1, N1)
+                if self.method == "resolvent":
+                    
+                    # this is now going over frequencies 
+                    self.resolv = numpy.zeros(MM.shape, COMPLEX)
+                    for io in range(len(tt)):
+                        self.resolv[io,:,:,:,:] = (-1j*om[io] + gamma)*unity \
+                                                   +1j*LL + MM[io,:,:,:,:]
+                        A = self.resolv[io,:,:,:,:].reshape(N1**2, N1**2)
+                        A = numpy.linalg.inv(A)                          
+                        self.resolv[io,:,:,:,:] = A.reshape(N1, N1, N1, N1)
+
+            elif self.method == "solve":
+                
+                self.fftKernel = None
 
             else:
                 
@@ -142,6 +183,12 @@ class IntegrodiffPropagator:
                     A = numpy.linalg.inv(A)
                     self.resolv[io,:,:,:,:] = A.reshape(N1, N1, N1, N1)                          
             
+        elif self.method == "exponential":
+            
+            # fit of the kernel and time-local propagator
+            self._fit_exponentials(nexp)
+            self._make_exponential_propagator()
+            
         else:
             
             # prepare propagation in time domain
@@ -163,14 +210,20 @@ class IntegrodiffPropagator:
             
             Nt = len(self.om)
             
-            rhOm = numpy.zeros((Nt, N1, N1), dtype=COMPLEX)
-            
             rho0 = rhoi.data #.reshape(N1**2)
             
-            for ii in range(Nt):
-                G = self.resolv[ii,:,:,:,:]
-                #Gr = G.reshape(N1**2, N1**2)
-                rhOm[ii,:,:] = numpy.tensordot(G, rho0)            
+            if self.method == "solve":
+                
+                rhOm = self._solve_resolvent(rho0)
+                
+            else:
+                
+                rhOm = numpy.zeros((Nt, N1, N1), dtype=COMPLEX)
+                
+                for ii in range(Nt):
+                    G = self.resolv[ii,:,:,:,:]
+                    #Gr = G.reshape(N1**2, N1**2)
+                    rhOm[ii,:,:] = numpy.tensordot(G, rho0)            
             
             rhOm = numpy.fft.fft(rhOm, axis=0) \
                     *((self.om[1]-self.om[0])/(2.0*numpy.pi))
@@ -183,6 +236,20 @@ class IntegrodiffPropagator:
             
             return rhot
         
+        elif self.method == "exponential":
+            
+            #
+            # time-local propagation with auxiliary memory variables
+            #
+            
+            yy = numpy.zeros(self.expU.shape[0], dtype=COMPLEX)
+            yy[:N1**2] = rhoi.data.reshape(N1**2)
+            for ii in range(1, self.timeaxis.length):
+                yy = numpy.dot(self.expU, yy)
+                rhot.data[ii,:,:] = yy[:N1**2].reshape(N1, N1)
+                
+            return rhot
+        
         else:
             
             #
@@ -227,15 +294,17 @@ class IntegrodiffPropagator:
         dim = rhot.data.shape[1]
         
         if tn == self.last_tn:
-            rho = self.last_int
+            rho = self.last_int.copy()
         else:
-            rho = numpy.zeros((dim, dim), dtype=COMPLEX)
             self.last_int = numpy.zeros((dim, dim), dtype=COMPLEX)
-            for nn in range(1, self.kernel_cutoff):
-                nr = tn - nn
-                rho += self.timeaxis.step* \
-                   numpy.tensordot(self.kernel[nn,:,:,:,:],rhot.data[nr,:,:])
-            self.last_int[:,:] = rho
+            # only the past (already calculated) times contribute
+            nmax = min(self.kernel_cutoff, tn+1)
+            if nmax > 1:
+                self.last_int[:,:] = self.timeaxis.step* \
+                   numpy.tensordot(self.kernel[1:nmax,:,:,:,:],
+                                   rhot.data[tn-numpy.arange(1,nmax),:,:],
+                                   axes=([0,3,4],[0,1,2]))
+            rho = self.last_int.copy()
             
         rho += \
         self.timeaxis.step*numpy.tensordot(self.kernel[0,:,:,:,:],rho_in)
@@ -254,5 +323,139 @@ class IntegrodiffPropagator:
         
         return drho
 
+
+    def _solve_resolvent(self, rho0):
+        """Solution in the frequency domain for a given initial condition
+        
+        Linear equations with the resolvent matrix are solved for all
+        frequencies in batches, instead of inverting the matrices. Fourier
+        transform of the kernel is calculated for each batch of frequencies
+        separately, so that it is never stored for all frequencies.
+        
+        """
+        N1 = rho0.shape[0]
+        N2 = N1**2
+        Nt = len(self.om)
+        
+        unity = numpy.eye(N2, dtype=COMPLEX)
+        LL = Liouvillian(self.ham).data.reshape(N2, N2)
+        b = rho0.reshape(N2)
+        
+        if self.kernel is not None:
+            Nk = self.kernel.shape[0]
+            KK = numpy.reshape(self.kernel, (Nk, N2**2))
+            tk = numpy.arange(Nk)
+            damp = numpy.exp(-self.gamma*(self.timeaxis.data[0] 
+                                          + self.timeaxis.step*tk))
+        else:
+            Nk = 1
+
+        rhOm = numpy.zeros((Nt, N2), dtype=COMPLEX)
+        
+        # batches of about 10^7 matrix elements
+        chunk = max(1, min(10000000//(N2**2), 10000000//Nk))
+        for i0 in range(0, Nt, chunk):
+            i1 = min(i0+chunk, Nt)
+            A = ((-1j*self.om[i0:i1] + self.gamma)[:,None,None])*unity \
+                + 1j*LL
+            if self.fftKernel is not None:
+                A += self.fftKernel[i0:i1,:,:,:,:].reshape(i1-i0, N2, N2)
+            elif self.kernel is not None:
+                # the same as the inverse FFT of the damped and zero-padded
+                # kernel in the "resolvent" method, for these frequencies
+                kt = (numpy.arange(i0, i1)[:,None]*tk[None,:]) % Nt
+                phase = numpy.exp((2.0j*numpy.pi/Nt)*kt)*damp[None,:]
+                A += (2.0*self.timeaxis.step*numpy.dot(phase, KK)
+                      ).reshape(i1-i0, N2, N2)
+            bb = numpy.broadcast_to(b, (i1-i0, N2))[:,:,None]
+            rhOm[i0:i1,:] = numpy.linalg.solve(A, bb)[:,:,0]
+            
+        return rhOm.reshape(Nt, N1, N1)
+    
+    
+    def _fit_exponentials(self, nexp):
+        """Fits the kernel by a sum of complex exponentials
+        
+        The kernel is approximated as
+        
+        K(t) = sum_m A_m exp(-s_m t)
+        
+        where the decay rates s_m are common to all elements of the kernel.
+        The rates are obtained by the matrix pencil method applied to 
+        the dominant components of the kernel, the superoperators A_m by 
+        linear least squares.
+        
+        """
+        N1 = self.ham.dim
+        dt = self.timeaxis.step
+        
+        Nk = max(self.kernel_cutoff, 2)
+        if self.kernel is None:
+            KK = numpy.zeros((Nk, N1**4), dtype=COMPLEX)
+        else:
+            KK = numpy.reshape(self.kernel[:Nk,...], (Nk, N1**4))
+            
+        self.exp_rates = numpy.zeros(0, dtype=COMPLEX)
+        self.exp_amplitudes = numpy.zeros((0, N1, N1, N1, N1), dtype=COMPLEX)
+        self.exp_fit_error = 0.0
+        
+        knorm = numpy.linalg.norm(KK)
+        if knorm == 0.0:
+            return
+
+        # dominant time dependences of the kernel elements
+        U, S, Vh = numpy.linalg.svd(KK, full_matrices=False)
+        nexp = min(nexp, Nk//2)
+        nc = min(nexp, max(1, numpy.sum(S > S[0]*1.0e-10)))
+        sigs = U[:,:nc]*S[:nc]
+        
+        # Hankel matrices of all signals stacked together
+        Lp = min(Nk//2, max(4*nexp, 100))
+        rows = numpy.arange(Nk-Lp)[:,None] + numpy.arange(Lp+1)[None,:]
+        YY = numpy.concatenate([sigs[rows,kk] for kk in range(nc)], axis=0)
+        
+        _U, _S, YVh = numpy.linalg.svd(YY, full_matrices=False)
+        BB = YVh[:nexp,:].T
+        zz = numpy.linalg.eigvals(numpy.dot(numpy.linalg.pinv(BB[:-1,:]),
+                                            BB[1:,:]))
+        # growing exponentials are not allowed
+        big = numpy.abs(zz) > 1.0
+        zz[big] = zz[big]/numpy.abs(zz[big])
+        
+        # amplitudes from the linear least squares
+        ZZ = zz[None,:]**numpy.arange(Nk)[:,None]
+        AA = numpy.linalg.lstsq(ZZ, KK, rcond=None)[0]
+
+        self.exp_rates = -numpy.log(zz.astype(COMPLEX))/dt
+        self.exp_amplitudes = AA.reshape(len(zz), N1, N1, N1, N1)
+        self.exp_fit_error = numpy.linalg.norm(numpy.dot(ZZ, AA) - KK)/knorm
+        
+        
+    def _make_exponential_propagator(self):
+        """Propagator of the time-local equations with memory variables
+        
+        With the memory variables
+        
+        I_m(t) = int_0^t exp(-s_m tau) rho(t-tau) dtau
+        
+        the integro-differential equation becomes time-local
+        
+        d rho/dt = -i L rho - sum_m A_m I_m
+        d I_m/dt = rho - s_m I_m
+        
+        and it is propagated by the exponential of its generator.
+        
+        """
+        N2 = self.ham.dim**2
+        Ne = len(self.exp_rates)
+        
+        GG = numpy.zeros(((Ne+1)*N2, (Ne+1)*N2), dtype=COMPLEX)
+        GG[:N2,:N2] = -1j*Liouvillian(self.ham).data.reshape(N2, N2)
+        for mm in range(Ne):
+            i0 = (mm+1)*N2
+            GG[:N2,i0:i0+N2] = -self.exp_amplitudes[mm,...].reshape(N2, N2)
+            GG[i0:i0+N2,:N2] = numpy.eye(N2)
+            GG[i0:i0+N2,i0:i0+N2] = -self.exp_rates[mm]*numpy.eye(N2)
+            
+        self.expU = scipy.linalg.expm(GG*self.timeaxis.step)
         
-             
\ No newline at end of file
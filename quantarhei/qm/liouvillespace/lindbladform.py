@@ -13,6 +13,7 @@ from .systembathinteraction import SystemBathInteraction
 from ...builders.aggregate_states import VibronicState
 from ... import REAL
 from ..hilbertspace.operators import ProjectionOperator
+from ...utils.timing import profiled
 
 class LindbladForm(RedfieldRelaxationTensor):
     """Lindblad form of relaxation tensor
@@ -21,6 +22,7 @@ class LindbladForm(RedfieldRelaxationTensor):
 
     """
 
+    @profiled()
     def __init__(self, ham, sbi, initialize=True,
                  as_operators=True, name=""):
         super().__init__(ham, sbi, initialize=initialize,
@@ -90,6 +92,7 @@ class ElectronicLindbladForm(LindbladForm):
 
     """
 
+    @profiled()
     def __init__(self, ham, sbi, initialize=True,
                  as_operators=True, name=""):
 
@@ -119,33 +122,10 @@ class ElectronicLindbladForm(LindbladForm):
                 if Nel1 == sbi.KK.shape[1]:
                     
                     # create new interaction operators of higher 
-                    # dimensionality
-                    Nop = sbi.KK.shape[0]
-                    ops = []
-                    for k in range(Nop):
-                        newkk = numpy.zeros((agg.Ntot, agg.Ntot), 
-                                            dtype=numpy.float64)
-                        # populate the operator
-                        for i_el in range(agg.Nel):
-                            for i_vib in agg.vibindices[i_el]:
-                                
-                                vs_i = agg.vibsigs[i_vib]
-                                st_i = agg.get_VibronicState(vs_i[0], vs_i[1])
-                                
-                                for j_el in range(agg.Nel):
-                                    for j_vib in agg.vibindices[j_el]:
-                                
-                                        vs_j = agg.vibsigs[j_vib]
-                                        st_j = agg.get_VibronicState(vs_j[0],
-                                                                     vs_j[1])
-                                
-                                        # electronic transition operator
-                                        # dressed in Franck-Condon factors
-                                        newkk[i_vib, j_vib] = (
-                                        numpy.real(agg.fc_factor(st_i, st_j))*
-                                        sbi.KK[k, i_el, j_el])
-                    
-                        ops.append(newkk)
+                    # dimensionality: electronic transition operators
+                    # dressed in Franck-Condon factors
+                    ops = list(agg.get_vibronic_operators(sbi.KK,
+                                                          fc_weighted=True))
                     
                     # with the operators constructed, we create Lindblad form
                     newsbi = SystemBathInteraction(sys_operators=ops,
@@ -199,6 +179,7 @@ class VibrationalDecayLindbladForm(LindbladForm):
 
     """
 
+    @profiled()
     def __init__(self, ham, sbi, initialize=True,
                  as_operators=True, name=""):
 
@@ -212,7 +193,11 @@ class VibrationalDecayLindbladForm(LindbladForm):
             ops = []
             rts = []
             
-            zero = numpy.zeros((Ntot,Ntot), dtype=REAL)
+            # electronic index and vibrational quantum numbers of all states
+            elind = numpy.array(agg.elinds, dtype=numpy.int64)
+            vibqn = numpy.array([agg.vibsigs[a][1] for a in range(Ntot)],
+                                dtype=numpy.int64)
+            
             zrs = 0
             
             # we loop over sites in which we want to introduce relaxation
@@ -223,6 +208,13 @@ class VibrationalDecayLindbladForm(LindbladForm):
                 # rates for each site
                 rate = orates[k]
                 
+                # states are identified by their electronic state and
+                # the vibrational quantum numbers of all other sites
+                rest = numpy.delete(vibqn, site, axis=1)
+                (_, keys) = numpy.unique(numpy.column_stack((elind, rest)),
+                                         axis=0, return_inverse=True)
+                keys = keys.ravel()
+                
                 # get max number of states for the site 
                 nmax = 5
                 
@@ -233,33 +225,20 @@ class VibrationalDecayLindbladForm(LindbladForm):
  
                     # projection operator for each transition
                     op = ProjectionOperator(dim=Ntot)
-                   
-                    # loop over all a matrix of states
-                    for a, s1 in agg.all_states:
                     
-                        sig1 = s1.signature()
-                        el1 = sig1[0]
-                        vb1 = sig1[1]
+                    # pairs of states differing only in the quantum number 
+                    # of the site
+                    aa = numpy.nonzero(vibqn[:,site] == pair[0])[0]
+                    bb = numpy.nonzero(vibqn[:,site] == pair[1])[0]
+                    if len(bb) > 0:
+                        order = numpy.argsort(keys[bb])
+                        pos = numpy.searchsorted(keys[bb], keys[aa],
+                                                 sorter=order)
+                        bb = bb[order[numpy.minimum(pos, len(bb)-1)]]
+                        match = (keys[bb] == keys[aa])
+                        op.data[aa[match], bb[match]] = 1.0 #numpy.sqrt(nn)
                     
-                        for b, s2 in agg.all_states:
-                        
-                            sig2 = s2.signature()
-                            el2 = sig2[0]
-                            vb2 = sig2[1]
-                        
-                            op.data[a,b] = 0.0
-                        
-                            if ((el1 == el2) and 
-                                self._same_regardless_of_one(vb1, vb2, site)):
-                            
-                                if (vb1[site] == pair[0] 
-                                    and vb2[site] == pair[1]):
-                                    #print("site:", site, ":", pair[0],"<-",
-                                    #      pair[1],"|", sig1, "<--", sig2)
-                                
-                                    op.data[a,b] = 1.0 #numpy.sqrt(nn)
-
-                    if not numpy.array_equal(op.data, zero):
+                    if numpy.any(op.data != 0.0):
                         ops.append(op)
                         nops += 1
                         rts.append(rate*numpy.sqrt(nn))
@@ -284,13 +263,4 @@ class VibrationalDecayLindbladForm(LindbladForm):
                                        system=sbi.system)
         super().__init__(ham, newsbi, initialize=initialize,
                          as_operators=as_operators, name=name)
-        
-            
-    def _same_regardless_of_one(self, a, b, k):
-        
-        if (a[:k] == b[:k]) and (a[k+1:] == b[k+1:]):
-            return True
-        
-        
-        
-        
\ No newline at end of file
+
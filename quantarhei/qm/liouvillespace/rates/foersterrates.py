@@ -5,6 +5,7 @@ import scipy.interpolate as interp
 from ...hilbertspace.hamiltonian import Hamiltonian
 from ...liouvillespace.systembathinteraction import SystemBathInteraction
 from ...corfunctions.correlationfunctions import c2g
+from ....utils.timing import profiled
 
 class FoersterRateMatrix:
     """Förster relaxation rate matrix
@@ -31,6 +32,7 @@ class FoersterRateMatrix:
     
     """
     
+    @profiled()
     def __init__(self, ham, sbi, initialize=True, cutoff_time=None):
         
         if not isinstance(ham, Hamiltonian):
@@ -17,9 +17,11 @@ from ....core.parallel import distributed_configuration
 from ....core.units import cm2int
 from ....core.units import kB_intK
 from ....core.managers import Manager
+from ....core.basiscache import unitary_inverse
 
 from ...hilbertspace.hamiltonian import Hamiltonian
 from ...liouvillespace.systembathinteraction import SystemBathInteraction
+from ....utils.timing import profiled
 
 
 
@@ -52,6 +54,7 @@ class RedfieldRateMatrix:
     
     """
     
+    @profiled()
     def __init__(self, ham, sbi, initialize=True, cutoff_time=None):
         
         if not isinstance(ham, Hamiltonian):
@@ -91,8 +94,9 @@ class RedfieldRateMatrix:
             raise Exception("No system bath intraction components present")
         
         # Eigen problem
-        hD,SS = numpy.linalg.eigh(self.ham._data) 
-        S1 = numpy.linalg.inv(SS)
+        hD,SS = self.ham.manager.basis_cache.eigh(self.ham._data,
+                                                     owner=self.ham) 
+        S1 = unitary_inverse(SS)
         
         # component operators
         KI = self.sbi.KK.copy()
@@ -129,20 +133,16 @@ class RedfieldRateMatrix:
             cw = cf.get_Fourier_transform()
             
 
-            # Spectral density at all frequencies
-            for i in range(Na):
-                for j in range(Na):
-                    if i != j:
-                        if numpy.abs(Om[j,i]) > freq_cutoff:
-                            cc[k,i,j] = 0.0
-                        else:
-                            if Om[j,i] < 0.0:
-                                cc[k,i,j] = numpy.real((cw.at(Om[i,j],
-                                approx="spline")
-                                *numpy.exp(-Om[i,j]/(kB_intK*Temp))))
-                            else:
-                                cc[k,i,j] = numpy.real(cw.at(Om[j,i],
-                                approx="spline"))
+            # Spectral density at all frequencies (evaluated at once)
+            OmT = Om.T
+            inside = (numpy.abs(OmT) <= freq_cutoff) \
+                   & ~numpy.eye(Na, dtype=bool)
+            neg = OmT < 0.0
+            arg = numpy.where(neg, Om, OmT)[inside]
+            val = cw.at(arg, approx="spline")
+            val = numpy.where(neg[inside],
+                              val*numpy.exp(-arg/(kB_intK*Temp)), val)
+            cc[k,inside] = numpy.real(val)
                                 
 
         
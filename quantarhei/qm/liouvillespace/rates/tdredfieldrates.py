@@ -12,6 +12,7 @@ import scipy
 
 from ....core.implementations import implementation
 from ....core.units import cm2int
+from ....core.basiscache import unitary_inverse
 
 from ...hilbertspace.hamiltonian import Hamiltonian
 from ...liouvillespace.systembathinteraction import SystemBathInteraction
@@ -91,8 +92,8 @@ class TDRedfieldRateMatrix(TimeDependent):
             raise Exception("No system bath intraction components present")
         
         # Eigen problem
-        hD,SS = numpy.linalg.eigh(ham.data) 
-        S1 = numpy.linalg.inv(SS)
+        hD,SS = ham.manager.basis_cache.eigh(ham.data, owner=ham) 
+        S1 = unitary_inverse(SS)
         
         # component operators
         KI = self.sbi.KK.copy()
@@ -7,6 +7,8 @@ from .rates.foersterrates import _reference_implementation as foerster_rates
 from ..corfunctions.correlationfunctions import c2g
 from ...core.managers import Manager
 from ...core.managers import energy_units
+from ...core.basiscache import unitary_inverse
+from ...utils.timing import profiled
 
 
 class RedfieldFoersterRelaxationTensor(RedfieldRelaxationTensor,
@@ -34,6 +36,7 @@ class RedfieldFoersterRelaxationTensor(RedfieldRelaxationTensor,
         
     
     """
+    @profiled()
     def __init__(self, ham, sbi, initialize=True,
                  cutoff_time=None, coupling_cutoff=None):
                      
@@ -96,7 +99,7 @@ class RedfieldFoersterRelaxationTensor(RedfieldRelaxationTensor,
         #
         if calcFT:
 
-            hD, SS = numpy.linalg.eigh(ham.data) 
+            hD, SS = ham.manager.basis_cache.eigh(ham.data, owner=ham) 
 
                        
             #
@@ -148,7 +151,7 @@ class RedfieldFoersterRelaxationTensor(RedfieldRelaxationTensor,
             #
             # Hamiltonian matrix
             #
-            hj = numpy.dot(numpy.linalg.inv(SS), numpy.dot(ham.JR,SS))
+            hj = numpy.dot(unitary_inverse(SS), numpy.dot(ham.JR,SS))
             for i in range(ham.dim):
                 hj[i,i] = 0.0
             hh = numpy.diag(hD) + hj
@@ -20,7 +20,9 @@ from ...core.parallel import block_distributed_range
 from ...core.parallel import start_parallel_region, close_parallel_region
 from ...core.parallel import distributed_configuration
 from ...core.managers import BasisManaged
+from ...core.basiscache import unitary_inverse
 from ...utils.types import BasisManagedComplexArray
+from ...utils.timing import profiled
 
 import quantarhei as qr
 
@@ -75,6 +77,7 @@ class RedfieldRelaxationTensor(RelaxationTensor):
     Lm = BasisManagedComplexArray("Lm")
     Ld = BasisManagedComplexArray("Ld")    
 
+    @profiled()
     def __init__(self, ham, sbi, initialize=True,
                  cutoff_time=None, as_operators=False,
                  name=""):
@@ -277,7 +280,7 @@ class RedfieldRelaxationTensor(RelaxationTensor):
             # THIS ASSUMES WE ARE IN SITE BASIS
             # FIXME: devise a mechanism to ensure this!!!!
             #
-            hD, SS = numpy.linalg.eigh(ham.data)   
+            hD, SS = ham.manager.basis_cache.eigh(ham.data, owner=ham)   
                
         #
         #  Find all transition frequencies
@@ -296,7 +299,7 @@ class RedfieldRelaxationTensor(RelaxationTensor):
 
         Km = numpy.zeros((Nb, Na, Na), dtype=numpy.float64) 
         # Transform site operators       
-        S1 = scipy.linalg.inv(SS)
+        S1 = unitary_inverse(SS)
         #FIXME: SBI should also be basis controlled
         for ns in range(Nb): 
             Km[ns,:,:] = numpy.dot(S1, numpy.dot(sbi.KK[ns,:,:],SS))
@@ -3,7 +3,7 @@
 import numpy
 
 from .superoperator import SuperOperator
-from .secular import Secular
+from .secular import Secular, secular_mask
 from ...core.saveable import Saveable
 
 class RelaxationTensor(SuperOperator, Secular, Saveable):
@@ -34,6 +34,17 @@ class RelaxationTensor(SuperOperator, Secular, Saveable):
 
     def secularize(self, legacy=True):
         """Secularizes the relaxation tensor
+        
+        Parameters
+        ----------
+        
+        legacy : bool
+            If True, the non-secular elements of the tensor are set to zero.
+            Otherwise, the tensor is irreversibly replaced by a compact 
+            representation of a population rate matrix and a matrix of 
+            dephasing rates (see Secular class), which requires only N^2 
+            storage. The compact tensor is valid in the current basis, 
+            and it is used in that basis by the propagators.
 
 
         """
@@ -44,68 +55,90 @@ class RelaxationTensor(SuperOperator, Secular, Saveable):
                 self.convert_2_tensor()
                 #raise Exception("Cannot be secularized in the operator form")
                 
-            if True:
-                if self.data.ndim == 4:
-                    N = self.data.shape[0]
-                    for ii in range(N):
-                        for jj in range(N):
-                            for kk in range(N):
-                                for ll in range(N):
-                                    if not (((ii == jj) and (kk == ll)) 
-                                        or ((ii == kk) and (jj == ll))) :
-                                            self.data[ii,jj,kk,ll] = 0
-                else:  
-                    N = self.data.shape[1]
-                    for ii in range(N):
-                        for jj in range(N):
-                            for kk in range(N):
-                                for ll in range(N):
-                                    if not (((ii == jj) and (kk == ll)) 
-                                        or ((ii == kk) and (jj == ll))) :
-                                            self.data[:,ii,jj,kk,ll] = 0
+            N = self.data.shape[-1]
+            self.data[..., numpy.logical_not(secular_mask(N))] = 0.0
                                             
         else:
             
-            super().secularize()
+            # compact representation by rate matrices; with the operator 
+            # form, the rates are calculated from the operators without
+            # constructing the tensor
+            super().secularize(use_data=False)
+            
+            if self.secular_compact and self.as_operators:
+                # the operators are replaced by the compact form
+                self.as_operators = False
+                for name in ["_Km", "_Lm", "_Ld"]:
+                    if hasattr(self, name):
+                        setattr(self, name, None)
 
 
     def _set_population_rates_from_operators(self):
-        raise Exception("Method _set_population_rates_from_operators()"+
-                        " needs to be implemented in a class inheriting"+
-                        " from Secular")
+        """Population transfer rates R_iijj from the operator form
+        
+        The operator form of the tensor (see RedfieldRelaxationTensor) is
+        
+        R_abcd = sum_m [K_ac Ld_db + L_ac K_bd - delta_bd (K^T L)_ac 
+                                               - delta_ac (Ld K)_db]
+                                               
+        where L (and Ld) may carry a leading time index
+        
+        """
+        Km = self.Km
+        Lm = self.Lm
+        Ld = self.Ld
+        KK = (numpy.einsum("mij,...mji->...ij", Km, Ld)
+             +numpy.einsum("...mij,mij->...ij", Lm, Km))
+        
+        # the terms with delta functions contribute to the diagonal only
+        dg = numpy.arange(Km.shape[-1])
+        KK[..., dg, dg] -= (numpy.einsum("mki,...mki->...i", Km, Lm)
+                           +numpy.einsum("...mik,mki->...i", Ld, Km))
+        self.secular_KK = KK
 
 
     def _set_population_rates_from_tensor(self):
         """ 
         
         """
-        if self.data.ndim == 4:            
-            self.secular_KK = numpy.einsum("iijj->ij", self.data)
-        else:      
-            self.secular_KK = numpy.einsum("hiijj->hij", self.data)            
+        self.secular_KK = numpy.array(numpy.einsum("...iijj->...ij", 
+                                                   self.data))
 
 
     def _set_dephasing_rates_from_operators(self):
-        raise Exception("Method _set_dephasing_rates_from_operators()"+
-                        " needs to be implemented in a class inheriting"+
-                        " from Secular")
+        """Dephasing rates R_ijij from the operator form
+        
+        See _set_population_rates_from_operators
+        
+        """
+        Km = self.Km
+        Lm = self.Lm
+        Ld = self.Ld
+        Kdg = numpy.einsum("mii->mi", Km)
+        GG = (numpy.einsum("mi,...mj->...ij", Kdg, 
+                           numpy.einsum("...mjj->...mj", Ld))
+             +numpy.einsum("...mi,mj->...ij", 
+                           numpy.einsum("...mii->...mi", Lm), Kdg))
+        
+        # diagonals of K^T L and Ld K
+        KL = numpy.einsum("mki,...mki->...i", Km, Lm)
+        LK = numpy.einsum("...mjk,mkj->...j", Ld, Km)
+        GG -= KL[..., :, numpy.newaxis] + LK[..., numpy.newaxis, :]
+        
+        dg = numpy.arange(Km.shape[-1])
+        GG[..., dg, dg] = 0.0
+        self.secular_GG = GG
 
 
     def _set_dephasing_rates_from_tensor(self):
         """
         
         """
-        if self.data.ndim == 4:
-            N = self.data.shape[0]
-            
-            self.secular_GG = numpy.einsum("ijij->ij", self.data)
-            for ii in range(N):
-                self.secular_GG[ii,ii] = 0.0
-        else:
-            N = self.data.shape[1]
-            self.secular_GG = numpy.einsum("hijij->hij", self.data)            
-            for ii in range(N):
-                self.secular_GG[:,ii,ii] = 0.0
+        N = self.data.shape[-1]
+        self.secular_GG = numpy.array(numpy.einsum("...ijij->...ij", 
+                                                   self.data))
+        dg = numpy.arange(N)
+        self.secular_GG[..., dg, dg] = 0.0
 
                                
     def transform(self, SS, inv=None):
@@ -129,6 +162,10 @@ class RelaxationTensor(SuperOperator, Secular, Saveable):
         if (self.manager.warn_about_basis_change):
                 print("\nQr >>> Relaxation tensor '%s' changes basis"
                       %self.name)
+                
+        # compact secular form is always kept in the secular basis
+        if self.secular_compact:
+            return
            
         if inv is None:
             S1 = numpy.linalg.inv(SS)
@@ -235,6 +272,26 @@ class RelaxationTensor(SuperOperator, Secular, Saveable):
         return self.__add__(other)
     
     
+    def apply(self, oper, copy=True):
+        """Applies the tensor to an operator
+        
+        See SuperOperator.apply(). The compact secular form is applied
+        without reconstructing the full tensor.
+        
+        """
+        if self.secular_compact:
+            if copy:
+                import copy
+                oper_ven = copy.copy(oper)
+                oper_ven.data = Secular.apply(self, oper)
+                return oper_ven
+            else:
+                oper.data = Secular.apply(self, oper)
+                return oper
+            
+        return super().apply(oper, copy=copy)
+    
+    
     def _rhs(self, rho):
         """Applies the tensor to a given matrix
         
@@ -10,6 +10,23 @@
 import numpy
 
 from ...core.managers import Manager
+from ...core.basiscache import unitary_inverse
+
+
+def secular_mask(N):
+    """Boolean mask of the secular elements of an N x N x N x N tensor
+    
+    Secular elements are the population transfer rates R_iijj and 
+    the dephasing rates R_ijij.
+    
+    >>> mask = secular_mask(2)
+    >>> print(mask[0,0,1,1], mask[0,1,0,1], mask[0,1,1,0])
+    True True False
+    
+    """
+    ii, jj, kk, ll = numpy.indices((N, N, N, N), sparse=True)
+    return ((ii == jj) & (kk == ll)) | ((ii == kk) & (jj == ll))
+
 
 class Secular:
     """Class representing secular Superoperators
@@ -30,6 +47,9 @@ class Secular:
     
     secularize() :
         Converts the superoperator into secular form
+        
+    apply() :
+        Applies the secular superoperator to a density matrix
    
     
     Examples
@@ -104,6 +124,9 @@ class Secular:
     
     # population tranfer rates
     secular_KK = None
+    
+    # True if the secular rates are the only representation of the object
+    secular_compact = False
 
     ###########################################################################
     #
@@ -121,6 +144,14 @@ class Secular:
         reversible : bool
             If the secularization is reversible, the original data property
             is left untouched, so that secularization can be reversed.
+            
+        use_data : bool
+            If True, the non-secular elements of the data property are set
+            to zero. Otherwise, the object is represented by a matrix of 
+            population transfer rates (`secular_KK`) and a matrix of 
+            dephasing rates (`secular_GG`). If such secularization is not
+            reversible, the dense data are released and only the compact
+            representation is kept.
         
         
         """
@@ -152,6 +183,14 @@ class Secular:
                 else:
                     self._set_population_rates_from_tensor()
                     self._set_dephasing_rates_from_tensor()
+                    
+                self.secular_time_dependent = \
+                    (self.secular_KK is not None) and (self.secular_KK.ndim == 3)
+                
+                if not reversible:
+                    # the rates are the only representation we keep
+                    self._data = None
+                    self.secular_compact = True
             
             self.is_secular = True
 
@@ -221,48 +260,91 @@ class Secular:
         if self.as_operators:
             self.convert_2_tensor()   
             
-        if self.data.ndim == 4:
-            N = self.data.shape[0]
-            for ii in range(N):
-                for jj in range(N):
-                    for kk in range(N):
-                        for ll in range(N):
-                            if not (((ii == jj) and (kk == ll)) 
-                                or ((ii == kk) and (jj == ll))) :
-                                    self.data[ii,jj,kk,ll] = 0
-        else:  
-            N = self.data.shape[1]
-            for ii in range(N):
-                for jj in range(N):
-                    for kk in range(N):
-                        for ll in range(N):
-                            if not (((ii == jj) and (kk == ll)) 
-                                or ((ii == kk) and (jj == ll))) :
-                                    self.data[:,ii,jj,kk,ll] = 0
+        N = self.data.shape[-1]
+        self.data[..., numpy.logical_not(secular_mask(N))] = 0.0
         
     
     def apply(self, rho):
         """Application of the secular tensor on the statistical operator
         
+        The density matrix is transformed into the basis in which 
+        the object was secularized, the compact secular form is applied
+        and the result is transformed back into the current basis.
         
-        """
-#        rhoret = -self.secular_GG*rho.data
-#        if self._has_rates:
-#            rhoret += numpy.diagflat(numpy.einsum("ij,jj", 
-#                                     self.secular_KK.data, rho.data))
+        Parameters
+        ----------
+        
+        rho : DensityMatrix, ReducedDensityMatrix
+            Density matrix on which the tensor acts
             
-        # FIXME: time this to find out how bad is to call additional function
-        return self._apply(rho.data)
+        Returns
+        -------
+        
+        numpy.ndarray with the result in the current basis
         
+        """
+        SS = self.get_secular_transformation()
+        if SS is None:
+            return self._apply(rho.data)
 
-    def _apply(self, rho):
+        S1 = unitary_inverse(SS)
+        rhos = numpy.dot(S1, numpy.dot(rho.data, SS))
+        return numpy.dot(SS, numpy.dot(self._apply(rhos), S1))
+        
+
+    def _apply(self, rho, tt=None):
         """Application of the tensor directly to an array
         
+        The array has to be in the secular basis. Leading dimensions 
+        of the array are treated as independent density matrices.
+        
+        Parameters
+        ----------
+        
+        rho : numpy.ndarray
+            Array of the shape (..., N, N)
+            
+        tt : int
+            Time index of the rates if they are time dependent
+        
+        """
+        if self.secular_time_dependent:
+            KK = self.secular_KK[tt,:,:]
+            GG = self.secular_GG[tt,:,:]
+        else:
+            KK = self.secular_KK
+            GG = self.secular_GG
+            
+        N = KK.shape[0]
+        dg = numpy.arange(N)
+        
+        # dephasing (diagonal of GG is zero)
+        rhoret = GG*rho
+        # population transfer
+        rhoret[..., dg, dg] += numpy.einsum("ij,...jj->...i", KK, rho)
+        
+        return rhoret
+
+        
+    def get_secular_transformation(self):
+        """Transformation from the current basis into the secular one
+        
+        Returns the matrix SS whose columns are the states of the basis 
+        in which the object was secularized, expressed in the current 
+        basis, or None if the object was secularized in the basis used 
+        outside any basis context.
+        
         """
-        rhoret = -self.secular_GG*rho
-        if self._has_rates:
-            rhoret += numpy.diagflat(numpy.einsum("ij,jj", 
-                                     self.secular_KK.data, rho))
+        op = self.secular_basis_op
+        if op is None:
+            if Manager().get_current_basis() != 0:
+                raise Exception("Object was secularized outside any basis"+
+                                " context and it has to be used there")
+            return None
+            
+        # access to data brings the operator into the current basis
+        op.data
+        return op.get_diagonalization_matrix()
         
         
     ###########################################################################
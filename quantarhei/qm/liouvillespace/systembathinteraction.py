@@ -59,6 +59,9 @@ class SystemBathInteraction(Saveable):
 
     """
 
+    # the system is described by its Hamiltonian in cache fingerprints
+    _fingerprint_excluded = ("aggregate", "molecule", "system")
+
     def __init__(self, sys_operators=None, bath_correlation_matrix=None,
                  rates=None, drates=None, dtype="Lorentzian", osites=None,
                  orates=None, system=None):
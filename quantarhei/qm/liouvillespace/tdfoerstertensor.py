@@ -9,6 +9,7 @@ from ..corfunctions.correlationfunctions import c2g
 from ...core.managers import energy_units
 
 from ...core.time import TimeDependent
+from ...utils.timing import profiled
 
 class TDFoersterRelaxationTensor(FoersterRelaxationTensor, TimeDependent):
     """Weak resonance coupling relaxation tensor by Foerster theory
@@ -16,6 +17,7 @@ class TDFoersterRelaxationTensor(FoersterRelaxationTensor, TimeDependent):
     
     
     """
+    @profiled()
     def __init__(self, ham, sbi, initialize=True, cutoff_time=None):
         
         super().__init__(ham, sbi, initialize, cutoff_time)
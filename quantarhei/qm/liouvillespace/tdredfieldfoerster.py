@@ -7,8 +7,10 @@ from .tdfoerstertensor import _td_reference_implementation as td_foerster_rates
 from ..corfunctions.correlationfunctions import c2g
 #from ...core.managers import Manager
 from ...core.managers import energy_units
+from ...core.basiscache import unitary_inverse
 
 from ...core.time import TimeDependent
+from ...utils.timing import profiled
 
 class TDRedfieldFoersterRelaxationTensor(RedfieldFoersterRelaxationTensor, 
                                          TimeDependent):
@@ -35,6 +37,7 @@ class TDRedfieldFoersterRelaxationTensor(RedfieldFoersterRelaxationTensor,
         
     
     """
+    @profiled()
     def __init__(self, ham, sbi, initialize=True,
                  cutoff_time=None, coupling_cutoff=None):
             
@@ -95,7 +98,7 @@ class TDRedfieldFoersterRelaxationTensor(RedfieldFoersterRelaxationTensor,
         #
         if calcFT:
 
-            hD, SS = numpy.linalg.eigh(ham.data) 
+            hD, SS = ham.manager.basis_cache.eigh(ham.data, owner=ham) 
 
                        
             #
@@ -147,7 +150,7 @@ class TDRedfieldFoersterRelaxationTensor(RedfieldFoersterRelaxationTensor,
             #
             # Hamiltonian matrix
             #
-            hj = numpy.dot(numpy.linalg.inv(SS), numpy.dot(ham.JR,SS))
+            hj = numpy.dot(unitary_inverse(SS), numpy.dot(ham.JR,SS))
             for i in range(ham.dim):
                 hj[i,i] = 0.0
             hh = numpy.diag(hD) + hj
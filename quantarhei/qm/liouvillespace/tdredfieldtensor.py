@@ -1,16 +1,57 @@
 # -*- coding: utf-8 -*-
 import numpy
-import scipy
 
 from .redfieldtensor import RedfieldRelaxationTensor
 from ...core.time import TimeDependent
+from ...core.basiscache import unitary_inverse
+from ...utils.timing import profiled
 
 class TDRedfieldRelaxationTensor(RedfieldRelaxationTensor, TimeDependent):
+    r"""Time-dependent Redfield Relaxation Tensor
     
     
+    Parameters
+    ----------
+    
+    ham : Hamiltonian
+        Hamiltonian of the system.
+        
+    sbi : SystemBathInteraction
+        Object specifying the system-bath interaction
+        
+    initialize : bool
+        If True, the tensor will be imediately calculated
+        
+    cutoff_time : float
+        Time in femtoseconds after which the integral kernel in the 
+        definition of the relaxation tensor is assummed to be zero.
+            
+    as_operators : bool
+        If True the tensor will not be constructed. Instead a set of
+        operators whose application is equal to the application of the
+        tensor will be defined and stored
+        
+    markov_tolerance : float
+        If specified, the time-dependent \Lambda_m operators are stored
+        only until they converge to their Markovian (long time) limit
+        within this relative tolerance. The tensor then behaves as if
+        a cut-off time was set at the time of convergence.
+            
+    """
+    
+    @profiled()
+    def __init__(self, ham, sbi, initialize=True,
+                 cutoff_time=None, as_operators=False,
+                 markov_tolerance=None, name=""):
+        
+        self.markov_tolerance = markov_tolerance
+        super().__init__(ham, sbi, initialize=initialize,
+                         cutoff_time=cutoff_time, as_operators=as_operators,
+                         name=name)
+    
     
     def _implementation(self, ham, sbi):
-        """ Reference implementation, completely in Python
+        r""" Reference implementation, completely in Python
         
         Implementation of Redfield relaxation tensor according to 
         
@@ -27,6 +68,10 @@ class TDRedfieldRelaxationTensor(RedfieldRelaxationTensor, TimeDependent):
         in Section 3.8.3 to get the so-called "Multi-level Redfield
         Equations"). Such a deletion can be done later manually. 
         
+        The time-dependent integrals of the correlation functions are
+        calculated for all transition frequencies at once (see
+        `_cumulative_integrals`), and only once for all baths which share
+        the same correlation function.
         
         """
         #
@@ -69,15 +114,12 @@ class TDRedfieldRelaxationTensor(RedfieldRelaxationTensor, TimeDependent):
         # Get eigenenergies and transformation matrix of the Hamiltonian
         #
         if True:
-            hD, SS = numpy.linalg.eigh(ham.data)   
+            hD, SS = ham.manager.basis_cache.eigh(ham.data, owner=ham)   
                
         #
         #  Find all transition frequencies
         # 
-        Om = numpy.zeros((Na, Na))
-        for a in range(Na):
-            for b in range(Na):
-                Om[a,b] = hD[a] - hD[b]
+        Om = hD[:,None] - hD[None,:]
                 
         # number of baths - one per monomer            
         Nb = sbi.N
@@ -89,58 +131,56 @@ class TDRedfieldRelaxationTensor(RedfieldRelaxationTensor, TimeDependent):
         # Site K_m operators 
         #
 
-        Km = numpy.zeros((Nb, Na, Na), dtype=numpy.float64) 
         # Transform site operators       
-        S1 = scipy.linalg.inv(SS)
+        S1 = unitary_inverse(SS)
         #FIXME: SBI should also be basis controlled
-        for ns in range(Nb): 
-            Km[ns,:,:] = numpy.dot(S1, numpy.dot(sbi.KK[ns,:,:],SS))
+        Km = numpy.real(numpy.matmul(S1, numpy.matmul(sbi.KK, SS)))
         
         #
         # \Lambda_m operator
         #
         
+        # integrals are calculated only for distinct frequencies
+        oms, oinv = numpy.unique(Om, return_inverse=True)
+        oinv = oinv.reshape(Na, Na)
+        
         # Integrals of correlation functions from the set 
         Lm = numpy.zeros((Nt, Nb, Na, Na), dtype=numpy.complex128)
-        for ms in range(Nb):
-            #for ns in range(Nb):
-            if not multi_ex:
-                ns = ms
+        if not multi_ex:
+            
+            # baths sharing the same correlation function share 
+            # the integrals, too
+            cfs = {}
+            for ms in range(Nb):
+                cfs.setdefault(sbi.CC.cpointer[ms, ms], []).append(ms)
                 
-                # correlation function of site ns (if ns == ms)
-                # or a cross-correlation function of sites ns and ms
+            for icf in cfs:
                 
                 #FIXME: reaching correct correlation function is a nightmare!!!
-                rc1 = sbi.CC.get_coft(ms, ns) 
+                ms = cfs[icf][0]
+                rc1 = sbi.CC.get_coft(ms, ms)
                 
-                for a in range(Na):
-                    for b in range(Na):
-                        
-                        # argument of the integration
-                        eexp = numpy.exp(-1.0j*Om[a,b]*tm) 
-                        rc = rc1[0:length]*eexp
-                        
-                        # spline integration instead of FFT
-                        rr = numpy.real(rc)
-                        ri = numpy.imag(rc)
-                        sr = scipy.interpolate.UnivariateSpline(tm,
-                                    rr, s=0).antiderivative()(tm)
-                        si = scipy.interpolate.UnivariateSpline(tm,
-                                    ri, s=0).antiderivative()(tm)
-                                
-                        # we take the last value (integral to infinity)
-                        # #### cc_mnab = (sr[length-1] + 1.0j*si[length-1]) 
-                        cc_mnab = (sr + 1.0j*si)
-                        
-                        # \Lambda_m operators
-                        Lm[:,ms,a,b] += cc_mnab*Km[ns,a,b] 
-             
+                # integrals for all distinct frequencies, shape (Nt, Nom)
+                cc_om = _cumulative_integrals(rc1[0:length], oms, tm)
+                cc_ab = cc_om[:, oinv]
+                
+                # \Lambda_m operators
+                for ms in cfs[icf]:
+                    Lm[:,ms,:,:] = cc_ab*Km[ms,:,:]
+        
+        #
+        # keep \Lambda_m operators only until they converge
+        #
+        if self.markov_tolerance is not None:
+            Nconv = _markov_convergence_index(Lm, self.markov_tolerance)
+            if Nconv < Nt:
+                Lm = Lm[0:Nconv,...].copy()
+                self.Nt = Nconv
+                self.cutoff_time = ta.data[Nconv]
+                self._has_cutoff_time = True
         
         # create the Hermite conjuged version of \Lamnda_m
-        Ld = numpy.zeros((Nt, Nb, Na, Na), dtype=numpy.complex128)
-        for tt in range(Nt):
-            for ms in range(Nb):
-                Ld[tt, ms, :, :] += numpy.conj(numpy.transpose(Lm[tt,ms,:,:]))        
+        Ld = numpy.conj(numpy.swapaxes(Lm, 2, 3))
             
         if self.as_operators:
             
@@ -163,7 +203,7 @@ class TDRedfieldRelaxationTensor(RedfieldRelaxationTensor, TimeDependent):
 
     
     def _convert_operators_2_tensor(self, Km, Lm, Ld):
-        """Converts operator representation to the tensor one
+        r"""Converts operator representation to the tensor one
         
         Convertes operator representation of the Redfield tensor
         into a truely tensor representation
@@ -183,27 +223,17 @@ class TDRedfieldRelaxationTensor(RedfieldRelaxationTensor, TimeDependent):
         """    
         
         Na = self.Hamiltonian.data.shape[0]
-        Nb = self.SystemBathInteraction.N
-        Nt = self.Nt
         
-        RR = numpy.zeros((Nt, Na, Na, Na, Na), dtype=numpy.complex128)
-        
-        for m in range(Nb):
-            #print("m =", m ,"of", Nb)
-            for tt in range(Nt):
-                KmLm = numpy.dot(Km[m,:,:],Lm[tt,m,:,:])
-                LdKm = numpy.dot(Ld[tt,m,:,:],Km[m,:,:])
-                for a in range(Na):
-                    for b in range(Na):
-                        for c in range(Na):
-                            for d in range(Na):
-                            
-                                RR[tt,a,b,c,d] += (Km[m,a,c]*Ld[tt,m,d,b] 
-                                                + Lm[tt,m,a,c]*Km[m,d,b])
-                                if b == d:
-                                    RR[tt,a,b,c,d] -= KmLm[a,c] 
-                                if a == c:
-                                    RR[tt,a,b,c,d] -= LdKm[d,b]
+        # delta functions for the terms with the identity operator
+        delta = numpy.eye(Na)
+
+        KmLm = numpy.einsum("mac,tmcd->tad", Km, Lm)
+        LdKm = numpy.einsum("tmac,mcd->tad", Ld, Km)
+        
+        RR = (numpy.einsum("mac,tmdb->tabcd", Km, Ld)
+             +numpy.einsum("tmac,mdb->tabcd", Lm, Km))
+        RR -= numpy.einsum("tac,bd->tabcd", KmLm, delta)
+        RR -= numpy.einsum("tdb,ac->tabcd", LdKm, delta)
         
         return RR
         
@@ -226,6 +256,10 @@ class TDRedfieldRelaxationTensor(RedfieldRelaxationTensor, TimeDependent):
             
         """        
 
+        # compact secular form is always kept in the secular basis
+        if self.secular_compact:
+            return
+        
         if inv is None:
             S1 = numpy.linalg.inv(SS)
         else:
@@ -234,48 +268,106 @@ class TDRedfieldRelaxationTensor(RedfieldRelaxationTensor, TimeDependent):
         
 
         if not self._data_initialized:
-            for tt in range(self.Nt):
-                for m in range(self.Km.shape[0]):
-                    self.Lm[tt, m, :, :] = \
-                    numpy.dot(S1,numpy.dot(self.Lm[tt, m, :, :],SS))
-                    self.Ld[tt, m, :, :] = \
-                    numpy.dot(S1,numpy.dot(self.Ld[tt, m, :, :],SS))            
-            for m in range(self.Km.shape[0]):
-                self.Km[m, :, :] = numpy.dot(S1,numpy.dot(self.Km[m, :, :],SS))
+            self._Lm = numpy.matmul(S1, numpy.matmul(self._Lm, SS))
+            self._Ld = numpy.matmul(S1, numpy.matmul(self._Ld, SS))
+            self._Km = numpy.matmul(S1, numpy.matmul(self._Km, SS))
                 
             return
         
         
         if (self.manager.warn_about_basis_change):
                 print("\nQr >>> Relaxation tensor '%s' changes basis" %self.name)
-           
-        
-        for tt in range(self.Nt):
-            for c in range(dim):
-                for d in range(dim):
-                    self._data[tt,:,:,c,d] = \
-                        numpy.dot(S1,numpy.dot(self._data[tt,:,:,c,d],SS))
                 
-            for a in range(dim):
-                for b in range(dim):
-                    self._data[tt,a,b,:,:] = \
-                        numpy.dot(S1,numpy.dot(self._data[tt,a,b,:,:],SS))
+        self._data = numpy.einsum("ia,tabcd,bj,kc,dl->tijkl",
+                                  S1, self._data, SS, S1, SS, optimize=True)
 
             
-    def secularize(self):
+    def secularize(self, legacy=True):
         """Secularizes the relaxation tensor
-
+        
+        See RelaxationTensor.secularize()
 
         """
-        if self.as_operators:
+        if self.as_operators and legacy:
             raise Exception("Cannot be secularized in an opeator form")
             
         else:
-            N = self.data.shape[1]
-            for ii in range(N):
-                for jj in range(N):
-                    for kk in range(N):
-                        for ll in range(N):
-                            if not (((ii == jj) and (kk == ll)) 
-                                or ((ii == kk) and (jj == ll))) :
-                                    self.data[:,ii,jj,kk,ll] = 0
\ No newline at end of file
+            super().secularize(legacy=legacy)
+
+
+def _cumulative_integrals(cf, oms, tm):
+    r"""Cumulative integrals of a correlation function with oscillating factors
+
+    Calculates
+
+    I(t, om) = \int_0^t d\tau cf(\tau) exp(-i om \tau)
+
+    on the (uniform) time grid `tm` for all frequencies `om` in `oms` at
+    once. The correlation function is interpolated linearly between the
+    grid points and the integrals over each step are evaluated
+    analytically (Filon-type quadrature), so that even the fast
+    oscillating factors are integrated exactly.
+
+    Parameters
+    ----------
+
+    cf : numpy.ndarray
+        Correlation function on the time grid
+
+    oms : numpy.ndarray
+        Frequencies
+
+    tm : numpy.ndarray
+        Uniform time grid
+
+    Returns
+    -------
+
+    numpy.ndarray of shape (len(tm), len(oms))
+
+    """
+    Nt = tm.shape[0]
+    ret = numpy.zeros((Nt, oms.shape[0]), dtype=numpy.complex128)
+    if Nt < 2:
+        return ret
+
+    hh = tm[1] - tm[0]
+    xx = -1.0j*oms*hh
+
+    # weights of the linear interpolation
+    #   A = \int_0^h exp(-i om s) ds, B = \int_0^h s exp(-i om s) ds / h
+    small = numpy.abs(xx) < 1.0e-3
+    xs = numpy.where(small, 1.0, xx)
+    ex = numpy.exp(xs)
+    AA = numpy.where(small, 1.0 + xx/2.0 + xx**2/6.0, (ex - 1.0)/xs)*hh
+    BB = numpy.where(small, 0.5 + xx/3.0 + xx**2/8.0,
+                     ex/xs - (ex - 1.0)/xs**2)*hh
+    w0 = AA - BB
+    w1 = BB
+
+    phase = numpy.exp(-1.0j*numpy.outer(tm[0:Nt-1], oms))
+    steps = phase*(numpy.outer(cf[0:Nt-1], w0) + numpy.outer(cf[1:Nt], w1))
+    numpy.cumsum(steps, axis=0, out=ret[1:,:])
+
+    return ret
+
+
+def _markov_convergence_index(Lm, rtol):
+    r"""Returns the number of time steps after which Lm stays converged
+
+    \Lambda_m(t) is considered converged at time t, if it differs from its
+    last (long time) value by less than `rtol` relative to the maximum
+    absolute value of the last value for all later times.
+
+    """
+    Nt = Lm.shape[0]
+    Lmax = numpy.max(numpy.abs(Lm[Nt-1,...]))
+    if Lmax == 0.0:
+        return 1
+
+    err = numpy.max(numpy.abs(Lm - Lm[Nt-1,...]).reshape(Nt, -1), axis=1)
+    above = numpy.nonzero(err > rtol*Lmax)[0]
+    if above.shape[0] == 0:
+        return 1
+
+    return min(above[-1] + 2, Nt)
@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 import numpy
+import scipy.linalg
 from ..liouvillespace.rates.ratematrix import RateMatrix
+from .dmevolution import ReducedDensityMatrixEvolution
+from ...core.basiscache import unitary_inverse
+from ...utils.timing import profiled
 
 class PopulationPropagator:
     """ Propagator for a population vector 
@@ -36,15 +40,143 @@ class PopulationPropagator:
                 self.KK = rate_matrix.data
             else:
                 self.KK = rate_matrix
+                
+        # eigen-decomposition of the rate matrix (calculated once)
+        self._eigen = None
+        
     
+    @profiled()
     def propagate(self, pini):
         """Propagates a given initional population vector
         
+        The populations are calculated on the whole time axis at once 
+        from the eigen-decomposition of the rate matrix
+        
+        P(t) = S exp(K_d t) S^-1 P(0)
+        
+        If the rate matrix is (close to) defective, i.e. its eigenvectors
+        are ill-conditioned, the populations are propagated by the powers
+        of the exact evolution matrix exp(K dt) instead.
+        
+        Parameters
+        ----------
+        
+        pini : array
+            Initial population vector. Several initial conditions can be
+            submitted as an array of the shape (Nini, N)
+        
+        Returns
+        -------
+        
+        numpy.ndarray of the shape (Nt, N), or (Nt, Nini, N) for several
+        initial conditions
+        
         """
         if not isinstance(pini, numpy.ndarray):
             pini = numpy.array(pini)
             
-        return self._propagate_short_exp(pini)    
+        eigen = self._get_eigen()
+        if eigen is None:
+            return self._real_if_real(self._propagate_by_powers(pini))
+        
+        Kd, SS, S1 = eigen
+        tt = self.timeAxis.data - self.timeAxis.data[0]
+        
+        # initial condition in the eigenbasis of the rate matrix 
+        cc = numpy.dot(pini, S1.T)
+        expK = numpy.exp(numpy.outer(tt, Kd))
+        if cc.ndim == 1:
+            pops = numpy.dot(expK*cc[numpy.newaxis,:], SS.T)
+        else:
+            pops = numpy.dot(expK[:,numpy.newaxis,:]*cc[numpy.newaxis,:,:],
+                             SS.T)
+        
+        return self._real_if_real(pops)
+        
+        
+    def get_evolution(self, times):
+        """Returns population evolution matrices at given times
+        
+        Parameters
+        ----------
+        
+        times : numpy.ndarray
+            Times (relative to the initial time) at which the evolution 
+            matrices exp(K t) are calculated
+            
+        Returns
+        -------
+        
+        numpy.ndarray of the shape (len(times), N, N)
+        
+        """
+        eigen = self._get_eigen()
+        if eigen is None:
+            KK = self._get_rate_data()
+            U = scipy.linalg.expm(numpy.asarray(times)[:,numpy.newaxis,
+                                                       numpy.newaxis]*KK)
+            return self._real_if_real(U)
+        
+        Kd, SS, S1 = eigen
+        expK = numpy.exp(numpy.outer(times, Kd))
+        U = numpy.einsum("ik,tk,kj->tij", SS, expK, S1)
+        
+        return self._real_if_real(U)
+            
+    
+    # largest condition number of the eigenvectors of the rate matrix
+    # for which the eigen-decomposition is used
+    _max_condition = 1.0e6
+    
+    def _get_eigen(self):
+        """Returns the (cached) eigen-decomposition of the rate matrix
+        
+        None is returned if the rate matrix is (close to) defective
+        
+        """
+        if self._eigen is None:
+            Kd, SS = numpy.linalg.eig(self._get_rate_data())
+            if numpy.linalg.cond(SS) > self._max_condition:
+                self._eigen = False
+            else:
+                S1 = numpy.linalg.inv(SS)
+                self._eigen = (Kd, SS, S1)
+        if self._eigen is False:
+            return None
+        return self._eigen
+    
+    
+    def _propagate_by_powers(self, pini):
+        """Propagation by the powers of the evolution matrix exp(K dt)
+        
+        """
+        UU = scipy.linalg.expm(self._get_rate_data()*self.dt)
+        pops = numpy.zeros((self.Nt,)+pini.shape, dtype=UU.dtype)
+        pops[0] = pini
+        for indx in range(1, self.Nt):
+            pops[indx] = numpy.dot(pops[indx-1], UU.T)
+        return pops
+    
+    
+    def _real_if_real(self, data):
+        """Real part of the data if the rate matrix is real
+        
+        """
+        if numpy.isrealobj(self._get_rate_data()):
+            return numpy.real(data)
+        return data
+    
+    
+    def _get_rate_data(self):
+        """Returns the rate matrix as an array
+        
+        Rate matrix objects which are not RateMatrix instances (e.g. 
+        RedfieldRateMatrix) are stored as they were submitted
+        
+        """
+        if isinstance(self.KK, numpy.ndarray):
+            return self.KK
+        return numpy.asarray(self.KK.data)
         
         
     def _propagate_short_exp(self,pini,L=4):
@@ -99,8 +231,7 @@ class PopulationPropagator:
         """
         expK = numpy.exp((Ka-Kb)*timeaxis.data)
         integ = numpy.zeros(timeaxis.length,dtype=numpy.float64)
-        for i in range(timeaxis.length):
-            integ[i] = numpy.sum(expK[0:i])
+        integ[1:] = numpy.cumsum(expK[:-1])
         return Kab*integ*timeaxis.step
     
     def _integrateKn(self,timeaxis,Kab,Ka,Kb,Kbc):
@@ -111,8 +242,7 @@ class PopulationPropagator:
         """
         expK = numpy.exp((Ka-Kb)*timeaxis.data)
         integ = numpy.zeros(timeaxis.length,dtype=numpy.float64)
-        for i in range(timeaxis.length):
-            integ[i] = numpy.sum(expK[0:i]*Kbc[0:i])
+        integ[1:] = numpy.cumsum(expK[:-1]*Kbc[:-1])
         return Kab*integ*timeaxis.step
         
     def get_PropagationMatrix(self, timeaxis, corrections=-1, exact=False):
@@ -140,50 +270,12 @@ class PopulationPropagator:
         """
         if timeaxis.is_subset_of(self.timeAxis):
             N = self.KK.shape[0]
-            U = numpy.zeros((N,N,timeaxis.length), dtype=numpy.float64)
             
-            # initial condition
-            U0 = numpy.eye(N)
-            
-            # diagonalization of the rate matrix
-            Kd, SS = numpy.linalg.eig(self.KK)
-            S1 = numpy.linalg.inv(SS)
-
-            
-            # calculating exp(KK*step)
-            expKd_step = numpy.dot(SS,numpy.dot(
-                    numpy.diag(numpy.exp(Kd*timeaxis.step)),S1))
-
-            #
-            # If the starts of the time axes do not coincide, and the
-            # shift is not a multiple of the submitted time axis step,
-            # we have to calculate the evolution matrix also with
-            # the difference of the starting times
-            #
-            if self.timeAxis.start != timeaxis.start:
-
-                
-                # get the distance of the starts in timeaxis.steps
-                Ns = round((timeaxis.start - self.timeAxis.start)
-                            /timeaxis.step)
-                # if one can use timeaxis.step, make Ns steps 
-                if (timeaxis.start == self.timeAxis.start + Ns*timeaxis.step):
-                    for i in range(Ns):
-                        U0 = numpy.dot(expKd_step,U0)
-                # otherwise new exp(KK*dt) has to be calculated and applied
-                else:
-                    dt = timeaxis.start - self.timeAxis.start
-                    expKd_dt = numpy.dot(SS,numpy.dot(
-                            numpy.diag(numpy.exp(Kd*dt)),S1))
-                    U0 = numpy.dot(expKd_dt,U0)
-                    
-            # initial condition at the start of the submitted timeaxis            
-            U[:,:,0] = U0
- 
-            # application of the exp(KK*step) on initial condition
-            for i in range(1,timeaxis.length):
-                U[:,:,i] = numpy.dot(expKd_step,U[:,:,i-1])
-                
+            # evolution matrices on the whole submitted time axis at once
+            # (the starts of the time axes do not have to coincide)
+            U = numpy.transpose(self.get_evolution(timeaxis.data
+                                                   -self.timeAxis.start),
+                                (1, 2, 0))
             
             #
             # Calculate exact orders in transfer matrix
@@ -319,4 +411,172 @@ class PopulationPropagator:
                             +" TimeAxis of this propagator.")
             
             
-    
\ No newline at end of file
+    
+
+class SecularPropagator(PopulationPropagator):
+    """Propagator of the density matrix with secular relaxation
+    
+    With a secular relaxation tensor, populations decouple from coherences.
+    Populations are propagated by the exponential of the population transfer
+    rate matrix (see PopulationPropagator), coherences are damped 
+    oscillations
+    
+    rho_ij(t) = rho_ij(0) exp(-i om_ij t + G_ij t)
+    
+    where G_ij are the dephasing rates of the tensor. No time stepping is
+    involved, and the full density matrix is assembled only when 
+    the method `propagate` is called.
+    
+    Parameters
+    ----------
+    
+    timeaxis : TimeAxis
+        The time interval on which we propagate.
+        
+    ham : Hamiltonian
+        Hamiltonian of the system. It has to be diagonal in the basis 
+        in which the relaxation tensor was secularized.
+        
+    relt : RelaxationTensor
+        Time-independent relaxation tensor in compact secular form
+        (see the `secularize` method with `legacy=False`)
+        
+    """
+    
+    def __init__(self, timeaxis, ham, relt):
+        
+        if not relt.secular_compact:
+            raise Exception("Relaxation tensor has to be in compact secular"+
+                            " form; use secularize(legacy=False)")
+        if relt.secular_time_dependent:
+            raise Exception("Time-dependent relaxation tensors are not"+
+                            " supported")
+            
+        super().__init__(timeaxis, rate_matrix=relt.secular_KK)
+        
+        self.Hamiltonian = ham
+        self.RelaxationTensor = relt
+        self.N = ham.dim
+        
+        
+    def propagate_populations(self, rhoi):
+        """Returns populations in the basis of secularization
+        
+        Parameters
+        ----------
+        
+        rhoi : ReducedDensityMatrix
+            Initial density matrix (in the current basis)
+            
+        Returns
+        -------
+        
+        numpy.ndarray of the shape (Nt, N)
+        
+        """
+        SS, en = self._secular_basis()
+        rho0 = self._to_secular_basis(rhoi.data, SS)
+        return PopulationPropagator.propagate(self, numpy.diag(rho0))
+    
+    
+    def propagate_coherences(self, rhoi):
+        """Returns coherences in the basis of secularization
+        
+        Parameters
+        ----------
+        
+        rhoi : ReducedDensityMatrix
+            Initial density matrix (in the current basis)
+            
+        Returns
+        -------
+        
+        numpy.ndarray of the shape (Nt, N, N) with zero diagonal
+        
+        """
+        SS, en = self._secular_basis()
+        rho0 = self._to_secular_basis(rhoi.data, SS)
+        return self._coherences(rho0, en)
+        
+    
+    @profiled()
+    def propagate(self, rhoi):
+        """Propagates the density matrix
+        
+        Populations and coherences are assembled into 
+        the ReducedDensityMatrixEvolution object in the current basis.
+        
+        Parameters
+        ----------
+        
+        rhoi : ReducedDensityMatrix
+            Initial density matrix (in the current basis)
+            
+        """
+        SS, en = self._secular_basis()
+        rho0 = self._to_secular_basis(rhoi.data, SS)
+        
+        rhot = self._coherences(rho0, en)
+        dg = numpy.arange(self.N)
+        rhot[:, dg, dg] = PopulationPropagator.propagate(self, 
+                                                         numpy.diag(rho0))
+        
+        if SS is not None:
+            rhot = numpy.matmul(SS, numpy.matmul(rhot, unitary_inverse(SS)))
+            
+        pr = ReducedDensityMatrixEvolution(self.timeAxis, rhoi)
+        pr.data[:,:,:] = rhot
+        
+        if self.Hamiltonian.has_rwa:
+            pr.is_in_rwa = True
+            
+        return pr
+    
+    
+    def _coherences(self, rho0, en):
+        """Closed form evolution of coherences
+        
+        """
+        tt = self.timeAxis.data - self.timeAxis.data[0]
+        om = en[:,numpy.newaxis] - en[numpy.newaxis,:]
+        expo = -1j*om + self.RelaxationTensor.secular_GG
+        
+        rhot = rho0[numpy.newaxis,:,:] \
+              *numpy.exp(tt[:,numpy.newaxis,numpy.newaxis]
+                         *expo[numpy.newaxis,:,:])
+        dg = numpy.arange(self.N)
+        rhot[:, dg, dg] = 0.0
+        
+        return rhot
+    
+    
+    def _to_secular_basis(self, rho, SS):
+        """Transforms density matrix data into the basis of secularization
+        
+        """
+        if SS is None:
+            return numpy.array(rho, dtype=numpy.complex128)
+        return numpy.dot(unitary_inverse(SS), numpy.dot(rho, SS))
+        
+    
+    def _secular_basis(self):
+        """Transformation into the basis of secularization and energies
+        
+        """
+        if self.Hamiltonian.has_rwa:
+            HH = self.Hamiltonian.get_RWA_data()
+        else:
+            HH = self.Hamiltonian.data
+            
+        SS = self.RelaxationTensor.get_secular_transformation()
+        if SS is not None:
+            HH = numpy.dot(unitary_inverse(SS), numpy.dot(HH, SS))
+            
+        en = numpy.diag(HH)
+        off = HH - numpy.diag(en)
+        if numpy.max(numpy.abs(off)) > 1.0e-8*max(1.0,
+                                                numpy.max(numpy.abs(en))):
+            raise Exception("Hamiltonian has to be diagonal in the basis"+
+                            " in which the relaxation tensor is secular")
+            
+        return SS, numpy.real(en)
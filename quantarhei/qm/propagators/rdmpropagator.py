@@ -18,6 +18,7 @@ import numpy
 
 #import scipy.integrate
 import numpy.linalg
+import scipy.linalg
 
 import matplotlib.pyplot as plt
 
@@ -31,8 +32,12 @@ from ...core.saveable import Saveable
 from ..liouvillespace.redfieldtensor import RelaxationTensor
 from ..hilbertspace.operators import ReducedDensityMatrix, DensityMatrix
 from .dmevolution import ReducedDensityMatrixEvolution
+from .poppropagator import SecularPropagator
 from ...core.matrixdata import MatrixData
 from ...core.managers import Manager
+from ...core.basiscache import unitary_inverse
+from ...core.diskcache import fingerprint
+from ...utils.timing import profiled
 
 import quantarhei as qr
 
@@ -203,8 +208,26 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
         self.dt = self.Odt/self.Nref
         
         
-    def propagate(self, rhoi, method="short-exp", mdata=None, name=""):
-        """
+    @profiled()
+    def propagate(self, rhoi, method="short-exp", mdata=None, name="",
+                  checkpoint=None):
+        """Propagates the density matrix
+        
+        Parameters
+        ----------
+        
+        rhoi : ReducedDensityMatrix
+            Initial density matrix
+            
+        method : str
+            Propagation method
+            
+        checkpoint : Checkpoint
+            If specified, the propagation saves its state periodically
+            and it resumes from the last saved state of the same propagation
+            (see quantarhei.core.checkpoint). Supported with the "short-exp"
+            methods and time-independent relaxation tensors.
+        
         
         >>> T0   = 0
         >>> Tmax = 100
@@ -245,6 +268,12 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
              or isinstance(rhoi, DensityMatrix)):
             raise Exception("First argument has be of"+
             "the ReducedDensityMatrix type")
+
+        self._checkpoint = checkpoint
+        if ((checkpoint is not None) 
+            and (not self._uses_short_exp_steps(method))):
+            raise Exception("Checkpoints are not supported with this"+
+                            " propagation method")
               
         #######################################################################
         #
@@ -360,6 +389,8 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
                         return \
                         self.__propagate_short_exp_with_relaxation_EField(
                         rhoi,L=6)            
+                    elif method == "magnus":
+                        return self.__propagate_magnus_EField(rhoi)
                     else:
                         raise Exception("Unknown propagation method: "+method)
                         
@@ -392,6 +423,8 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
                         return self.__propagate_Runge_Kutta(rhoi)
                     elif method == "diagonalization":
                         return self.__propagate_diagonalization(rhoi)
+                    elif method == "secular":
+                        return self.__propagate_secular(rhoi)
 
                     else:
                         raise Exception("Unknown propagation method: "+method)   
@@ -408,6 +441,11 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
 
                 raise Exception("NOT IMPLEMENTED")
 
+            elif (self.has_EField and self.has_Trdip
+                  and (method == "magnus")):
+                
+                return self.__propagate_magnus_EField(rhoi)
+
             else:
                  
                 if method == "short-exp":
@@ -434,6 +472,428 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
         
             
         
+    def propagate_iter(self, rhoi, method="short-exp", observables=None,
+                       decimate=1):
+        """Propagates the density matrix yielding results as they are computed
+        
+        Unlike the `propagate` method, the evolution of the density matrix
+        is not stored. Only the current density matrix is kept in memory, and
+        the density matrix or selected observables are yielded as soon as
+        they are calculated. The memory requirements therefore do not grow
+        with the number of time steps.
+        
+        Parameters
+        ----------
+        
+        rhoi : ReducedDensityMatrix
+            Initial density matrix
+            
+        method : str
+            Propagation method. The "short-exp" methods are supported with
+            time-independent and time-dependent relaxation tensors, in
+            tensor or operator form and in the compact secular form. 
+            Relaxation tensors in operator form are always propagated
+            by the complex numpy implementation.
+            
+        observables : None, str, list or callable
+            What is yielded at each time step. None yields the density
+            matrix (numpy.ndarray in the current basis, in the RWA if the
+            Hamiltonian has RWA set), "populations" yields its real diagonal,
+            a list of operators (Operator objects or numpy arrays) yields
+            a complex array of expectation values Tr(A rho), and a boolean
+            mask of the shape of the density matrix yields its selected
+            elements. A callable is applied to the density matrix and its
+            result is yielded.
+            
+        decimate : int
+            Only every `decimate`-th time of the TimeAxis is yielded
+            
+            
+        Yields
+        ------
+        
+        (t, value) : tuple
+            Time and the value requested by the `observables` argument
+            
+            
+        Examples
+        --------
+        
+        >>> import quantarhei as qr
+        >>> HH = qr.Hamiltonian(data=[[0.0, 0.1], [0.1, 0.05]])
+        >>> time = qr.TimeAxis(0.0, 1000, 0.1)
+        >>> prop = qr.ReducedDensityMatrixPropagator(time, HH)
+        >>> rhoi = qr.ReducedDensityMatrix(data=[[1.0, 0.0], [0.0, 0.0]])
+        >>> for (t, pop) in prop.propagate_iter(rhoi, 
+        ...                         observables="populations", decimate=400):
+        ...     print("%5.1f %6.4f" % (t, pop[0]))
+          0.0 1.0000
+         40.0 0.3495
+         80.0 0.1963
+        
+        """
+        if not (isinstance(rhoi, ReducedDensityMatrix) 
+             or isinstance(rhoi, DensityMatrix)):
+            raise Exception("First argument has be of"+
+            "the ReducedDensityMatrix type")
+            
+        if not self._supports_streaming(method):
+            raise Exception("Streaming is not supported with this"+
+                            " propagation method")
+        if decimate < 1:
+            raise Exception("Decimation has to be a positive integer")
+            
+        measure = self._observable_function(observables)
+        L = self._short_exp_orders[method]
+        times = self.TimeAxis.data
+        
+        rho = numpy.array(rhoi.data, dtype=numpy.complex128)
+        yield (times[0], measure(rho.copy()))
+        
+        for (indx, rho) in self._streaming_steps(rho, L):
+            if indx % decimate == 0:
+                yield (times[indx], measure(rho))
+        
+        
+    def _observable_function(self, observables):
+        """Returns a function which evaluates observables on a density matrix
+        
+        See the `observables` argument of the `propagate_iter` method
+        
+        """
+        if observables is None:
+            return lambda rho: rho
+        
+        elif isinstance(observables, str):
+            if observables == "populations":
+                return lambda rho: numpy.real(numpy.diag(rho)).copy()
+            raise Exception("Unknown observables: "+observables)
+            
+        elif callable(observables):
+            return observables
+        
+        AT = numpy.transpose(self._observable_operators(observables), 
+                             (0, 2, 1))
+        AT = numpy.reshape(numpy.ascontiguousarray(AT), (AT.shape[0], -1))
+        
+        # Tr(A rho) = sum_ij A_ji rho_ij
+        return lambda rho: numpy.dot(AT, numpy.reshape(rho, -1))
+        
+        
+    def _observable_operators(self, observables):
+        """Returns the observables as a (Nobs, N, N) array of operators
+        
+        Operators are taken in the current basis. A boolean mask selecting
+        elements rho_ij of the density matrix is converted into operators
+        |j><i| in the order given by numpy.nonzero.
+        
+        """
+        if isinstance(observables, str):
+            if observables == "populations":
+                observables = numpy.eye(self.N, dtype=bool)
+            else:
+                raise Exception("Unknown observables: "+observables)
+        
+        if (isinstance(observables, numpy.ndarray) 
+            and (observables.dtype == bool)):
+            if observables.shape != (self.N, self.N):
+                raise Exception("Mask has to be of the shape"+
+                                " of the density matrix")
+            (ii, jj) = numpy.nonzero(observables)
+            AA = numpy.zeros((len(ii), self.N, self.N), dtype=qr.REAL)
+            AA[numpy.arange(len(ii)), jj, ii] = 1.0
+            return AA
+        
+        AA = numpy.array([op.data if isinstance(op, Operator) else op
+                          for op in observables])
+        if AA.shape[1:] != (self.N, self.N):
+            raise Exception("Operators have to be of the dimension of"+
+                            " the Hamiltonian")
+        return AA
+        
+        
+    @profiled()
+    def propagate_observables(self, rhoi, observables, method="short-exp",
+                              picture="auto"):
+        """Returns expectation values of operators during the propagation
+        
+        The expectation values Tr(A rho(t)) are accumulated during
+        the propagation into an array of the shape (Nt, Nobs) and
+        the evolution of the density matrix is not stored.
+        
+        With a time-independent generator of the dynamics (the "short-exp"
+        methods and a time-independent relaxation tensor), the propagation
+        can run in the Heisenberg picture, i.e. the observables are
+        propagated by the adjoint of the generator, and the expectation
+        values for any number of initial density matrices are obtained
+        from a single propagation. This is advantageous when the number
+        of initial conditions exceeds the number of observables. In the
+        Schrodinger picture, the "short-exp" methods stream the density
+        matrix (see `propagate_iter`) with any relaxation tensor; only
+        with other methods the expectation values are evaluated from
+        the result of the `propagate` method.
+        
+        Parameters
+        ----------
+        
+        rhoi : ReducedDensityMatrix or list
+            Initial density matrix, or a list of initial density matrices
+            
+        observables : list, numpy.ndarray or str
+            List of operators (Operator objects or numpy arrays), a boolean
+            mask selecting elements of the density matrix (see the 
+            `propagate_iter` method), or "populations"
+            
+        method : str
+            Propagation method
+            
+        picture : str
+            "Schrodinger", "Heisenberg", or "auto". With "auto", the 
+            Heisenberg picture is used if it is supported and if there are
+            more initial conditions than observables.
+            
+            
+        Returns
+        -------
+        
+        numpy.ndarray
+            Expectation values with the shape (Nt, Nobs), or (Nt, Nrho, Nobs)
+            if a list of Nrho initial density matrices is submitted. They are
+            real if all operators and all initial density matrices are 
+            Hermitian. In the RWA, the operators are assumed in the rotating
+            frame.
+            
+            
+        Examples
+        --------
+        
+        >>> import quantarhei as qr
+        >>> HH = qr.Hamiltonian(data=[[0.0, 0.1], [0.1, 0.05]])
+        >>> time = qr.TimeAxis(0.0, 1000, 0.1)
+        >>> prop = qr.ReducedDensityMatrixPropagator(time, HH)
+        >>> rho1 = qr.ReducedDensityMatrix(data=[[1.0, 0.0], [0.0, 0.0]])
+        >>> rho2 = qr.ReducedDensityMatrix(data=[[0.0, 0.0], [0.0, 1.0]])
+        >>> pops = prop.propagate_observables([rho1, rho2], "populations")
+        >>> pops.shape
+        (1000, 2, 2)
+        >>> print("%6.4f %6.4f" % (pops[400,0,0], pops[400,1,1]))
+        0.3495 0.3495
+        
+        """
+        single = isinstance(rhoi, (ReducedDensityMatrix, DensityMatrix))
+        rhos = [rhoi] if single else list(rhoi)
+        for rho in rhos:
+            if not isinstance(rho, (ReducedDensityMatrix, DensityMatrix)):
+                raise Exception("Initial conditions have to be of"+
+                                " the ReducedDensityMatrix type")
+        
+        AA = self._observable_operators(observables)
+        
+        # expectation values are real if both the operators and
+        # the initial density matrices are Hermitian
+        hermitian = numpy.allclose(AA, 
+                        numpy.conj(numpy.transpose(AA, (0, 2, 1))))
+        for rho in rhos:
+            hermitian = hermitian and numpy.allclose(rho.data,
+                                            numpy.conj(rho.data.T))
+        
+        heisenberg = self._uses_short_exp_steps(method)
+        if self.has_PDeph and (self.PDeph.dtype != "Lorentzian"):
+            heisenberg = False
+        if picture == "auto":
+            heisenberg = heisenberg and (AA.shape[0] < len(rhos))
+        elif picture == "Heisenberg":
+            if not heisenberg:
+                raise Exception("Heisenberg picture requires"+
+                                " a time-independent generator")
+        elif picture == "Schrodinger":
+            heisenberg = False
+        else:
+            raise Exception("Unknown picture: "+picture)
+            
+        Nobs = AA.shape[0]
+        vals = numpy.zeros((self.Nt, len(rhos), Nobs), dtype=qr.COMPLEX)
+        
+        if heisenberg:
+            
+            RR = numpy.array([rho.data for rho in rhos], dtype=qr.COMPLEX)
+            aa = numpy.transpose(AA, (0, 2, 1)).astype(qr.COMPLEX)
+            vals[0,:,:] = numpy.einsum("oij,rij->ro", aa, RR)
+            L = self._short_exp_orders[method]
+            for (indx, aa) in self._adjoint_short_exp_steps(aa, L):
+                vals[indx,:,:] = numpy.einsum("oij,rij->ro", aa, RR)
+                
+        elif self._supports_streaming(method):
+            
+            for (k, rho) in enumerate(rhos):
+                for (indx, (t, val)) in enumerate(self.propagate_iter(rho,
+                                                  method=method,
+                                                  observables=AA)):
+                    vals[indx,k,:] = val
+                    
+        else:
+            
+            aa = numpy.transpose(AA, (0, 2, 1))
+            for (k, rho) in enumerate(rhos):
+                pr = self.propagate(rho, method=method)
+                vals[:,k,:] = numpy.einsum("oij,tij->to", aa, pr.data)
+            
+        if hermitian:
+            vals = numpy.real(vals)
+        if single:
+            return vals[:,0,:]
+        return vals
+    
+    
+    def _adjoint_short_exp_steps(self, aa, L):
+        """Yields the time index and the observables propagated backwards
+        
+        The observables are submitted as a (Nobs, N, N) stack of transposed
+        operators a = A^T, so that Tr(A rho) = sum_ij a_ij rho_ij. They are
+        propagated by the transpose of the short exponential step of the 
+        _short_exp_steps generator, so that the scalar product of the
+        yielded a(t) with the initial density matrix gives Tr(A rho(t)).
+        
+        """
+        if self.Hamiltonian.has_rwa:
+            HH = self.Hamiltonian.get_RWA_data()
+        else:
+            HH = self.Hamiltonian.data
+        HT = numpy.transpose(HH)
+        
+        RR = self.RelaxationTensor.data if self.has_RTensor else None
+        expo = None
+        if self.has_PDeph:
+            expo = numpy.exp(-self.PDeph.data*self.dt)
+            
+        a1 = aa
+        a2 = aa
+        for indx in range(1, self.Nt):
+            
+            for jj in range(0, self.Nref):
+                
+                # the transpose of the step applies pure dephasing first
+                if expo is not None:
+                    a2 = a2*expo
+                    a1 = a2
+                
+                for ll in range(1, L+1):
+                    
+                    if RR is None:
+                        a1 = -(1j*self.dt/ll)*(numpy.matmul(HT,a1) 
+                                             - numpy.matmul(a1,HT))
+                    else:
+                        # (a R)_kl = sum_ij a_ij R_ijkl
+                        a1 = -(1j*self.dt/ll)*(numpy.matmul(HT,a1) 
+                                             - numpy.matmul(a1,HT)) \
+                             + (self.dt/ll)*numpy.tensordot(a1, RR,
+                                                    axes=([1,2],[0,1]))
+                    a2 = a2 + a1
+                a1 = a2
+                
+            yield (indx, a2)
+        
+        
+    _short_exp_orders = {"short-exp":4, "short-exp-2":2, "short-exp-4":4,
+                         "short-exp-6":6}
+        
+    def _uses_short_exp_steps(self, method):
+        """Returns True if the method propagates by the _short_exp_steps
+        
+        Only such propagations support checkpoints and streaming
+        of the results.
+        
+        """
+        if method not in self._short_exp_orders:
+            return False
+        if (self.has_Efield or self.has_EField) and self.has_Trdip:
+            return False
+        if self.has_RTensor:
+            RT = self.RelaxationTensor
+            if (isinstance(RT, TimeDependent) or RT.as_operators
+                or RT.secular_compact):
+                return False
+        return True
+        
+        
+    def _supports_streaming(self, method):
+        """Returns True if the results of the method can be streamed
+        
+        All short exponential propagations without an external field
+        can be performed step by step by the _streaming_steps generator
+        
+        """
+        if method not in self._short_exp_orders:
+            return False
+        if (self.has_Efield or self.has_EField) and self.has_Trdip:
+            return False
+        return True
+        
+        
+    def _streaming_steps(self, rho, L):
+        """Yields the time index and the density matrix after each time step
+        
+        Selects the short exponential step generator appropriate for 
+        the relaxation tensor and its representation. The propagation
+        starts from the density matrix `rho` at the first time of the
+        TimeAxis.
+        
+        """
+        if self.has_RTensor:
+            RT = self.RelaxationTensor
+            if RT.secular_compact:
+                return self._short_exp_secular_steps(rho, L)
+            if isinstance(RT, TimeDependent):
+                if RT.as_operators:
+                    return self._short_exp_TDoperator_steps(rho, L)
+                return self._short_exp_TD_steps(rho, L)
+            if RT.as_operators:
+                return self._short_exp_operator_steps(rho, L)
+        return self._short_exp_steps(rho, 1, L)
+        
+        
+    def _relaxation_tensor_data(self):
+        """Returns the data of the relaxation tensor
+        
+        Relaxation tensors in the compact secular form have no tensor data
+        and they are supported only by some of the propagation methods
+        
+        """
+        if self.RelaxationTensor.secular_compact:
+            raise Exception("Compact secular relaxation tensors are not"+
+                            " supported by this propagation method")
+        return self.RelaxationTensor.data
+        
+        
+    def _begin_checkpoint(self, pr, rho, L):
+        """Returns the time index and the density matrix to start with
+        
+        If a checkpoint of the same propagation exists, the propagation
+        continues from the last saved time step.
+        
+        """
+        if self._checkpoint is None:
+            return (1, rho)
+        
+        RT = self.RelaxationTensor if self.has_RTensor else None
+        PD = self.PDeph if self.has_PDeph else None
+        key = fingerprint("ReducedDensityMatrixPropagator", self.TimeAxis,
+                          self.Nref, self.Hamiltonian, RT, PD, rho, L)
+        
+        (index, state) = self._checkpoint.begin(key, pr.data)
+        if state is None:
+            return (1, rho)
+        return (index+1, state["rho"])
+    
+    
+    def _checkpoint_step(self, indx, pr, rho):
+        """Saves a checkpoint if it is due after the time step
+        
+        """
+        if self._checkpoint is not None:
+            self._checkpoint.step(indx, self.Nt, pr.data, rho=rho)
+        
+        
     def __propagate_primitive(self, rhoi):
         """Primitive integration of equantion of motion
         
@@ -473,7 +933,7 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
        
         rhoPrim = rhoi.data
         HH = self.Hamiltonian.data        
-        RR = self.RelaxationTensor.data        
+        RR = self._relaxation_tensor_data()
         
         indx = 0
         for ii in self.TimeAxis.data: 
@@ -514,33 +974,12 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
         """
         
         pr = ReducedDensityMatrixEvolution(self.TimeAxis,rhoi)
-        rho1 = rhoi.data
-        rho2 = rhoi.data
         
-        #HH = self.Hamiltonian.data
-        #
-        # RWA is applied here
-        #
-        if self.Hamiltonian.has_rwa:
-            HH = self.Hamiltonian.get_RWA_data() #data  - self.HOmega
-        else:
-            HH = self.Hamiltonian.data
+        (start, rho2) = self._begin_checkpoint(pr, rhoi.data, L)
         
-        indx = 1
-        for ii in self.TimeAxis.data[1:self.Nt]:
-            
-            for jj in range(0,self.Nref):
-                
-                for ll in range(1,L+1):
-                    
-                    rho1 = -1j*(self.dt/ll)*(numpy.dot(HH,rho1) \
-                             - numpy.dot(rho1,HH) )
-                             
-                    rho2 = rho2 + rho1
-                rho1 = rho2    
-                
+        for (indx, rho2) in self._short_exp_steps(rho2, start, L):
             pr.data[indx,:,:] = rho2                        
-            indx += 1                       
+            self._checkpoint_step(indx, pr, rho2)
             
         if self.Hamiltonian.has_rwa:
             pr.is_in_rwa = True
@@ -561,15 +1000,40 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
                 return self.__propagate_short_exp_with_rel_operators(rhoi, L=L)
         except:
             raise Exception("Operator propagation failed")
+            
+        if self.RelaxationTensor.secular_compact:
+            return self.__propagate_short_exp_with_secular_relaxation(rhoi,
+                                                                      L=L)
         
         
         pr = ReducedDensityMatrixEvolution(self.TimeAxis, rhoi,
                                            name=self.propagation_name)
+
+        (start, rho2) = self._begin_checkpoint(pr, rhoi.data, L)
+
+        for (indx, rho2) in self._short_exp_steps(rho2, start, L):
+            pr.data[indx,:,:] = rho2 
+            self._checkpoint_step(indx, pr, rho2)
+
+        if self.Hamiltonian.has_rwa:
+            pr.is_in_rwa = True
+            
+        return pr  
+
+
+    def _short_exp_steps(self, rho, start, L):
+        """Yields the time index and the density matrix after each time step
         
-        rho1 = rhoi.data
-        rho2 = rhoi.data
+        Short exponential expansion to Lth order with the Hamiltonian and
+        (if present) a time-independent relaxation tensor and pure dephasing.
+        The propagation starts from the density matrix `rho` at the time
+        index `start-1`. Only the current density matrix is kept in memory;
+        the yielded arrays are not modified by later steps.
+        
+        """
+        rho1 = rho
+        rho2 = rho
         
-        #HH = self.Hamiltonian.data  
         #
         # RWA is applied here
         #
@@ -578,7 +1042,25 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
         else:
             HH = self.Hamiltonian.data
             
-        RR = self.RelaxationTensor.data
+        if not self.has_relaxation:
+            
+            for indx in range(start, self.Nt):
+                
+                for jj in range(0,self.Nref):
+                    
+                    for ll in range(1,L+1):
+                        
+                        rho1 = -1j*(self.dt/ll)*(numpy.dot(HH,rho1) \
+                                 - numpy.dot(rho1,HH) )
+                                 
+                        rho2 = rho2 + rho1
+                    rho1 = rho2    
+                    
+                yield (indx, rho2)
+                
+            return
+            
+        RR = self._relaxation_tensor_data()
 
         if self.has_PDeph:
             
@@ -590,8 +1072,7 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
                 t0 = self.PDeph.data*self.dt
 
             
-            indx = 1
-            for ii in range(1, self.Nt): 
+            for indx in range(start, self.Nt): 
 
                 # time at the beginning of the step
                 tNt = self.TimeAxis.data[indx-1]  
@@ -613,13 +1094,11 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
                         
                     rho1 = rho2    
                     
-                pr.data[indx,:,:] = rho2 
-                indx += 1   
+                yield (indx, rho2)
                 
         else:
             
-            indx = 1
-            for ii in range(1, self.Nt): 
+            for indx in range(start, self.Nt): 
                 
                 for jj in range(0, self.Nref):
                     
@@ -633,16 +1112,110 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
                         rho2 = rho2 + rho1
                     rho1 = rho2    
                     
-                pr.data[indx,:,:] = rho2 
-                indx += 1   
-           
+                yield (indx, rho2)
+
+        
+    def __propagate_secular(self, rhoi):
+        """Closed form propagation with compact secular relaxation
+        
+        Populations are propagated by the exponential of the rate matrix
+        and coherences as damped oscillations (see SecularPropagator)
+        
+        """
+        if self.has_PDeph:
+            raise Exception("Pure dephasing is not implemented"+
+                            " with compact secular relaxation")
+            
+        prop = SecularPropagator(self.TimeAxis, self.Hamiltonian,
+                                 self.RelaxationTensor)
+        pr = prop.propagate(rhoi)
+        pr.name = self.propagation_name
+        
+        return pr
+    
+    
+    def __propagate_short_exp_with_secular_relaxation(self, rhoi, L=4):
+        """Short exponential integration with compact secular relaxation
+        
+        The relaxation tensor is represented by the population transfer
+        and dephasing rate matrices (see Secular class). The propagation
+        runs in the basis in which the tensor was secularized and the 
+        result is transformed back into the current basis.
+        
+        """
+        pr = ReducedDensityMatrixEvolution(self.TimeAxis, rhoi,
+                                           name=self.propagation_name)
+        
+        rho = numpy.array(rhoi.data, dtype=numpy.complex128)
+        for (indx, rho2) in self._short_exp_secular_steps(rho, L):
+            pr.data[indx,:,:] = rho2
 
         if self.Hamiltonian.has_rwa:
             pr.is_in_rwa = True
             
-        return pr  
-
+        return pr
+    
+    
+    def _short_exp_secular_steps(self, rho, L):
+        """Yields the time index and the density matrix after each time step
+        
+        Short exponential expansion with a relaxation tensor in the compact
+        secular form. The steps are taken in the basis in which the tensor
+        was secularized and every yielded density matrix is transformed
+        back into the current basis. The propagation starts from the 
+        density matrix `rho` at the first time of the TimeAxis.
+        
+        """
+        if self.has_PDeph:
+            raise Exception("Pure dephasing is not implemented"+
+                            " with compact secular relaxation")
+            
+        RT = self.RelaxationTensor
+        
+        if self.Hamiltonian.has_rwa:
+            HH = self.Hamiltonian.get_RWA_data()
+        else:
+            HH = self.Hamiltonian.data
+        rho2 = rho
+        
+        SS = RT.get_secular_transformation()
+        if SS is not None:
+            S1 = unitary_inverse(SS)
+            HH = numpy.dot(S1, numpy.dot(HH, SS))
+            rho2 = numpy.dot(S1, numpy.dot(rho2, SS))
+        rho1 = rho2
+            
+        if RT.secular_time_dependent:
+            cutoff_indx = RT.secular_KK.shape[0]
+            if RT._has_cutoff_time:
+                cutoff_indx = min(cutoff_indx,
+                            self.TimeAxis.nearest(RT.cutoff_time))
+        else:
+            cutoff_indx = 1
         
+        indxR = 1 if RT.secular_time_dependent else None
+        for indx in range(1, self.Nt):
+            
+            for jj in range(0, self.Nref):
+                
+                for ll in range(1, L+1):
+                    
+                    rho1 =  - (1j*self.dt/ll)*(numpy.dot(HH,rho1) 
+                                             - numpy.dot(rho1,HH)) \
+                           + (self.dt/ll)*RT._apply(rho1, indxR)
+                             
+                    rho2 = rho2 + rho1
+                rho1 = rho2    
+                
+            if SS is not None:
+                yield (indx, numpy.dot(SS, numpy.dot(rho2, S1)))
+            else:
+                yield (indx, rho2)
+            
+            if RT.secular_time_dependent and (indxR < cutoff_indx-1):
+                indxR += 1
+    
+    
     def __propagate_short_exp_with_rel_operators(self, rhoi, L=4):
         """Integration by short exponentional expansion
         
@@ -685,8 +1258,38 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
         pr = ReducedDensityMatrixEvolution(self.TimeAxis, rhoi,
                                            name=self.propagation_name)
         
-        rho1 = rhoi.data
-        rho2 = rhoi.data
+        qr.log_detail("PROPAGATION (short exponential with "+
+                     "relaxation in operator form): order ", L, 
+                     verbose=self.verbose)
+        qr.log_detail("Using complex numpy implementation")
+        
+        levs = [qr.LOG_QUICK] #, 8]
+        verb = qr.loglevels2bool(levs)
+
+        for (indx, rho2) in self._short_exp_operator_steps(rhoi.data, L):
+            qr.printlog(" time step ", indx, "of", self.Nt, 
+                        verbose=verb[0], loglevel=levs[0])
+            pr.data[indx,:,:] = rho2 
+             
+        qr.log_detail("...DONE")
+
+        if self.Hamiltonian.has_rwa:
+            pr.is_in_rwa = True
+            
+        return pr
+
+
+    def _short_exp_operator_steps(self, rho, L):
+        """Yields the time index and the density matrix after each time step
+        
+        Short exponential expansion to Lth order with a time-independent
+        relaxation tensor in operator form (complex numpy implementation)
+        and (if present) pure dephasing. The propagation starts from the 
+        density matrix `rho` at the first time of the TimeAxis.
+        
+        """
+        rho1 = rho
+        rho2 = rho
         
         #
         # RWA is applied here
@@ -696,11 +1299,6 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
         else:
             HH = self.Hamiltonian.data
         
-        qr.log_detail("PROPAGATION (short exponential with "+
-                     "relaxation in operator form): order ", L, 
-                     verbose=self.verbose)
-        qr.log_detail("Using complex numpy implementation")
-        
         try:
             Km = self.RelaxationTensor.Km # real
             Lm = self.RelaxationTensor.Lm # complex
@@ -711,11 +1309,6 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
                 Kd[m, :, :] = numpy.transpose(Km[m, :, :])
         except:
             raise Exception("Tensor is not in operator form")
-            
-        indx = 1
-
-        levs = [qr.LOG_QUICK] #, 8]
-        verb = qr.loglevels2bool(levs)
 
         # after each step we apply pure dephasing (if present)
         if self.has_PDeph:
@@ -726,92 +1319,46 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
             elif self.PDeph.dtype == "Gaussian":
                 expo = numpy.exp(-self.PDeph.data*(self.dt**2)/2.0)
                 t0 = self.PDeph.data*self.dt
+        else:
+            expo = None
             
-            # loop over time
-            for ii in range(1, self.Nt):
-                qr.printlog(" time step ", ii, "of", self.Nt, 
-                            verbose=verb[0], loglevel=levs[0])
+        # loop over time
+        for indx in range(1, self.Nt):
+            
+            # time at the beginning of the step
+            tNt = self.TimeAxis.data[indx-1]  
+            
+            # steps in between saving the results
+            for jj in range(0, self.Nref):
                 
-                # time at the beginning of the step
-                tNt = self.TimeAxis.data[indx-1]  
-                #print("tNt = ", tNt)
+                tt = tNt + jj*self.dt  # time right now 
                 
-                # steps in between saving the results
-                for jj in range(0, self.Nref):
+                # L interations to get short exponential expansion
+                for ll in range(1, L+1):
                     
-                    tt = tNt + jj*self.dt  # time right now 
+                    rhoY =  - (1j*self.dt/ll)*(numpy.dot(HH,rho1) 
+                                             - numpy.dot(rho1,HH))
                     
-                    # L interations to get short exponential expansion
-                    for ll in range(1, L+1):
-                        
-                        rhoY =  - (1j*self.dt/ll)*(numpy.dot(HH,rho1) 
-                                                 - numpy.dot(rho1,HH))
-                        
-                        #rhoX = numpy.zeros(rho1.shape, dtype=numpy.complex128)
-                        for mm in range(Nm):
-                            
-                           rhoY += (self.dt/ll)*(
-                            numpy.dot(Km[mm,:,:],numpy.dot(rho1, Ld[mm,:,:]))
-                           +numpy.dot(Lm[mm,:,:],numpy.dot(rho1, Kd[mm,:,:]))
-                           -numpy.dot(numpy.dot(Kd[mm,:,:],Lm[mm,:,:]), rho1)
-                           -numpy.dot(rho1, numpy.dot(Ld[mm,:,:],Km[mm,:,:]))
-                           )
-                                 
-                        rho1 = rhoY #+ rhoX
-                        
-                        rho2 = rho2 + rho1
-                       
-                    # pure dephasing is added here                        
-                    rho2 = rho2*expo*numpy.exp(-t0*tt)
+                    for mm in range(Nm):
                         
-                    rho1 = rho2    
-                
-                pr.data[indx,:,:] = rho2 
-                indx += 1
-            
-        # no extra dephasing
-        else:
-            
-             # loop over time
-            for ii in range(1, self.Nt):
-                qr.printlog(" time step ", ii, "of", self.Nt, 
-                            verbose=verb[0], loglevel=levs[0])
-                
-                # steps in between saving the results
-                for jj in range(0, self.Nref):
+                       rhoY += (self.dt/ll)*(
+                        numpy.dot(Km[mm,:,:],numpy.dot(rho1, Ld[mm,:,:]))
+                       +numpy.dot(Lm[mm,:,:],numpy.dot(rho1, Kd[mm,:,:]))
+                       -numpy.dot(numpy.dot(Kd[mm,:,:],Lm[mm,:,:]), rho1)
+                       -numpy.dot(rho1, numpy.dot(Ld[mm,:,:],Km[mm,:,:]))
+                       )
+                             
+                    rho1 = rhoY
                     
-                    # L interations to get short exponential expansion
-                    for ll in range(1, L+1):
-                        
-                        rhoY =  - (1j*self.dt/ll)*(numpy.dot(HH,rho1) 
-                                                 - numpy.dot(rho1,HH))
-                        
-                        #rhoX = numpy.zeros(rho1.shape, dtype=numpy.complex128)
-                        for mm in range(Nm):
-                            
-                           rhoY += (self.dt/ll)*(
-                            numpy.dot(Km[mm,:,:],numpy.dot(rho1, Ld[mm,:,:]))
-                           +numpy.dot(Lm[mm,:,:],numpy.dot(rho1, Kd[mm,:,:]))
-                           -numpy.dot(numpy.dot(Kd[mm,:,:],Lm[mm,:,:]), rho1)
-                           -numpy.dot(rho1, numpy.dot(Ld[mm,:,:],Km[mm,:,:]))
-                           )
-                                 
-                        rho1 = rhoY #+ rhoX
-                        
-                        rho2 = rho2 + rho1
+                    rho2 = rho2 + rho1
+                   
+                # pure dephasing is added here
+                if expo is not None:
+                    rho2 = rho2*expo*numpy.exp(-t0*tt)
                     
-                    rho1 = rho2    
-                
-                pr.data[indx,:,:] = rho2 
-                indx += 1
-           
-             
-        qr.log_detail("...DONE")
-
-        if self.Hamiltonian.has_rwa:
-            pr.is_in_rwa = True
+                rho1 = rho2    
             
-        return pr
+            yield (indx, rho2)
 
 
     def _propagate_SExp_RTOp_ReSymK_Re_numpy(self, rhoi, Ham, RT, dt, L=4):
@@ -1106,11 +1653,29 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
                 return self.__propagate_short_exp_with_TDrel_operators(rhoi, L=L)
         except:
             raise Exception("Operator propagation failed")
+            
+        if self.RelaxationTensor.secular_compact:
+            return self.__propagate_short_exp_with_secular_relaxation(rhoi,
+                                                                      L=L)
         
         pr = ReducedDensityMatrixEvolution(self.TimeAxis,rhoi)
         
-        rho1 = rhoi.data
-        rho2 = rhoi.data
+        for (indx, rho2) in self._short_exp_TD_steps(rhoi.data, L):
+            pr.data[indx,:,:] = rho2
+            
+        return pr     
+
+
+    def _short_exp_TD_steps(self, rho, L):
+        """Yields the time index and the density matrix after each time step
+        
+        Short exponential expansion to Lth order with a time-dependent
+        relaxation tensor. The propagation starts from the density matrix
+        `rho` at the first time of the TimeAxis.
+        
+        """
+        rho1 = rho
+        rho2 = rho
 
         
         #HH = self.Hamiltonian.data  
@@ -1129,11 +1694,11 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
         else:
             cutoff_indx = self.TimeAxis.length
             
-        indx = 1
+        RD = self._relaxation_tensor_data()
         indxR = 1
-        for ii in self.TimeAxis.data[1:self.Nt]:
+        for indx in range(1, self.Nt):
 
-            RR = self.RelaxationTensor.data[indxR,:,:]        
+            RR = RD[indxR,:,:]
             
             for jj in range(0,self.Nref):
                 for ll in range(1,L+1):
@@ -1146,13 +1711,10 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
                     rho2 = rho2 + rho1
                 rho1 = rho2    
                 
-            pr.data[indx,:,:] = rho2
+            yield (indx, rho2)
             
-            indx += 1
             if indxR < cutoff_indx-1:                      
                 indxR += 1             
-            
-        return pr     
 
 
     def __propagate_short_exp_with_TDrel_operators(self, rhoi, L=4):
@@ -1163,8 +1725,22 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
         pr = ReducedDensityMatrixEvolution(self.TimeAxis, rhoi,
                                            name=self.propagation_name)
         
-        rho1 = rhoi.data
-        rho2 = rhoi.data
+        for (indx, rho2) in self._short_exp_TDoperator_steps(rhoi.data, L):
+            pr.data[indx,:,:] = rho2 
+            
+        return pr
+        
+        
+    def _short_exp_TDoperator_steps(self, rho, L):
+        """Yields the time index and the density matrix after each time step
+        
+        Short exponential expansion to Lth order with a time-dependent
+        relaxation tensor in operator form. The propagation starts from
+        the density matrix `rho` at the first time of the TimeAxis.
+        
+        """
+        rho1 = rho
+        rho2 = rho
         
         #HH = self.Hamiltonian.data  
         #
@@ -1192,9 +1768,8 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
         except:
             raise Exception("Tensor is not in operator form")
                         
-        indx = 1
         indxR = 1
-        for ii in range(1, self.Nt): 
+        for indx in range(1, self.Nt): 
 
             Lm = self.RelaxationTensor.Lm[indxR,:,:,:]
             Ld = self.RelaxationTensor.Ld[indxR,:,:,:]
@@ -1221,12 +1796,10 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
                     rho2 = rho2 + rho1
                 rho1 = rho2    
                 
-            pr.data[indx,:,:] = rho2 
-            indx += 1             
+            yield (indx, rho2)
+            
             if indxR < cutoff_indx-1:                      
                 indxR += 1             
-            
-        return pr
         
         
     def __propagate_diagonalization(self,rhoi):
@@ -1263,10 +1836,11 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
         else:
             HH = self.Hamiltonian.data
         
+        RD = self._relaxation_tensor_data()
         indx = 1
         for ii in self.TimeAxis.time[1:self.Nt]:
 
-            RR = self.RelaxationTensor.data[indx,:,:]        
+            RR = RD[indx,:,:]
             EE = self.Efield[indx]
             
             for jj in range(0,self.Nref):
@@ -1307,7 +1881,7 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
         rho2 = rhoi.data
         
         HH = self.Hamiltonian.data        
-        RR = self.RelaxationTensor.data        
+        RR = self._relaxation_tensor_data()
         MU = self.Trdip.data
         
         indx = 1
@@ -1333,6 +1907,94 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
         return pr
 
 
+    def __propagate_magnus_EField(self, rhoi):
+        """Split-operator propagation with a precomputed field
+        
+        The interaction with the field -mu.E(t) is precomputed at the
+        midpoints of all refined time steps as a (Nt_ref, N, N) stack, and
+        its exponentials are obtained by one batched diagonalization 
+        (exponential midpoint rule, i.e. the second order Magnus expansion).
+        The field-free part of the dynamics (Hamiltonian and constant
+        relaxation) is propagated by the exact superoperator exponential,
+        split symmetrically around the interaction steps.
+        
+        """
+        N = self.Hamiltonian.dim
+        Nsteps = (self.Nt-1)*self.Nref
+        tm = self.TimeAxis.data[0] + self.dt*(numpy.arange(Nsteps) + 0.5)
+        
+        MU = self.Trdip.data
+        
+        if self.Hamiltonian.has_rwa:
+            
+            HH = self.Hamiltonian.get_RWA_data()
+            
+            om = self.Hamiltonian.rwa_energies[self.Hamiltonian.rwa_indices[1]]
+            self.EField.subtract_omega(om)
+            Epls = self.EField.field_vector(sign=1, times=tm)
+            Emin = self.EField.field_vector(sign=-1, times=tm)
+            self.EField.restore_omega()
+            
+            # upper and lower triangle
+            Mu = numpy.triu(numpy.ones((N,N), dtype=qr.REAL), k=1)
+            Ml = numpy.transpose(Mu)
+            
+            MuE = Mu[numpy.newaxis,:,:]*numpy.einsum("ijx,tx->tij", MU, Epls) \
+                + Ml[numpy.newaxis,:,:]*numpy.einsum("ijx,tx->tij", MU, Emin)
+            
+        else:
+            
+            HH = self.Hamiltonian.data
+            Efld = self.EField.field_vector(times=tm)
+            MuE = numpy.einsum("ijx,tx->tij", MU, Efld)
+            
+        #
+        # Exponentials of the interaction at all midpoints at once
+        #
+        ee, WW = numpy.linalg.eigh(MuE)
+        UU = numpy.matmul(WW*numpy.exp(1j*self.dt*ee)[:,numpy.newaxis,:],
+                          numpy.conj(numpy.transpose(WW, (0, 2, 1))))
+        UUh = numpy.conj(numpy.transpose(UU, (0, 2, 1)))
+        
+        #
+        # Field-free Liouvillian as a matrix
+        #
+        One = numpy.eye(N)
+        LL = -1j*(numpy.kron(HH, One) - numpy.kron(One, numpy.transpose(HH)))
+        if self.has_relaxation:
+            if self.RelaxationTensor.secular_compact:
+                raise Exception("Compact secular relaxation tensors"+
+                                " are not supported by this method")
+            LL = LL + numpy.reshape(self.RelaxationTensor.data, (N*N, N*N))
+        P_half = scipy.linalg.expm(LL*self.dt/2.0)
+        P_full = numpy.dot(P_half, P_half)
+            
+        pr = ReducedDensityMatrixEvolution(self.TimeAxis, rhoi,
+                                           name=self.propagation_name)
+        
+        rho = numpy.dot(P_half, numpy.reshape(rhoi.data, N*N))
+        indx = 1
+        for nn in range(Nsteps):
+            
+            rho = numpy.dot(UU[nn,:,:],
+                            numpy.dot(numpy.reshape(rho, (N,N)), 
+                                      UUh[nn,:,:]))
+            rho = numpy.reshape(rho, N*N)
+            
+            if (nn+1) % self.Nref == 0:
+                rho = numpy.dot(P_half, rho)
+                pr.data[indx,:,:] = numpy.reshape(rho, (N,N))
+                rho = numpy.dot(P_half, rho)
+                indx += 1
+            else:
+                rho = numpy.dot(P_full, rho)
+                
+        if self.Hamiltonian.has_rwa:
+            pr.is_in_rwa = True
+            
+        return pr
+    
+    
     def __propagate_short_exp_with_relaxation_EField(self,rhoi,L=4):
         """
               Short exp integration
@@ -1356,9 +2018,9 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
             om = self.Hamiltonian.rwa_energies[self.Hamiltonian.rwa_indices[1]]
             self.EField.subtract_omega(om)
             
-            # the two complex components of the field
-            Epls = self.EField.field(sign=1)
-            Emin = self.EField.field(sign=-1)
+            # the two complex components of the field (summed over pulses)
+            Epls = self.EField.field_vector(sign=1)
+            Emin = self.EField.field_vector(sign=-1)
             self.EField.restore_omega()
             
             # upper and lower triagle
@@ -1372,12 +2034,11 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
         else:
             
             HH = self.Hamiltonian.data 
-            EField = self.EField.field()
+            EField = self.EField.field_vector()
         
-        RR = self.RelaxationTensor.data
+        RR = self._relaxation_tensor_data()
         
-        pol = self.EField.pol
-        MU = numpy.dot(self.Trdip.data[:,:,:], pol)
+        MU = self.Trdip.data
         
         #
         # Propagation
@@ -1387,9 +2048,10 @@ class ReducedDensityMatrixPropagator(MatrixData, Saveable):
         for ii in self.TimeAxis.data[1:self.Nt]:
             
             if self.Hamiltonian.has_rwa:
-                MuE = MU*(Mu*Epls[indx]+Ml*Emin[indx])
+                MuE = Mu*numpy.dot(MU, Epls[indx]) \
+                    + Ml*numpy.dot(MU, Emin[indx])
             else:
-                MuE = MU*EField[indx]
+                MuE = numpy.dot(MU, EField[indx])
             
             for jj in range(0,self.Nref):
                 for ll in range(1,L+1):
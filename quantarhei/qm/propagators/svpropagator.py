@@ -12,6 +12,7 @@ import numpy
 from .statevectorevolution import StateVectorEvolution
 from ..hilbertspace.evolutionoperator import EvolutionOperator
 from ... import REAL
+from ...utils.timing import profiled
 
    
 class StateVectorPropagator:
@@ -51,6 +52,7 @@ class StateVectorPropagator:
         self.dt = self.Odt/self.Nref
         
         
+    @profiled()
     def propagate(self, psii):
         
         return self._propagate_short_exp(psii,L=4)
@@ -11,6 +11,7 @@
 import argparse
 import subprocess
 import os
+import sys
 import fnmatch
 import traceback
 import pkg_resources
@@ -84,7 +85,7 @@ def do_command_run(args):
 
         qr.printlog("Running benchmark no. ", args.benchmark, verbose=True,
                     loglevel=1)
-        import quantarhei.benchmarks.bm_001 as bm        
+        import quantarhei.wizard.benchmarks.bm_001 as bm        
         t1 = time.time()
         bm.main()
         t2 = time.time()
@@ -269,6 +270,50 @@ def do_command_run(args):
     
     
 
+def do_command_bench(args):
+    """Runs Quantarhei benchmark suite
+    
+    When compared with a baseline, the script exits with a nonzero status
+    if any performance regression is found.
+    
+    """
+    import quantarhei.wizard.benchmarks.suite as suite
+    
+    if args.list:
+        qr.printlog("Available benchmarks:", loglevel=1)
+        for (name, desc) in suite.available_benchmarks().items():
+            qr.printlog("    "+name+": "+desc, loglevel=1)
+        return
+
+    names = None
+    if len(args.names) > 0:
+        names = args.names
+        
+    qr.printlog("--- Running benchmarks (scale "+str(args.scale)+") ---",
+                loglevel=1)
+    results = suite.run_benchmarks(names=names, scale=args.scale,
+                                   repeat=args.repeat,
+                                   memory=not args.no_memory)
+    
+    if len(args.output) > 0:
+        suite.save_results(results, args.output)
+        qr.printlog("Results saved into", args.output, loglevel=1)
+
+    if len(args.baseline) > 0:
+        baseline = suite.load_results(args.baseline)
+        regressions = suite.compare_with_baseline(results, baseline,
+                                                  tolerance=args.tolerance)
+        qr.printlog("Comparison with the baseline", args.baseline,
+                    loglevel=1)
+        if len(regressions) == 0:
+            qr.printlog("No performance regressions found", loglevel=1)
+        for (name, key, base, curr) in regressions:
+            qr.printlog("REGRESSION in "+name+": "+key+" "+str(base)
+                        +" -> "+str(curr), loglevel=1)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
 def do_command_test(args):
     """Runs Quantarhei tests
     
@@ -605,6 +650,34 @@ def main():
     
     parser_run.set_defaults(func=do_command_run)
     
+    #
+    # Subparser for command `bench`
+    #
+
+    parser_bench = subparsers.add_parser("bench", help="Benchmark runner")
+    
+    parser_bench.add_argument("names", metavar='names', type=str, 
+                              help='names of the benchmarks to run', 
+                              nargs="*")
+    parser_bench.add_argument("-s", "--scale", type=int, default=1,
+                              help="scale factor of the problem sizes")
+    parser_bench.add_argument("-r", "--repeat", type=int, default=3,
+                              help="number of timed runs of each benchmark")
+    parser_bench.add_argument("-o", "--output", metavar="FILE", default="",
+                              help="saves results into a JSON file")
+    parser_bench.add_argument("-b", "--baseline", metavar="FILE", default="",
+                              help="compares results with a baseline"
+                              +" JSON file")
+    parser_bench.add_argument("-t", "--tolerance", type=float, default=0.2,
+                              help="relative slowdown (or memory increase)"
+                              +" reported as a regression")
+    parser_bench.add_argument("-l", "--list", action='store_true', 
+                              help="lists available benchmarks")
+    parser_bench.add_argument("-m", "--no-memory", action='store_true', 
+                              help="skips peak memory measurement")
+    
+    parser_bench.set_defaults(func=do_command_bench)
+    
     #
     # Subparser for command `test`
     #
@@ -25,8 +25,11 @@ from ..core.dfunction import DFunction
 
 from ..core.managers import energy_units
 from ..core.managers import EnergyUnitsManaged
+from ..core.basiscache import unitary_inverse
 from ..core.time import TimeDependent
 from ..core.units import cm2int
+from .linearresponse import response_to_spectrum
+from ..utils.timing import profiled
 
 class AbsSpectrumBase(DFunction, EnergyUnitsManaged):
     """Provides basic container for absorption spectrum
@@ -384,6 +387,11 @@ class AbsSpectrumDifference(EnergyUnitsManaged):
         
         self.difftype = "square"
         
+        # fitting model evaluates the spectrum directly at the points x
+        self._has_model = isinstance(self.optfce, AbsSpectrumFitModel)
+        if self._has_model:
+            self.optfce.set_points(self.x)
+        
     def difference(self, par=None):
         """Calculates difference between spectra
         
@@ -398,7 +406,13 @@ class AbsSpectrumDifference(EnergyUnitsManaged):
         
         """
         target = self.target.data[self.nl:self.nu]
-        if self._can_minimize:
+        if self._has_model:
+            if par is None:
+                raise Exception("Function parameters must be specified "+
+                                "to calculate difference")
+            # only the changed transitions are recalculated
+            secabs = self.optfce.evaluate(par)
+        elif self._can_minimize:
             if par is None:
                 raise Exception("Function parameters must be specified "+
                                 "to calculate difference")
@@ -408,11 +422,7 @@ class AbsSpectrumDifference(EnergyUnitsManaged):
             # get values at the correct points by fitting (using the fact that
             # absorption spectrum is a DFunction )
             #
-            i = 0
-
-            for xi in self.x:
-                sdat[i] = secabs.at(xi)
-                i += 1
+            sdat[:] = numpy.real(secabs.at(numpy.asarray(self.x)))
             secabs = sdat    
         else:
             secabs = self.secabs #.data[self.nl:self.nu]
@@ -421,10 +431,7 @@ class AbsSpectrumDifference(EnergyUnitsManaged):
             # get values at the correct points by fitting (using the fact that
             # absorption spectrum is a DFunction )
             #
-            i = 0
-            for xi in self.x:
-                sdat[i] = secabs.at(xi)
-                i += 1
+            sdat[:] = numpy.real(secabs.at(numpy.asarray(self.x)))
             secabs = sdat    
 
             
@@ -444,21 +451,419 @@ class AbsSpectrumDifference(EnergyUnitsManaged):
         
         return diff
         
+    def gradient(self, par):
+        """Calculates gradient of the difference with respect to parameters
+        
+        Available only when the spectrum is specified by 
+        an AbsSpectrumFitModel. All columns of the Jacobian of the model
+        are calculated in one batch.
+        
+        Parameters
+        ----------
+        
+        par : list or array
+            parameters of the model 
+            
+        """
+        if not self._has_model:
+            raise Exception("Gradient requires AbsSpectrumFitModel")
+        if self.difftype != "square":
+            raise Exception("Gradient implemented only for "+
+                            "the square difference")
+            
+        target = self.target.data[self.nl:self.nu]
+        secabs = self.optfce.evaluate(par)
+        jac = self.optfce.jacobian(par)
+        
+        return -2000.0*numpy.dot(jac, target-secabs)/ \
+                (self.x[len(self.x)-1]-self.x[0])
+        
     def minimize(self, init_params, method):
         """Minimizes the submitted function and returns optimal parameters
         
+        If the spectrum is specified by an AbsSpectrumFitModel, gradient
+        based methods receive the gradient calculated by the model.
+        
         """
         if self._can_minimize:
             from scipy.optimize import minimize
+            kwargs = dict()
+            if self._has_model and (method in _gradient_methods):
+                kwargs["jac"] = self.gradient
             self.opt_result = minimize(self.difference, init_params,
                                        method=method, tol=self.tol,
-                                       options=dict(disp=True))
+                                       options=dict(disp=True), **kwargs)
             return self.opt_result.x
         else:
             raise Exception("Cannot perform minimization, "+
                             "no function suplied")
+
+
+# optimization methods of scipy.optimize.minimize using gradient
+_gradient_methods = ["CG", "BFGS", "Newton-CG", "L-BFGS-B", "TNC", "SLSQP",
+                     "dogleg", "trust-ncg", "trust-krylov", "trust-exact",
+                     "trust-constr"]
+
+
+class AbsSpectrumFitModel(EnergyUnitsManaged):
+    """Absorption spectrum model for incremental spectral fitting
+    
+    The model spectrum is a sum of transitions
+    
+    A(w) = w sum_n d_n Re FT[exp(-g_n(t) - i(om_n - rwa)t)]
+    
+    The frequency om_n, the dipole strength d_n and the lineshape function
+    g_n(t) of each transition are either fixed, or they depend on some of
+    the fitted parameters. The model keeps track of which parameters
+    every transition depends on. Lineshape functions and spectra of 
+    transitions whose parameters did not change since the last evaluation
+    are reused, and the finite difference derivatives with respect to all
+    parameters are evaluated in one batch (with a single FFT).
+    
+    Frequencies are specified (and fitted) in the energy units which are
+    current when the model is created. 
+    
+    Parameters
+    ----------
+    
+    timeaxis : TimeAxis
+        Time axis on which the responses are calculated
+        
+    rwa : float
+        Rotating wave approximation frequency
         
+    raw : bool
+        If True, the spectrum is not multiplied by the frequency
         
+    step : float
+        Relative step of the finite difference derivatives
+        
+        
+    Examples
+    --------
+    
+    >>> import quantarhei as qr
+    >>> ta = qr.TimeAxis(0.0, 1000, 1.0)
+    >>> def gauss(sig):
+    ...     return ((sig*qr.core.units.cm2int*ta.data)**2)/2.0
+    >>> with qr.energy_units("1/cm"):
+    ...     model = AbsSpectrumFitModel(ta, rwa=12000.0)
+    ...     model.add_transition(frequency_index=0, dipole_strength_index=1,
+    ...                          lineshape=gauss, lineshape_parameters=[2])
+    ...     model.add_transition(frequency=12300.0, dipole_strength=0.5,
+    ...                          lineshape=gauss(100.0))
+    >>> vals = model.evaluate([12000.0, 1.0, 80.0])
+    >>> jac = model.jacobian([12000.0, 1.0, 80.0])
+    >>> jac.shape == (3, model.axis.length)
+    True
+    
+    """
+    
+    def __init__(self, timeaxis, rwa=0.0, raw=False, step=1.0e-7):
+        
+        self.TimeAxis = timeaxis
+        self.rwa = self.convert_2_internal_u(rwa)
+        self.raw = raw
+        self.step = step
+        self._units = self.manager.get_current_units("energy")
+        
+        with energy_units("int"):
+            fa = self.TimeAxis.get_FrequencyAxis()
+            fa.data += self.rwa
+            # we only want to retain the upper half of the spectrum
+            Nt = len(fa.data)//2
+            do = fa.data[1]-fa.data[0]
+            st = fa.data[Nt//2]
+            self.axis = FrequencyAxis(st,Nt,do)
+            self._w = self.axis.data.copy()
+            
+        self._transitions = []
+        self._depends = dict()
+        self.set_points(None)
+        
+        
+    def add_transition(self, frequency=None, dipole_strength=None, 
+                       lineshape=None, lineshape_parameters=(), 
+                       frequency_index=None, dipole_strength_index=None):
+        """Adds a transition to the model
+        
+        The frequency and the dipole strength of the transition are either
+        fixed values, or they are fitted. The fitted ones are specified by
+        the index of the parameter in the `frequency_index` and 
+        `dipole_strength_index` arguments.
+        
+        Parameters
+        ----------
+        
+        frequency : float
+            Fixed value of the transition frequency
+            
+        dipole_strength : float
+            Fixed value of the dipole strength (1.0 if neither 
+            `dipole_strength` nor `dipole_strength_index` is specified)
+            
+        lineshape : callable or array or None
+            Fixed lineshape function g(t) on the time axis, or a function
+            which returns it when called with the values of the parameters
+            listed in `lineshape_parameters`
+            
+        lineshape_parameters : list of int
+            Indices of the fitted parameters of the lineshape function
+            
+        frequency_index : int
+            Index of the fitted parameter of the transition frequency
+            
+        dipole_strength_index : int
+            Index of the fitted parameter of the dipole strength
+            
+        """
+        tr = dict()
+        
+        tr["om"] = self._parameter_spec("frequency", frequency, 
+                                        frequency_index)
+        if (dipole_strength is None) and (dipole_strength_index is None):
+            dipole_strength = 1.0
+        tr["dd"] = self._parameter_spec("dipole_strength", dipole_strength,
+                                        dipole_strength_index)
+        if tr["om"][1] is not None:
+            with energy_units(self._units):
+                tr["om"] = (None, self.convert_2_internal_u(tr["om"][1]))
+            
+        if callable(lineshape):
+            tr["gt"] = (lineshape, [int(k) for k in lineshape_parameters])
+        elif lineshape is None:
+            tr["gt"] = (None, numpy.zeros(self.TimeAxis.length,
+                                          dtype=numpy.complex128))
+        else:
+            tr["gt"] = (None, numpy.array(lineshape, dtype=numpy.complex128))
+            
+        # cache of the lineshape function and the normalized spectrum
+        tr["gkey"] = None
+        tr["skey"] = None
+            
+        nn = len(self._transitions)
+        self._transitions.append(tr)
+        for k in self._parameters_of(tr):
+            self._depends.setdefault(k, []).append(nn)
+            
+            
+    def _parameter_spec(self, name, value, index):
+        """Returns the (index, value) pair specifying a transition property
+        
+        """
+        if (value is None) == (index is None):
+            raise Exception("Either "+name+" or "+name+"_index"+
+                            " has to be specified")
+        if index is not None:
+            if not isinstance(index, (int, numpy.integer)):
+                raise Exception(name+"_index has to be an integer")
+            return (int(index), None)
+        return (None, float(value))
+            
+            
+    def set_points(self, x):
+        """Sets frequencies (in internal units) at which the model is evaluated
+        
+        If `x` is None, the model is evaluated on its frequency axis.
+        
+        """
+        if x is None:
+            self._nx = None
+        else:
+            x = numpy.asarray(x, dtype=numpy.float64)
+            fn = (x - self._w[0])/(self._w[1]-self._w[0])
+            nx = numpy.floor(fn).astype(int)
+            nx = numpy.clip(nx, 0, self._w.shape[0]-2)
+            self._nx = nx
+            self._dx = fn - nx
+            
+        # cached spectra are no longer valid
+        for tr in self._transitions:
+            tr["skey"] = None
+
+
+    def evaluate(self, par):
+        """Returns the model spectrum for the given parameters
+        
+        Only the transitions whose parameters changed since the last
+        evaluation are recalculated.
+        
+        """
+        par = numpy.asarray(par, dtype=numpy.float64)
+        
+        todo = []
+        for tr in self._transitions:
+            skey = self._spectrum_key(tr, par)
+            if tr["skey"] != skey:
+                todo.append((tr, skey))
+                
+        if len(todo) > 0:
+            oms = numpy.array([skey[0] for tr, skey in todo])
+            gts = numpy.array([self._lineshape(tr, par) for tr, skey in todo])
+            spects = self._spectra(oms, gts)
+            for (tr, skey), spect in zip(todo, spects):
+                tr["skey"] = skey
+                tr["spect"] = spect
+        
+        ret = numpy.zeros(self._npoints(), dtype=numpy.float64)
+        for tr in self._transitions:
+            ret += self._value(tr["dd"], par)*tr["spect"]
+        
+        return ret
+
+
+    def jacobian(self, par):
+        """Returns finite difference derivatives of the model spectrum
+        
+        Only transitions which depend on a given parameter are recalculated
+        when the parameter is varied, and all of them are calculated in one
+        batch.
+        
+        Returns
+        -------
+        
+        numpy.ndarray of the shape (Nparameters, Npoints)
+        
+        """
+        par = numpy.asarray(par, dtype=numpy.float64)
+        self.evaluate(par)
+        
+        jac = numpy.zeros((par.shape[0], self._npoints()), 
+                          dtype=numpy.float64)
+        
+        batch = []
+        for kk in range(par.shape[0]):
+            hh = self.step*max(abs(par[kk]), 1.0)
+            pp = par.copy()
+            pp[kk] += hh
+            for nn in self._depends.get(kk, []):
+                tr = self._transitions[nn]
+                dd0 = self._value(tr["dd"], par)
+                dd1 = self._value(tr["dd"], pp)
+                skey = self._spectrum_key(tr, pp)
+                if skey == tr["skey"]:
+                    # only the dipole strength changed
+                    jac[kk,:] += ((dd1-dd0)/hh)*tr["spect"]
+                else:
+                    jac[kk,:] -= (dd0/hh)*tr["spect"]
+                    batch.append((kk, dd1/hh, skey[0], 
+                                  self._lineshape(tr, pp, store=False)))
+                    
+        if len(batch) > 0:
+            oms = numpy.array([bt[2] for bt in batch])
+            gts = numpy.array([bt[3] for bt in batch])
+            spects = self._spectra(oms, gts)
+            for bt, spect in zip(batch, spects):
+                jac[bt[0],:] += bt[1]*spect
+                
+        return jac
+    
+    
+    def __call__(self, par):
+        """Returns the model spectrum as AbsSpectrumBase object
+        
+        """
+        par = numpy.asarray(par, dtype=numpy.float64)
+        nx = self._nx
+        self._nx = None
+        try:
+            oms = numpy.array([self._spectrum_key(tr, par)[0] 
+                               for tr in self._transitions])
+            gts = numpy.array([self._lineshape(tr, par, store=False)
+                               for tr in self._transitions])
+            dds = numpy.array([self._value(tr["dd"], par)
+                               for tr in self._transitions])
+            data = numpy.dot(dds, self._spectra(oms, gts))
+        finally:
+            self._nx = nx
+        
+        with energy_units("int"):
+            spect = AbsSpectrumBase(axis=self.axis, data=data)
+        return spect
+    
+    
+    def _parameters_of(self, tr):
+        """Indices of the parameters on which a transition depends
+        
+        """
+        pars = []
+        if tr["om"][0] is not None:
+            pars.append(tr["om"][0])
+        if tr["dd"][0] is not None:
+            pars.append(tr["dd"][0])
+        if tr["gt"][0] is not None:
+            pars += tr["gt"][1]
+        return sorted(set(pars))
+        
+    
+    def _value(self, spec, par):
+        """Value of a fixed or fitted quantity
+        
+        """
+        if spec[0] is None:
+            return spec[1]
+        return par[spec[0]]
+    
+    
+    def _spectrum_key(self, tr, par):
+        """Parameters which determine the normalized transition spectrum
+        
+        """
+        if tr["om"][0] is None:
+            om = tr["om"][1]
+        else:
+            with energy_units(self._units):
+                om = self.convert_2_internal_u(par[tr["om"][0]])
+        if tr["gt"][0] is None:
+            gkey = ()
+        else:
+            gkey = tuple(par[k] for k in tr["gt"][1])
+        return (om, gkey)
+    
+    
+    def _lineshape(self, tr, par, store=True):
+        """Returns lineshape function of a transition (cached)
+        
+        """
+        fce, args = tr["gt"]
+        if fce is None:
+            return args
+        gkey = tuple(par[k] for k in args)
+        if gkey == tr["gkey"]:
+            return tr["gval"]
+        gval = numpy.asarray(fce(*gkey))[0:self.TimeAxis.length]
+        if store:
+            tr["gkey"] = gkey
+            tr["gval"] = gval
+        return gval
+    
+    
+    def _npoints(self):
+        if self._nx is None:
+            return self._w.shape[0]
+        return self._nx.shape[0]
+    
+    
+    def _spectra(self, oms, gts):
+        """Normalized spectra of a batch of transitions
+        
+        """
+        ta = self.TimeAxis
+        at = numpy.exp(-gts - 1j*numpy.outer(oms - self.rwa, ta.data))
+        data = numpy.real(response_to_spectrum(at, ta))
+        
+        # multiply the spectrum by frequency (compulsory prefactor)
+        if not self.raw:
+            data = self._w[numpy.newaxis,:]*data
+        
+        if self._nx is None:
+            return data
+        
+        # linear interpolation to the requested points
+        return (data[:,self._nx]*(1.0-self._dx) 
+                + data[:,self._nx+1]*self._dx)
+    
+
 class AbsSpectContainer(DFunction, EnergyUnitsManaged):
     """This class contains a single absorption spectrum
     
@@ -576,6 +981,7 @@ class AbsSpect(AbsSpectContainer):
             self._rate_matrix = rate_matrix
             self._has_rate_matrix = True
         
+    @profiled()
     def calculate(self,rwa=0.0):
         """ Calculates the absorption spectrum 
         
@@ -856,7 +1262,7 @@ class AbsSpect(AbsSpectContainer):
         self.frequency = self._frequency(ta.step) + rwa
         
         # transform all quantities back
-        S1 = numpy.linalg.inv(SS)
+        S1 = unitary_inverse(SS)
         HH.transform(S1)
         DD.transform(S1)
         
@@ -18,8 +18,13 @@ from ..core.frequency import FrequencyAxis
 from ..core.managers import energy_units
 from ..core.managers import EnergyUnitsManaged
 from ..core.time import TimeDependent
+from .linearresponse import batched_response
+from .linearresponse import response_to_spectrum
+from .linearresponse import aggregate_transitions
+from .linearresponse import transition_responses
 
 from .abs2 import AbsSpectrum
+from ..utils.timing import profiled
 
 class AbsSpectrumCalculator(EnergyUnitsManaged):
     """Linear absorption spectrum 
@@ -85,6 +90,7 @@ class AbsSpectrumCalculator(EnergyUnitsManaged):
         #    self.system.diagonalize()
                     
         
+    @profiled()
     def calculate(self, raw=False):
         """ Calculates the absorption spectrum 
         
@@ -111,6 +117,74 @@ class AbsSpectrumCalculator(EnergyUnitsManaged):
         return spect
     
 
+    def calculate_transitions(self, raw=False):
+        """ Calculates absorption spectra of individual excitonic transitions
+        
+        Returns a list of AbsSpectrum objects, one for every transition
+        from the ground state of the aggregate (in the order of increasing
+        energy). Their sum is the spectrum returned by `calculate`.
+        
+        """
+        if not isinstance(self.system, Aggregate):
+            raise Exception("Transitions can be resolved only for aggregates")
+        
+        with energy_units("int"):
+            axis, data = self._transition_spectra( 
+                                          relaxation_tensor=
+                                          self._relaxation_tensor,
+                                          rate_matrix=
+                                          self._rate_matrix,
+                                          relaxation_hamiltonian=
+                                          self._relaxation_hamiltonian,
+                                          raw=raw)
+            spects = [AbsSpectrum(axis=axis, data=data[ii,:]) 
+                      for ii in range(data.shape[0])]
+        
+        return spects
+    
+
+    def calculate_ensemble(self, ensemble, raw=False):
+        """ Calculates absorption spectrum averaged over a disordered ensemble
+        
+        All transitions of all realizations are summed in the time domain
+        and the average spectrum is obtained by a single FFT.
+        Relaxation broadening is not included.
+        
+        Parameters
+        ----------
+        
+        ensemble : DisorderEnsemble
+            Ensemble of realizations of a disordered aggregate
+            
+        raw : bool
+            If True, the spectrum is not multiplied by frequency
+        
+        """
+        with energy_units("int"):
+            ta = self.TimeAxis
+            
+            at = batched_response(ta, ensemble.energies - self.rwa,
+                                  ensemble.get_dipole_strengths(),
+                                  ensemble.get_lineshape_weights(),
+                                  ensemble.get_lineshape_functions())
+            data = numpy.real(response_to_spectrum(at, ta))/ensemble.Nreal
+            
+            # we only want to retain the upper half of the spectrum
+            Nt = len(self.frequencyAxis.data)//2        
+            do = self.frequencyAxis.data[1]-self.frequencyAxis.data[0]
+            st = self.frequencyAxis.data[Nt//2]
+            # we represent the Frequency axis anew
+            axis = FrequencyAxis(st,Nt,do)
+            
+            # multiply the spectrum by frequency (compulsory prefactor)
+            if not raw:
+                data = axis.data*data
+            
+            spect = AbsSpectrum(axis=axis, data=data)
+        
+        return spect
+    
+    
     def _calculateMolecule(self,rwa):
         
         if self.system._has_system_bath_coupling:
@@ -184,10 +258,6 @@ class AbsSpectrumCalculator(EnergyUnitsManaged):
             rt = numpy.exp((gg)*ta.data)          
             at *= rt
             #print("Time dependent: len = ", rt[20], len(rt))
-        
-        response = open("response.txt", "w")
-        for i, res in enumerate(at):
-            response.write(str(res.real) + '\t' + str(res.imag) + '\t' + str(ta.data[i]) + "\n")
 
         # Fourier transform the result
         ft = dd*numpy.fft.hfft(at)*ta.step
@@ -281,6 +351,35 @@ class AbsSpectrumCalculator(EnergyUnitsManaged):
         
         
         
+        """
+        axis, data = self._transition_spectra(
+                                relaxation_tensor=relaxation_tensor,
+                                relaxation_hamiltonian=relaxation_hamiltonian,
+                                rate_matrix=rate_matrix, raw=raw)
+        
+        spect = AbsSpectrum(axis=axis, data=numpy.sum(data, axis=0))
+        
+        return spect
+
+
+    def _transition_spectra(self, relaxation_tensor=None,
+                            relaxation_hamiltonian=None, rate_matrix=None,
+                            raw=False):
+        """ Calculates absorption spectra of all transitions of an aggregate
+        
+        Lineshape functions of all excitonic transitions are constructed
+        as one array and all spectra are obtained by a single FFT along
+        the time axis.
+        
+        Returns
+        -------
+        
+        axis : FrequencyAxis
+            Frequency axis of the spectra
+            
+        data : numpy.ndarray
+            Spectra of individual transitions (Ntr, Nw)
+        
         """
         ta = self.TimeAxis
         
@@ -290,77 +389,16 @@ class AbsSpectrumCalculator(EnergyUnitsManaged):
         else:
             HH = relaxation_hamiltonian
             
-
-        SS = HH.diagonalize() # transformed into eigenbasis
-
-        
-        # Transition dipole moment operator
-        DD = self.system.get_TransitionDipoleMoment()
-        # transformed into the basis of Hamiltonian eigenstates
-        DD.transform(SS)         
-
-        # TimeAxis
-        tr = {"ta":ta}
-        
-        if relaxation_tensor is not None:
-            RR = relaxation_tensor
-            RR.transform(SS)
-            gg = []            
-            if isinstance(RR, TimeDependent):
-                for ii in range(HH.dim):
-                    gg.append(RR.data[:,ii,ii,ii,ii])
-            else:
-                for ii in range(HH.dim):
-                    gg.append([RR.data[ii,ii,ii,ii]])
-            tr["gg"] = gg[1]
-        elif rate_matrix is not None:
-            RR = rate_matrix  # rate matrix is in excitonic basis
-            gg = []
-            if isinstance(RR, TimeDependent):
-                for ii in range(HH.dim):
-                    gg.append(RR.data[:,ii,ii])
-            else:
-                for ii in range(HH.dim):
-                    gg.append([RR.data[ii,ii]])
-            tr["gg"] = gg[1]
-        else:
-            tr["gg"] = [0.0]
-        
-        # get square of transition dipole moment here    #print(H_RC)
-        #tr.append(DD.dipole_strength(0,1))
-        tr["dd"] = DD.dipole_strength(0,1)
-        # first transition energy
-        #tr.append(HH.data[1,1]-HH.data[0,0]-rwa)
-        tr["om"] = HH.data[1,1]-HH.data[0,0]-self.rwa
-        # get a transformed ct here
-        ct = self._excitonic_coft(SS,self.system,0)
-        #tr.append(ct)
-        tr["ct"] = ct
+        tr = aggregate_transitions(ta, self.system, HH, self.rwa,
+                                   relaxation_tensor=relaxation_tensor,
+                                   rate_matrix=rate_matrix)
         self.system._has_system_bath_coupling = True
         
-        #
-        # Calculates spectrum of a single transition
-        #
-        data = numpy.real(self.one_transition_spectrum(tr))
+        at = transition_responses(ta, tr["om"], tr["gw"], tr["gt"],
+                                  rates=tr["gg"])
+        data = tr["dd"][:,numpy.newaxis]*numpy.real(
+                                               response_to_spectrum(at, ta))
         
-        for ii in range(2,HH.dim):
-            if relaxation_tensor is not None:
-                tr["gg"] = gg[ii]
-            else:
-                tr["gg"] = [0.0]
-            #tr[1] = DD.dipole_strength(0,ii) # update transition dipole moment
-            tr["dd"] = DD.dipole_strength(0,ii)
-            #tr[2] = HH.data[ii,ii]-HH.data[0,0]-rwa
-            tr["om"] = HH.data[ii,ii]-HH.data[0,0]-self.rwa
-            #tr[3] = self._excitonic_coft(SS,self.system,ii-1) # update ct here
-            tr["ct"] = self._excitonic_coft(SS,self.system,ii-1)
-            
-            #
-            # Calculates spectrum of a single transition
-            #
-            data += numpy.real(self.one_transition_spectrum(tr))
-
-
         # we only want to retain the upper half of the spectrum
         Nt = len(self.frequencyAxis.data)//2        
         do = self.frequencyAxis.data[1]-self.frequencyAxis.data[0]
@@ -370,18 +408,8 @@ class AbsSpectrumCalculator(EnergyUnitsManaged):
         
         # multiply the spectrum by frequency (compulsory prefactor)
         if not raw:
-            data = axis.data*data
-        
-        # transform all quantities back
-        S1 = numpy.linalg.inv(SS)
-        HH.transform(S1)
-        DD.transform(S1)
-        
-        if relaxation_tensor is not None:
-            RR.transform(S1)
-
-        spect = AbsSpectrum(axis=axis, data=data)
-        
-        return spect        
+            data = axis.data[numpy.newaxis,:]*data
+            
+        return axis, data        
 
                    
@@ -25,9 +25,14 @@ from ..core.dfunction import DFunction
 from ..core.managers import energy_units
 from ..core.managers import EnergyUnitsManaged
 from ..core.time import TimeDependent
+from .linearresponse import batched_response
+from .linearresponse import response_to_spectrum
+from .linearresponse import aggregate_transitions
+from .linearresponse import transition_responses
 from ..core.units import cm2int
 
 from ..core.saveable import Saveable
+from ..utils.timing import profiled
 
 class CircDichSpectrumBase(DFunction, EnergyUnitsManaged):
     """Provides basic container for circular dichroism spectrum
@@ -608,6 +613,7 @@ class CircDichSpectrumCalculator(EnergyUnitsManaged):
         
         
         
+    @profiled()
     def calculate(self):
         """ Calculates the circular dichroism spectrum 
         
@@ -633,6 +639,42 @@ class CircDichSpectrumCalculator(EnergyUnitsManaged):
         return spect
     
 
+    def calculate_ensemble(self, ensemble):
+        """ Calculates CD spectrum averaged over a disordered ensemble
+        
+        All transitions of all realizations are summed in the time domain
+        and the average spectrum is obtained by a single FFT.
+        Relaxation broadening is not included.
+        
+        Parameters
+        ----------
+        
+        ensemble : DisorderEnsemble
+            Ensemble of realizations of a disordered aggregate
+        
+        """
+        with energy_units("int"):
+            ta = self.TimeAxis
+            
+            weights = (ensemble.get_rotatory_strengths()
+                       *ensemble.get_dipole_strengths())
+            at = batched_response(ta, ensemble.energies - self.rwa, weights,
+                                  ensemble.get_lineshape_weights(),
+                                  ensemble.get_lineshape_functions())
+            data = numpy.real(response_to_spectrum(at, ta))/ensemble.Nreal
+            
+            # we only want to retain the upper half of the spectrum
+            Nt = len(self.frequencyAxis.data)//2        
+            do = self.frequencyAxis.data[1]-self.frequencyAxis.data[0]
+            st = self.frequencyAxis.data[Nt//2]
+            # we represent the Frequency axis anew
+            axis = FrequencyAxis(st,Nt,do)
+            
+            spect = CircDichSpectrum(axis=axis, data=data)
+        
+        return spect
+    
+    
     def _calculateMolecule(self,rwa):
         
         if self.system._has_system_bath_coupling:
@@ -761,6 +803,25 @@ class CircDichSpectrumCalculator(EnergyUnitsManaged):
         
         return rr
         
+    def _excitonic_rot_dips(self, SS, AG):
+        """ Returns rotatory strengths of all transitions from ground state
+        
+        Vectorized version of `_excitonic_rot_dip`
+        
+        """
+        Na = AG.nmono
+        pos = numpy.array([AG.monomers[kk].position for kk in range(Na)])
+        dd = numpy.array([AG.monomers[kk].get_TransitionDipoleMoment().data[0][1]
+                          for kk in range(Na)])
+        
+        # (r_l - r_k).(d_l x d_k) for all pairs k < l
+        displ = pos[numpy.newaxis,:,:] - pos[:,numpy.newaxis,:]
+        cross = numpy.cross(dd[numpy.newaxis,:,:], dd[:,numpy.newaxis,:])
+        geom = numpy.triu(numpy.einsum("kli,kli->kl", displ, cross), k=1)
+        
+        S1 = SS[1:Na+1,1:]
+        return numpy.einsum("kn,ln,kl->n", S1, S1, geom)
+        
     def _calculate_monomer(self):
         """ Calculates the circular dichroism spectrum of a monomer 
         
@@ -787,81 +848,18 @@ class CircDichSpectrumCalculator(EnergyUnitsManaged):
         else:
             HH = relaxation_hamiltonian
             
-
-        SS = HH.diagonalize() # transformed into eigenbasis
-
-        
-        # Transition dipole moment operator
-        DD = self.system.get_TransitionDipoleMoment()
-        # transformed into the basis of Hamiltonian eigenstates
-        DD.transform(SS)         
-
-        # TimeAxis
-        tr = {"ta":ta}
-        
-        if relaxation_tensor is not None:
-            RR = relaxation_tensor
-            RR.transform(SS)
-            gg = []            
-            if isinstance(RR, TimeDependent):
-                for ii in range(HH.dim):
-                    gg.append(RR.data[:,ii,ii,ii,ii])
-            else:
-                for ii in range(HH.dim):
-                    gg.append([RR.data[ii,ii,ii,ii]])
-            tr["gg"] = gg[1]
-        elif rate_matrix is not None:
-            RR = rate_matrix  # rate matrix is in excitonic basis
-            gg = []
-            if isinstance(RR, TimeDependent):
-                for ii in range(HH.dim):
-                    gg.append(RR.data[:,ii,ii])
-            else:
-                for ii in range(HH.dim):
-                    gg.append([RR.data[ii,ii]])
-            tr["gg"] = gg[1]
-        else:
-            tr["gg"] = [0.0]
-        
-        # get square of transition dipole moment here    #print(H_RC)
-        #tr.append(DD.dipole_strength(0,1))
-        tr["dd"] = DD.dipole_strength(0,1)
-        # first transition energy
-        #tr.append(HH.data[1,1]-HH.data[0,0]-rwa)
-        tr["om"] = HH.data[1,1]-HH.data[0,0]-self.rwa
-        # get a transformed ct here
-        ct = self._excitonic_coft(SS,self.system,0)
-        #tr.append(ct)
-        tr["ct"] = ct
+        # all transitions at once
+        tr = aggregate_transitions(ta, self.system, HH, self.rwa,
+                                   relaxation_tensor=relaxation_tensor,
+                                   rate_matrix=rate_matrix)
         self.system._has_system_bath_coupling = True
         
-        rot_dip = self._excitonic_rot_dip(SS,self.system, 0)  
-        data = rot_dip*numpy.real(self.one_transition_spectrum(tr))
-        
-        #
-        # Calculates spectrum of a single transition
-        #
-        data = numpy.real(self.one_transition_spectrum(tr))
+        at = transition_responses(ta, tr["om"], tr["gw"], tr["gt"],
+                                  rates=tr["gg"])
         
-        for ii in range(2,HH.dim):
-            if relaxation_tensor is not None:
-                tr["gg"] = gg[ii]
-            else:
-                tr["gg"] = [0.0]
-            
-            rot_dip = self._excitonic_rot_dip(SS,self.system, ii-1)  
-            #tr[1] = DD.dipole_strength(0,ii) # update transition dipole moment
-            tr["dd"] = DD.dipole_strength(0,ii)
-            #tr[2] = HH.data[ii,ii]-HH.data[0,0]-rwa
-            tr["om"] = HH.data[ii,ii]-HH.data[0,0]-self.rwa
-            #tr[3] = self._excitonic_coft(SS,self.system,ii-1) # update ct here
-            tr["ct"] = self._excitonic_coft(SS,self.system,ii-1)
-            
-            #
-            # Calculates spectrum of a single transition
-            #
-            data += rot_dip*numpy.real(self.one_transition_spectrum(tr))
-
+        rot_dip = self._excitonic_rot_dips(tr["SS"], self.system)
+        data = numpy.dot(rot_dip*tr["dd"], 
+                         numpy.real(response_to_spectrum(at, ta)))
 
         # we only want to retain the upper half of the spectrum
         Nt = len(self.frequencyAxis.data)//2        
@@ -869,15 +867,6 @@ class CircDichSpectrumCalculator(EnergyUnitsManaged):
         st = self.frequencyAxis.data[Nt//2]
         # we represent the Frequency axis anew
         axis = FrequencyAxis(st,Nt,do)
-        
-        
-        # transform all quantities back
-        S1 = numpy.linalg.inv(SS)
-        HH.transform(S1)
-        DD.transform(S1)
-        
-        if relaxation_tensor is not None:
-            RR.transform(S1)
 
         spect = CircDichSpectrum(axis=axis, data=data)
         
@@ -31,11 +31,15 @@ from ..core.dfunction import DFunction
 
 from ..core.managers import energy_units
 from ..core.managers import EnergyUnitsManaged
+from ..core.basiscache import unitary_inverse
 from ..core.managers import eigenbasis_of
 from ..core.time import TimeDependent
+from .linearresponse import batched_response
+from .linearresponse import response_to_spectrum
 from ..core.units import cm2int
 
 from ..core.saveable import Saveable
+from ..utils.timing import profiled
 
 class FluorSpectrumBase(DFunction, EnergyUnitsManaged):
     """Provides basic container for fluorescence spectrum
@@ -617,6 +621,7 @@ class FluorSpectrumCalculator(EnergyUnitsManaged):
         
         
         
+    @profiled()
     def calculate(self):
         """ Calculates the fluorescence spectrum 
         
@@ -642,6 +647,48 @@ class FluorSpectrumCalculator(EnergyUnitsManaged):
         return spect
     
 
+    def calculate_ensemble(self, ensemble):
+        """ Calculates fluorescence averaged over a disordered ensemble
+        
+        All transitions of all realizations are summed in the time domain
+        and the average spectrum is obtained by a single FFT. Emitting
+        states are populated according to the canonical distribution
+        at the temperature of the calculator. Relaxation broadening is
+        not included.
+        
+        Parameters
+        ----------
+        
+        ensemble : DisorderEnsemble
+            Ensemble of realizations of a disordered aggregate
+        
+        """
+        with energy_units("int"):
+            ta = self.TimeAxis
+            
+            weights = (ensemble.get_thermal_populations(self.temperature)
+                       *ensemble.get_dipole_strengths())
+            # emission is shifted by twice the reorganization energy
+            oms = (ensemble.energies - self.rwa
+                   - 2.0*numpy.real(ensemble.get_reorganization_energies()))
+            at = batched_response(ta, oms, weights,
+                                  ensemble.get_lineshape_weights(),
+                                  ensemble.get_lineshape_functions(),
+                                  conjugate=True)
+            data = numpy.real(response_to_spectrum(at, ta))/ensemble.Nreal
+            
+            # we only want to retain the upper half of the spectrum
+            Nt = len(self.frequencyAxis.data)//2        
+            do = self.frequencyAxis.data[1]-self.frequencyAxis.data[0]
+            st = self.frequencyAxis.data[Nt//2]
+            # we represent the Frequency axis anew
+            axis = FrequencyAxis(st,Nt,do)
+            
+            spect = FluorSpectrum(axis=axis, data=data)
+        
+        return spect
+    
+    
     def _calculateMolecule(self,rwa):
         
         if self.system._has_system_bath_coupling:
@@ -931,7 +978,7 @@ class FluorSpectrumCalculator(EnergyUnitsManaged):
         
         
         # transform all quantities back
-        S1 = numpy.linalg.inv(SS)
+        S1 = unitary_inverse(SS)
         HH.transform(S1)
         DD.transform(S1)
         
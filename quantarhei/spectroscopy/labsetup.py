@@ -69,6 +69,10 @@ class LabSetup:
         self.pulse_t = [None]*nopulses
         self.pulse_f = [None]*nopulses
         
+        # stacked representations of the pulses
+        self.pulse_bank_t = None
+        self.pulse_bank_f = None
+        
         self.omega = None
         
                         
@@ -287,78 +291,54 @@ class LabSetup:
             raise Exception("Wrong axis paramater")
 
         if len(params) == self.number_of_pulses:
-        
-            k_p = 0
-            for par in params:
             
-                if par["ptype"] == "Gaussian":
-                    
-                    if self.axis_type == "time":
-                        #
-                        # Time domain Gaussian pulse around 0.0 as a DFunction
-                        #
-                        tma = self.timeaxis
-                        fwhm = par["FWHM"]
-                        amp = par["amplitude"]
-                        
-                        # normalized Gaussian mupliplied by amplitude
-                        val = (2.0/fwhm)*numpy.sqrt(numpy.log(2.0)/3.14159) \
-                        *amp*numpy.exp(-4.0*numpy.log(2.0)*(tma.data/fwhm)**2)
-                        
-                        self.pulse_t[k_p] = DFunction(tma, val)
-                    
-                    elif self.axis_type == "frequency":
-                        #
-                        # Frequency domain Gaussian pulse around 0.0 
-                        # as a DFunction
-                        #
-                        fra = self.freqaxis
-                        fwhm = par["FWHM"]
-                        amp = par["amplitude"]
-                        
-                        # normalized Gaussian mupliplied by amplitude
-                        val = (2.0/fwhm)*numpy.sqrt(numpy.log(2.0)/3.14159) \
-                        *amp*numpy.exp(-4.0*numpy.log(2.0)*(fra.data/fwhm)**2)
-                        
-                        self.pulse_f[k_p] = DFunction(fra, val) 
-                        
-                elif par["ptype"] == "numeric":
+            if self.axis_type == "time":
+                axs = self.timeaxis
+            else:
+                axs = self.freqaxis
             
-                    fce = par["function"]
-
-                    if self.axis_type == "time":
-                        
-                        #
-                        # Create a new DFunction based on the submitted time 
-                        # axis
-                        #
-                        data = numpy.zeros(self.timeaxis.length)
-                        i_p = 0
-                        for t_p in self.timeaxis.data:
-                            data[i_p] = fce.at(t_p)
-                            i_p += 1
-                            
-                        self.pulse_t[k_p] = DFunction(self.timeaxis, data)
-                    
-                    elif self.axis_type == "frequency":
-                        
-                        data = numpy.zeros(self.freqaxis.length)
-                        i_p = 0
-                        for t_p in self.freqaxis.data:
-                            data[i_p] = fce.at(t_p)
-                            i_p += 1
-                            
-                        self.pulse_f[k_p] = DFunction(self.freqaxis, data)
-                    
-        
-                else:
+            for par in params:
+                if par["ptype"] not in ["Gaussian", "numeric"]:
                     raise Exception("Unknown pulse type")
-                    
-                k_p += 1
-             
+            
+            data = numpy.zeros((self.number_of_pulses, axs.length))
+            
+            #
+            # Gaussian pulses around 0.0 are calculated all at once
+            #
+            gauss = [k_p for k_p in range(self.number_of_pulses)
+                     if params[k_p]["ptype"] == "Gaussian"]
+            if len(gauss) > 0:
+                fwhm = numpy.array([params[k_p]["FWHM"] for k_p in gauss])
+                amp = numpy.array([params[k_p]["amplitude"] for k_p in gauss])
+                fwhm = fwhm[:,numpy.newaxis]
+                amp = amp[:,numpy.newaxis]
+                
+                # normalized Gaussian mupliplied by amplitude
+                data[gauss,:] = (2.0/fwhm)* \
+                    numpy.sqrt(numpy.log(2.0)/3.14159)*amp* \
+                    numpy.exp(-4.0*numpy.log(2.0)*(axs.data/fwhm)**2)
+            
+            #
+            # Numerical pulses are evaluated on the submitted axis 
+            #
+            for k_p in range(self.number_of_pulses):
+                if params[k_p]["ptype"] == "numeric":
+                    fce = params[k_p]["function"]
+                    vals = numpy.asarray(fce.at(axs.data))
+                    if numpy.iscomplexobj(vals):
+                        data = data.astype(vals.dtype)
+                    data[k_p,:] = vals
+            
+            bank = PulseBank(axs, data)
+            
             if self.axis_type == "time":
+                self.pulse_bank_t = bank
+                self.pulse_t = bank.get_DFunctions()
                 self.has_timedomain = True
             elif self.axis_type == "frequency":
+                self.pulse_bank_f = bank
+                self.pulse_f = bank.get_DFunctions()
                 self.has_freqdomain = True
                 
         else:
@@ -568,20 +548,14 @@ class LabSetup:
         """
         if self.has_freqdomain:
             
-            freq = self.freqaxis
-            time = freq.get_TimeAxis()
+            # Fourier transform of all pulses at once (cached by the bank)
+            bank = self._get_pulse_bank("frequency").get_Fourier_transform()
             
-            k_p = 0
-            for pulse in self.pulse_f:
-                ft_pulse = pulse.get_Fourier_transform()
-                # we replace the DFunction's axis attribute with the one
-                # calculated above; in time domain the pulses also share
-                # the same TimeAxis object
-                ft_pulse.axis = time
-                self.pulse_t[k_p] = ft_pulse
-                k_p += 1
+            # in time domain the pulses share the same TimeAxis object
+            self.pulse_bank_t = bank
+            self.pulse_t = bank.get_DFunctions()
             
-            self.timeaxis = time
+            self.timeaxis = bank.axis
             self.has_timedomain = True
         
         else:
@@ -641,20 +615,14 @@ class LabSetup:
         """
         if self.has_timedomain:
             
-            time = self.timeaxis
-            freq = time.get_FrequencyAxis()
+            # Fourier transform of all pulses at once (cached by the bank)
+            bank = self._get_pulse_bank("time").get_Fourier_transform()
             
-            k_p = 0
-            for pulse in self.pulse_t:
-                ft_pulse = pulse.get_Fourier_transform()
-                # we replace the DFunction's axis attribute with the one
-                # calculated above; in time domain the pulses also share
-                # the same TimeAxis object
-                ft_pulse.axis = freq
-                self.pulse_f[k_p] = ft_pulse
-                k_p += 1
+            # in frequency domain the pulses share the same axis object
+            self.pulse_bank_f = bank
+            self.pulse_f = bank.get_DFunctions()
             
-            self.freqaxis = freq
+            self.freqaxis = bank.axis
             self.has_freqdomain = True
                 
         else:
@@ -714,7 +682,7 @@ class LabSetup:
 
         
         """
-        return self.pulse_t[k].at(t)
+        return self._get_pulse_bank("time").at(t, k)
     
     
     def get_pulse_spectrum(self, k, omega):
@@ -770,7 +738,112 @@ class LabSetup:
 
         
         """
-        return self.pulse_f[k].at(omega)
+        return self._get_pulse_bank("frequency").at(omega, k)
+    
+    
+    def get_pulse_envelops(self, t):
+        """Returns time-domain envelopes of all pulses
+        
+        Parameters
+        ----------
+        
+        t : array like
+            Array of time points at which the pulses are returned. 
+            An array of the shape (number_of_pulses, Nt) specifies
+            the time points for each pulse separately.
+            
+        Returns
+        -------
+        
+        numpy.ndarray of the shape (number_of_pulses, Nt)
+        
+        """
+        return self._get_pulse_bank("time").at(t)
+    
+    
+    def get_pulse_spectra(self, omega):
+        """Returns frequency-domain spectra of all pulses
+        
+        Parameters
+        ----------
+        
+        omega : array like
+            Array of frequency points at which the pulses are returned
+            
+        Returns
+        -------
+        
+        numpy.ndarray of the shape (number_of_pulses, Nomega)
+        
+        """
+        return self._get_pulse_bank("frequency").at(omega)
+    
+    
+    def get_EField(self, timeaxis, tcs, outside=0.0):
+        """Returns the electric field of all pulses on a given time axis
+        
+        The time domain pulse envelopes are evaluated at once for all
+        pulses centered at times `tcs`. Pulse frequencies and polarizations
+        are taken from the lab settings (polarizations default to X).
+        
+        Parameters
+        ----------
+        
+        timeaxis : TimeAxis
+            Time axis on which the field is calculated
+            
+        tcs : array like
+            Central times of the pulses
+            
+        outside : float
+            Value of the envelopes outside the axis on which the pulses are
+            defined
+        
+        """
+        tcs = numpy.asarray(tcs, dtype=numpy.float64)
+        if tcs.shape[0] != self.number_of_pulses:
+            raise Exception("Wrong number of pulse centers: "+
+                            str(self.number_of_pulses)+" required")
+        if self.omega is None:
+            raise Exception("Pulse frequencies not set")
+        
+        tt = timeaxis.data[numpy.newaxis,:] - tcs[:,numpy.newaxis]
+        env = self._get_pulse_bank("time").at(tt, outside=outside)
+        
+        if self.e is not None:
+            pol = self.e[0:self.number_of_pulses,:]
+        else:
+            pol = numpy.outer(numpy.ones(self.number_of_pulses), X)
+            
+        return EField(timeaxis, omega=numpy.array(self.omega, dtype=float),
+                      polar=pol, ftype="numeric", 
+                      params=dict(envelop=env))
+    
+    
+    def _get_pulse_bank(self, domain):
+        """Returns the bank of pulses in time or frequency domain
+        
+        If the pulse DFunctions were replaced by the user, the bank
+        is rebuilt from them.
+        
+        """
+        if domain == "time":
+            bank = self.pulse_bank_t
+            pulses = self.pulse_t
+        else:
+            bank = self.pulse_bank_f
+            pulses = self.pulse_f
+            
+        if (bank is None) or (not bank.represents(pulses)):
+            bank = PulseBank.from_DFunctions(pulses)
+            if domain == "time":
+                self.pulse_bank_t = bank
+                self.pulse_t = bank.get_DFunctions()
+            else:
+                self.pulse_bank_f = bank
+                self.pulse_f = bank.get_DFunctions()
+                
+        return bank
     
     
     def set_pulse_frequencies(self, omegas):
@@ -837,9 +910,208 @@ class labsetup(LabSetup):
 
 
 
+class PulseBank:
+    """Stacked representation of several pulses on a shared axis
+    
+    Pulse shapes (time-domain envelopes or spectra) are stored as rows
+    of a single array, so that all pulses are evaluated, interpolated and
+    Fourier transformed at once. The Fourier transform is cached.
+    
+    Parameters
+    ----------
+    
+    axis : TimeAxis or FrequencyAxis
+        Axis shared by all pulses
+        
+    data : numpy.ndarray
+        Pulse shapes of the shape (number_of_pulses, axis.length)
+        
+    """
+    
+    def __init__(self, axis, data):
+        
+        data = numpy.asarray(data)
+        if (data.ndim != 2) or (data.shape[1] != axis.length):
+            raise Exception("Pulse data have to be of the shape"+
+                            " (number_of_pulses, axis.length)")
+        self.axis = axis
+        self.data = data
+        self.number_of_pulses = data.shape[0]
+        
+        self._fourier = None
+        self._dfunctions = None
+        
+        
+    @classmethod
+    def from_DFunctions(cls, pulses):
+        """Creates the bank from a list of DFunctions with a shared axis
+        
+        """
+        axis = pulses[0].axis
+        for pulse in pulses:
+            if not pulse.axis.is_equal_to(axis):
+                raise Exception("Pulses have to share the same axis")
+        return cls(axis, numpy.array([pulse.data for pulse in pulses]))
+    
+    
+    def get_DFunctions(self):
+        """Returns the pulses as DFunctions sharing the data of the bank
+        
+        """
+        if self._dfunctions is None:
+            self._dfunctions = [DFunction(self.axis, self.data[k_p,:]) 
+                                for k_p in range(self.number_of_pulses)]
+        return list(self._dfunctions)
+    
+    
+    def represents(self, pulses):
+        """Checks if the list of DFunctions is the one of this bank
+        
+        """
+        if self._dfunctions is None:
+            return False
+        if len(pulses) != self.number_of_pulses:
+            return False
+        for (pulse, dfc) in zip(pulses, self._dfunctions):
+            if (pulse is not dfc) or (pulse.data.base is not self.data):
+                return False
+        return True
+    
+    
+    def at(self, x, k=None, outside=None):
+        """Linear interpolation of the pulses at given points
+        
+        The interpolation is the same as the default (linear) one of
+        DFunction, but all pulses are evaluated in one call.
+        
+        Parameters
+        ----------
+        
+        x : float or array like
+            Points at which the pulses are evaluated. An array of the shape
+            (number_of_pulses, M) specifies points for each pulse separately.
+            
+        k : int
+            If specified, only the pulse with index k is returned
+            
+        outside : float
+            If specified, this value is returned for points outside the 
+            axis, otherwise an exception is raised for such points
+            
+        """
+        is_scalar = numpy.isscalar(x)
+        xx = numpy.asarray(x, dtype=numpy.float64)
+        
+        if k is not None:
+            data = self.data[k:k+1,:]
+        else:
+            data = self.data
+        Np = data.shape[0]
+        
+        if xx.ndim < 2:
+            xx = numpy.broadcast_to(numpy.atleast_1d(xx), 
+                                    (Np, numpy.atleast_1d(xx).shape[0]))
+        elif k is not None:
+            xx = xx[k:k+1,:]
+            
+        axs = self.axis
+        nn = numpy.floor((xx - axs.start)/axs.step).astype(int)
+        inside = (nn >= 0) & (nn < axs.length)
+        if outside is None:
+            if not numpy.all(inside):
+                raise Exception("Value out of bounds")
+        nn = numpy.clip(nn, 0, axs.length-1)
+        mm = numpy.minimum(nn, axs.length-2)
+        
+        d_n = numpy.take_along_axis(data, nn, axis=1)
+        d_m = numpy.take_along_axis(data, mm, axis=1)
+        d_m1 = numpy.take_along_axis(data, mm+1, axis=1)
+        
+        val = d_n + ((xx - axs.data[nn])/axs.step)*(d_m1 - d_m)
+        if outside is not None:
+            val = numpy.where(inside, val, outside)
+            
+        if k is not None:
+            val = val[0,...]
+        if is_scalar:
+            val = val[...,0]
+            
+        return val
+    
+    
+    def get_Fourier_transform(self):
+        """Returns the bank of Fourier transformed pulses
+        
+        The transform is the same as the one of DFunction, and it 
+        is calculated only once.
+        
+        """
+        if self._fourier is not None:
+            return self._fourier
+        
+        y = self.data
+        
+        if isinstance(self.axis, TimeAxis):
+            
+            t = self.axis
+            w = t.get_FrequencyAxis()
+            
+            if t.atype == "complete":
+                Y = t.length*numpy.fft.fftshift(numpy.fft.ifft(
+                    numpy.fft.fftshift(y, axes=1), axis=1), axes=1)*t.step
+            else:
+                raise Exception("TimeAxis has to be of 'complete' type")
+            
+            self._fourier = PulseBank(w, Y)
+            
+        elif isinstance(self.axis, FrequencyAxis):
+            
+            w = self.axis
+            t = w.get_TimeAxis()
+            
+            Y = w.length*numpy.fft.fftshift(numpy.fft.ifft(
+                numpy.fft.fftshift(y, axes=1), axis=1), axes=1) \
+                *w.step/(numpy.pi*2.0)
+                
+            if w.atype == "upper-half":
+                Y = Y[:,t.length:2*t.length]
+            elif w.atype != "complete":
+                raise Exception("Unknown axis type"
+                                +" (must be complete or upper-half)")
+                
+            self._fourier = PulseBank(t, Y)
+            
+        else:
+            raise Exception("Unknown axis type")
+            
+        return self._fourier
+
+
+
 class EField():
     """Class representing electric field of a laser pulse
     
+    Several pulses can be represented by one object; in that case
+    `omega`, the parameters of the Gaussian pulses and the rows of `polar`
+    specify the individual pulses, and the fields of all pulses are 
+    calculated at once.
+    
+    Parameters
+    ----------
+    
+    time : TimeAxis
+        Time axis on which the field is calculated
+        
+    omega : float or array
+        Frequency (frequencies) of the pulse(s)
+        
+    polar : array
+        Polarization vector, or an array (number_of_pulses, 3)
+        
+    ftype : str {"Gaussian", "numeric"}
+        Gaussian pulses are specified by parameters `Emax`, `fwhm` and `tc`
+        (floats or arrays), numeric pulses by their `envelop` of the shape
+        (Nt) or (number_of_pulses, Nt)
     
     """
     
@@ -859,10 +1131,27 @@ class EField():
             self.fwhm = params["fwhm"]
             self.tc = params["tc"]
             
-            self.envelop = self.Emax*numpy.sqrt(numpy.log(2.0)/numpy.pi)\
+            Emax = numpy.asarray(self.Emax)[...,numpy.newaxis]
+            fwhm = numpy.asarray(self.fwhm)[...,numpy.newaxis]
+            tc = numpy.asarray(self.tc)[...,numpy.newaxis]
+            
+            self.envelop = Emax*numpy.sqrt(numpy.log(2.0)/numpy.pi)\
                      *numpy.exp(-numpy.log(2.0)*((self.time.data
-                                -self.tc)/self.fwhm)**2) \
-                     /self.fwhm
+                                -tc)/fwhm)**2) \
+                     /fwhm
+                     
+        elif ftype=="numeric":
+            
+            self.ftype=ftype
+            self.envelop = numpy.asarray(params["envelop"])
+            
+        else:
+            raise Exception("Unknown field type")
+            
+        if self.envelop.ndim == 1:
+            self.number_of_pulses = 1
+        else:
+            self.number_of_pulses = self.envelop.shape[0]
 
 
     def subtract_omega(self, om):
@@ -870,7 +1159,7 @@ class EField():
         
         """
         self.saved_omega = self.omega
-        self.omega -= om
+        self.omega = numpy.asarray(self.omega) - om
 
 
     def restore_omega(self):
@@ -884,34 +1173,89 @@ class EField():
         """Field at index i
         
         """
-        if sign is None:
-            return self.envelop[i]*numpy.cos(self.omega*self.time.data[i])
-        
-        if sign == 1:
-            return 0.5*self.envelop[i]* \
-                   numpy.exp(1j*self.omega*self.time.data[i])        
-        elif sign == -1:
-            return 0.5*numpy.conj(self.envelop[i])* \
-                   numpy.exp(-1j*self.omega*self.time.data[i]) 
-        else:
-            raise Exception("Unknown field component")
+        return self._field(sign, self.envelop[...,i], self.time.data[i])
     
     
-    def field(self, sign=None):
+    def field(self, sign=None, times=None):
         """Field in an array
         
+        For several pulses, an array of the shape (number_of_pulses, Nt)
+        is returned.
+        
+        Parameters
+        ----------
+        
+        sign : {None, 1, -1}
+            Full real field (None), or one of its complex components
+            
+        times : array
+            Times at which the field is calculated. By default, the field
+            is returned on its time axis.
+        
+        """
+        if times is None:
+            return self._field(sign, self.envelop, self.time.data)
+        return self._field(sign, self.get_envelop(times), times)
+    
+    
+    def field_vector(self, sign=None, times=None):
+        """Field vector summed over all pulses, array of the shape (Nt, 3)
+        
+        """
+        fld = self.field(sign, times=times)
+        pol = numpy.asarray(self.pol)
+        if fld.ndim == 1:
+            return numpy.outer(fld, pol)
+        return numpy.dot(fld.T, pol)
+    
+    
+    def get_envelop(self, times):
+        """Envelope(s) of the pulse(s) at arbitrary times
+        
+        Gaussian envelopes are calculated from their formula, numerical
+        ones are linearly interpolated.
+        
         """
+        times = numpy.asarray(times)
+        
+        if self.ftype == "Gaussian":
+            
+            Emax = numpy.asarray(self.Emax)[...,numpy.newaxis]
+            fwhm = numpy.asarray(self.fwhm)[...,numpy.newaxis]
+            tc = numpy.asarray(self.tc)[...,numpy.newaxis]
+            
+            return Emax*numpy.sqrt(numpy.log(2.0)/numpy.pi)\
+                     *numpy.exp(-numpy.log(2.0)*((times-tc)/fwhm)**2)/fwhm
+                     
+        env = numpy.atleast_2d(self.envelop)
+        ret = numpy.zeros((env.shape[0], times.shape[0]), dtype=env.dtype)
+        for k_p in range(env.shape[0]):
+            ret[k_p,:] = numpy.interp(times, self.time.data, 
+                                      numpy.real(env[k_p,:]))
+            if numpy.iscomplexobj(env):
+                ret[k_p,:] += 1j*numpy.interp(times, self.time.data, 
+                                              numpy.imag(env[k_p,:]))
+        if self.envelop.ndim == 1:
+            return ret[0,:]
+        return ret
+    
+    
+    def _field(self, sign, env, tt):
+        """Field components calculated from the envelope
+        
+        """
+        om = numpy.asarray(self.omega)
+        if numpy.ndim(env) == 2:
+            om = om[...,numpy.newaxis]
+            
         if sign is None:
-            return self.envelop*numpy.cos(self.omega*self.time.data)
+            return env*numpy.cos(om*tt)
         
         if sign == 1:
-            return 0.5*self.envelop*numpy.exp(1j*self.omega*self.time.data)
+            return 0.5*env*numpy.exp(1j*om*tt)        
         elif sign == -1:
-            return 0.5*numpy.conj(self.envelop) \
-                   *numpy.exp(-1j*self.omega*self.time.data)
+            return 0.5*numpy.conj(env)*numpy.exp(-1j*om*tt) 
         else:
             raise Exception("Unknown field component")
                    
 
-
-
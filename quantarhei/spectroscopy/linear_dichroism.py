@@ -25,9 +25,14 @@ from ..core.dfunction import DFunction
 from ..core.managers import energy_units
 from ..core.managers import EnergyUnitsManaged
 from ..core.time import TimeDependent
+from .linearresponse import batched_response
+from .linearresponse import response_to_spectrum
+from .linearresponse import aggregate_transitions
+from .linearresponse import transition_responses
 from ..core.units import cm2int
 
 from ..core.saveable import Saveable
+from ..utils.timing import profiled
 
 class LinDichSpectrumBase(DFunction, EnergyUnitsManaged):
     """Provides basic container for linear dichroism spectrum
@@ -613,6 +618,7 @@ class LinDichSpectrumCalculator(EnergyUnitsManaged):
         
         
         
+    @profiled()
     def calculate(self):
         """ Calculates the linear dichroism spectrum 
         
@@ -638,6 +644,48 @@ class LinDichSpectrumCalculator(EnergyUnitsManaged):
         return spect
     
 
+    def calculate_ensemble(self, ensemble):
+        """ Calculates LD spectrum averaged over a disordered ensemble
+        
+        All transitions of all realizations are summed in the time domain
+        and the average spectrum is obtained by a single FFT.
+        Relaxation broadening is not included.
+        
+        Parameters
+        ----------
+        
+        ensemble : DisorderEnsemble
+            Ensemble of realizations of a disordered aggregate
+        
+        """
+        agg = ensemble.aggregate
+        if not agg._has_lindich_axes:
+            agg.set_lindich_axes(self.vector_perp_to_membrane)
+        q = agg.get_lindich_axes()
+        
+        with energy_units("int"):
+            ta = self.TimeAxis
+            
+            # dipole moments in the linear dichroism axes
+            dq = numpy.dot(ensemble.get_transition_dipoles(), q)
+            weights = -dq[:,:,0]**2 + 0.5*dq[:,:,1]**2 + 0.5*dq[:,:,2]**2
+            at = batched_response(ta, ensemble.energies - self.rwa, weights,
+                                  ensemble.get_lineshape_weights(),
+                                  ensemble.get_lineshape_functions())
+            data = numpy.real(response_to_spectrum(at, ta))/ensemble.Nreal
+            
+            # we only want to retain the upper half of the spectrum
+            Nt = len(self.frequencyAxis.data)//2        
+            do = self.frequencyAxis.data[1]-self.frequencyAxis.data[0]
+            st = self.frequencyAxis.data[Nt//2]
+            # we represent the Frequency axis anew
+            axis = FrequencyAxis(st,Nt,do)
+            
+            spect = LinDichSpectrum(axis=axis, data=data)
+        
+        return spect
+    
+    
     def _calculateMolecule(self,rwa):
         
         if self.system._has_system_bath_coupling:
@@ -781,42 +829,6 @@ class LinDichSpectrumCalculator(EnergyUnitsManaged):
         else:
             HH = relaxation_hamiltonian
             
-
-        SS = HH.diagonalize() # transformed into eigenbasis
-
-        
-        # Transition dipole moment operator
-        DD = self.system.get_TransitionDipoleMoment()
-        # transformed into the basis of Hamiltonian eigenstates
-        DD.transform(SS)         
-
-        # TimeAxis
-        tr = {"ta":ta}
-        
-        if relaxation_tensor is not None:
-            RR = relaxation_tensor
-            RR.transform(SS)
-            gg = []            
-            if isinstance(RR, TimeDependent):
-                for ii in range(HH.dim):
-                    gg.append(RR.data[:,ii,ii,ii,ii])
-            else:
-                for ii in range(HH.dim):
-                    gg.append([RR.data[ii,ii,ii,ii]])
-            tr["gg"] = gg[1]
-        elif rate_matrix is not None:
-            RR = rate_matrix  # rate matrix is in excitonic basis
-            gg = []
-            if isinstance(RR, TimeDependent):
-                for ii in range(HH.dim):
-                    gg.append(RR.data[:,ii,ii])
-            else:
-                for ii in range(HH.dim):
-                    gg.append([RR.data[ii,ii]])
-            tr["gg"] = gg[1]
-        else:
-            tr["gg"] = [0.0]
-        
         if not self.system._has_lindich_axes:
             self.system.set_lindich_axes(self.vector_perp_to_membrane)
             q = self.system.get_lindich_axes()
@@ -827,40 +839,20 @@ class LinDichSpectrumCalculator(EnergyUnitsManaged):
                 raise Exception('No orthogonal axis system provided for\
                                 calculation of linear dichroism.')
         
-        # get square of transition dipole moment here    #print(H_RC)
-        #tr.append(DD.dipole_strength(0,1))
-        tr["dd_vec"] = numpy.dot(DD.data[0][1], q)
-        # first transition energy
-        #tr.append(HH.data[1,1]-HH.data[0,0]-rwa)
-        tr["om"] = HH.data[1,1]-HH.data[0,0]-self.rwa
-        # get a transformed ct here
-        ct = self._excitonic_coft(SS,self.system,0)
-        #tr.append(ct)
-        tr["ct"] = ct
+        # all transitions at once
+        tr = aggregate_transitions(ta, self.system, HH, self.rwa,
+                                   relaxation_tensor=relaxation_tensor,
+                                   rate_matrix=rate_matrix)
         self.system._has_system_bath_coupling = True
         
-        #
-        # Calculates spectrum of a single transition
-        #
-        data = numpy.real(self.one_transition_spectrum(tr))
+        at = transition_responses(ta, tr["om"], tr["gw"], tr["gt"],
+                                  rates=tr["gg"])
         
-        for ii in range(2,HH.dim):
-            if relaxation_tensor is not None:
-                tr["gg"] = gg[ii]
-            else:
-                tr["gg"] = [0.0]
-            #tr[1] = DD.dipole_strength(0,ii) # update transition dipole moment
-            tr["dd_vec"] = numpy.dot(DD.data[0][ii], q)
-            #tr[2] = HH.data[ii,ii]-HH.data[0,0]-rwa
-            tr["om"] = HH.data[ii,ii]-HH.data[0,0]-self.rwa
-            #tr[3] = self._excitonic_coft(SS,self.system,ii-1) # update ct here
-            tr["ct"] = self._excitonic_coft(SS,self.system,ii-1)
-            
-            #
-            # Calculates spectrum of a single transition
-            #
-            data += numpy.real(self.one_transition_spectrum(tr))
-
+        # linear dichroism dipole moment pre-factors
+        dq = numpy.dot(tr["dd_vec"], q)
+        ld = -dq[:,0]**2 + 0.5*dq[:,1]**2 + 0.5*dq[:,2]**2
+        
+        data = numpy.dot(ld, numpy.real(response_to_spectrum(at, ta)))
 
         # we only want to retain the upper half of the spectrum
         Nt = len(self.frequencyAxis.data)//2        
@@ -868,15 +860,6 @@ class LinDichSpectrumCalculator(EnergyUnitsManaged):
         st = self.frequencyAxis.data[Nt//2]
         # we represent the Frequency axis anew
         axis = FrequencyAxis(st,Nt,do)
-        
-        
-        # transform all quantities back
-        S1 = numpy.linalg.inv(SS)
-        HH.transform(S1)
-        DD.transform(S1)
-        
-        if relaxation_tensor is not None:
-            RR.transform(S1)
 
         spect = LinDichSpectrum(axis=axis, data=data)
         
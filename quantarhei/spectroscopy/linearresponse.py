@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+"""
+    Batched synthesis of linear optical responses
+
+
+    Linear spectra (absorption, circular and linear dichroism, fluorescence)
+    of excitonic systems are sums of single-transition contributions
+
+    a(t) = sum_n w_n exp(-g_n(t) - i om_n t)
+
+    where the excitonic lineshape functions g_n(t) are linear combinations
+    of a small number of site lineshape functions g_f(t)
+
+    g_n(t) = sum_f W_nf g_f(t)
+
+    The functions of this module evaluate such sums for arbitrary batches
+    of transitions (e.g. all transitions of an aggregate, or all transitions 
+    of all realizations of a disordered ensemble) without Python loops over
+    transitions, and they convert the responses to spectra with a single
+    (batched) FFT.
+
+
+    Functions
+    ---------
+
+"""
+import numpy
+import scipy.interpolate
+
+from ..core.basiscache import unitary_inverse
+from ..core.time import TimeDependent
+
+
+def excitonic_lineshape_weights(SS, cpointer, Nf=None):
+    """Weights of site lineshape functions in the excitonic ones
+
+    For an excitonic state n with expansion coefficients S_kn into the
+    site (monomer) states, the energy gap correlation function reads
+
+    c_n(t) = sum_kl S_kn^2 S_ln^2 c_kl(t)
+
+    Correlation functions c_kl are identified by the `cpointer` index
+    of the CorrelationFunctionMatrix, so that c_n(t) = sum_f W_nf c_f(t).
+
+    Parameters
+    ----------
+
+    SS : numpy.ndarray
+        Expansion coefficients of shape (..., Nsites, Nexcitons)
+
+    cpointer : numpy.ndarray
+        Integer array (Nsites, Nsites) pointing to correlation functions
+
+    Nf : int
+        Number of correlation functions. If not specified, the maximum
+        value in cpointer plus one is used.
+
+    Returns
+    -------
+
+    numpy.ndarray of shape (..., Nexcitons, Nf)
+
+    """
+    if Nf is None:
+        Nf = numpy.max(cpointer) + 1
+    S2 = numpy.real(numpy.conj(SS)*SS)
+
+    # indicator of pairs of sites (k,l) belonging to the function f
+    Pf = numpy.zeros((cpointer.shape[0], cpointer.shape[1], Nf))
+    kk, ll = numpy.indices(cpointer.shape)
+    Pf[kk, ll, cpointer] = 1.0
+
+    return numpy.einsum("...kn,...ln,klf->...nf", S2, S2, Pf)
+
+
+def batched_response(timeaxis, omegas, weights, gweights=None, gofts=None,
+                     conjugate=False, chunk_size=None):
+    """Sum of linear responses of many transitions
+
+    Calculates
+
+    a(t) = sum_n w_n exp(-g_n(t) - i om_n t),  g_n(t) = sum_f W_nf g_f(t)
+
+    Parameters
+    ----------
+
+    timeaxis : TimeAxis
+        Time axis of the response
+
+    omegas : numpy.ndarray
+        Transition frequencies (minus RWA frequency) of any shape
+
+    weights : numpy.ndarray
+        Weights (dipole strengths etc.) of the same shape as omegas
+
+    gweights : numpy.ndarray
+        Weights W_nf of the shape omegas.shape + (Nfunctions,)
+
+    gofts : numpy.ndarray
+        Lineshape functions g_f(t) of the shape (Nfunctions, Nt)
+
+    conjugate : bool
+        If True, the complex conjugated lineshape functions are used
+        (as in fluorescence)
+
+    chunk_size : int
+        Maximum number of transitions treated at once. By default
+        it is chosen so that intermediate arrays have about 10^7 elements.
+
+    Returns
+    -------
+
+    Complex numpy.ndarray of the length of the time axis
+
+    """
+    tt = timeaxis.data
+    Nt = tt.shape[0]
+
+    oms = numpy.ravel(omegas)
+    wgs = numpy.ravel(weights)
+    Ntr = oms.shape[0]
+
+    has_lineshape = (gweights is not None) and (gofts is not None)
+    if has_lineshape:
+        gws = numpy.reshape(gweights, (Ntr, -1))
+        gfs = numpy.conj(gofts) if conjugate else gofts
+        gfs = gfs[:, 0:Nt]
+
+    if chunk_size is None:
+        chunk_size = max(1, 10000000//Nt)
+
+    at = numpy.zeros(Nt, dtype=numpy.complex128)
+    for i0 in range(0, Ntr, chunk_size):
+        i1 = min(i0 + chunk_size, Ntr)
+        expo = -1j*numpy.outer(oms[i0:i1], tt)
+        if has_lineshape:
+            expo -= numpy.dot(gws[i0:i1, :], gfs)
+        at += numpy.dot(wgs[i0:i1], numpy.exp(expo))
+
+    return at
+
+
+def response_to_spectrum(at, timeaxis):
+    """Converts time domain linear response to a spectrum
+
+    The conversion follows the single transition calculation of the
+    linear spectra calculators: the response is Fourier transformed
+    with `numpy.fft.hfft` and the central part of the spectrum is
+    returned.
+
+    Parameters
+    ----------
+
+    at : numpy.ndarray
+        Response on the time axis. The last axis has to be the time axis,
+        leading axes are treated as independent responses.
+
+    timeaxis : TimeAxis
+        Time axis of the response
+
+    """
+    ft = numpy.fft.hfft(at, axis=-1)*timeaxis.step
+    ft = numpy.fft.fftshift(ft, axes=-1)
+    # invert the order because hfft is a transform with -i
+    ft = numpy.flip(ft, axis=-1)
+    # cut the center of the spectrum
+    Nt = timeaxis.length
+    return ft[..., Nt//2:Nt+Nt//2]
+
+
+def lineshape_functions(timeaxis, cofts):
+    """Converts correlation functions to lineshape functions
+
+    Explicit numerical double integration of the correlation functions
+    by spline antiderivatives, the same as in the `_c2g` methods of 
+    the linear spectra calculators. Because the integration is linear,
+    lineshape functions of excitons can be obtained as linear combinations
+    of the lineshape functions returned here.
+
+    Parameters
+    ----------
+
+    timeaxis : TimeAxis
+        TimeAxis of the correlation functions
+
+    cofts : numpy.ndarray
+        Correlation functions of the shape (Nfunctions, Nt)
+
+    """
+    tt = timeaxis.data
+    gofts = numpy.zeros((cofts.shape[0], tt.shape[0]), 
+                        dtype=numpy.complex128)
+    for kf in range(cofts.shape[0]):
+        if not numpy.any(cofts[kf,:]):
+            continue
+        rr = numpy.real(cofts[kf,:])
+        ri = numpy.imag(cofts[kf,:])
+        sr = scipy.interpolate.UnivariateSpline(tt,
+                            rr,s=0).antiderivative()(tt)
+        sr = scipy.interpolate.UnivariateSpline(tt,
+                            sr,s=0).antiderivative()(tt)
+        si = scipy.interpolate.UnivariateSpline(tt,
+                            ri,s=0).antiderivative()(tt)
+        si = scipy.interpolate.UnivariateSpline(tt,
+                            si,s=0).antiderivative()(tt)
+        gofts[kf,:] = sr + 1j*si
+        
+    return gofts
+
+
+def aggregate_transitions(timeaxis, system, HH, rwa, relaxation_tensor=None,
+                          rate_matrix=None):
+    """Collects the properties of all excitonic transitions of an aggregate
+
+    The Hamiltonian is diagonalized once and the transition frequencies,
+    transition dipole moments, lineshape function weights and relaxation
+    broadening of all transitions from the ground state are returned as
+    arrays. All objects are returned to their original basis.
+
+    Parameters
+    ----------
+
+    timeaxis : TimeAxis
+        Time axis of the calculation
+
+    system : Aggregate
+        Aggregate of two-level molecules with system-bath interaction
+
+    HH : Hamiltonian
+        Hamiltonian (possibly an effective relaxation Hamiltonian)
+
+    rwa : float
+        Rotating wave approximation frequency in internal units
+
+    relaxation_tensor : RelaxationTensor
+        Relaxation tensor from which the broadening is taken
+
+    rate_matrix : RateMatrix
+        Rate matrix (in excitonic basis) from which the broadening is taken
+
+
+    Returns
+    -------
+
+    Dictionary with the keys
+
+    "om" : transition frequencies minus rwa (Ntr)
+    "dd_vec" : transition dipole vectors (Ntr, 3)
+    "dd" : dipole strengths (Ntr)
+    "SS" : eigenvectors of the Hamiltonian (in columns)
+    "gw" : weights of the lineshape functions (Ntr, Nf)
+    "gt" : site lineshape functions (Nf, Nt)
+    "gg" : broadening rates (Ntr) or (Ntr, Nt), or None
+
+    """
+    Nt = timeaxis.length
+    Na = system.nmono
+
+    SS = HH.diagonalize() # transformed into eigenbasis
+
+    # Transition dipole moment operator
+    DD = system.get_TransitionDipoleMoment()
+    # transformed into the basis of Hamiltonian eigenstates
+    DD.transform(SS)
+
+    tr = dict(SS=SS)
+
+    hd = numpy.real(numpy.diag(HH.data))
+    tr["om"] = hd[1:] - hd[0] - rwa
+    # copies are needed, because the operators are transformed back below
+    tr["dd_vec"] = numpy.array(numpy.real(DD.data[0,1:,:]))
+    tr["dd"] = numpy.sum(numpy.abs(DD.data[0,1:,:])**2, axis=1)
+
+    RR = None
+    gg = None
+    if relaxation_tensor is not None:
+        RR = relaxation_tensor
+        RR.transform(SS)
+        if RR.secular_compact:
+            # compact secular tensors are kept in the basis of their
+            # secularization (assumed to be the excitonic one)
+            gg = numpy.diagonal(RR.secular_KK, axis1=-2, axis2=-1).T
+        elif isinstance(RR, TimeDependent):
+            gg = numpy.einsum("tiiii->it", RR.data)
+        else:
+            gg = numpy.einsum("iiii->i", RR.data)
+    elif rate_matrix is not None:
+        # rate matrix is in excitonic basis
+        if isinstance(rate_matrix, TimeDependent):
+            gg = numpy.einsum("tii->it", rate_matrix.data)
+        else:
+            gg = numpy.diag(rate_matrix.data)
+
+    if gg is not None:
+        gg = numpy.array(numpy.real(gg[1:,...]))
+        # relaxation with a cut-off time is constant after the cut-off
+        if (gg.ndim == 2) and (gg.shape[1] < Nt):
+            gg = numpy.pad(gg, ((0, 0), (0, Nt-gg.shape[1])), mode="edge")
+    tr["gg"] = gg
+    
+    # lineshape functions
+    # FIXME: works only for 2 level molecules
+    cfm = system.get_SystemBathInteraction().CC
+    tr["gw"] = excitonic_lineshape_weights(SS[1:Na+1,1:], 
+                                           cfm.cpointer[0:Na,0:Na],
+                                           Nf=cfm.nof+1)
+    tr["gt"] = lineshape_functions(timeaxis, cfm._cofts[:,0:Nt])
+
+    # transform all quantities back
+    S1 = unitary_inverse(SS)
+    HH.transform(S1)
+    DD.transform(S1)
+    if RR is not None:
+        RR.transform(S1)
+
+    return tr
+
+
+def transition_responses(timeaxis, omegas, gweights=None, gofts=None,
+                         rates=None, conjugate=False):
+    """Linear responses of individual transitions
+
+    Calculates
+
+    a_n(t) = exp(-g_n(t) - i om_n t + gamma_n t)
+
+    for all transitions at once.
+
+    Parameters
+    ----------
+
+    timeaxis : TimeAxis
+        Time axis of the response
+
+    omegas : numpy.ndarray
+        Transition frequencies (minus RWA frequency) (Ntr)
+
+    gweights : numpy.ndarray
+        Weights W_nf of the lineshape functions (Ntr, Nfunctions)
+
+    gofts : numpy.ndarray
+        Lineshape functions g_f(t) of the shape (Nfunctions, Nt)
+
+    rates : numpy.ndarray
+        Broadening (negative for decay), either constant (Ntr) 
+        or time dependent (Ntr, Nt)
+
+    conjugate : bool
+        If True, the complex conjugated lineshape functions are used
+
+    Returns
+    -------
+
+    Complex numpy.ndarray of the shape (Ntr, Nt)
+
+    """
+    tt = timeaxis.data
+    Nt = tt.shape[0]
+
+    expo = -1j*numpy.outer(omegas, tt)
+    if (gweights is not None) and (gofts is not None):
+        gfs = numpy.conj(gofts) if conjugate else gofts
+        expo -= numpy.dot(gweights, gfs[:, 0:Nt])
+    if rates is not None:
+        if rates.ndim == 1:
+            expo += numpy.outer(rates, tt)
+        else:
+            expo += rates[:, 0:Nt]*tt[numpy.newaxis,:]
+
+    return numpy.exp(expo)
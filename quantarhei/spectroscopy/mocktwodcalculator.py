@@ -1,18 +1,29 @@
 # -*- coding: utf-8 -*-
 
+from functools import partial
+
 import numpy
 
 from .twodcalculator import TwoDResponseCalculator
 from .twodcontainer import TwoDResponseContainer
 from .pathwayanalyzer import LiouvillePathwayAnalyzer
 from .twod2 import TwoDResponse
+from .twod2 import PathwayBank
 from ..core.units import convert
 from .. import COMPLEX
 from .. import signal_REPH, signal_NONR
 from .lineshapes import gaussian2D
 from .lineshapes import lorentzian2D
+from .lineshapes import cvoigt
+from .lineshapes import lorentzian
+from .lineshapes import lorentzian_im
 from ..core.managers import Manager
 from ..core.managers import energy_units
+from ..utils.timing import profiled
+
+# pathway types and the corresponding signals
+_signal_types = [("R", signal_REPH), ("NR", signal_NONR)]
+
 
 class MockTwoDResponseCalculator(TwoDResponseCalculator):
     """Calculator of the third order non-linear response 
@@ -29,12 +40,14 @@ class MockTwoDResponseCalculator(TwoDResponseCalculator):
         self.widthy = convert(300, "1/cm", "int")
         self.dephx = convert(300, "1/cm", "int")
         self.dephy = convert(300, "1/cm", "int")        
+        self.keep_pathways = False
 
         
     def bootstrap(self,rwa=0.0, pathways=None, verbose=False, 
-                  shape="Gaussian"):
+                  shape="Gaussian", keep_pathways=False):
         
         self.shape = shape
+        self.keep_pathways = keep_pathways
         
         self.verbose = verbose
         self.rwa = Manager().convert_energy_2_internal_u(rwa)
@@ -95,6 +108,15 @@ class MockTwoDResponseCalculator(TwoDResponseCalculator):
         onetwod = TwoDResponse()
         onetwod.set_axis_1(self.oa1)
         onetwod.set_axis_3(self.oa3)
+        
+        if self.keep_pathways:
+            # pathway resolved spectrum stored by pathway parameters
+            pathways = self.pathways if self.pathways is not None else []
+            onetwod.set_pathway_bank(self.get_pathway_bank(pathways,
+                                                           shape=self.shape))
+            onetwod.set_t2(self.t2axis.data[tc])
+            return onetwod
+        
         onetwod.set_resolution("signals")
         
         # First we fill it with zeros
@@ -103,23 +125,19 @@ class MockTwoDResponseCalculator(TwoDResponseCalculator):
         onetwod._add_data(data, dtype=signal_REPH)
         onetwod._add_data(data, dtype=signal_NONR)
 
-        if self.pathways is not None:        
-            for pwy in self.pathways:
-                
-                data = self.calculate_pathway(pwy, shape=self.shape)
-    
-                if pwy.pathway_type == "R":
-                    onetwod._add_data(data, dtype=signal_REPH)
-                elif pwy.pathway_type == "NR":
-                    onetwod._add_data(data, dtype=signal_NONR)
-                else:
-                    raise Exception("Unknown pathway type")
+        if self.pathways is not None:
+            # all pathways of a given type at once
+            sdata = self.calculate_pathways(self.pathways, shape=self.shape)
+            for ptype, dtype in _signal_types:
+                if ptype in sdata:
+                    onetwod._add_data(sdata[ptype], dtype=dtype)
 
         onetwod.set_t2(self.t2axis.data[tc])    
             
         return onetwod
 
 
+    @profiled()
     def calculate(self):
         """Calculate the 2D spectrum for all pathways
         
@@ -130,21 +148,13 @@ class MockTwoDResponseCalculator(TwoDResponseCalculator):
         onetwod.set_axis_3(self.oa3)
         onetwod.set_resolution("signals")
         
-        k = 0
-        for pwy in self.pathways:
-            
-            data = self.calculate_pathway(pwy, shape=self.shape)
-            
-            if pwy.pathway_type == "R":
-                onetwod._add_data(data, dtype=signal_REPH)
-            elif pwy.pathway_type == "NR":
-                onetwod._add_data(data, dtype=signal_NONR)
-            else:
-                raise Exception("Unknown pathway type")
-                
-            k += 1
+        # all pathways of a given type at once
+        sdata = self.calculate_pathways(self.pathways, shape=self.shape)
+        for ptype, dtype in _signal_types:
+            if ptype in sdata:
+                onetwod._add_data(sdata[ptype], dtype=dtype)
         
-        if k == 0:
+        if len(sdata) == 0:
             pwy = None
             data = self.calculate_pathway(pwy, shape=self.shape)
             onetwod._add_data(data, dtype=signal_REPH)
@@ -191,6 +201,7 @@ class MockTwoDResponseCalculator(TwoDResponseCalculator):
         return tcont
 
 
+    @profiled()
     def calculate_one_system(self, t2, sys, eUt, lab, 
                              selection=None, pways=None, dtol=1.0e-12):
         """Returns 2D spectrum at t2 for a system and evolution superoperator
@@ -283,6 +294,213 @@ class MockTwoDResponseCalculator(TwoDResponseCalculator):
         return twod1
         
 
+    def calculate_pathways(self, pathways, shape="Gaussian"):
+        """Calculate the summed shapes of many Liouville pathways
+        
+        The 2D lineshape of every pathway is a product of two 1D profiles.
+        Pathways are grouped by their type (rephasing "R" and non-rephasing
+        "NR"), pathways sharing the same 1D profiles are merged, and the 
+        spectrum of each group is obtained as a single matrix product
+        
+        P1^T W P3
+        
+        where P1 and P3 are the stacks of the distinct 1D profiles and W
+        holds the summed prefactors of the pathways.
+        
+        Returns
+        -------
+        
+        Dictionary with pathway types as keys and the 2D data (of the same
+        layout as those returned by `calculate_pathway`) as values. 
+        Only types present among the pathways are included.
+        
+        """
+        ret = dict()
+        for ptype, (pref, prof1, prof3, i1, i3) in \
+                self._pathway_profiles(pathways, shape).items():
+            
+            ww = numpy.zeros((prof1.shape[0], prof3.shape[0]), dtype=COMPLEX)
+            numpy.add.at(ww, (i1, i3), pref)
+            
+            if shape == "Gaussian":
+                # the layout of data from gaussian2D
+                ret[ptype] = numpy.dot(prof3.T, numpy.dot(ww.T, prof1))
+            else:
+                ret[ptype] = numpy.dot(prof1.T, numpy.dot(ww, prof3))
+                
+        return ret
+    
+    
+    def pathway_profiles(self, pathways, shape="Gaussian"):
+        """Returns 1D profiles of the lineshapes of Liouville pathways
+        
+        This is the pathway resolved counterpart of `calculate_pathways`.
+        
+        Returns
+        -------
+        
+        Dictionary with pathway types ("R", "NR") as keys and the tuples
+        (pref, P1, P3) as values. pref are the prefactors of the pathways,
+        and P1 and P3 are arrays of shapes (Npw, N1) and (Npw, N3) with
+        the profiles along the omega_1 and omega_3 axes, respectively. The
+        data returned by `calculate_pathway` for the k-th pathway of a given
+        type are pref[k]*outer(P3[k], P1[k]) for the Gaussian shape
+        and pref[k]*outer(P1[k], P3[k]) for the Lorentzian shape.
+        
+        """
+        ret = dict()
+        for ptype, (pref, prof1, prof3, i1, i3) in \
+                self._pathway_profiles(pathways, shape).items():
+            ret[ptype] = (pref, prof1[i1,:], prof3[i3,:])
+        return ret
+    
+    
+    def get_pathway_bank(self, pathways, shape="Gaussian"):
+        """Returns the parameters of Liouville pathways as a PathwayBank
+        
+        The PathwayBank holds the prefactors, frequencies and widths of
+        the pathways, and it calculates their 2D lineshapes only when
+        the data are requested from a TwoDResponse (see
+        TwoDResponse.set_pathway_bank). The data are the same as those
+        returned by `calculate_pathway`.
+        
+        """
+        ptypes, pref, cen1, cen3, wid1, wid3 = \
+            self._pathway_parameters(pathways, shape)
+        
+        names = [pathway.pathway_name.replace("*", "s") 
+                 for pathway in pathways]
+        sign = numpy.where(ptypes == "R", -1.0, 1.0)
+        
+        return PathwayBank(partial(self._pathway_kernel, shape=shape), 
+                           names, numpy.arange(len(pathways)), pref,
+                           sign=sign, cen1=cen1, cen3=cen3, 
+                           wid1=wid1, wid3=wid3)
+    
+    
+    def _pathway_kernel(self, xaxis, yaxis, sign=None, cen1=None, cen3=None,
+                        wid1=None, wid3=None, shape="Gaussian"):
+        """1D profiles of the pathways on given axes
+        
+        """
+        oo1 = sign[:,numpy.newaxis]*xaxis.data[numpy.newaxis,:]
+        oo3 = yaxis.data[numpy.newaxis,:]
+        prof1 = self._profiles(oo1, cen1[:,numpy.newaxis], 
+                               wid1[:,numpy.newaxis], shape)
+        prof3 = self._profiles(oo3, cen3[:,numpy.newaxis],
+                               wid3[:,numpy.newaxis], shape)
+        
+        if shape == "Gaussian":
+            # the layout of data from gaussian2D
+            return (prof3, prof1)
+        return (prof1, prof3)
+    
+    
+    def _pathway_profiles(self, pathways, shape):
+        """Distinct 1D profiles of pathways grouped by their types
+        
+        Returns dictionary of tuples (pref, P1, P3, i1, i3), where P1 and P3
+        are the distinct profiles and i1 and i3 are the indices of 
+        the profiles of individual pathways.
+        
+        """
+        ptypes, pref, cen1, cen3, wid1, wid3 = \
+            self._pathway_parameters(pathways, shape)
+        
+        ret = dict()
+        for ptype in ["R", "NR"]:
+            sel = (ptypes == ptype)
+            if not numpy.any(sel):
+                continue
+            
+            if ptype == "R":
+                oo1 = -self.oa1.data[:]
+            else:
+                oo1 = self.oa1.data[:]
+            oo3 = self.oa3.data[:]
+            
+            prof1, i1 = self._unique_profiles(oo1, cen1[sel], wid1[sel], 
+                                              shape)
+            prof3, i3 = self._unique_profiles(oo3, cen3[sel], wid3[sel],
+                                              shape)
+            ret[ptype] = (pref[sel], prof1, prof3, i1, i3)
+            
+        return ret
+    
+    
+    def _pathway_parameters(self, pathways, shape):
+        """Types, prefactors, frequencies and widths of the pathways
+        
+        """
+        if shape not in ["Gaussian", "Lorentzian"]:
+            raise Exception("Unknown line shape: "+shape)
+            
+        Npw = len(pathways)
+        ptypes = []
+        cen1 = numpy.zeros(Npw, dtype=numpy.float64)
+        cen3 = numpy.zeros(Npw, dtype=numpy.float64)
+        wid1 = numpy.zeros(Npw, dtype=numpy.float64)
+        wid3 = numpy.zeros(Npw, dtype=numpy.float64)
+        pref = numpy.zeros(Npw, dtype=COMPLEX)
+        
+        for kk, pathway in enumerate(pathways):
+            
+            if pathway.pathway_type not in ["R", "NR"]:
+                raise Exception("Unknown pathway type")
+            ptypes.append(pathway.pathway_type)
+            
+            noe = 1+pathway.order+pathway.relax_order 
+            cen1[kk] = pathway.frequency[0]
+            cen3[kk] = pathway.frequency[noe-2]
+            pref[kk] = pathway.pref
+            
+            # the same choice of widths as in calculate_pathway
+            if shape == "Gaussian":
+                if pathway.widths[1] < 0.0:
+                    wid1[kk] = self.widthx
+                else:
+                    wid1[kk] = pathway.widths[1]
+                if pathway.widths[3] < 0.0:
+                    wid3[kk] = self.widthy
+                else:
+                    wid3[kk] = pathway.widths[3]
+            else:
+                if pathway.dephs[1] < 0.0:
+                    wid1[kk] = self.dephx
+                else:
+                    wid1[kk] = pathway.dephs[1]
+                if pathway.widths[3] < 0.0:
+                    wid3[kk] = self.dephy
+                else:
+                    wid3[kk] = pathway.dephs[3]
+                    
+        ptypes = numpy.array(ptypes)
+        
+        return ptypes, pref, cen1, cen3, wid1, wid3
+    
+    
+    def _unique_profiles(self, omega, cent, width, shape):
+        """Calculates distinct 1D profiles
+        
+        """
+        pars, inv = numpy.unique(numpy.stack([cent, width], axis=1), axis=0,
+                                 return_inverse=True)
+        cc = pars[:,0][:,numpy.newaxis]
+        ww = pars[:,1][:,numpy.newaxis]
+        oo = omega[numpy.newaxis,:]
+        
+        return self._profiles(oo, cc, ww, shape), numpy.reshape(inv, (-1,))
+    
+    
+    def _profiles(self, oo, cc, ww, shape):
+        """1D profiles with centers cc and widths ww (broadcasting)
+        
+        """
+        if shape == "Gaussian":
+            return cvoigt(oo, cc, ww, 0.0).astype(COMPLEX)
+        return lorentzian(oo, cc, ww) + lorentzian_im(oo, cc, ww)
+    
+
     def calculate_pathway(self, pathway, shape="Gaussian"):
         """Calculate the shape of a Liouville pathway
         
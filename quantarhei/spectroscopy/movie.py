@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+    Movie pipeline for containers of spectra
+
+
+    Frames of a movie are rendered independently of each other with
+    the non-interactive Agg backend, either serially or in a pool
+    of worker processes. Rendered frames are passed, in order, as raw RGB
+    data through a pipe to the `ffmpeg` encoder, so that no temporary files
+    are written. Color limits of the frames have to be determined
+    beforehand by the caller, the same for all frames.
+
+
+    Functions
+    ---------
+
+    render_frames
+    write_movie
+
+"""
+import io
+import multiprocessing
+import subprocess
+
+import numpy
+
+
+# plotting function and its options in worker processes
+_worker = dict()
+
+
+def _init_worker(plot_frame, options, figsize, dpi):
+    """Initializes a process rendering frames of the movie
+
+    """
+    import matplotlib
+    matplotlib.use("Agg", force=True)
+    import matplotlib.pyplot as plt
+
+    _worker["plot_frame"] = plot_frame
+    _worker["options"] = options
+    _worker["figure"] = plt.figure(figsize=figsize, dpi=dpi)
+
+
+def _grab(fig):
+    """Returns the RGB data of the rendered figure
+
+    Frames with odd number of pixels are cropped to even size
+    which is required by most video codecs.
+
+    """
+    buff = io.BytesIO()
+    fig.savefig(buff, format="rgba", dpi=fig.dpi)
+    (Nx, Ny) = fig.canvas.get_width_height()
+    rgba = numpy.frombuffer(buff.getvalue(),
+                            dtype=numpy.uint8).reshape(Ny, Nx, 4)
+    Ny = 2*(rgba.shape[0]//2)
+    Nx = 2*(rgba.shape[1]//2)
+    return numpy.ascontiguousarray(rgba[:Ny,:Nx,0:3])
+
+
+def _render_in_worker(frame):
+    """Renders one frame in a worker process
+
+    """
+    fig = _worker["figure"]
+    _worker["plot_frame"](fig, frame, _worker["options"])
+    return _grab(fig)
+
+
+def render_frames(plot_frame, frames, options=None, figsize=None, dpi=100,
+                  nprocs=None):
+    """Generator of rendered frames of a movie
+
+    Parameters
+    ----------
+
+    plot_frame : function
+        Function with the signature plot_frame(fig, frame, options) which
+        plots the frame into the figure `fig`. It has to be a module
+        level function, so that it can be sent to worker processes.
+
+    frames : list
+        Objects (e.g. spectra) to be plotted, one for each frame
+
+    options : dict
+        Options passed to the plotting function. Should include
+        the color limits common to all frames.
+
+    figsize : tuple
+        Size of the figure in inches. Default is matplotlib's default
+
+    dpi : int
+        Resolution of the frames
+
+    nprocs : int
+        Number of worker processes. If None, all available CPUs are used.
+        With nprocs=1, frames are rendered serially in this process.
+
+    Yields
+    ------
+
+    numpy.ndarray of the shape (Ny, Nx, 3) with the RGB data of the frame
+
+    """
+    import matplotlib
+
+    if options is None:
+        options = dict()
+    if figsize is None:
+        figsize = tuple(matplotlib.rcParams["figure.figsize"])
+    if nprocs is None:
+        nprocs = multiprocessing.cpu_count()
+    nprocs = max(1, min(nprocs, len(frames)))
+
+    if nprocs == 1:
+        import matplotlib.pyplot as plt
+
+        current = plt.gcf() if plt.get_fignums() else None
+        fig = plt.figure(figsize=figsize, dpi=dpi)
+        try:
+            for frame in frames:
+                plot_frame(fig, frame, options)
+                yield _grab(fig)
+        finally:
+            plt.close(fig)
+            if current is not None:
+                plt.figure(current.number)
+        return
+
+    with multiprocessing.Pool(nprocs, initializer=_init_worker,
+                              initargs=(plot_frame, options,
+                                        figsize, dpi)) as pool:
+        for rgb in pool.imap(_render_in_worker, frames):
+            yield rgb
+
+
+def write_movie(filename, frames, frate=20, metadata=None, codec="h264",
+                bitrate=None, progress=None):
+    """Writes rendered frames to a movie file using `ffmpeg`
+
+    Frames are written into the standard input of the encoder as soon
+    as they are available.
+
+    Parameters
+    ----------
+
+    filename : str
+        Name of the movie file
+
+    frames : iterable
+        Iterable of RGB frames (numpy.ndarray of uint8 of the shape
+        (Ny, Nx, 3)), e.g. the generator returned by `render_frames`
+
+    frate : int
+        Frame rate
+
+    metadata : dict
+        Metadata of the movie (title, artist, comment etc.)
+
+    codec : str
+        Video codec
+
+    bitrate : int
+        Bitrate in kbps; default is the ffmpeg's default
+
+    progress : function
+        If specified, it is called with the number of written frames after
+        each frame
+
+    """
+    import matplotlib
+
+    proc = None
+    k = 0
+    try:
+        for rgb in frames:
+            if proc is None:
+                cmd = [matplotlib.rcParams["animation.ffmpeg_path"], "-y",
+                       "-loglevel", "error",
+                       "-f", "rawvideo", "-vcodec", "rawvideo",
+                       "-s", "{}x{}".format(rgb.shape[1], rgb.shape[0]),
+                       "-pix_fmt", "rgb24", "-r", str(frate), "-i", "-",
+                       "-vcodec", codec, "-pix_fmt", "yuv420p"]
+                if bitrate is not None:
+                    cmd += ["-b", "{}k".format(bitrate)]
+                if metadata is not None:
+                    for key, val in metadata.items():
+                        cmd += ["-metadata", "{}={}".format(key, val)]
+                cmd.append(filename)
+                proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+            proc.stdin.write(rgb.tobytes())
+            k += 1
+            if progress is not None:
+                progress(k)
+    finally:
+        if proc is not None:
+            proc.stdin.close()
+            err = proc.stderr.read()
+            proc.stderr.close()
+            if proc.wait() != 0:
+                raise Exception("Movie encoding failed: "
+                                +err.decode(errors="replace"))
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+from functools import partial
+
 import numpy
 
 from .twod import TwoDSpectrum
@@ -7,6 +9,7 @@ from .twodcontainer import TwoDResponseContainer
 from .twodcalculator import TwoDResponseCalculator
 from .mocktwodcalculator import MockTwoDResponseCalculator
 from ..core.dfunction import DFunction
+from .movie import render_frames, write_movie
 
 import matplotlib.pyplot as plt
 
@@ -97,18 +100,14 @@ class PumpProbeSpectrumContainer(TwoDResponseContainer):
     def make_movie(self, filename, axis=None,
                    cmap=None, vmax=None, vmin=None,
                    frate=20, dpi=100, start=None, end=None,
-                   show_states=None, progressbar=False):
-        
-        import matplotlib.pyplot as plt
-        import matplotlib.animation as manimation
+                   show_states=None, progressbar=False, nprocs=None):
+        """Creates a movie out of the pump-probe spectra in the container
         
-        FFMpegWriter = manimation.writers["ffmpeg"]
-
-        metadata = dict(title="Test Movie", artist='Matplotlib',
-                comment='Movie support!')
-        writer = FFMpegWriter(fps=frate, metadata=metadata)
+        Frames are rendered by `nprocs` processes (all available CPUs
+        by default) and passed to the `ffmpeg` encoder through a pipe.
+        The range of values is the same for all frames.
         
-        fig = plt.figure() 
+        """
         
         spctr = self.get_spectra()
         l = len(spctr)
@@ -134,26 +133,32 @@ class PumpProbeSpectrumContainer(TwoDResponseContainer):
         if end is None:
             end = last_t2
         
-                
-        with writer.saving(fig, filename, dpi):  
-            k = 0
-            # Initial call to print 0% progress
-            sp2write = self.get_spectra(start=start, end=end)
-            l = len(sp2write)
-            if progressbar:
-                self._printProgressBar(0, l, prefix = 'Progress:',
-                                       suffix = 'Complete', length = 50)
-            for sp in self.get_spectra(start=start, end=end):
-                # FIXME: this does not work as it should yet
-                sp.plot(show=False, fig=fig, axis=axis,
-                        label="T="+str(sp.get_t2())+"fs") #, vmax=mx, vmin=mn,
-                          #)
-                writer.grab_frame()
-                if progressbar:
-                    self._printProgressBar(k + 1, l, prefix = 'Progress:',
-                                           suffix = 'Complete', length = 50)
-                
-                k += 1
+        sp2write = self.get_spectra(start=start, end=end)
+        l = len(sp2write)
+        
+        progress = None
+        if progressbar:
+            self._printProgressBar(0, l, prefix = 'Progress:',
+                                   suffix = 'Complete', length = 50)
+            progress = partial(self._printProgressBar, total=l,
+                               prefix = 'Progress:', suffix = 'Complete',
+                               length = 50)
+
+        options = dict(axis=axis, vmax=mx, vmin=mn)
+        metadata = dict(title="Test Movie", artist='Matplotlib',
+                        comment='Movie support!')
+        write_movie(filename, render_frames(_plot_pp_frame, sp2write,
+                                            options=options, dpi=dpi,
+                                            nprocs=nprocs),
+                    frate=frate, metadata=metadata, progress=progress)
+
+
+def _plot_pp_frame(fig, sp, options):
+    """Plots one frame of a pump-probe spectrum movie
+    
+    """
+    sp.plot(show=False, fig=fig, label="T="+str(sp.get_t2())+"fs",
+            **options)
 
 
 class PumpProbeSpectrumCalculator(TwoDResponseCalculator):
@@ -320,6 +320,165 @@ def _types_to_total(obj):
     return data
 
 
+class PathwayBank:
+    """Pathway resolved 2D data stored as parameters of Liouville pathways
+    
+    Instead of keeping a full 2D array for every Liouville pathway, only 
+    the parameters of the pathways (prefactors, frequencies, widths etc.)
+    are stored together with a lineshape kernel. Data are materialized
+    only when requested, and only for the requested level of aggregation
+    (single pathway, pathway type, process, signal or total spectrum).
+    
+    The 2D data of a set of pathways K are calculated as
+    
+    data = sum_{k in K} pref_k outer(A_k, B_k)
+    
+    where the profiles A and B are returned by the kernel. The sums over
+    pathways are performed in chunks as matrix products.
+    
+    Parameters
+    ----------
+    
+    kernel : callable
+        Function kernel(xaxis, yaxis, **params) which returns a tuple
+        (A, B) of arrays of the shapes (Npw, xaxis.length) and 
+        (Npw, yaxis.length) for Npw pathways specified by the parameters
+        
+    ptypes : list of strings
+        Types of the pathways ("R1g", "R2g", etc.)
+        
+    tags : list
+        Tags of the pathways, unique within a pathway type
+        
+    prefactors : array
+        Prefactors of the pathways
+        
+    chunk_size : int
+        Maximum number of pathways materialized at once
+        
+    params : arrays
+        Further parameters of the pathways passed to the kernel
+    
+    """
+    
+    def __init__(self, kernel, ptypes, tags, prefactors, chunk_size=1000,
+                 **params):
+        
+        for ptype in ptypes:
+            if ptype not in _ptypes:
+                raise Exception("Unknown type of Liouville pathway: "+ptype)
+                
+        self.kernel = kernel
+        self.type_index = numpy.array([_ptypes.index(ptype) 
+                                       for ptype in ptypes], dtype=int)
+        self.tags = list(tags)
+        self.prefactors = numpy.asarray(prefactors, dtype=COMPLEX)
+        self.params = {key: numpy.asarray(val) for (key, val) 
+                       in params.items()}
+        self.chunk_size = chunk_size
+        
+        Npw = self.type_index.shape[0]
+        if (len(self.tags) != Npw) or (self.prefactors.shape[0] != Npw):
+            raise Exception("Inconsistent number of pathway parameters")
+        for key in self.params:
+            if self.params[key].shape[0] != Npw:
+                raise Exception("Inconsistent number of pathway parameters")
+        
+        self._tag_index = {}
+        for kk in range(Npw):
+            key = (self.type_index[kk], self.tags[kk])
+            if key in self._tag_index:
+                raise Exception("Tag "+str(self.tags[kk])+" already exists")
+            self._tag_index[key] = kk
+        
+    
+    @property
+    def number_of_pathways(self):
+        return self.type_index.shape[0]
+    
+    
+    def get_tags(self):
+        """Returns the [type, tag] pairs of all pathways
+        
+        """
+        tags = []
+        for kt, typ in enumerate(_ptypes):
+            for kk in numpy.nonzero(self.type_index == kt)[0]:
+                tags.append([typ, self.tags[kk]])
+        return tags
+    
+    
+    def select(self, dtype, tag=None):
+        """Returns indices of the pathways belonging to a given data type
+        
+        Parameters
+        ----------
+        
+        dtype : string
+            Pathway type, process, signal or total
+            
+        tag : 
+            Tag of a pathway (only with dtype being a pathway type)
+            
+        """
+        if dtype in _ptypes:
+            if tag is not None:
+                try:
+                    return numpy.array([self._tag_index[
+                                            (_ptypes.index(dtype), tag)]])
+                except KeyError:
+                    raise Exception("Unknown pathway: "+dtype+" "+str(tag))
+            types = [dtype]
+        elif dtype in _processes:
+            types = _processes[dtype]
+        elif dtype in _signals:
+            types = _signals[dtype]
+        elif dtype == _total:
+            types = _ptypes
+        else:
+            raise Exception("Unknown data type: "+str(dtype))
+            
+        tindx = [_ptypes.index(typ) for typ in types]
+        return numpy.nonzero(numpy.isin(self.type_index, tindx))[0]
+    
+    
+    def scaled(self, factor):
+        """Returns a copy of the bank with prefactors multiplied by a factor
+        
+        The kernel and the parameters of the pathways are shared with 
+        the original bank, which remains unchanged.
+        
+        """
+        import copy
+        bank = copy.copy(self)
+        bank.prefactors = self.prefactors*factor
+        return bank
+    
+    
+    def get_data(self, xaxis, yaxis, dtype, tag=None):
+        """Materializes the data of a given type on the submitted axes
+        
+        """
+        return self.materialize(xaxis, yaxis, self.select(dtype, tag))
+    
+    
+    def materialize(self, xaxis, yaxis, indices):
+        """Sums the 2D data of the pathways with given indices
+        
+        """
+        data = None
+        for i0 in range(0, len(indices), self.chunk_size):
+            idx = indices[i0:i0+self.chunk_size]
+            pars = {key: val[idx] for (key, val) in self.params.items()}
+            AA, BB = self.kernel(xaxis, yaxis, **pars)
+            if data is None:
+                data = numpy.zeros((AA.shape[1], BB.shape[1]), dtype=COMPLEX)
+            data += numpy.dot(AA.T*self.prefactors[idx], BB)
+        if data is None:
+            data = numpy.zeros((xaxis.length, yaxis.length), dtype=COMPLEX)
+        return data
+    
+
 def twodspectrum_dictionary(name, dtype):
     """Defines operations of setting and retrieving (getting) data 
     
@@ -339,6 +498,14 @@ def twodspectrum_dictionary(name, dtype):
         # with pathway resolution => type and tag has to be specified
         #
         if self.storage_resolution == "pathways":
+            
+            #
+            # pathways stored by their parameters
+            #
+            if self._pathway_bank is not None:
+                return self._pathway_bank.get_data(self.xaxis, self.yaxis,
+                                                   self.current_dtype,
+                                                   self.current_tag)
              
             if self.current_dtype in _ptypes:
 
@@ -525,6 +692,10 @@ def twodspectrum_dictionary(name, dtype):
             #
             if self.storage_resolution == "pathways":
 
+                if self._pathway_bank is not None:
+                    raise Exception("Pathways are stored by their"+
+                                    " parameters; data cannot be set")
+                    
                 if self.current_dtype not in _ptypes:
                     # check the current_type attribute
                     raise Exception("Wrong pathways type")
@@ -662,6 +833,9 @@ class TwoDSpectrumBase(DataSaveable):
 
     _allow_data_writing = False
     
+    # pathways stored by their parameters (see PathwayBank)
+    _pathway_bank = None
+    
     def __init__(self):
         super().__init__()
         
@@ -844,6 +1018,9 @@ class TwoDSpectrumBase(DataSaveable):
         if self.storage_resolution != "pathways":
             return []
         
+        if self._pathway_bank is not None:
+            return self._pathway_bank.get_tags()
+        
         tags = []
         for typ in _ptypes:
             try:
@@ -857,6 +1034,32 @@ class TwoDSpectrumBase(DataSaveable):
         return tags
 
 
+    def set_pathway_bank(self, bank):
+        """Stores pathway resolved data by the parameters of the pathways
+        
+        The data of individual pathways, pathway types, processes and 
+        signals are calculated on demand from the PathwayBank object 
+        (see PathwayBank). Axes of the spectrum have to be set.
+        
+        Parameters
+        ----------
+        
+        bank : PathwayBank
+            Parameters of the Liouville pathways and the lineshape kernel
+            
+        """
+        if self.storage_initialized:
+            raise Exception("Pathway bank can be set only"+
+                            " to an empty spectrum")
+        if (self.xaxis is None) or (self.yaxis is None):
+            raise Exception("Axes of the spectrum have to be set")
+            
+        self.storage_resolution = "pathways"
+        self._d__data = {}
+        self.storage_initialized = True
+        self._pathway_bank = bank
+        
+        
     # FIXME: maybe set_storage_resolution ?
     def set_resolution(self, resolution):
         """Sets the storage resolution attribute of TwoDSpectrum
@@ -957,6 +1160,21 @@ class TwoDSpectrumBase(DataSaveable):
         
         """
         
+        # data of the requested level are calculated directly from 
+        # the parameters of the pathways
+        if (old == 4) and (self._pathway_bank is not None):
+            levels = {3:_ptypes, 2:list(_processes.keys()),
+                      1:list(_signals.keys()), 0:[_total]}
+            storage = {}
+            for dtype in levels[new]:
+                storage[dtype] = self._pathway_bank.get_data(self.xaxis,
+                                                             self.yaxis,
+                                                             dtype)
+            self._d__data = storage
+            self._pathway_bank = None
+            self.storage_resolution = _resolutions[new]
+            return
+        
         _conversion_paths = {4:{3:[4,3], 2:[4,3,2], 1:[4,3,1], 0:[4,3,2,0]}, 
                  3:{2:[3,2], 1:[3,1], 0:[3,2,0]},
                  2:{0:[2,0]},
@@ -1116,6 +1334,9 @@ class TwoDSpectrumBase(DataSaveable):
                                 +resolution)
 
         if resolution == "pathways":
+            if self._pathway_bank is not None:
+                raise Exception("Pathways are stored by their parameters;"+
+                                " data cannot be added")
             if dtype in _ptypes:
                 if tag is not None:
                     self.set_data_flag([dtype, tag])
@@ -1262,7 +1483,15 @@ class TwoDSpectrumBase(DataSaveable):
         
         """
         data_dict = {}
-        if self.storage_resolution == "pathways":
+        if (self.storage_resolution == "pathways") and \
+           (self._pathway_bank is not None):
+            for typ, tag in self._pathway_bank.get_tags():
+                key = typ+"_"+str(tag)
+                data_dict[key] = self._pathway_bank.get_data(self.xaxis,
+                                                             self.yaxis,
+                                                             typ, tag)
+            
+        elif self.storage_resolution == "pathways":
             for typ in _ptypes:
                 try:
                     piece = self._d__data[typ]
@@ -1580,6 +1809,10 @@ class TwoDResponse(TwoDSpectrumBase, Saveable):
         if legacy:
             self.reph2D = self.reph2D/val
             self.nonr2D = self.nonr2D/val
+        elif self._pathway_bank is not None:
+            # materialized data are temporary; the bank might be shared
+            # with other spectra, so it is replaced by a scaled copy
+            self._pathway_bank = self._pathway_bank.scaled(1.0/val)
         else:
             data_dict = self.get_all_data()
             for data_key in data_dict:
@@ -1968,7 +2201,12 @@ class TwoDResponse(TwoDSpectrumBase, Saveable):
                 
             dtype_saved = self.current_dtype
             
-            if self.storage_resolution == "pathways":
+            if (self.storage_resolution == "pathways") and \
+               (self._pathway_bank is not None):
+                # pathway data are calculated on the new axes
+                pass
+                
+            elif self.storage_resolution == "pathways":
                 for typ in _ptypes:
                     piece_ex = True
                     try:
@@ -12,6 +12,7 @@ from ..core.managers import eigenbasis_of
 from ..qm.propagators.poppropagator import PopulationPropagator
 from .twod2 import TwoDResponse
 from .. import signal_REPH, signal_NONR
+from ..utils.timing import profiled
 
 import quantarhei as qr
 
@@ -472,6 +473,7 @@ class TwoDResponseCalculator:
 
         return onetwod
 
+    @profiled()
     def calculate(self):
         """Returns 2D spectrum
 
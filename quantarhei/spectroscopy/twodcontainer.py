@@ -8,6 +8,7 @@
 
 """
 import numbers
+from functools import partial
 
 #import h5py
 #import matplotlib.pyplot as plt  
@@ -19,6 +20,7 @@ from ..core.frequency import FrequencyAxis
 from ..core.dfunction import DFunction
 #from .twod2 import TwoDResponse
 from .twod import TwoDSpectrum
+from .movie import render_frames, write_movie
 
 from ..core.managers import Manager, energy_units
 
@@ -728,7 +730,8 @@ class TwoDResponseContainer(Saveable):
                    progressbar=False, 
                    use_t2=True, 
                    title="Quantarhei movie",
-                   comment="Created with Quantarhei"):
+                   comment="Created with Quantarhei",
+                   nprocs=None):
         """Creates a movie out of the spectra in the container
         
         
@@ -738,22 +741,18 @@ class TwoDResponseContainer(Saveable):
         Npos_contours : int
             Nomber of positive value contours in the plot
             
-        
+        nprocs : int
+            Number of processes rendering the frames. By default, all 
+            available CPUs are used. With nprocs=1 the frames are rendered
+            serially.
+            
+        Frames are rendered with the Agg backend and passed to the `ffmpeg`
+        encoder through a pipe. The color range is determined once for
+        all frames. Functions `label_func` and `show_states_func` are
+        evaluated in the calling process.
         
         """
         
-        
-        import matplotlib.pyplot as plt
-        import matplotlib.animation as manimation
-        
-        FFMpegWriter = manimation.writers["ffmpeg"]
-
-        metadata = dict(title=title, artist='Quantarhei',
-                comment=comment)
-        writer = FFMpegWriter(fps=frate, metadata=metadata)
-        
-        fig = plt.figure() 
-        
         spctr = self.get_spectra()
         l = len(spctr)
         
@@ -776,41 +775,52 @@ class TwoDResponseContainer(Saveable):
         else:
             mx = vmax        
                 
-        with writer.saving(fig, filename, dpi):  
-            k = 0
-            # Initial call to print 0% progress
-            if use_t2:
-                sp2write = self.get_spectra(start=start, end=end)
-            else:
-                sp2write = self.get_spectra()
-            l = len(sp2write)
-            
-            if progressbar:
-                self._printProgressBar(0, l, prefix = 'Progress:',
-                                       suffix = 'Complete', length = 50)
-                                
-            for sp in sp2write: #self.get_spectra(start=start, end=end):
-                
-                if label_func is not None:
-                    (label, text_loc) = label_func(sp)
-                if show_states_func is not None:
-                    show_states = show_states_func(sp)
-
-                sp.plot(fig=fig, window=window, cmap=cmap, vmax=mx, 
-                        Npos_contours=Npos_contours,
-                        stype=stype,spart=spart,
-                        show_states=show_states,
-                        xlabel=xlabel, ylabel=ylabel,
-                        axis_label_font=axis_label_font,
-                        label=label, text_loc=text_loc) #"T="+str(sp.get_t2())+"fs")
-                writer.grab_frame()
-                if progressbar:
-                    self._printProgressBar(k + 1, l, prefix = 'Progress:',
-                                           suffix = 'Complete', length = 50)
-                
-                k += 1
-#                if k == 20:
-#                    return
+        if use_t2:
+            sp2write = self.get_spectra(start=start, end=end)
+        else:
+            sp2write = self.get_spectra()
+        l = len(sp2write)
+
+        frames = []
+        for sp in sp2write:
+            if label_func is not None:
+                (label, text_loc) = label_func(sp)
+            if show_states_func is not None:
+                show_states = show_states_func(sp)
+            frames.append((sp, label, text_loc, show_states))
+
+        options = dict(window=window, cmap=cmap, vmax=mx, 
+                       Npos_contours=Npos_contours,
+                       stype=stype, spart=spart,
+                       xlabel=xlabel, ylabel=ylabel,
+                       axis_label_font=axis_label_font)
+        
+        progress = None
+        if progressbar:
+            self._printProgressBar(0, l, prefix = 'Progress:',
+                                   suffix = 'Complete', length = 50)
+            progress = partial(self._printProgressBar, total=l,
+                               prefix = 'Progress:', suffix = 'Complete',
+                               length = 50)
+            
+        metadata = dict(title=title, artist='Quantarhei',
+                        comment=comment)
+        write_movie(filename, render_frames(_plot_twod_frame, frames,
+                                            options=options, dpi=dpi,
+                                            nprocs=nprocs),
+                    frate=frate, metadata=metadata, progress=progress)
+
+
+def _plot_twod_frame(fig, frame, options):
+    """Plots one frame of a 2D spectrum movie 
+    
+    """
+    (sp, label, text_loc, show_states) = frame
+    if text_loc is None:
+        sp.plot(fig=fig, label=label, show_states=show_states, **options)
+    else:
+        sp.plot(fig=fig, label=label, text_loc=text_loc, 
+                show_states=show_states, **options)
 
 
 def _exp_2D_data0(params, times=None, cont=None):
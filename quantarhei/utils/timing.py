@@ -1,11 +1,29 @@
 # -*- coding: utf-8 -*-
 """Timing routines
 
+    Simple timing of script sections is provided by the `timeit` and
+    `finished_in` (or `done_in`) functions. Hierarchical profiling of named
+    regions of the code is provided by the `Profiler` class; its package-wide
+    instance `profiler` is switched on by
+
+    >>> import quantarhei as qr
+    >>> qr.profiler.enable()
+
+    Afterwards, all instrumented regions (including those marked by
+    the `profiled` decorator and the `Profiler.region` context manager)
+    are profiled until the profiler is switched off
+
+    >>> qr.profiler.disable()
+    >>> qr.profiler.reset()
 
 
 """
 import time
 import datetime
+import functools
+import json
+import threading
+import tracemalloc
 
 # Quantarhei imports 
 from .logging import printlog
@@ -62,3 +80,362 @@ def done_in(show_stamp=False,loglevel=5, verbose=True):
                  verbose=verbose)
     else:
         printlog("... done in",tm,"sec", loglevel=loglevel, verbose=verbose)
+
+
+#
+# Hierarchical profiler
+#
+
+
+class _Region:
+    """Accumulated statistics of a named region of the code
+
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.alloc = 0
+        self.children = dict()
+
+
+    def child(self, name):
+        try:
+            return self.children[name]
+        except KeyError:
+            reg = _Region(name)
+            self.children[name] = reg
+            return reg
+
+
+    def to_dict(self):
+        return dict(name=self.name, calls=self.calls, wall=self.wall,
+                    cpu=self.cpu, alloc=self.alloc,
+                    children=[ch.to_dict() for ch in self.children.values()])
+
+
+class _NullRegion:
+    """Context manager which does nothing (used when profiling is off)
+
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, ext_ty, exc_val, tb):
+        return False
+
+
+_null_region = _NullRegion()
+
+
+class _ActiveRegion:
+    """Context manager of a region entered while profiling is on
+
+    """
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.enter(self.name)
+        return self
+
+    def __exit__(self, ext_ty, exc_val, tb):
+        self.profiler.exit(self.name)
+        return False
+
+
+class Profiler:
+    """Hierarchical profiler of named regions of the code
+
+    Regions are entered and exited in a nested manner, and the profiler
+    accumulates the number of calls, wall time, CPU time and the net
+    change of allocated memory of every region within its parent region.
+    Completed region calls are also recorded as events which can be
+    exported in the Chrome trace format (viewable in chrome://tracing
+    or Perfetto).
+
+    Profiling is switched off by default. When it is off, entering
+    a region costs only a check of the `enabled` attribute. Only the
+    thread which switched the profiler on is profiled.
+
+    The package-wide profiler is available as `quantarhei.profiler`.
+    Main hot paths of Quantarhei (building of aggregates, relaxation
+    tensors, propagations, spectroscopic calculators and parallel
+    regions) are already instrumented.
+
+
+    Examples
+    --------
+
+    >>> prof = Profiler()
+    >>> prof.enable()
+    >>> with prof.region("outer"):
+    ...     for i in range(3):
+    ...         with prof.region("inner"):
+    ...             pass
+    >>> prof.disable()
+    >>> stats = prof.to_dict()
+    >>> outer = stats["children"][0]
+    >>> print(outer["name"], outer["calls"])
+    outer 1
+    >>> inner = outer["children"][0]
+    >>> print(inner["name"], inner["calls"])
+    inner 3
+
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.max_events = 100000
+        self._thread = None
+        self._started_tracemalloc = False
+        self.reset()
+
+
+    def reset(self):
+        """Removes all collected statistics and events
+
+        """
+        self._root = _Region("total")
+        self._stack = [(self._root, 0.0, 0.0, 0)]
+        self._events = []
+        self._t0 = time.perf_counter()
+
+
+    def enable(self, memory=False):
+        """Switches profiling on
+
+        Parameters
+        ----------
+
+        memory : bool
+            If True, net changes of the allocated memory are recorded.
+            This uses the `tracemalloc` module, which slows down
+            the calculation.
+
+        """
+        self._thread = threading.get_ident()
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self.enabled = True
+
+
+    def disable(self):
+        """Switches profiling off
+
+        The collected statistics are kept until `reset` is called.
+
+        """
+        self.enabled = False
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        self.memory = False
+
+
+    def _memory(self):
+        if self.memory:
+            return tracemalloc.get_traced_memory()[0]
+        return 0
+
+
+    def enter(self, name):
+        """Enters a named region
+
+        """
+        if (not self.enabled) or (threading.get_ident() != self._thread):
+            return
+        reg = self._stack[-1][0].child(name)
+        self._stack.append((reg, time.perf_counter(), time.process_time(),
+                            self._memory()))
+
+
+    def exit(self, name=None):
+        """Exits the most recently entered region
+
+        Parameters
+        ----------
+
+        name : str
+            If specified, the region is exited only if it has this name.
+            This protects the statistics when the profiler was switched
+            on between entering and exiting a region.
+
+        """
+        if ((not self.enabled) or (threading.get_ident() != self._thread)
+            or (len(self._stack) == 1)):
+            return
+        if (name is not None) and (self._stack[-1][0].name != name):
+            return
+        (reg, wall0, cpu0, mem0) = self._stack.pop()
+        wall1 = time.perf_counter()
+        reg.calls += 1
+        reg.wall += wall1 - wall0
+        reg.cpu += time.process_time() - cpu0
+        reg.alloc += self._memory() - mem0
+
+        if len(self._events) < self.max_events:
+            self._events.append((reg.name, wall0 - self._t0, wall1 - wall0,
+                                 len(self._stack) - 1))
+
+
+    def region(self, name):
+        """Returns a context manager of a named region
+
+        """
+        if not self.enabled:
+            return _null_region
+        return _ActiveRegion(self, name)
+
+
+    def to_dict(self):
+        """Returns the collected statistics as a tree of dictionaries
+
+        Every region is represented by a dictionary with the keys
+        `name`, `calls`, `wall` and `cpu` (in seconds), `alloc` (in bytes)
+        and `children` (list of subregions).
+
+        """
+        root = self._root.to_dict()
+        root["calls"] = 1
+        root["wall"] = sum(ch["wall"] for ch in root["children"])
+        root["cpu"] = sum(ch["cpu"] for ch in root["children"])
+        root["alloc"] = sum(ch["alloc"] for ch in root["children"])
+        return root
+
+
+    def _gather(self):
+        """Collects statistics and events from all MPI processes
+
+        Returns None on the processes with rank > 0
+
+        """
+        dc = Manager().get_DistributedConfiguration()
+        local = (self.to_dict(), self._events)
+        if dc.size == 1:
+            return [local]
+        return dc.comm.gather(local, root=0)
+
+
+    def save_json(self, filename):
+        """Saves statistics summed over all MPI processes in JSON format
+
+        When running under MPI, the method has to be called by all
+        processes. The file is written by the process with rank 0 only.
+
+        """
+        data = self._gather()
+        if data is None:
+            return
+        tree = data[0][0]
+        for (other, events) in data[1:]:
+            _merge_region_dicts(tree, other)
+        with open(filename, "w") as f:
+            json.dump(dict(processes=len(data), regions=tree), f, indent=1)
+
+
+    def save_chrome_trace(self, filename):
+        """Saves the recorded events in the Chrome trace format
+
+        Events of all MPI processes are saved, every process is represented
+        by its rank. When running under MPI, the method has to be called
+        by all processes. The file is written by the process with rank 0
+        only.
+
+        """
+        data = self._gather()
+        if data is None:
+            return
+        events = []
+        for (rank, (tree, evs)) in enumerate(data):
+            for (name, start, duration, depth) in evs:
+                events.append(dict(name=name, ph="X", pid=rank, tid=0,
+                                   ts=1.0e6*start, dur=1.0e6*duration,
+                                   args=dict(depth=depth)))
+        with open(filename, "w") as f:
+            json.dump(dict(traceEvents=events, displayTimeUnit="ms"), f)
+
+
+    def report(self, loglevel=5, verbose=True):
+        """Prints a table of the collected statistics
+
+        """
+        printlog("{:<48}{:>9}{:>12}{:>12}{:>14}".format("Region", "calls",
+                 "wall [s]", "cpu [s]", "alloc [B]"), loglevel=loglevel,
+                 verbose=verbose)
+
+        def _print(reg, indent):
+            printlog("{:<48}{:>9}{:>12.4f}{:>12.4f}{:>14}".format(
+                     (" "*indent+reg["name"])[:48], reg["calls"], reg["wall"],
+                     reg["cpu"], reg["alloc"]), loglevel=loglevel,
+                     verbose=verbose)
+            for ch in reg["children"]:
+                _print(ch, indent+2)
+
+        for ch in self.to_dict()["children"]:
+            _print(ch, 0)
+
+
+def _merge_region_dicts(tree, other):
+    """Adds statistics of the region tree `other` to `tree`
+
+    """
+    for key in ["calls", "wall", "cpu", "alloc"]:
+        tree[key] += other[key]
+    children = {ch["name"]: ch for ch in tree["children"]}
+    for ch in other["children"]:
+        if ch["name"] in children:
+            _merge_region_dicts(children[ch["name"]], ch)
+        else:
+            tree["children"].append(ch)
+
+
+profiler = Profiler()
+
+
+def profiled(name=None):
+    """Decorator which profiles every call of a function as a named region
+
+    Parameters
+    ----------
+
+    name : str
+        Name of the region. The qualified name of the function is used
+        by default.
+
+
+    Examples
+    --------
+
+    >>> @profiled()
+    ... def work(n):
+    ...     return sum(range(n))
+    >>> work(10)
+    45
+
+    """
+    def decorator(func):
+
+        rname = func.__qualname__ if name is None else name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            profiler.enter(rname)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.exit(rname)
+
+        return wrapper
+
+    return decorator
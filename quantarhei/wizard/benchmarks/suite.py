@@ -0,0 +1,434 @@
+# -*- coding: utf-8 -*-
+"""
+    Quantarhei benchmark suite
+
+
+    Benchmarks of the computationally demanding parts of Quantarhei. Each
+    benchmark prepares its input (which is not timed) and returns a function
+    performing the timed calculation. Problem sizes are scaled by an integer
+    `scale` factor, so that the same benchmark can be run as a quick check
+    or as a realistic production size calculation.
+
+    Results are returned as a dictionary which can be saved as JSON and
+    used later as a baseline for the detection of performance regressions.
+    The suite is run from command line as
+
+    $ qrhei bench
+
+    Functions
+    ---------
+
+    run_benchmarks
+    compare_with_baseline
+    save_results
+    load_results
+
+"""
+import contextlib
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+from collections import OrderedDict
+
+import numpy
+
+import quantarhei as qr
+
+
+_benchmarks = OrderedDict()
+
+
+def benchmark(name, unit):
+    """Registers a benchmark
+
+    The decorated function has to accept the scale factor and return
+    a tuple (run, work), where `run` is a function without arguments
+    performing the timed calculation, and `work` is the amount of work
+    done by it (in units of `unit`) used to calculate throughput.
+
+    """
+    def register(func):
+        _benchmarks[name] = (func, unit, func.__doc__.strip().split("\n")[0])
+        return func
+    return register
+
+
+def available_benchmarks():
+    """Returns a dictionary of benchmark names and their descriptions
+
+    """
+    return OrderedDict((name, bm[2]) for (name, bm) in _benchmarks.items())
+
+
+def _chain_aggregate(Nmol, timeaxis=None, width=None):
+    """Linear chain of two-level molecules with nearest neighbour coupling
+
+    """
+    with qr.energy_units("1/cm"):
+        mols = []
+        for ii in range(Nmol):
+            mol = qr.Molecule([0.0, 12000.0 + 50.0*(ii % 5)])
+            mol.set_dipole(0, 1, [1.0, 0.2*(ii % 3), 0.0])
+            mol.position = [0.0, 0.0, 8.0*ii]
+            if width is not None:
+                mol.set_transition_width((0, 1), width)
+            mols.append(mol)
+
+        if timeaxis is not None:
+            cfce = qr.CorrelationFunction(timeaxis,
+                                          dict(ftype="OverdampedBrownian",
+                                               reorg=30.0, cortime=100.0,
+                                               T=300.0, matsubara=20))
+            for mol in mols:
+                mol.set_transition_environment((0, 1), cfce)
+
+        agg = qr.Aggregate(molecules=mols)
+        for ii in range(Nmol-1):
+            agg.set_resonance_coupling(ii, ii+1, 100.0)
+
+    return agg
+
+
+def _relaxation_system(scale, Ntime=500, step=1.0):
+    """Hamiltonian and system-bath interaction of a chain of molecules
+
+    """
+    time = qr.TimeAxis(0.0, Ntime, step)
+    agg = _chain_aggregate(4*scale, timeaxis=time)
+    agg.build(mult=1)
+    return (time, agg, agg.get_Hamiltonian(),
+            agg.get_SystemBathInteraction())
+
+
+@benchmark("aggregate_build", unit="states")
+def bm_aggregate_build(scale):
+    """Building of an aggregate with two-exciton states
+
+    """
+    Nmol = 10*scale
+    agg = _chain_aggregate(Nmol)
+    Ntot = 1 + Nmol + (Nmol*(Nmol-1))//2
+
+    def run():
+        agg.rebuild(mult=2)
+
+    return (run, Ntot)
+
+
+@benchmark("redfield_tensor", unit="tensor elements")
+def bm_redfield_tensor(scale):
+    """Redfield relaxation tensor construction
+
+    """
+    (time, agg, ham, sbi) = _relaxation_system(scale)
+
+    def run():
+        qr.qm.RedfieldRelaxationTensor(ham, sbi)
+
+    return (run, ham.dim**4)
+
+
+@benchmark("foerster_tensor", unit="tensor elements")
+def bm_foerster_tensor(scale):
+    """Foerster relaxation tensor construction
+
+    """
+    (time, agg, ham, sbi) = _relaxation_system(scale)
+
+    def run():
+        qr.qm.FoersterRelaxationTensor(ham, sbi)
+
+    return (run, ham.dim**4)
+
+
+@benchmark("modified_redfield_rates", unit="rates")
+def bm_modified_redfield(scale):
+    """Modified Redfield rate matrix construction
+
+    """
+    (time, agg, ham, sbi) = _relaxation_system(scale)
+
+    def run():
+        qr.qm.ModifiedRedfieldRateMatrix(ham, sbi, time)
+
+    return (run, ham.dim**2)
+
+
+@benchmark("rdm_propagation", unit="time steps")
+def bm_rdm_propagation(scale):
+    """Reduced density matrix propagation with Redfield tensor
+
+    """
+    (time, agg, ham, sbi) = _relaxation_system(scale, Ntime=1000*scale)
+    RR = qr.qm.RedfieldRelaxationTensor(ham, sbi)
+    prop = qr.ReducedDensityMatrixPropagator(time, ham, RR)
+    rhoi = qr.ReducedDensityMatrix(dim=ham.dim)
+    rhoi.data[ham.dim-1, ham.dim-1] = 1.0
+
+    def run():
+        prop.propagate(rhoi)
+
+    return (run, time.length)
+
+
+@benchmark("evolution_superoperator", unit="time steps")
+def bm_evolution_superoperator(scale):
+    """Evolution superoperator calculation with Redfield tensor
+
+    """
+    (time, agg, ham, sbi) = _relaxation_system(scale)
+    RR = qr.qm.RedfieldRelaxationTensor(ham, sbi)
+    t2axis = qr.TimeAxis(0.0, 100*scale, 10.0)
+
+    def run():
+        eUt = qr.qm.EvolutionSuperOperator(t2axis, ham, RR)
+        eUt.set_dense_dt(10)
+        eUt.calculate()
+
+    return (run, t2axis.length*10)
+
+
+@benchmark("heom_propagation", unit="ADO steps")
+def bm_heom(scale):
+    """Propagation of the Kubo-Tanimura hierarchy of a dimer
+
+    """
+    from ...qm.liouvillespace.heom import KTHierarchy
+    from ...qm.liouvillespace.heom import KTHierarchyPropagator
+
+    with qr.energy_units("1/cm"):
+        agg = qr.Aggregate([qr.Molecule([0.0, 10000.0]),
+                            qr.Molecule([0.0, 10100.0])])
+        agg.set_resonance_coupling(0, 1, 80.0)
+    agg.build()
+    ham = agg.get_Hamiltonian()
+    sbi = qr.qm.TestSystemBathInteraction("dimer-2-env")
+    hy = KTHierarchy(ham, sbi, 2 + scale)
+    time = qr.TimeAxis(0.0, 200*scale, 2.0)
+    prop = KTHierarchyPropagator(time, hy)
+    rhoi = qr.ReducedDensityMatrix(dim=hy.dim)
+    rhoi.data[2, 2] = 1.0
+
+    def run():
+        hy.reset_ados()
+        prop.propagate(rhoi)
+
+    return (run, hy.hsize*time.length)
+
+
+@benchmark("absorption", unit="spectral points")
+def bm_absorption(scale):
+    """Absorption spectrum of an aggregate with Redfield broadening
+
+    """
+    (time, agg, ham, sbi) = _relaxation_system(scale, Ntime=1000*scale)
+    RR = qr.qm.RedfieldRelaxationTensor(ham, sbi)
+
+    def run():
+        calc = qr.AbsSpectrumCalculator(time, system=agg,
+                                        relaxation_tensor=RR)
+        with qr.energy_units("1/cm"):
+            calc.bootstrap(rwa=12000.0)
+        calc.calculate()
+
+    return (run, time.length)
+
+
+@benchmark("twod_spectra", unit="spectra")
+def bm_twod(scale):
+    """Effective lineshape 2D spectra of an aggregate
+
+    """
+    from ...spectroscopy.mocktwodcalculator \
+        import MockTwoDResponseCalculator
+
+    t1axis = qr.TimeAxis(0.0, 100*scale, 10.0)
+    t2axis = qr.TimeAxis(0.0, 10, 10.0)
+    t3axis = qr.TimeAxis(0.0, 100*scale, 10.0)
+
+    agg = _chain_aggregate(2 + scale, width=100.0)
+    agg1 = agg.deepcopy()
+    agg1.build(mult=1)
+    ham = agg1.get_Hamiltonian()
+    agg.build(mult=2)
+    agg.diagonalize()
+
+    lab = qr.LabSetup()
+    lab.set_polarizations(pulse_polarizations=(qr.utils.vectors.X,)*3,
+                          detection_polarization=qr.utils.vectors.X)
+    eUt = qr.qm.EvolutionSuperOperator(t2axis, ham)
+    eUt.set_dense_dt(10)
+    eUt.calculate()
+
+    calc = MockTwoDResponseCalculator(t1axis, t2axis, t3axis)
+    with qr.energy_units("1/cm"):
+        calc.bootstrap(rwa=12100.0)
+
+    def run():
+        calc.calculate_all_system(agg, eUt, lab)
+
+    return (run, t2axis.length)
+
+
+@benchmark("saveable_io", unit="MB")
+def bm_saveable_io(scale):
+    """Saving and loading of a large object
+
+    """
+    Nt = 1000*scale
+    time = qr.TimeAxis(0.0, Nt, 1.0)
+    rhot = qr.ReducedDensityMatrixEvolution(time)
+    rhot.data = numpy.ones((Nt, 20, 20), dtype=qr.COMPLEX)
+    fname = os.path.join(tempfile.gettempdir(),
+                         "qrhei_bench_"+str(os.getpid())+".qrp")
+
+    def run():
+        try:
+            rhot.save(fname)
+            qr.load_parcel(fname)
+        finally:
+            if os.path.exists(fname):
+                os.remove(fname)
+
+    return (run, 2*rhot.data.nbytes/1.0e6)
+
+
+def _machine_info():
+    """Information about the machine and software versions
+
+    """
+    return dict(quantarhei=qr.Manager().version,
+                python=platform.python_version(),
+                numpy=numpy.__version__,
+                platform=platform.platform(),
+                processor=platform.processor(),
+                cpu_count=os.cpu_count())
+
+
+def run_benchmarks(names=None, scale=1, repeat=3, memory=True,
+                   verbose=True):
+    """Runs the benchmarks and returns their results
+
+    Parameters
+    ----------
+
+    names : list
+        Names of the benchmarks to run. All benchmarks are run by default.
+
+    scale : int
+        Factor by which the problem sizes are scaled
+
+    repeat : int
+        Number of timed runs of each benchmark. The best time is reported.
+
+    memory : bool
+        If True, peak memory allocated by the benchmark is measured in
+        a separate (untimed) run
+
+    Returns
+    -------
+
+    Dictionary with the keys "machine", "scale" and "results". Results
+    of individual benchmarks contain the best time (in seconds), all
+    measured times, peak memory (in bytes), throughput and its unit.
+
+    """
+    if names is None:
+        names = list(_benchmarks.keys())
+
+    for name in names:
+        if name not in _benchmarks:
+            raise Exception("Unknown benchmark: "+name)
+
+    results = OrderedDict()
+    for name in names:
+        (func, unit, desc) = _benchmarks[name]
+        if verbose:
+            qr.printlog("Benchmark "+name+": "+desc, loglevel=1)
+
+        # output of the benchmarked code is suppressed
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+
+                (run, work) = func(scale)
+
+                times = []
+                for ii in range(repeat):
+                    t0 = time.perf_counter()
+                    run()
+                    times.append(time.perf_counter() - t0)
+                best = min(times)
+
+                peak = None
+                if memory:
+                    tracemalloc.start()
+                    try:
+                        run()
+                        peak = tracemalloc.get_traced_memory()[1]
+                    finally:
+                        tracemalloc.stop()
+
+        results[name] = OrderedDict(time=best, times=times,
+                                    peak_memory=peak,
+                                    throughput=work/best if best > 0.0
+                                               else float("inf"),
+                                    unit=unit+"/s")
+        if verbose:
+            qr.printlog("    time: {:.4g} s, throughput: {:.4g} {}".format(
+                        best, results[name]["throughput"],
+                        results[name]["unit"]), loglevel=1)
+
+    return OrderedDict(machine=_machine_info(), scale=scale,
+                       results=results)
+
+
+def compare_with_baseline(current, baseline, tolerance=0.2):
+    """Compares benchmark results with a baseline
+
+    A benchmark regresses when its time or peak memory are larger than
+    those of the baseline by more than the fraction `tolerance`. Only
+    benchmarks present in both results are compared, and results obtained
+    with different scale factors are not comparable.
+
+    Returns
+    -------
+
+    List of tuples (benchmark name, quantity, baseline value, current value)
+    describing the regressions.
+
+    """
+    if current["scale"] != baseline["scale"]:
+        raise Exception("Benchmarks were run with different scale factors")
+
+    regressions = []
+    for (name, res) in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        base = baseline["results"][name]
+        for key in ["time", "peak_memory"]:
+            if (res.get(key) is None) or (base.get(key) is None):
+                continue
+            if res[key] > (1.0 + tolerance)*base[key]:
+                regressions.append((name, key, base[key], res[key]))
+
+    return regressions
+
+
+def save_results(results, filename):
+    """Saves benchmark results as JSON
+
+    """
+    with open(filename, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def load_results(filename):
+    """Loads benchmark results from a JSON file
+
+    """
+    with open(filename, "r") as f:
+        return json.load(f, object_pairs_hook=OrderedDict)
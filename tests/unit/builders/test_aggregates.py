@@ -185,10 +185,90 @@ class AggregateTest(unittest.TestCase):
         for state_ind in range(agg.Nb[0]):
             rho._data[state_ind, state_ind] = n_part
 
-        redr = agg.trace_over_vibrations(rho)  
+        redr = agg.trace_over_vibrations(rho)
         numpy.testing.assert_almost_equal(numpy.trace(redr._data), 1.0,
                                     decimal=7)
 
+
+    def test_vibronic_operators(self):
+        """(Aggregate) Testing expansion of electronic operators to vibronic basis
+
+        """
+        agg = self.vagg
+        Ntot = agg.Ntot
+
+        elops = numpy.zeros((2, 3, 3))
+        elops[0, 1, 2] = 1.0
+        elops[1, 2, 1] = 0.5
+        elops[1, 1, 1] = 2.0
+
+        vops = agg.get_vibronic_operators(elops)
+        sops = agg.get_vibronic_operators(elops, sparse=True)
+        iops = agg.get_vibronic_operators(elops[1], fc_weighted=False)
+        self.assertEqual(vops.shape, (2, Ntot, Ntot))
+
+        # reference by explicit summation
+        for k in range(2):
+            ref = numpy.zeros((Ntot, Ntot))
+            ide = numpy.zeros((Ntot, Ntot))
+            for i_el in range(3):
+                for i_vib in agg.vibindices[i_el]:
+                    st_i = agg.get_VibronicState(*agg.vibsigs[i_vib])
+                    for j_el in range(3):
+                        for j_vib in agg.vibindices[j_el]:
+                            st_j = agg.get_VibronicState(*agg.vibsigs[j_vib])
+                            ref[i_vib, j_vib] = elops[k, i_el, j_el] \
+                                *numpy.real(agg.fc_factor(st_i, st_j))
+                            if agg.vibsigs[i_vib][1] == agg.vibsigs[j_vib][1]:
+                                ide[i_vib, j_vib] = elops[k, i_el, j_el]
+            numpy.testing.assert_allclose(vops[k], ref)
+            numpy.testing.assert_allclose(sops[k].toarray(), ref)
+        numpy.testing.assert_allclose(iops, ide)
+        numpy.testing.assert_allclose(
+            agg.get_vibronic_operators(elops[1], fc_weighted=False,
+                                       sparse=True).toarray(), ide)
+
+
+    def test_trace_over_vibrations_evolution(self):
+        """(Aggregate) Testing trace over vibrational DOF of an evolution
+
+        """
+        agg = self.vagg
+        Ntot = agg.Ntot
+
+        rng = numpy.random.default_rng(7)
+        time = TimeAxis(0.0, 5, 1.0)
+        dat = rng.normal(size=(5, Ntot, Ntot)) \
+            + 1j*rng.normal(size=(5, Ntot, Ntot))
+        dat = dat + numpy.conj(numpy.transpose(dat, (0, 2, 1)))
+
+        rhot = qr.ReducedDensityMatrixEvolution(time,
+                                    ReducedDensityMatrix(dim=Ntot))
+        rhot._data[:,:,:] = dat
+
+        redt = agg.trace_over_vibrations(rhot)
+        self.assertEqual(redt._data.shape, (5, agg.Nel, agg.Nel))
+
+        # reference by explicit summation
+        Ng = agg.Nb[0]
+        for tt in [0, 3]:
+            ref = numpy.zeros((agg.Nel, agg.Nel), dtype=numpy.complex128)
+            for n in range(agg.Nel):
+                for i_n in agg.vibindices[n]:
+                    for m in range(agg.Nel):
+                        for i_m in agg.vibindices[m]:
+                            ref[n,m] += dat[tt,i_n,i_m] \
+                              *numpy.sum(agg.FCf[:Ng,i_n]*agg.FCf[i_m,:Ng])
+            numpy.testing.assert_allclose(redt._data[tt,:,:], ref,
+                                          rtol=1.0e-12, atol=1.0e-12)
+            numpy.testing.assert_allclose(
+                    agg.trace_over_vibrations(rhot, tt)._data, ref,
+                    rtol=1.0e-12, atol=1.0e-12)
+            rho = ReducedDensityMatrix(data=dat[tt,:,:])
+            numpy.testing.assert_allclose(
+                    agg.trace_over_vibrations(rho)._data, ref,
+                    rtol=1.0e-12, atol=1.0e-12)
+
         
     def test_get_Density_Matrix_thermal(self):
         """(Aggregate) Testing the get_Densitymatrix method with `thermal` condition type
@@ -426,6 +506,54 @@ class AggregateTest(unittest.TestCase):
         self.assertEqual(coup1, agg.resonance_coupling[1,0])
             
             
+    def test_coupling_matrix_engine(self):
+        """(Aggregate) Testing vectorized couplings with and without cutoff
+        
+        """
+        numpy.random.seed(7)
+        Nmol = 30
+        mols = []
+        for ii in range(Nmol):
+            mol = Molecule(elenergies=[0.0, 1.0])
+            mol.set_dipole(0, 1, numpy.random.randn(3))
+            mol.position = 20.0*numpy.random.rand(3)
+            mols.append(mol)
+        agg = Aggregate(molecules=mols)
+        agg.set_coupling_by_dipole_dipole(epsr=2.0)
+        
+        JJ = numpy.zeros((Nmol, Nmol))
+        for kk in range(Nmol):
+            for ll in range(Nmol):
+                if kk != ll:
+                    JJ[kk,ll] = agg.dipole_dipole_coupling(kk, ll, epsr=2.0)
+        numpy.testing.assert_allclose(agg.resonance_coupling, JJ, 
+                                      rtol=1.0e-12)
+
+        # sparse couplings within the cutoff distance
+        from quantarhei.builders.interactions \
+            import dipole_dipole_coupling_matrix
+        (pos, dip) = agg._get_positions_and_dipoles()
+        JS = dipole_dipole_coupling_matrix(pos, dip, epsr=2.0, cutoff=8.0)
+        dist = numpy.sqrt(numpy.sum((pos[:,numpy.newaxis,:] 
+                                     - pos[numpy.newaxis,:,:])**2, axis=2))
+        numpy.testing.assert_allclose(JS.toarray(), 
+                                      numpy.where(dist < 8.0, JJ, 0.0),
+                                      rtol=1.0e-12)
+        agg.set_coupling_by_dipole_dipole(epsr=2.0, cutoff=8.0)
+        numpy.testing.assert_allclose(agg.resonance_coupling, JS.toarray())
+        
+        # short extended dipoles approach point dipoles
+        agg.set_coupling_by_extended_dipole(1.0e-3, epsr=2.0)
+        numpy.testing.assert_allclose(agg.resonance_coupling, JJ, 
+                                      rtol=1.0e-4, atol=1.0e-8)
+        
+        # nearest molecule
+        (mol, dmin) = agg.get_nearest_Molecule(mols[5])
+        dist[5,5] = dist.max()
+        self.assertIs(mol, mols[numpy.argmin(dist[5,:])])
+        self.assertAlmostEqual(dmin, numpy.min(dist[5,:]))
+        
+        
     def test_add_Molecule(self):
         """(Aggregate) Testing add_Molecule() method
         
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy
+
+"""
+*******************************************************************************
+
+
+    Tests of the quantarhei.DisorderEnsemble class
+
+
+*******************************************************************************
+"""
+
+from quantarhei import Aggregate
+from quantarhei import Molecule
+from quantarhei import CorrelationFunction
+from quantarhei import energy_units
+from quantarhei import TimeAxis
+from quantarhei import DisorderEnsemble
+from quantarhei import AbsSpectrumCalculator
+from quantarhei import LinDichSpectrumCalculator
+from quantarhei import FluorSpectrumCalculator
+
+
+class DisorderEnsembleTest(unittest.TestCase):
+    """Tests for the DisorderEnsemble class
+
+
+    """
+
+    def setUp(self):
+
+        self.time = TimeAxis(0.0, 1000, 1.0)
+        params = dict(ftype="OverdampedBrownian", reorg=20, cortime=100,
+                      T=300)
+        with energy_units("1/cm"):
+            fc = CorrelationFunction(self.time, params)
+            mols = []
+            for ii in range(3):
+                m = Molecule(elenergies=[0.0, 12000.0+50.0*ii])
+                m.set_dipole(0,1,[numpy.cos(ii), numpy.sin(ii), 0.3*ii])
+                m.position = [0.0, 5.0*ii, 1.0*ii]
+                m.set_transition_environment((0,1), fc)
+                mols.append(m)
+
+            self.agg = Aggregate(molecules=mols)
+            self.agg.set_resonance_coupling(0, 1, 100.0)
+            self.agg.set_resonance_coupling(1, 2, 100.0)
+
+        self.agg.build()
+
+
+    def test_batched_diagonalization(self):
+        """Testing DisorderEnsemble realizations and their diagonalization
+
+        """
+        with energy_units("1/cm"):
+            ens = DisorderEnsemble(self.agg, 50, width=100.0,
+                                   coupling_width=10.0, seed=12)
+
+        self.assertEqual(ens.HH.shape, (50, 3, 3))
+        self.assertEqual(ens.energies.shape, (50, 3))
+
+        # realizations are symmetric and couplings stay zero where they were
+        numpy.testing.assert_allclose(ens.HH,
+                                      numpy.transpose(ens.HH, (0, 2, 1)))
+        numpy.testing.assert_allclose(ens.HH[:,0,2], 0.0)
+
+        for rr in [0, 17, 49]:
+            ee, SS = numpy.linalg.eigh(ens.HH[rr,:,:])
+            numpy.testing.assert_allclose(ens.energies[rr,:], ee-ens.E0,
+                                          rtol=1.0e-10)
+
+        # dipole strength sum rule
+        numpy.testing.assert_allclose(
+                numpy.sum(ens.get_dipole_strengths(), axis=1),
+                numpy.sum(ens.get_site_dipoles()**2))
+
+
+    def test_zero_width_spectra(self):
+        """Testing that ensemble spectra at zero disorder are the usual ones
+
+        """
+        with energy_units("1/cm"):
+            ens = DisorderEnsemble(self.agg, 4, width=0.0)
+
+        for Calc in [AbsSpectrumCalculator, LinDichSpectrumCalculator,
+                     FluorSpectrumCalculator]:
+            calc = Calc(self.time, system=self.agg)
+            with energy_units("1/cm"):
+                calc.bootstrap(rwa=12000)
+
+            s1 = calc.calculate()
+            s2 = calc.calculate_ensemble(ens)
+
+            numpy.testing.assert_allclose(s2.data, s1.data,
+                                    atol=1.0e-6*numpy.max(numpy.abs(s1.data)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import tempfile
+import os
+
+import numpy
+
+"""
+*******************************************************************************
+
+
+    Tests of the quantarhei.builders.pdb module
+
+
+*******************************************************************************
+"""
+
+from quantarhei import PDBFile
+from quantarhei.builders import pdb
+from quantarhei.models.chlorophylls import ChlorophyllA
+
+
+def _record(rec, serial, atm, alt, res, chain, seq, xyz):
+    """Formats one coordinate record of a PDB file
+
+    """
+    return "{:<6}{:>5} {:<4}{:1}{:>3} {:1}{:>4}    {:8.3f}{:8.3f}{:8.3f}" \
+           "  1.00 10.00           C  \n".format(rec, serial, atm, alt, res,
+                                                 chain, seq, *xyz)
+
+
+class TestPDBFile(unittest.TestCase):
+    """Tests of the structured reading of PDB files
+
+
+    """
+
+    def setUp(self):
+
+        rng = numpy.random.default_rng(11)
+        self.lines = ["HEADER    PHOTOSYNTHESIS\n",
+                      _record("ATOM", 1, " CA", "", "LYS", "A", 5,
+                              rng.normal(size=3))]
+        k = 2
+        for (chain, seq) in [("A", 601), ("B", 601), ("A", 602)]:
+            for atm in [" NA", " NB", " NC", " ND", " MG", " C1"]:
+                self.lines.append(_record("HETATM", k, atm, "", "CLA",
+                                          chain, seq,
+                                          10.0*rng.normal(size=3)))
+                k += 1
+        # alternate location of an atom
+        self.lines.append(_record("HETATM", k, " NB", "B", "CLA", "A", 602,
+                                  10.0*rng.normal(size=3)))
+        self.lines.append("TER\n")
+        self.lines.append(_record("HETATM", k+1, " O", "", "HOH", "A", 700,
+                                  rng.normal(size=3)))
+        self.lines.append("END")
+
+
+    def test_structured_records(self):
+        """Testing parsing of coordinate records into a structured array
+
+        """
+        with tempfile.TemporaryDirectory() as tdir:
+            fname = os.path.join(tdir, "test.pdb")
+            with open(fname, "w") as f:
+                f.writelines(self.lines)
+            fl = PDBFile(fname)
+
+        self.assertEqual(fl.linecount, len(self.lines))
+        self.assertEqual(fl.lines, self.lines)
+        self.assertEqual(len(fl.atoms), 21)
+
+        # lines of unequal length give the same result
+        atoms = pdb.atoms_from_lines(self.lines)
+        numpy.testing.assert_array_equal(atoms, fl.atoms)
+
+        for atom in fl.atoms:
+            line = self.lines[atom["line"]]
+            self.assertEqual(atom["recName"], line[0:6].strip())
+            self.assertEqual(atom["atmName"], line[12:16].strip())
+            self.assertEqual(atom["resName"], line[17:20])
+            self.assertEqual(atom["chainId"], pdb.line_chainId(line))
+            self.assertEqual(atom["resSeq"], int(pdb.line_resSeq(line)))
+            numpy.testing.assert_array_equal(atom["xyz"], pdb.line_xyz(line))
+
+        sel = fl.select_atoms(by_recName="HETATM", by_chainId="A",
+                              by_resSeq=602)
+        self.assertEqual(len(sel), 7)
+        self.assertEqual(fl._match_lines(by_resName="HOH"), [self.lines[-2]])
+
+
+    def test_molecules(self):
+        """Testing molecules extracted from a PDB file
+
+        """
+        with tempfile.TemporaryDirectory() as tdir:
+            fname = os.path.join(tdir, "test.pdb")
+            with open(fname, "w") as f:
+                f.writelines(self.lines)
+            fl = PDBFile(fname)
+
+        model = ChlorophyllA(model_type="PDB")
+        mols = fl.get_Molecules(model=model)
+
+        self.assertEqual([m.name for m in mols], ["A601", "B601", "A602"])
+        self.assertEqual([fl.get_chainId(m) for m in mols], ["A", "B", "A"])
+
+        # vectorized models agree with the models applied to lines
+        for m in mols:
+            lines = [self.lines[i] for i in m.data["line"]]
+            numpy.testing.assert_allclose(m.position,
+                model.position_of_center(data=lines))
+            numpy.testing.assert_allclose(m.dmoments[0,1],
+                model.transition_dipole(data=lines))
+            self.assertAlmostEqual(numpy.linalg.norm(m.dmoments[0,1]),
+                                   model.default_dipole_lengths[0,1])
+
+        # the last alternate location is taken
+        xyz = [pdb.line_xyz(self.lines[i]) for i in mols[2].data["line"]]
+        numpy.testing.assert_allclose(mols[2].position,
+                                      (xyz[0]+xyz[6]+xyz[2]+xyz[3])/4.0)
+
+        with self.assertRaises(Exception):
+            model.position_of_center(data=self.lines[:4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+"""
+*******************************************************************************
+
+
+    Tests of the quantarhei.core.basiscache module
+
+
+*******************************************************************************
+"""
+
+import numpy
+
+from quantarhei.core.basiscache import BasisCache
+from quantarhei.core.basiscache import unitary_inverse
+from quantarhei.core.managers import Manager
+from quantarhei import Hamiltonian
+from quantarhei import eigenbasis_of
+
+
+
+class TestBasisCache(unittest.TestCase):
+
+    def setUp(self):
+
+        self.A = numpy.array([[0.1, 1.0, 0.2],
+                              [1.0, 0.0, 0.3],
+                              [0.2, 0.3, 0.5]])
+
+
+    def test_cached_eigh(self):
+        """Testing that BasisCache returns correct and cached decompositions
+
+        """
+        cache = BasisCache()
+
+        dd, SS = cache.eigh(self.A)
+        d0, S0 = numpy.linalg.eigh(self.A)
+
+        numpy.testing.assert_allclose(dd, d0)
+        numpy.testing.assert_allclose(numpy.abs(SS), numpy.abs(S0))
+        self.assertEqual(cache.misses, 1)
+
+        # same content, different array
+        dd2, SS2 = cache.eigh(self.A.copy())
+        self.assertEqual(cache.hits, 1)
+        numpy.testing.assert_allclose(SS2, SS)
+
+        # modification of the returned arrays does not affect the cache
+        SS2[0,0] = 100.0
+        dd3, SS3 = cache.eigh(self.A)
+        numpy.testing.assert_allclose(SS3, SS)
+
+        # changed content is a new version
+        B = self.A.copy()
+        B[2,2] = 1.0
+        cache.eigh(B)
+        self.assertEqual(cache.misses, 2)
+
+
+    def test_lru_eviction(self):
+        """Testing that BasisCache keeps only a limited number of entries
+
+        """
+        cache = BasisCache(maxsize=2)
+        for k in range(4):
+            B = self.A.copy()
+            B[0,0] = k
+            cache.eigh(B)
+        self.assertEqual(len(cache), 2)
+
+
+    def test_unitary_inverse(self):
+        """Testing the inverse of unitary transformation
+
+        """
+        dd, SS = numpy.linalg.eigh(self.A)
+        numpy.testing.assert_allclose(unitary_inverse(SS),
+                                      numpy.linalg.inv(SS), atol=1.0e-12)
+
+
+    def test_repeated_context(self):
+        """Testing that repeated eigenbasis_of contexts reuse decomposition
+
+        """
+        H = Hamiltonian(data=self.A)
+        cache = Manager().basis_cache
+
+        with eigenbasis_of(H):
+            d1 = numpy.diag(H.data).copy()
+
+        hits = cache.hits
+        with eigenbasis_of(H):
+            d2 = numpy.diag(H.data).copy()
+
+        self.assertEqual(cache.hits, hits+1)
+        numpy.testing.assert_allclose(d1, d2)
+        numpy.testing.assert_allclose(H.data, self.A, atol=1.0e-12)
+
+
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import tempfile
+import shutil
+
+"""
+*******************************************************************************
+
+
+    Tests of the quantarhei.core.checkpoint module
+
+
+*******************************************************************************
+"""
+
+import numpy
+
+import quantarhei as qr
+from quantarhei.core.checkpoint import Checkpoint
+from quantarhei.qm import EvolutionSuperOperator
+from quantarhei.qm.liouvillespace.heom import KTHierarchy
+from quantarhei.qm.liouvillespace.heom import KTHierarchyPropagator
+
+
+
+class _Killed(Exception):
+    pass
+
+
+class _KilledCheckpoint(Checkpoint):
+    """Checkpoint which interrupts the calculation after a number of saves
+
+    """
+
+    def __init__(self, directory, every, kill_after):
+        super().__init__(directory, every=every)
+        self.kill_after = kill_after
+
+    def save(self, index, output=None, **state):
+        super().save(index, output, **state)
+        if self.saved == self.kill_after:
+            raise _Killed()
+
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+        self.agg = qr.TestAggregate(name="dimer-2-env")
+        self.agg.set_coupling_by_dipole_dipole()
+        self.agg.build()
+        self.time = qr.TimeAxis(0.0, 300, 1.0)
+        self.rhoi = qr.ReducedDensityMatrix(dim=3)
+        self.rhoi.data[2,2] = 1.0
+
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+    def _interrupted(self, calculate, every=40, kill_after=3):
+        """Runs a calculation which is killed and resumed
+
+        """
+        with self.assertRaises(_Killed):
+            calculate(_KilledCheckpoint(self.dir, every, kill_after))
+
+        chk = Checkpoint(self.dir, every=every)
+        result = calculate(chk)
+        return (result, chk)
+
+
+    def test_density_matrix_propagation(self):
+        """Testing resumed density matrix propagation
+
+        """
+        time = self.agg.get_SystemBathInteraction().TimeAxis
+        prop = self.agg.get_ReducedDensityMatrixPropagator(time,
+                                                    relaxation_theory="stR")
+        rhot = prop.propagate(self.rhoi)
+
+        (rhor, chk) = self._interrupted(
+            lambda ck: prop.propagate(self.rhoi, checkpoint=ck), every=200)
+        numpy.testing.assert_array_equal(rhor.data, rhot.data)
+        # only the remaining time steps were calculated
+        self.assertEqual(chk.saved, 2)
+
+        # another propagation does not take the checkpoint over
+        rho2 = qr.ReducedDensityMatrix(dim=3)
+        rho2.data[1,1] = 1.0
+        rhos = prop.propagate(rho2, checkpoint=Checkpoint(self.dir))
+        numpy.testing.assert_array_equal(rhos.data, prop.propagate(rho2).data)
+
+        with self.assertRaises(Exception):
+            prop.propagate(self.rhoi, method="primitive",
+                           checkpoint=Checkpoint(self.dir))
+
+
+    def test_hierarchy_propagation(self):
+        """Testing resumed propagation of the hierarchy
+
+        """
+        ham = self.agg.get_Hamiltonian()
+        sbi = self.agg.get_SystemBathInteraction()
+
+        def calculate(ck):
+            # every propagation starts with an empty hierarchy
+            Hy = KTHierarchy(ham, sbi, 2)
+            kprop = KTHierarchyPropagator(self.time, Hy)
+            rhot = kprop.propagate(self.rhoi, report_hierarchy=True,
+                                   checkpoint=ck)
+            return (rhot.data, Hy.hpop)
+
+        (rhot, hpop) = calculate(None)
+        ((rhor, hpopr), chk) = self._interrupted(calculate)
+        numpy.testing.assert_array_equal(rhor, rhot)
+        numpy.testing.assert_array_equal(hpopr, hpop)
+        self.assertEqual(chk.saved, 5)
+
+
+    def test_evolution_superoperator(self):
+        """Testing resumed calculation of the evolution superoperator
+
+        """
+        time = self.agg.get_SystemBathInteraction().TimeAxis
+        RR, HH = self.agg.get_RelaxationTensor(time, relaxation_theory="stR")
+        tt = qr.TimeAxis(0.0, 50, 10.0)
+
+        with qr.eigenbasis_of(HH):
+
+            def calculate(ck):
+                eSO = EvolutionSuperOperator(tt, HH, RR)
+                eSO.set_dense_dt(5)
+                eSO.calculate(checkpoint=ck)
+                return eSO.data
+
+            data = calculate(None)
+            (datr, chk) = self._interrupted(calculate, every=10)
+            numpy.testing.assert_array_equal(datr, data)
+            self.assertEqual(chk.saved, 2)
+
+            # "jit" mode
+            def calculate_next(ck):
+                eSO = EvolutionSuperOperator(tt, HH, RR, mode="jit")
+                eSO.set_dense_dt(5)
+                while eSO.now < tt.length-1:
+                    eSO.calculate_next(checkpoint=ck)
+                return eSO.data
+
+            shutil.rmtree(self.dir)
+            (datj, chk) = self._interrupted(calculate_next, every=10)
+            numpy.testing.assert_array_equal(datj, data[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -78,3 +78,46 @@ class TestDFunction(unittest.TestCase):
         self.assertEqual(val_mez_spline, new_mez_spline)
         self.assertEqual(fce._splines_initialized, fce2._splines_initialized)
         numpy.testing.assert_array_equal(fce.data, fce2.data)
+
+
+    def test_vectorized_interpolation(self):
+        """Testing interpolation at many points and of many functions
+        
+        """
+        from quantarhei.core.dfunction import at_many
+        
+        wa = FrequencyAxis(0.0, 100, 0.5)
+        fw = numpy.exp(-wa.data/30.0)*(numpy.cos(wa.data) 
+                                       + 1j*numpy.sin(wa.data/3.0))
+        fce = DFunction(wa, fw)
+        
+        xx = numpy.array([[0.0, 0.3, 17.25], [33.3, 49.0, 49.4]])
+        vals = fce.at(xx)
+        self.assertEqual(vals.shape, (2, 3))
+        for (ii, jj) in numpy.ndindex(xx.shape):
+            self.assertEqual(vals[ii,jj], fce.at(xx[ii,jj]))
+            
+        with self.assertRaises(Exception):
+            fce.at(numpy.array([1.0, 50.0]))
+            
+        # many functions at once
+        fces = [fce, DFunction(wa, numpy.cos(wa.data)), 
+                DFunction(wa, fw**2)]
+        vals = at_many(fces, xx)
+        self.assertEqual(vals.shape, (3, 2, 3))
+        for kk in range(3):
+            numpy.testing.assert_array_equal(vals[kk], fces[kk].at(xx))
+        
+        # complex spline
+        sval = fce.at(xx, approx="spline")
+        self.assertTrue(fce._splines_initialized)
+        for (ii, jj) in numpy.ndindex(xx.shape):
+            self.assertAlmostEqual(sval[ii,jj], 
+                                   fce._spline_r(xx[ii,jj])
+                                   + 1j*fce._spline_i(xx[ii,jj]))
+        numpy.testing.assert_allclose(sval[0,0], fw[0])
+        
+        vals = at_many(fces, xx)
+        numpy.testing.assert_array_equal(vals[0], sval)
+        numpy.testing.assert_array_equal(vals[1], fces[1].at(xx))
+
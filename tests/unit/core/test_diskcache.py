@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import tempfile
+import shutil
+import os
+
+"""
+*******************************************************************************
+
+
+    Tests of the quantarhei.core.diskcache module
+
+
+*******************************************************************************
+"""
+
+import numpy
+
+import quantarhei as qr
+from quantarhei.core.diskcache import DiskCache
+from quantarhei.core.diskcache import fingerprint
+from quantarhei.core.managers import Manager
+from quantarhei.qm import EvolutionSuperOperator
+
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        Manager().unset_disk_cache()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+    def test_fingerprint(self):
+        """Testing that fingerprints depend on the content of objects only
+
+        """
+        H1 = qr.Hamiltonian(data=[[0.0, 0.1], [0.1, 1.0]])
+        H2 = qr.Hamiltonian(data=[[0.0, 0.1], [0.1, 1.0]])
+        H3 = qr.Hamiltonian(data=[[0.0, 0.2], [0.2, 1.0]])
+        time = qr.TimeAxis(0.0, 100, 1.0)
+
+        key = fingerprint(H1, time, "stR")
+        self.assertEqual(key, fingerprint(H2, qr.TimeAxis(0.0, 100, 1.0),
+                                          "stR"))
+        self.assertNotEqual(key, fingerprint(H3, time, "stR"))
+        self.assertNotEqual(key, fingerprint(H1, time, "stF"))
+        self.assertNotEqual(key, fingerprint(H1, qr.TimeAxis(0.0, 100, 2.0),
+                                             "stR"))
+
+        # temporary basis protection does not change the object
+        H1.protect_basis()
+        H1.unprotect_basis()
+        self.assertEqual(key, fingerprint(H1, time, "stR"))
+
+
+    def test_memory_mapping(self):
+        """Testing that large arrays are memory-mapped and context restored
+
+        """
+        cache = DiskCache(self.dir, mmap_threshold=1000)
+        ctx = qr.Hamiltonian(data=[[0.0, 0.1], [0.1, 1.0]])
+        value = dict(large=numpy.arange(500.0), small=numpy.arange(5.0),
+                     ham=ctx)
+
+        cache.put("a", value, context=(ctx,))
+        self.assertIn("a", cache)
+
+        out = cache.get("a", context=(ctx,))
+        self.assertIsInstance(out["large"], numpy.memmap)
+        self.assertNotIsInstance(out["small"], numpy.memmap)
+        self.assertIs(out["ham"], ctx)
+        numpy.testing.assert_array_equal(out["large"], value["large"])
+
+        # modifications do not reach the cache
+        out["large"][:] = 0.0
+        out = cache.get("a", context=(ctx,))
+        numpy.testing.assert_array_equal(out["large"], value["large"])
+        self.assertEqual(cache.hits, 2)
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.misses, 1)
+
+
+    def test_eviction(self):
+        """Testing the least-recently-used eviction of entries
+
+        """
+        cache = DiskCache(self.dir, maxsize=20000, mmap_threshold=1000)
+        for key in ["a", "b"]:
+            cache.put(key, numpy.zeros(1000))
+        self.assertEqual(len(cache), 2)
+
+        # "a" is used more recently than "b"
+        for key in ["b", "a"]:
+            entry = os.path.join(self.dir, key)
+            os.utime(entry, (0, os.path.getmtime(entry) - 10.0))
+        cache.get("a")
+
+        cache.put("c", numpy.zeros(1000))
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertLessEqual(cache.size(), 20000)
+
+        # the newest entry is kept even if it is larger than the limit
+        cache.put("d", numpy.zeros(5000))
+        self.assertEqual(len(cache), 1)
+        self.assertIn("d", cache)
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+
+    def test_relaxation_objects(self):
+        """Testing caching of relaxation tensors and evolution superoperators
+
+        """
+        cache = Manager().set_disk_cache(self.dir, mmap_threshold=100)
+
+        agg = qr.TestAggregate(name="dimer-2-env")
+        agg.set_coupling_by_dipole_dipole()
+        agg.build()
+        time = agg.get_SystemBathInteraction().TimeAxis
+
+        RR, HH = agg.get_RelaxationTensor(time, relaxation_theory="stR")
+        KK = agg.get_RedfieldRateMatrix()
+        self.assertEqual(cache.misses, 0)
+
+        # the same aggregate built again, as in a new run of a script
+        agg2 = qr.TestAggregate(name="dimer-2-env")
+        agg2.set_coupling_by_dipole_dipole()
+        agg2.build()
+
+        RR2, HH2 = agg2.get_RelaxationTensor(time, relaxation_theory="stR",
+                                             recalculate=False)
+        KK2 = agg2.get_RedfieldRateMatrix(recalculate=False)
+        self.assertEqual(cache.hits, 2)
+        numpy.testing.assert_allclose(RR2.data, RR.data)
+        numpy.testing.assert_allclose(KK2.data, KK.data)
+        self.assertIs(HH2, agg2.get_Hamiltonian())
+        self.assertIs(RR2.SystemBathInteraction,
+                      agg2.get_SystemBathInteraction())
+        self.assertIs(agg2.RelaxationTensor, RR2)
+
+        # different options are not taken from the cache
+        RS, HS = agg2.get_RelaxationTensor(time, relaxation_theory="stR",
+                                           secular_relaxation=True,
+                                           recalculate=False)
+        self.assertEqual(cache.misses, 1)
+
+        # evolution superoperator
+        tt = qr.TimeAxis(0.0, 10, 10.0)
+        with qr.eigenbasis_of(HH):
+            eSO = EvolutionSuperOperator(tt, HH, RR)
+            eSO.set_dense_dt(10)
+            eSO.calculate()
+
+            eSO2 = EvolutionSuperOperator(tt, HH2, RR2)
+            eSO2.set_dense_dt(10)
+            eSO2.calculate(recalculate=False)
+
+            numpy.testing.assert_allclose(eSO2.data, eSO.data)
+        self.assertEqual(cache.hits, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
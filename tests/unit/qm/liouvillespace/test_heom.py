@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy
+
+"""
+*******************************************************************************
+
+
+    Tests of the quantarhei.qm.liouvillespace.heom module
+
+
+*******************************************************************************
+"""
+
+from quantarhei import Molecule
+from quantarhei import Aggregate
+from quantarhei import TimeAxis
+from quantarhei import energy_units
+from quantarhei import ReducedDensityMatrix
+from quantarhei.qm import TestSystemBathInteraction
+
+from quantarhei.qm.liouvillespace.heom import KTHierarchy
+from quantarhei.qm.liouvillespace.heom import KTHierarchyPropagator
+
+
+class TestKTHierarchyKernel(unittest.TestCase):
+    """Tests of the memory kernel of the Kubo-Tanimura hierarchy
+
+
+    """
+
+    def setUp(self):
+
+        with energy_units("1/cm"):
+            m1 = Molecule([0.0, 10000.0])
+            m2 = Molecule([0.0, 10100.0])
+            agg = Aggregate([m1, m2])
+            agg.set_resonance_coupling(0, 1, 80.0)
+        agg.build()
+
+        self.ham = agg.get_Hamiltonian()
+        sbi = TestSystemBathInteraction("dimer-2-env")
+        self.hy = KTHierarchy(self.ham, sbi, 3)
+        self.time = TimeAxis(0.0, 200, 2.0)
+
+
+    def test_batched_kernel(self):
+        """Testing batched HEOM kernel against single initial conditions
+
+        """
+        N = self.hy.dim
+        Kb = self.hy.get_kernel(self.time)
+
+        self.assertEqual(Kb.shape, (self.time.length, N, N, N, N))
+
+        qhp = self.hy._QHPsop()
+        phq = self.hy._PHQsop()
+        tier1 = self.hy.np1[0,:]
+        prop = KTHierarchyPropagator(self.time, self.hy)
+
+        for (k, l) in [(1, 1), (1, 2), (0, 2)]:
+            ado = numpy.zeros((self.hy.hsize, N, N), dtype=numpy.complex128)
+            ado[tier1,:,:] = qhp[:,:,:,k,l]
+            adot = prop._propagate_ados(ado, slevel=1, store=tier1)
+            Ks = -numpy.einsum("qijab,tqab->tij", phq, adot)
+
+            numpy.testing.assert_allclose(Kb[:,:,:,k,l], Ks, rtol=1.0e-8,
+                                          atol=1.0e-14)
+
+        # the hierarchy itself is not affected
+        numpy.testing.assert_allclose(self.hy.ado, 0.0)
+
+
+    def test_kernel_reproduces_heom(self):
+        """Testing that the HEOM kernel reproduces the HEOM dynamics
+
+        """
+        K = self.hy.get_kernel(self.time)
+
+        rhoi = ReducedDensityMatrix(dim=self.hy.dim)
+        rhoi.data[2,2] = 1.0
+        rhot = KTHierarchyPropagator(self.time, self.hy).propagate(rhoi)
+
+        # time non-local equation solved by the Heun method
+        HH = self.ham.data
+        dt = self.time.step
+        Nt = self.time.length
+        rho = numpy.zeros((Nt, self.hy.dim, self.hy.dim),
+                          dtype=numpy.complex128)
+        rho[0,:,:] = rhoi.data
+
+        def rhs(n, rr):
+            drho = -1j*(numpy.dot(HH, rr) - numpy.dot(rr, HH))
+            if n > 0:
+                ww = numpy.ones(n+1)*dt
+                ww[0] = ww[-1] = 0.5*dt
+                drho -= numpy.einsum("t,tijkl,tkl->ij", ww, K[:n+1],
+                                     rho[n::-1])
+            return drho
+
+        for n in range(Nt-1):
+            k1 = rhs(n, rho[n,:,:])
+            rho[n+1,:,:] = rho[n,:,:] + dt*k1
+            k2 = rhs(n+1, rho[n+1,:,:])
+            rho[n+1,:,:] = rho[n,:,:] + 0.5*dt*(k1 + k2)
+
+        numpy.testing.assert_allclose(rho[:,1:,1:], rhot.data[:,1:,1:],
+                                      atol=2.0e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()
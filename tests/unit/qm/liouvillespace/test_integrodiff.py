@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy
+import scipy.linalg
+
+"""
+*******************************************************************************
+
+
+    Tests of the quantarhei.qm.liouvillespace.integrodiff module
+
+
+*******************************************************************************
+"""
+
+from quantarhei import Hamiltonian
+from quantarhei import TimeAxis
+from quantarhei import ReducedDensityMatrix
+from quantarhei.qm import LindbladForm
+from quantarhei.qm import SystemBathInteraction
+from quantarhei.qm import ProjectionOperator
+
+from quantarhei.qm.liouvillespace.integrodiff.integrodiff \
+     import IntegrodiffPropagator
+
+
+class TestIntegrodiffPropagator(unittest.TestCase):
+    """Tests of the IntegrodiffPropagator class
+
+
+    """
+
+    def setUp(self):
+
+        self.time = TimeAxis(0.0, 200, 0.5)
+        self.ham = Hamiltonian(data=[[0.0, 0.1],
+                                     [0.1, 0.01]])
+
+        K01 = ProjectionOperator(0, 1, self.ham.dim)
+        K10 = ProjectionOperator(1, 0, self.ham.dim)
+        sbi = SystemBathInteraction(sys_operators=[K01, K10],
+                                    rates=[1.0/30.0, 1.0/20.0])
+        self.lbf = LindbladForm(self.ham, sbi, as_operators=False)
+
+        self.ctime = 20.0
+        decay = numpy.exp(-self.time.data/self.ctime)
+        self.kernel = -self.lbf.data[numpy.newaxis,:,:,:,:]* \
+                       decay[:,numpy.newaxis,numpy.newaxis,
+                             numpy.newaxis,numpy.newaxis]
+
+        self.rhoi = ReducedDensityMatrix(data=[[0.0, 0.0],[0.0, 1.0]])
+
+
+    def test_solve_method(self):
+        """Testing that the linear solve method equals the resolvent one
+
+        """
+        for ker in [None, self.kernel]:
+            ip1 = IntegrodiffPropagator(self.time, self.ham, kernel=ker)
+            ip2 = IntegrodiffPropagator(self.time, self.ham, kernel=ker,
+                                        method="solve")
+            self.assertIsNone(ip2.resolv)
+            # Fourier transform of the kernel is not stored
+            self.assertIsNone(ip2.fftKernel)
+
+            rhot1 = ip1.propagate(self.rhoi)
+            rhot2 = ip2.propagate(self.rhoi)
+
+            numpy.testing.assert_allclose(rhot2.data, rhot1.data,
+                                          rtol=1.0e-8, atol=1.0e-12)
+
+
+    def test_direct_convolution(self):
+        """Testing that repeated convolutions at one time do not accumulate
+
+        """
+        ip = IntegrodiffPropagator(self.time, self.ham, kernel=self.kernel,
+                                   method="direct")
+        rhot = ip.propagate(self.rhoi)
+
+        tn = 50
+        rho = rhot.data[tn,:,:]
+        conv1 = ip._convolution_with_kernel(tn, rho, rhot)
+        hist = ip.last_int.copy()
+        conv2 = ip._convolution_with_kernel(tn, rho, rhot)
+
+        numpy.testing.assert_array_equal(conv2, conv1)
+        numpy.testing.assert_array_equal(ip.last_int, hist)
+
+
+    def test_exponential_method(self):
+        """Testing propagation with a sum-of-exponentials kernel
+
+        """
+        # without the kernel, the dynamics is unitary
+        ip = IntegrodiffPropagator(self.time, self.ham, method="exponential")
+        rhot = ip.propagate(self.rhoi)
+        for ti in [1, 57, 199]:
+            UU = scipy.linalg.expm(-1j*self.ham.data*self.time.data[ti])
+            rho = numpy.dot(UU, numpy.dot(self.rhoi.data, numpy.conj(UU.T)))
+            numpy.testing.assert_allclose(rhot.data[ti,:,:], rho,
+                                          atol=1.0e-10)
+
+        # exponential kernel is fitted exactly
+        ip = IntegrodiffPropagator(self.time, self.ham, kernel=self.kernel,
+                                   method="exponential", nexp=1)
+        numpy.testing.assert_allclose(ip.exp_rates, [1.0/self.ctime])
+        numpy.testing.assert_allclose(ip.exp_amplitudes[0,...],
+                                      -self.lbf.data, atol=1.0e-12)
+        self.assertTrue(ip.exp_fit_error < 1.0e-10)
+        rhot = ip.propagate(self.rhoi)
+
+        # memory kernel equation integrated with the Heun method
+        # on a finer grid
+        Nref = 10
+        dt = self.time.step/Nref
+        Nt = (self.time.length - 1)*Nref + 1
+        tt = dt*numpy.arange(Nt)
+        KK = numpy.einsum("ijkl,t->tijkl", -self.lbf.data,
+                          numpy.exp(-tt/self.ctime))
+        HH = self.ham.data
+        rho = numpy.zeros((Nt, 2, 2), dtype=numpy.complex128)
+        rho[0,:,:] = self.rhoi.data
+
+        def rhs(n, rr):
+            drho = -1j*(numpy.dot(HH, rr) - numpy.dot(rr, HH))
+            if n > 0:
+                ww = numpy.ones(n+1)*dt
+                ww[0] = ww[-1] = 0.5*dt
+                hist = rho[n::-1,:,:].copy()
+                hist[0,:,:] = rr
+                drho -= numpy.einsum("t,tijkl,tkl->ij", ww, KK[:n+1], hist)
+            return drho
+
+        for n in range(Nt-1):
+            k1 = rhs(n, rho[n,:,:])
+            rho[n+1,:,:] = rho[n,:,:] + dt*k1
+            k2 = rhs(n+1, rho[n+1,:,:])
+            rho[n+1,:,:] = rho[n,:,:] + 0.5*dt*(k1 + k2)
+
+        numpy.testing.assert_allclose(rhot.data, rho[::Nref,:,:], atol=1.0e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import numpy
+
+"""
+*******************************************************************************
+
+
+    Tests of the compact secular form of relaxation tensors
+
+
+*******************************************************************************
+"""
+
+import quantarhei as qr
+import quantarhei.models.modelgenerator as mgen
+
+from quantarhei.qm.liouvillespace.secular import secular_mask
+
+
+class TestCompactSecular(unittest.TestCase):
+    """Tests of the compact representation of secular relaxation tensors
+
+
+    """
+
+    def setUp(self):
+
+        self.time = qr.TimeAxis(0.0, 300, 1.0)
+        mg = mgen.ModelGenerator()
+        agg = mg.get_Aggregate_with_environment(name="trimer-1_env",
+                                                timeaxis=self.time)
+        agg.build()
+
+        self.sbi = agg.get_SystemBathInteraction()
+        self.ham = agg.get_Hamiltonian()
+
+        self.rho = qr.ReducedDensityMatrix(dim=self.ham.dim)
+        self.rho.data[3,3] = 1.0
+        self.rho.data[1,3] = 0.5
+        self.rho.data[3,1] = 0.5
+
+
+    def test_secular_mask(self):
+        """Testing the mask of secular tensor elements
+
+        """
+        N = 3
+        mask = secular_mask(N)
+        for ii in range(N):
+            for jj in range(N):
+                for kk in range(N):
+                    for ll in range(N):
+                        self.assertEqual(mask[ii,jj,kk,ll],
+                                         ((ii == jj) and (kk == ll))
+                                         or ((ii == kk) and (jj == ll)))
+
+
+    def test_compact_vs_dense(self):
+        """Testing compact secular Redfield tensor against the dense one
+
+        """
+        with qr.eigenbasis_of(self.ham):
+            R1 = qr.qm.RedfieldRelaxationTensor(self.ham, self.sbi)
+            R1.secularize()
+            R2 = qr.qm.RedfieldRelaxationTensor(self.ham, self.sbi)
+            R2.secularize(legacy=False)
+
+            RR = R1.data.copy()
+
+        self.assertTrue(R2.secular_compact)
+        self.assertIsNone(R2._data)
+        self.assertEqual(R2.secular_KK.shape, (4, 4))
+        numpy.testing.assert_allclose(R2.secular_KK,
+                                      numpy.einsum("iijj->ij", RR))
+
+        # application in the site basis
+        numpy.testing.assert_allclose(R2.apply(self.rho).data,
+                                      R1.apply(self.rho).data,
+                                      atol=1.0e-12)
+
+        # propagation in the site basis and in the excitonic basis
+        prop1 = qr.ReducedDensityMatrixPropagator(self.time, self.ham, R1)
+        prop2 = qr.ReducedDensityMatrixPropagator(self.time, self.ham, R2)
+        numpy.testing.assert_allclose(prop2.propagate(self.rho).data,
+                                      prop1.propagate(self.rho).data,
+                                      atol=1.0e-10)
+        with qr.eigenbasis_of(self.ham):
+            rhot1 = prop1.propagate(self.rho).data.copy()
+            rhot2 = prop2.propagate(self.rho).data.copy()
+        numpy.testing.assert_allclose(rhot2, rhot1, atol=1.0e-10)
+
+
+    def test_compact_from_operators(self):
+        """Testing compact secular form calculated from operators
+
+        """
+        with qr.eigenbasis_of(self.ham):
+            R1 = qr.qm.RedfieldRelaxationTensor(self.ham, self.sbi)
+            R1.secularize(legacy=False)
+            R2 = qr.qm.RedfieldRelaxationTensor(self.ham, self.sbi,
+                                                as_operators=True)
+            R2.secularize(legacy=False)
+
+            T1 = qr.qm.TDRedfieldRelaxationTensor(self.ham, self.sbi)
+            T1.secularize(legacy=False)
+            T2 = qr.qm.TDRedfieldRelaxationTensor(self.ham, self.sbi,
+                                                  as_operators=True)
+            T2.secularize(legacy=False)
+
+        # the dense tensor is never constructed
+        for RR in [R2, T2]:
+            self.assertTrue(RR.secular_compact)
+            self.assertFalse(RR.as_operators)
+            self.assertIsNone(RR._data)
+            self.assertIsNone(RR._Lm)
+
+        numpy.testing.assert_allclose(R2.secular_KK, R1.secular_KK,
+                                      atol=1.0e-14)
+        numpy.testing.assert_allclose(R2.secular_GG, R1.secular_GG,
+                                      atol=1.0e-14)
+        self.assertTrue(T2.secular_time_dependent)
+        numpy.testing.assert_allclose(T2.secular_KK, T1.secular_KK,
+                                      atol=1.0e-14)
+        numpy.testing.assert_allclose(T2.secular_GG, T1.secular_GG,
+                                      atol=1.0e-14)
+
+        prop1 = qr.ReducedDensityMatrixPropagator(self.time, self.ham, R1)
+        prop2 = qr.ReducedDensityMatrixPropagator(self.time, self.ham, R2)
+        numpy.testing.assert_allclose(prop2.propagate(self.rho).data,
+                                      prop1.propagate(self.rho).data,
+                                      atol=1.0e-10)
+
+        # methods which need the tensor data refuse the compact form
+        with self.assertRaises(Exception) as ctx:
+            prop2.propagate(self.rho, method="primitive")
+        self.assertIn("Compact secular", str(ctx.exception))
+
+
+    def test_compact_evolution_superoperator(self):
+        """Testing EvolutionSuperOperator with compact secular tensor
+
+        """
+        time = qr.TimeAxis(0.0, 40, 5.0)
+        with qr.eigenbasis_of(self.ham):
+            R1 = qr.qm.RedfieldRelaxationTensor(self.ham, self.sbi)
+            R1.secularize()
+            R2 = qr.qm.RedfieldRelaxationTensor(self.ham, self.sbi)
+            R2.secularize(legacy=False)
+
+            U1 = qr.qm.EvolutionSuperOperator(time, self.ham, R1)
+            U1.set_dense_dt(5)
+            U1.calculate()
+            U2 = qr.qm.EvolutionSuperOperator(time, self.ham, R2)
+            U2.set_dense_dt(5)
+            U2.calculate()
+
+            numpy.testing.assert_allclose(U2.data, U1.data, atol=1.0e-10)
+
+
+    def test_compact_time_dependent(self):
+        """Testing compact secular time-dependent Redfield tensor
+
+        """
+        with qr.eigenbasis_of(self.ham):
+            R1 = qr.qm.TDRedfieldRelaxationTensor(self.ham, self.sbi)
+            R1.secularize()
+            R2 = qr.qm.TDRedfieldRelaxationTensor(self.ham, self.sbi)
+            R2.secularize(legacy=False)
+
+        self.assertTrue(R2.secular_time_dependent)
+
+        prop1 = qr.ReducedDensityMatrixPropagator(self.time, self.ham, R1)
+        prop2 = qr.ReducedDensityMatrixPropagator(self.time, self.ham, R2)
+        numpy.testing.assert_allclose(prop2.propagate(self.rho).data,
+                                      prop1.propagate(self.rho).data,
+                                      atol=1.0e-10)
+
+
+    def test_secular_propagator(self):
+        """Testing closed form propagation with compact secular tensor
+
+        """
+        with qr.eigenbasis_of(self.ham):
+            R2 = qr.qm.RedfieldRelaxationTensor(self.ham, self.sbi)
+            R2.secularize(legacy=False)
+
+        prop = qr.ReducedDensityMatrixPropagator(self.time, self.ham, R2)
+        prop.setDtRefinement(10)
+        rhot1 = prop.propagate(self.rho)
+        rhot2 = prop.propagate(self.rho, method="secular")
+
+        numpy.testing.assert_allclose(rhot2.data, rhot1.data, atol=1.0e-8)
+
+        sprop = qr.SecularPropagator(self.time, self.ham, R2)
+        with qr.eigenbasis_of(self.ham):
+            pops = sprop.propagate_populations(self.rho)
+            cohs = sprop.propagate_coherences(self.rho)
+            rhot = rhot1.data.copy()
+
+        dg = numpy.arange(self.ham.dim)
+        numpy.testing.assert_allclose(pops, numpy.real(rhot[:,dg,dg]),
+                                      atol=1.0e-8)
+        rhot[:,dg,dg] = 0.0
+        numpy.testing.assert_allclose(cohs, rhot, atol=1.0e-8)
+
+        # non-secular tensors are refused
+        with qr.eigenbasis_of(self.ham):
+            R1 = qr.qm.RedfieldRelaxationTensor(self.ham, self.sbi)
+            R1.secularize()
+        with self.assertRaises(Exception):
+            qr.SecularPropagator(self.time, self.ham, R1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -122,3 +122,39 @@ class TDTestRedfield(unittest.TestCase):
                 
             
 
+        
+        
+    def test_operators_and_tensor_forms(self):
+        """Testing that operator and tensor forms of TD Redfield are compatible
+        
+        
+        """
+        RT = TDRedfieldRelaxationTensor(self.H1, self.sbi1)
+        RO = TDRedfieldRelaxationTensor(self.H1, self.sbi1, as_operators=True)
+        
+        RC = RO._convert_operators_2_tensor(RO.Km, RO.Lm, RO.Ld)
+        
+        numpy.testing.assert_allclose(RT.data, RC)
+        
+        
+    def test_markov_compression(self):
+        """Testing compressed storage of TD Redfield operators
+        
+        
+        """
+        RO = TDRedfieldRelaxationTensor(self.H1, self.sbi1, as_operators=True)
+        RC = TDRedfieldRelaxationTensor(self.H1, self.sbi1, as_operators=True,
+                                        markov_tolerance=1.0e-3)
+        
+        Nc = RC.Lm.shape[0]
+        self.assertTrue(Nc < RO.Lm.shape[0])
+        self.assertTrue(RC._has_cutoff_time)
+        
+        # stored part is unchanged
+        numpy.testing.assert_allclose(RC.Lm, RO.Lm[0:Nc,...])
+        
+        # the rest is converged
+        Lmax = numpy.max(numpy.abs(RO.Lm[-1,...]))
+        numpy.testing.assert_allclose(RO.Lm[Nc:,...],
+            numpy.broadcast_to(RC.Lm[-1,...], RO.Lm[Nc:,...].shape),
+            atol=2.0e-3*Lmax)
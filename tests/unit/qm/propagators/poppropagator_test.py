@@ -2,6 +2,7 @@
 
 import unittest
 import numpy
+import scipy.linalg
 
 """
 *******************************************************************************
@@ -79,4 +80,49 @@ class TestPopulationPropagator(unittest.TestCase):
         
         for n in range(Ntd):
             numpy.testing.assert_allclose(U[:,:,n],Ucheck[:,:,n])
+
+
+    def test_of_population_propagation(self):
+        """Testing propagation of population vectors"""
+        
+        KK = numpy.array([[-1.0/100.0,  1.0/100.0],
+                          [ 1.0/100.0, -1.0/100.0]])
+        
+        t = TimeAxis(0.0, 1000, 1.0)
+        prop = PopulationPropagator(t, rate_matrix=KK)
+        
+        pops = prop.propagate([1.0, 0.0])
+        self.assertEqual(pops.shape, (t.length, 2))
+        numpy.testing.assert_allclose(pops[:,0],
+                                0.5*(1.0+numpy.exp(2.0*KK[0,0]*t.data)))
+        numpy.testing.assert_allclose(pops[:,1],
+                                0.5*(1.0-numpy.exp(2.0*KK[0,0]*t.data)))
+        
+        # several initial conditions at once
+        pini = numpy.array([[1.0, 0.0], [0.3, 0.7]])
+        pops = prop.propagate(pini)
+        self.assertEqual(pops.shape, (t.length, 2, 2))
+        for ii in range(2):
+            numpy.testing.assert_allclose(pops[:,ii,:], 
+                                          prop.propagate(pini[ii,:]))
+
+
+
+    def test_of_defective_rate_matrix(self):
+        """Testing propagation with a defective rate matrix"""
+        
+        # irreversible cascade with equal rates
+        kk = 1.0/50.0
+        KK = numpy.array([[-kk, 0.0, 0.0],
+                          [ kk, -kk, 0.0],
+                          [0.0,  kk, 0.0]])
+        
+        t = TimeAxis(0.0, 500, 1.0)
+        prop = PopulationPropagator(t, rate_matrix=KK)
+        
+        pops = prop.propagate([1.0, 0.0, 0.0])
+        Uex = numpy.array([scipy.linalg.expm(KK*tt) for tt in t.data])
+        numpy.testing.assert_allclose(pops, Uex[:,:,0], atol=1.0e-10)
         
+        U = prop.get_evolution(t.data[::50])
+        numpy.testing.assert_allclose(U, Uex[::50,:,:], atol=1.0e-10)
@@ -95,5 +95,284 @@ class TestRDMPropagator(unittest.TestCase):
         
 
 
+    def test_rdm_evolution_streaming(self):
+        """Testing streaming of the density matrix and observables
+        
+        """
+        HH = qr.Hamiltonian(data=[[0.0, 0.0, 0.0],
+                                  [0.0, 1.0, 0.1],
+                                  [0.0, 0.1, 1.1]])
+        ops = [qr.qm.ProjectionOperator(1, 2, dim=3),
+               qr.qm.ProjectionOperator(0, 1, dim=3)]
+        sbi = qr.qm.SystemBathInteraction(sys_operators=ops,
+                                          rates=[1.0/10.0, 1.0/30.0])
+        LL = qr.qm.LindbladForm(HH, sbi, as_operators=False)
+        time = qr.TimeAxis(0.0, 200, 0.1)
+        
+        prop = qr.ReducedDensityMatrixPropagator(time, Ham=HH, RTensor=LL)
+        rho_ini = qr.ReducedDensityMatrix(dim=3)
+        rho_ini.data[1:,1:] = 0.5
+        
+        rhot = prop.propagate(rho_ini)
+        
+        # density matrices are identical to those of the full propagation
+        out = list(prop.propagate_iter(rho_ini))
+        self.assertEqual(len(out), time.length)
+        numpy.testing.assert_allclose([t for (t, rho) in out], time.data)
+        numpy.testing.assert_array_equal([rho for (t, rho) in out], 
+                                         rhot.data)
+        
+        # populations with decimation
+        out = list(prop.propagate_iter(rho_ini, observables="populations",
+                                       decimate=7))
+        self.assertEqual(len(out), 29)
+        pops = numpy.array([p for (t, p) in out])
+        numpy.testing.assert_allclose(pops, 
+            numpy.real(numpy.einsum("tii->ti", rhot.data[::7,:,:])))
+        
+        # expectation values of operators
+        AA = [qr.qm.ProjectionOperator(1, 1, dim=3), 
+              qr.qm.ProjectionOperator(2, 1, dim=3).data]
+        vals = numpy.array([v for (t, v) in 
+                            prop.propagate_iter(rho_ini, observables=AA)])
+        numpy.testing.assert_allclose(vals[:,0], rhot.data[:,1,1])
+        numpy.testing.assert_allclose(vals[:,1], rhot.data[:,1,2])
+        
+        # a function of the density matrix
+        trs = [v for (t, v) in prop.propagate_iter(rho_ini, 
+                                                   observables=numpy.trace)]
+        numpy.testing.assert_allclose(trs, numpy.ones(time.length))
+        
+        with self.assertRaises(Exception):
+            next(prop.propagate_iter(rho_ini, method="primitive"))
+        
+        
+    def test_rdm_evolution_streaming_tensor_forms(self):
+        """Testing streaming with operator-form, time-dependent and compact secular tensors
+        
+        """
+        import quantarhei.models.modelgenerator as mgen
+        
+        time = qr.TimeAxis(0.0, 100, 1.0)
+        mg = mgen.ModelGenerator()
+        agg = mg.get_Aggregate_with_environment(name="trimer-1_env",
+                                                timeaxis=time)
+        agg.build()
+        sbi = agg.get_SystemBathInteraction()
+        HH = agg.get_Hamiltonian()
+        
+        rho_ini = qr.ReducedDensityMatrix(dim=HH.dim)
+        rho_ini.data[3,3] = 1.0
+        rho_ini.data[1,3] = 0.5
+        rho_ini.data[3,1] = 0.5
+        
+        with qr.eigenbasis_of(HH):
+            tensors = [
+                qr.qm.RedfieldRelaxationTensor(HH, sbi, as_operators=True),
+                qr.qm.TDRedfieldRelaxationTensor(HH, sbi),
+                qr.qm.TDRedfieldRelaxationTensor(HH, sbi, as_operators=True)]
+            RS = qr.qm.RedfieldRelaxationTensor(HH, sbi)
+            RS.secularize(legacy=False)
+            TS = qr.qm.TDRedfieldRelaxationTensor(HH, sbi)
+            TS.secularize(legacy=False)
+            tensors += [RS, TS]
+        
+        for RR in tensors:
+            prop = qr.ReducedDensityMatrixPropagator(time, Ham=HH, 
+                                                     RTensor=RR)
+            rhot = prop.propagate(rho_ini)
+            out = list(prop.propagate_iter(rho_ini))
+            self.assertEqual(len(out), time.length)
+            numpy.testing.assert_allclose([rho for (t, rho) in out], 
+                                          rhot.data, rtol=1.0e-12, 
+                                          atol=1.0e-14)
+            
+        # operator form is streamed with pure dephasing, too
+        ops = [qr.qm.ProjectionOperator(1, 2, dim=4),
+               qr.qm.ProjectionOperator(0, 1, dim=4)]
+        lsbi = qr.qm.SystemBathInteraction(sys_operators=ops,
+                                           rates=[1.0/10.0, 1.0/30.0])
+        LL = qr.qm.LindbladForm(HH, lsbi, as_operators=True)
+        drates = numpy.zeros((4, 4))
+        drates[0,1:] = drates[1:,0] = 1.0/20.0
+        DD = qr.qm.PureDephasing(drates=drates, dtype="Lorentzian")
+        prop = qr.ReducedDensityMatrixPropagator(time, Ham=HH, RTensor=LL,
+                                                 PDeph=DD)
+        rhot = prop.propagate(rho_ini)
+        pops = numpy.array([p for (t, p) in 
+                prop.propagate_iter(rho_ini, observables="populations")])
+        numpy.testing.assert_allclose(pops, 
+                numpy.real(numpy.einsum("tii->ti", rhot.data)), rtol=1.0e-12,
+                atol=1.0e-14)
+        
+        
+    def test_rdm_evolution_observables(self):
+        """Testing propagation of expectation values in both pictures
+        
+        """
+        HH = qr.Hamiltonian(data=[[0.0, 0.0, 0.0],
+                                  [0.0, 1.0, 0.1],
+                                  [0.0, 0.1, 1.1]])
+        ops = [qr.qm.ProjectionOperator(1, 2, dim=3),
+               qr.qm.ProjectionOperator(0, 1, dim=3)]
+        sbi = qr.qm.SystemBathInteraction(sys_operators=ops,
+                                          rates=[1.0/10.0, 1.0/30.0])
+        LL = qr.qm.LindbladForm(HH, sbi, as_operators=False)
+        drates = numpy.zeros((3, 3))
+        drates[0,1:] = drates[1:,0] = 1.0/20.0
+        DD = qr.qm.PureDephasing(drates=drates, dtype="Lorentzian")
+        time = qr.TimeAxis(0.0, 100, 0.5)
+        
+        prop = qr.ReducedDensityMatrixPropagator(time, Ham=HH, RTensor=LL,
+                                                 PDeph=DD)
+        prop.setDtRefinement(5)
+        rhos = [qr.ReducedDensityMatrix(dim=3) for k in range(4)]
+        rhos[0].data[1,1] = 1.0
+        rhos[1].data[2,2] = 1.0
+        rhos[2].data[:,:] = 1.0/3.0
+        rhos[3].data[1:,1:] = 0.5
+        
+        AA = [qr.qm.ProjectionOperator(1, 1, dim=3), 
+              qr.qm.ProjectionOperator(1, 2, dim=3)]
+        
+        vals_s = prop.propagate_observables(rhos, AA, picture="Schrodinger")
+        vals_h = prop.propagate_observables(rhos, AA, picture="Heisenberg")
+        self.assertEqual(vals_h.shape, (time.length, 4, 2))
+        self.assertTrue(numpy.iscomplexobj(vals_h))
+        numpy.testing.assert_allclose(vals_h, vals_s, rtol=1.0e-10,
+                                      atol=1.0e-12)
+        for (k, rho) in enumerate(rhos):
+            rhot = prop.propagate(rho)
+            numpy.testing.assert_allclose(vals_s[:,k,0], rhot.data[:,1,1])
+            numpy.testing.assert_allclose(vals_s[:,k,1], rhot.data[:,2,1])
+            
+        # populations of a single initial condition are real
+        pops = prop.propagate_observables(rhos[2], "populations")
+        self.assertEqual(pops.shape, (time.length, 3))
+        self.assertFalse(numpy.iscomplexobj(pops))
+        rhot = prop.propagate(rhos[2])
+        numpy.testing.assert_allclose(pops, 
+                        numpy.real(numpy.einsum("tii->ti", rhot.data)))
+        
+        # coherence as the initial condition gives complex populations
+        rho_coh = qr.ReducedDensityMatrix(dim=3)
+        rho_coh.data[1,2] = 1.0
+        rhot_coh = prop.propagate(rho_coh)
+        for picture in ["Schrodinger", "Heisenberg"]:
+            pops = prop.propagate_observables([rho_coh], "populations",
+                                              picture=picture)
+            self.assertTrue(numpy.iscomplexobj(pops))
+            self.assertTrue(numpy.max(numpy.abs(numpy.imag(pops))) > 0.01)
+            numpy.testing.assert_allclose(pops[:,0,:], 
+                        numpy.einsum("tii->ti", rhot_coh.data), atol=1.0e-12)
+        
+        # projection mask selecting coherences
+        mask = numpy.zeros((3, 3), dtype=bool)
+        mask[0,1] = mask[1,2] = True
+        cohs = prop.propagate_observables(rhos[2], mask, picture="Heisenberg")
+        numpy.testing.assert_allclose(cohs[:,0], rhot.data[:,0,1])
+        numpy.testing.assert_allclose(cohs[:,1], rhot.data[:,1,2])
+        
+        # generators with time-dependent dephasing
+        prop = qr.ReducedDensityMatrixPropagator(time, Ham=HH, RTensor=LL,
+                PDeph=qr.qm.PureDephasing(drates=drates, dtype="Gaussian"))
+        with self.assertRaises(Exception):
+            prop.propagate_observables(rhos, AA, picture="Heisenberg")
+        
+        
+    def test_rdm_evolution_observables_streaming(self):
+        """Testing that observables are streamed with all tensor forms
+        
+        """
+        import quantarhei.models.modelgenerator as mgen
+        
+        time = qr.TimeAxis(0.0, 100, 1.0)
+        mg = mgen.ModelGenerator()
+        agg = mg.get_Aggregate_with_environment(name="trimer-1_env",
+                                                timeaxis=time)
+        agg.build()
+        sbi = agg.get_SystemBathInteraction()
+        HH = agg.get_Hamiltonian()
+        
+        rhos = [qr.ReducedDensityMatrix(dim=HH.dim) for k in range(2)]
+        rhos[0].data[3,3] = 1.0
+        rhos[1].data[1:,1:] = 1.0/3.0
+        AA = [qr.qm.ProjectionOperator(1, 1, dim=HH.dim), 
+              qr.qm.ProjectionOperator(1, 3, dim=HH.dim)]
+        
+        with qr.eigenbasis_of(HH):
+            RO = qr.qm.RedfieldRelaxationTensor(HH, sbi, as_operators=True)
+            TD = qr.qm.TDRedfieldRelaxationTensor(HH, sbi)
+            RS = qr.qm.RedfieldRelaxationTensor(HH, sbi)
+            RS.secularize(legacy=False)
+            
+        def refuse(*args, **kwargs):
+            raise Exception("The evolution must not be stored")
+        
+        for RR in [RO, TD, RS]:
+            prop = qr.ReducedDensityMatrixPropagator(time, Ham=HH, 
+                                                     RTensor=RR)
+            refs = [prop.propagate(rho) for rho in rhos]
+            
+            prop.propagate = refuse
+            for picture in ["auto", "Schrodinger"]:
+                vals = prop.propagate_observables(rhos, AA, picture=picture)
+                self.assertEqual(vals.shape, (time.length, 2, 2))
+                for (k, rhot) in enumerate(refs):
+                    numpy.testing.assert_allclose(vals[:,k,0], 
+                                                  rhot.data[:,1,1],
+                                                  rtol=1.0e-12, atol=1.0e-14)
+                    numpy.testing.assert_allclose(vals[:,k,1], 
+                                                  rhot.data[:,3,1],
+                                                  rtol=1.0e-12, atol=1.0e-14)
+        
+        
     def test_rdm_evolution_Saveable(self):
         pass
+
+
+    def test_rdm_evolution_magnus_EField(self):
+        """Testing field driven evolution with precomputed field
+        
+        """
+        with qr.energy_units("1/cm"):
+            m1 = qr.Molecule([0.0, 12000.0])
+            m2 = qr.Molecule([0.0, 12100.0])
+            m1.set_dipole(0, 1, [1.0, 0.0, 0.0])
+            m2.set_dipole(0, 1, [0.3, 1.0, 0.0])
+            agg = qr.Aggregate([m1, m2])
+            agg.set_resonance_coupling(0, 1, 50.0)
+            om = qr.convert(12050.0, "1/cm", "int")
+        agg.build()
+        
+        HH = agg.get_Hamiltonian()
+        DD = agg.get_TransitionDipoleMoment()
+        ops = [qr.qm.ProjectionOperator(1, 0, 3), 
+               qr.qm.ProjectionOperator(2, 1, 3)]
+        sbi = qr.qm.SystemBathInteraction(sys_operators=ops, 
+                                          rates=[1.0/100.0, 1.0/50.0])
+        LL = qr.qm.LindbladForm(HH, sbi, as_operators=False)
+        HH.set_rwa([0, 1])
+        
+        rho_ini = qr.ReducedDensityMatrix(dim=3)
+        rho_ini.data[0,0] = 1.0
+        params = dict(Emax=0.05, fwhm=20.0, tc=60.0)
+        
+        # reference by the short-exp method on a fine grid
+        Nf = 50
+        tf = TimeAxis(0.0, 150*Nf+1, 1.0/Nf)
+        ef = qr.EField(tf, omega=om, polar=[1.0, 0.2, 0.0], params=params)
+        prop = ReducedDensityMatrixPropagator(tf, HH, LL, Trdip=DD, 
+                                              Efield=ef)
+        rhot_1 = prop.propagate(rho_ini).data[::Nf,:,:]
+        
+        time = TimeAxis(0.0, 151, 1.0)
+        ef = qr.EField(time, omega=om, polar=[1.0, 0.2, 0.0], params=params)
+        prop = ReducedDensityMatrixPropagator(time, HH, LL, Trdip=DD, 
+                                              Efield=ef)
+        prop.setDtRefinement(5)
+        rhot_2 = prop.propagate(rho_ini, method="magnus")
+        
+        self.assertTrue(rhot_2.is_in_rwa)
+        self.assertTrue(numpy.max(numpy.abs(rhot_2.data[-1,1:,1:])) > 0.1)
+        numpy.testing.assert_allclose(rhot_2.data, rhot_1, atol=1.0e-5)
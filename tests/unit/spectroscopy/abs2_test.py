@@ -187,3 +187,52 @@ class TestAbs(unittest.TestCase):
         except:
             raise Exception('Absorption not calculatable for aggregate')
 
+            
+            
+    def test_abs_calculator_transitions(self):
+        """Testing vectorized absorption spectrum of an aggregate
+        
+        """
+        with energy_units("1/cm"):
+            mols = []
+            for ii in range(3):
+                mol = Molecule(elenergies=[0.0, 12000.0+50.0*ii])
+                mol.set_dipole(0,1,[numpy.cos(ii), numpy.sin(ii), 0.3*ii])
+                params = dict(ftype="OverdampedBrownian", reorg=20,
+                              cortime=100, T=300)
+                cf = CorrelationFunction(self.ta, params)
+                mol.set_transition_environment((0,1),cf)
+                mols.append(mol)
+            
+            agg = Aggregate(molecules=mols)
+            agg.set_resonance_coupling(0, 1, 100.0)
+            agg.set_resonance_coupling(1, 2, 100.0)
+        agg.build()
+        
+        abs_calc = AbsSpectrumCalculator(self.ta, system=agg)
+        with energy_units("1/cm"):
+            abs_calc.bootstrap(rwa=12000)
+        
+        spect = abs_calc.calculate(raw=True)
+        trans = abs_calc.calculate_transitions(raw=True)
+        
+        self.assertEqual(len(trans), 3)
+        numpy.testing.assert_allclose(numpy.sum([tr.data for tr in trans],
+                                                axis=0), spect.data,
+                                      atol=1.0e-10*numpy.max(spect.data))
+        
+        # transition by transition calculation
+        HH = agg.get_Hamiltonian()
+        SS = HH.diagonalize()
+        DD = agg.get_TransitionDipoleMoment()
+        DD.transform(SS)
+        with energy_units("int"):
+            for ii in range(1, HH.dim):
+                tr = {"ta":self.ta, "gg":[0.0],
+                      "dd":DD.dipole_strength(0,ii),
+                      "om":HH.data[ii,ii]-HH.data[0,0]-abs_calc.rwa,
+                      "ct":abs_calc._excitonic_coft(SS, agg, ii-1)}
+                data = numpy.real(abs_calc.one_transition_spectrum(tr))
+                numpy.testing.assert_allclose(trans[ii-1].data, data,
+                                        atol=1.0e-10*numpy.max(spect.data))
+        HH.transform(SS.T)
@@ -15,6 +15,8 @@ import numpy
 import tempfile
 
 from quantarhei.spectroscopy.abs import AbsSpectrumBase, AbsSpectrumDifference
+from quantarhei.spectroscopy.abs import AbsSpectrumFitModel
+from quantarhei.core.units import cm2int
 from quantarhei import FrequencyAxis
 from quantarhei import energy_units
 
@@ -155,6 +157,116 @@ class TestAbs(unittest.TestCase):
 #        p = ad.minimize(ini, method=method)
 #        
 #        numpy.testing.assert_array_almost_equal(p, [1.0, 11000.0, 100.0])
-
         
-        
\ No newline at end of file
+        
+    def _fit_model(self):
+        """Two transition model with Gaussian lineshapes
+        
+        """
+        ta = TimeAxis(0.0, 1000, 1.0)
+        self.ncalls = 0
+        def gauss(sig):
+            self.ncalls += 1
+            return ((sig*cm2int*ta.data)**2)/2.0
+        
+        with energy_units("1/cm"):
+            model = AbsSpectrumFitModel(ta, rwa=12000.0)
+            model.add_transition(frequency_index=0, dipole_strength_index=1,
+                                 lineshape=gauss, lineshape_parameters=[2])
+            model.add_transition(frequency_index=3, dipole_strength=0.5,
+                                 lineshape=gauss(150.0))
+        return model
+        
+        
+    def test_fit_model(self):
+        """Testing incremental evaluation and Jacobian of AbsSpectrumFitModel
+        
+        """
+        model = self._fit_model()
+        par = numpy.array([11900.0, 1.0, 100.0, 12200.0])
+        
+        full = model(par)
+        vals = model.evaluate(par)
+        numpy.testing.assert_allclose(vals, full.data)
+        
+        # changing the frequency of the second transition does not
+        # recalculate the lineshape of the first one
+        ncalls = self.ncalls
+        par2 = par.copy()
+        par2[3] = 12250.0
+        vals2 = model.evaluate(par2)
+        self.assertEqual(self.ncalls, ncalls)
+        numpy.testing.assert_allclose(vals2, model(par2).data)
+        
+        # Jacobian against explicit finite differences
+        jac = model.jacobian(par)
+        for kk in range(4):
+            hh = 1.0e-5*max(abs(par[kk]), 1.0)
+            pp = par.copy()
+            pm = par.copy()
+            pp[kk] += hh
+            pm[kk] -= hh
+            dd = (model(pp).data - model(pm).data)/(2.0*hh)
+            numpy.testing.assert_allclose(jac[kk,:], dd, 
+                                          atol=1.0e-3*numpy.max(numpy.abs(dd)))
+                
+                
+    def test_fit_model_transition_parameters(self):
+        """Testing specification of fixed and fitted transition parameters
+        
+        """
+        ta = TimeAxis(0.0, 1000, 1.0)
+        gt = ((100.0*cm2int*ta.data)**2)/2.0
+        
+        with energy_units("1/cm"):
+            model = AbsSpectrumFitModel(ta, rwa=12000.0)
+            
+            # integer values are fixed values, not parameter indices
+            model.add_transition(frequency=12100, dipole_strength=2,
+                                 lineshape=gt)
+            model.add_transition(frequency_index=0, lineshape=gt)
+            
+            with self.assertRaises(Exception):
+                model.add_transition(lineshape=gt)
+            with self.assertRaises(Exception):
+                model.add_transition(frequency=12100.0, frequency_index=0)
+            with self.assertRaises(Exception):
+                model.add_transition(frequency_index=0.0)
+                
+        vals = model.evaluate([12100.0])
+        jac = model.jacobian([12100.0])
+        self.assertEqual(jac.shape, (1, model.axis.length))
+        
+        # the fixed transition has twice the strength of the fitted one
+        with energy_units("1/cm"):
+            ref = AbsSpectrumFitModel(ta, rwa=12000.0)
+            ref.add_transition(frequency_index=0, dipole_strength=3.0,
+                               lineshape=gt)
+        numpy.testing.assert_allclose(vals, ref.evaluate([12100.0]),
+                                      rtol=1.0e-10, atol=1.0e-12)
+        
+        
+    def test_fit_model_minimize(self):
+        """Testing gradient based fitting with AbsSpectrumFitModel
+        
+        """
+        model = self._fit_model()
+        par0 = [11900.0, 1.0, 100.0, 12200.0]
+        target = model(par0)
+        
+        with energy_units("1/cm"):
+            ad = AbsSpectrumDifference(target=target, optfce=model,
+                                       bounds=(11500.0, 12600.0))
+        d = ad.difference(par0)
+        self.assertAlmostEqual(d, 0.0)
+        
+        # gradient against the difference function
+        par = numpy.array([11920.0, 0.8, 110.0, 12190.0])
+        grad = ad.gradient(par)
+        for kk in range(4):
+            hh = 1.0e-5*max(abs(par[kk]), 1.0)
+            pp = par.copy()
+            pp[kk] += hh
+            dd = (ad.difference(pp) - ad.difference(par))/hh
+            self.assertAlmostEqual(grad[kk]/dd, 1.0, places=2)
+
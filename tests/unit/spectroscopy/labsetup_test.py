@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+"""
+*******************************************************************************
+
+
+    Tests of the quantarhei.spectroscopy.labsetup module
+
+
+*******************************************************************************
+"""
+import numpy
+
+from quantarhei import LabSetup, EField
+from quantarhei import TimeAxis, FrequencyAxis
+from quantarhei.utils.vectors import X, Y
+
+
+class TestPulseBank(unittest.TestCase):
+    """Tests of the stacked pulse representation of LabSetup
+
+
+    """
+
+    def setUp(self):
+
+        self.time = TimeAxis(-100.0, 200, 1.0, atype="complete")
+        self.params = (dict(ptype="Gaussian", FWHM=30.0, amplitude=1.0),
+                       dict(ptype="Gaussian", FWHM=20.0, amplitude=2.0),
+                       dict(ptype="Gaussian", FWHM=10.0, amplitude=1.0))
+        self.lab = LabSetup()
+        self.lab.set_pulse_shapes(self.time, self.params)
+
+
+    def test_bank_vs_dfunctions(self):
+        """Testing pulse bank against pulse DFunctions
+
+        """
+        lab = self.lab
+        tt = numpy.array([-50.0, -30.0, 2.3, 30.0, 99.5])
+        envs = lab.get_pulse_envelops(tt)
+        self.assertEqual(envs.shape, (3, 5))
+        for k in range(3):
+            numpy.testing.assert_allclose(envs[k,:],
+                                          lab.pulse_t[k].at(tt))
+            numpy.testing.assert_allclose(lab.get_pulse_envelop(k, tt),
+                                          lab.pulse_t[k].at(tt))
+            self.assertAlmostEqual(lab.get_pulse_envelop(k, 2.3),
+                                   lab.pulse_t[k].at(2.3))
+
+        with self.assertRaises(Exception):
+            lab.get_pulse_envelops([200.0])
+
+        # Fourier transforms are calculated for all pulses at once
+        lab.convert_to_frequency()
+        for k in range(3):
+            ft = self.lab.pulse_bank_t.get_DFunctions()[k] \
+                     .get_Fourier_transform()
+            numpy.testing.assert_allclose(lab.pulse_f[k].data, ft.data)
+        self.assertIs(lab.pulse_bank_t.get_Fourier_transform(),
+                      lab.pulse_bank_f)
+
+        # and back
+        lab.convert_to_time()
+        numpy.testing.assert_allclose(
+                lab.get_pulse_envelops(self.time.data),
+                lab.pulse_bank_t.data, atol=1.0e-12)
+
+        # replaced pulses are picked up
+        lab.pulse_t[1] = lab.pulse_t[2]
+        numpy.testing.assert_allclose(lab.get_pulse_envelop(1, tt),
+                                      lab.get_pulse_envelop(2, tt))
+
+
+    def test_frequency_domain(self):
+        """Testing pulse bank in frequency domain
+
+        """
+        freq = FrequencyAxis(-100, 200, 1.0)
+        lab = LabSetup()
+        lab.set_pulse_shapes(freq, self.params)
+        vals1 = lab.get_pulse_spectra(freq.data)
+        lab.convert_to_time()
+        lab.convert_to_frequency()
+        vals2 = lab.get_pulse_spectra(freq.data)
+        numpy.testing.assert_allclose(vals2, vals1, atol=1.0e-12)
+
+
+    def test_fields(self):
+        """Testing fields of several pulses
+
+        """
+        time = TimeAxis(0.0, 500, 1.0)
+        tcs = [50.0, 150.0, 250.0]
+        oms = [0.1, 0.2, 0.3]
+        pols = [X, Y, X]
+
+        fld = EField(time, omega=oms, polar=pols,
+                     params=dict(Emax=[1.0, 2.0, 1.0],
+                                 fwhm=[30.0, 20.0, 10.0], tc=tcs))
+        self.assertEqual(fld.number_of_pulses, 3)
+
+        fvec = numpy.zeros((time.length, 3), dtype=numpy.complex128)
+        for k in range(3):
+            fk = EField(time, omega=oms[k], polar=pols[k],
+                        params=dict(Emax=fld.Emax[k], fwhm=fld.fwhm[k],
+                                    tc=tcs[k]))
+            for sign in [None, 1, -1]:
+                numpy.testing.assert_allclose(fld.field(sign)[k,:],
+                                              fk.field(sign))
+            numpy.testing.assert_allclose(fld.field_i(1, 77)[k],
+                                          fk.field_i(1, 77))
+            fvec += fk.field_vector(1)
+        numpy.testing.assert_allclose(fld.field_vector(1), fvec)
+
+        # fields from the lab setup
+        self.lab.set_pulse_frequencies(oms)
+        self.lab.set_polarizations(pulse_polarizations=pols)
+        fld = self.lab.get_EField(time, tcs)
+        for k in range(3):
+            env = numpy.zeros(time.length)
+            inside = numpy.abs(time.data - tcs[k]) < 99.0
+            env[inside] = self.lab.get_pulse_envelop(k,
+                                            time.data[inside] - tcs[k])
+            numpy.testing.assert_allclose(fld.envelop[k,:], env,
+                                          atol=1.0e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+import tempfile
+import os
+import stat
+import sys
+
+import numpy
+import matplotlib
+
+import quantarhei as qr
+from quantarhei.spectroscopy.twod2 import TwoDResponse
+from quantarhei.spectroscopy.twodcontainer import _plot_twod_frame
+from quantarhei.spectroscopy.movie import render_frames, write_movie
+
+
+"""
+*******************************************************************************
+
+
+    Tests of the quantarhei.spectroscopy.movie module
+
+
+*******************************************************************************
+"""
+
+
+# encoder which only records the number of received bytes
+_fake_encoder = """#!{}
+import sys
+nbytes = len(sys.stdin.buffer.read())
+with open(sys.argv[-1], "w") as f:
+    f.write(str(nbytes))
+"""
+
+
+class TestMovie(unittest.TestCase):
+    """Tests of the movie pipeline
+
+
+    """
+
+    def setUp(self):
+
+        t2axis = qr.TimeAxis(0.0, 4, 10.0)
+        xaxis = qr.FrequencyAxis(-1.0, 40, 0.05)
+        XX, YY = numpy.meshgrid(xaxis.data, xaxis.data)
+
+        self.cont = qr.TwoDResponseContainer(t2axis=t2axis)
+        for t2 in t2axis.data:
+            sp = TwoDResponse()
+            sp.set_axis_1(xaxis)
+            sp.set_axis_3(xaxis)
+            data = numpy.exp(-(XX**2 + YY**2)/0.2)*numpy.cos(0.05*t2) \
+                 - 0.3*numpy.exp(-((XX-0.3)**2 + YY**2)/0.1)
+            sp.set_data_writable()
+            sp.set_data(data.astype(qr.COMPLEX))
+            sp.set_t2(t2)
+            self.cont.set_spectrum(sp)
+
+        self.options = dict(vmax=self.cont.amax(), window=None, cmap=None,
+                            Npos_contours=10, stype=qr.signal_TOTL,
+                            spart=qr.part_REAL, xlabel=None, ylabel=None,
+                            axis_label_font=None)
+
+
+    def test_parallel_rendering(self):
+        """Testing that frames rendered in parallel equal the serial ones
+
+        """
+        frames = [(sp, "T="+str(sp.get_t2()), None, None)
+                  for sp in self.cont.get_spectra()]
+
+        fr1 = list(render_frames(_plot_twod_frame, frames,
+                                 options=self.options, dpi=30, nprocs=1))
+        fr2 = list(render_frames(_plot_twod_frame, frames,
+                                 options=self.options, dpi=30, nprocs=2))
+
+        self.assertEqual(len(fr1), 4)
+        for (rgb1, rgb2) in zip(fr1, fr2):
+            self.assertEqual(rgb1.dtype, numpy.uint8)
+            self.assertEqual(rgb1.shape[2], 3)
+            self.assertEqual(rgb1.shape[0] % 2, 0)
+            self.assertEqual(rgb1.shape[1] % 2, 0)
+            numpy.testing.assert_equal(rgb1, rgb2)
+
+        # frames differ from each other
+        self.assertTrue(numpy.any(fr1[0] != fr1[2]))
+
+
+    def test_streaming_to_encoder(self):
+        """Testing that frames are piped to the encoder
+
+        """
+        path = matplotlib.rcParams["animation.ffmpeg_path"]
+        with tempfile.TemporaryDirectory() as tdir:
+
+            encoder = os.path.join(tdir, "encoder.py")
+            with open(encoder, "w") as f:
+                f.write(_fake_encoder.format(sys.executable))
+            os.chmod(encoder, os.stat(encoder).st_mode | stat.S_IEXEC)
+
+            fname = os.path.join(tdir, "movie.mp4")
+            matplotlib.rcParams["animation.ffmpeg_path"] = encoder
+            try:
+                written = []
+                self.cont.make_movie(fname, dpi=30, nprocs=2)
+                with open(fname) as f:
+                    nbytes = int(f.read())
+
+                frames = [numpy.zeros((10, 12, 3), dtype=numpy.uint8)]*3
+                write_movie(fname, frames, progress=written.append)
+                with open(fname) as f:
+                    self.assertEqual(int(f.read()), 3*10*12*3)
+                self.assertEqual(written, [1, 2, 3])
+
+            finally:
+                matplotlib.rcParams["animation.ffmpeg_path"] = path
+
+        fig = matplotlib.pyplot.figure(figsize=(6.4, 4.8), dpi=30)
+        (Nx, Ny) = fig.canvas.get_width_height()
+        matplotlib.pyplot.close(fig)
+        self.assertEqual(nbytes, 4*2*(Nx//2)*2*(Ny//2)*3)
+
+
+if __name__ == '__main__':
+    unittest.main()
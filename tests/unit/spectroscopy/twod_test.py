@@ -187,4 +187,150 @@ class TestTwod(unittest.TestCase):
         
         
             
-    
\ No newline at end of file
+            
+        
+    def test_MockTwoD_batched_pathways(self):
+        """Testing batched synthesis of pathway lineshapes
+        
+        """
+        from quantarhei.spectroscopy.mocktwodcalculator \
+            import MockTwoDResponseCalculator
+        
+        class Pathway:
+            def __init__(self, ptype, om1, om3, pref, width=-1.0):
+                self.pathway_type = ptype
+                self.order = 3
+                self.relax_order = 0
+                self.frequency = [om1, 0.0, om3]
+                self.pref = pref
+                self.widths = [-1.0, width, -1.0, width]
+                self.dephs = [-1.0, width, -1.0, width]
+        
+        t1 = qr.TimeAxis(0.0, 100, 10.0)
+        t2 = qr.TimeAxis(0.0, 10, 10.0)
+        t3 = qr.TimeAxis(0.0, 100, 10.0)
+        
+        calc = MockTwoDResponseCalculator(t1, t2, t3)
+        with qr.energy_units("1/cm"):
+            calc.bootstrap(rwa=12000.0)
+            
+        oms = qr.convert(numpy.array([11900.0, 12000.0, 12150.0]), "1/cm",
+                         "int")
+        wd = qr.convert(100.0, "1/cm", "int")
+        pws = [Pathway("R", oms[0], oms[1], 1.0),
+               Pathway("R", oms[0], oms[1], -0.5),
+               Pathway("R", oms[2], oms[1], 0.3, width=wd),
+               Pathway("NR", oms[1], oms[2], 0.7),
+               Pathway("NR", oms[0], oms[0], -0.2j)]
+        
+        for shape in ["Gaussian", "Lorentzian"]:
+            
+            sdata = calc.calculate_pathways(pws, shape=shape)
+            profs = calc.pathway_profiles(pws, shape=shape)
+            
+            for ptype in ["R", "NR"]:
+                pw_type = [pw for pw in pws if pw.pathway_type == ptype]
+                data = numpy.zeros_like(sdata[ptype])
+                for pw in pw_type:
+                    data += calc.calculate_pathway(pw, shape=shape)
+                numpy.testing.assert_allclose(sdata[ptype], data,
+                                        atol=1.0e-12*numpy.max(numpy.abs(data)))
+                
+                # pathway resolved profiles
+                pref, P1, P3 = profs[ptype]
+                self.assertEqual(P1.shape, (len(pw_type), t1.length))
+                pw0 = calc.calculate_pathway(pw_type[-1], shape=shape)
+                if shape == "Gaussian":
+                    pw1 = pref[-1]*numpy.outer(P3[-1], P1[-1])
+                else:
+                    pw1 = pref[-1]*numpy.outer(P1[-1], P3[-1])
+                numpy.testing.assert_allclose(pw0, pw1,
+                                        atol=1.0e-12*numpy.max(numpy.abs(pw0)))
+
+
+    def test_MockTwoD_pathway_bank(self):
+        """Testing pathway resolved spectra stored by pathway parameters
+        
+        """
+        from quantarhei.spectroscopy.mocktwodcalculator \
+            import MockTwoDResponseCalculator
+        
+        class Pathway:
+            def __init__(self, pname, ptype, om1, om3, pref, width=-1.0):
+                self.pathway_name = pname
+                self.pathway_type = ptype
+                self.order = 3
+                self.relax_order = 0
+                self.frequency = [om1, 0.0, om3]
+                self.pref = pref
+                self.widths = [-1.0, width, -1.0, width]
+                self.dephs = [-1.0, width, -1.0, width]
+        
+        t1 = qr.TimeAxis(0.0, 100, 10.0)
+        t2 = qr.TimeAxis(0.0, 10, 10.0)
+        t3 = qr.TimeAxis(0.0, 100, 10.0)
+        
+        oms = qr.convert(numpy.array([11900.0, 12000.0, 12150.0]), "1/cm",
+                         "int")
+        wd = qr.convert(100.0, "1/cm", "int")
+        pws = [Pathway("R2g", "R", oms[0], oms[1], 1.0),
+               Pathway("R3g", "R", oms[0], oms[1], -0.5),
+               Pathway("R1f*", "R", oms[2], oms[1], 0.3, width=wd),
+               Pathway("R1g", "NR", oms[1], oms[2], 0.7),
+               Pathway("R2f*", "NR", oms[0], oms[0], -0.2j),
+               Pathway("R2g", "R", oms[2], oms[0], 0.1)]
+        
+        for shape in ["Gaussian", "Lorentzian"]:
+            
+            calc = MockTwoDResponseCalculator(t1, t2, t3)
+            with qr.energy_units("1/cm"):
+                calc.bootstrap(rwa=12000.0, pathways=pws, shape=shape)
+            sp1 = calc.calculate_one(0)
+            with qr.energy_units("1/cm"):
+                calc.bootstrap(rwa=12000.0, pathways=pws, shape=shape,
+                               keep_pathways=True)
+            sp2 = calc.calculate_one(0)
+            
+            self.assertEqual(sp2.get_resolution(), "pathways")
+            tags = sp2.get_all_tags()
+            self.assertEqual(len(tags), len(pws))
+            
+            # single pathways
+            for kk, pw in enumerate(pws):
+                sp2.set_data_flag([pw.pathway_name.replace("*", "s"), kk])
+                numpy.testing.assert_allclose(sp2.d__data,
+                                    calc.calculate_pathway(pw, shape=shape))
+            
+            # signals and total spectrum
+            for dtype in [qr.signal_REPH, qr.signal_NONR, qr.signal_TOTL]:
+                sp1.set_data_flag(dtype)
+                sp2.set_data_flag(dtype)
+                numpy.testing.assert_allclose(sp2.d__data, sp1.d__data,
+                            atol=1.0e-12*numpy.max(numpy.abs(sp1.d__data)))
+            
+            # division of a spectrum stored in the bank
+            sp3 = calc.calculate_one(0)
+            sp3.devide_by(4.0)
+            sp3.set_data_flag(qr.signal_TOTL)
+            sp1.set_data_flag(qr.signal_TOTL)
+            numpy.testing.assert_allclose(sp3.d__data, sp1.d__data/4.0,
+                            atol=1.0e-12*numpy.max(numpy.abs(sp1.d__data)))
+            sp3.set_data_flag([pws[2].pathway_name.replace("*", "s"), 2])
+            numpy.testing.assert_allclose(sp3.d__data,
+                        calc.calculate_pathway(pws[2], shape=shape)/4.0)
+            
+            # pathway types
+            sp2.set_data_flag("R2g")
+            data = calc.calculate_pathway(pws[0], shape=shape) \
+                 + calc.calculate_pathway(pws[5], shape=shape)
+            numpy.testing.assert_allclose(sp2.d__data, data)
+            
+            # conversion to lower resolution
+            sp2.set_resolution("processes")
+            self.assertEqual(sp2.get_resolution(), "processes")
+            sp2.set_data_flag("GSB")
+            data += calc.calculate_pathway(pws[3], shape=shape)
+            numpy.testing.assert_allclose(sp2.d__data, data)
+            sp2.set_data_flag(qr.signal_TOTL)
+            numpy.testing.assert_allclose(sp2.d__data, sp1.d__data,
+                            atol=1.0e-12*numpy.max(numpy.abs(sp1.d__data)))
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import tempfile
+import shutil
+import json
+import os
+
+"""
+*******************************************************************************
+
+
+    Tests of the quantarhei.utils.timing module
+
+
+*******************************************************************************
+"""
+
+import numpy
+
+import quantarhei as qr
+from quantarhei.utils.timing import Profiler
+from quantarhei.utils.timing import profiled
+
+
+
+@profiled("work")
+def _work(n):
+    with qr.profiler.region("allocation"):
+        return numpy.ones(n)
+
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+
+    def tearDown(self):
+        qr.profiler.disable()
+        qr.profiler.reset()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+    def test_nested_regions(self):
+        """Testing statistics of nested regions
+
+        """
+        prof = Profiler()
+
+        # nothing is recorded when the profiler is off
+        with prof.region("off"):
+            pass
+        prof.enter("off")
+        prof.exit()
+        self.assertEqual(prof.to_dict()["children"], [])
+
+        prof.enable()
+        with prof.region("outer"):
+            for i in range(4):
+                with prof.region("inner"):
+                    sum(range(10000))
+            with prof.region("other"):
+                pass
+        with prof.region("outer"):
+            pass
+        prof.disable()
+
+        stats = prof.to_dict()
+        self.assertEqual(len(stats["children"]), 1)
+        outer = stats["children"][0]
+        self.assertEqual(outer["calls"], 2)
+        self.assertEqual([(ch["name"], ch["calls"])
+                          for ch in outer["children"]],
+                         [("inner", 4), ("other", 1)])
+        inner = outer["children"][0]
+        self.assertGreater(inner["wall"], 0.0)
+        self.assertGreaterEqual(outer["wall"], inner["wall"])
+        self.assertEqual(stats["wall"], outer["wall"])
+
+        # regions entered before switching on are not closed by mistake
+        prof.enable()
+        prof.enter("a")
+        prof.exit("parallel region")
+        prof.exit("a")
+        prof.disable()
+        self.assertEqual(prof.to_dict()["children"][1]["calls"], 1)
+
+
+    def test_instrumented_calculation(self):
+        """Testing profiling of instrumented hot paths and export
+
+        """
+        qr.profiler.enable(memory=True)
+
+        data = _work(100000)
+
+        agg = qr.TestAggregate(name="dimer-2-env")
+        agg.build()
+        time = agg.get_SystemBathInteraction().TimeAxis
+        prop = agg.get_ReducedDensityMatrixPropagator(time,
+                                                relaxation_theory="stR")
+        rho = qr.ReducedDensityMatrix(dim=agg.get_Hamiltonian().dim)
+        rho.data[1,1] = 1.0
+        prop.propagate(rho)
+
+        qr.profiler.disable()
+
+        stats = qr.profiler.to_dict()
+        names = [ch["name"] for ch in stats["children"]]
+        self.assertIn("AggregateBase.build", names)
+        self.assertIn("ReducedDensityMatrixPropagator.propagate", names)
+
+        work = stats["children"][names.index("work")]
+        alloc = work["children"][0]
+        self.assertEqual(alloc["name"], "allocation")
+        self.assertGreaterEqual(alloc["alloc"], data.nbytes)
+
+        relt = stats["children"][
+            names.index("AggregateBase.get_RelaxationTensor")]
+        self.assertIn("RedfieldRelaxationTensor.__init__",
+                      [ch["name"] for ch in relt["children"]])
+
+        fname = os.path.join(self.dir, "profile.json")
+        qr.profiler.save_json(fname)
+        with open(fname) as f:
+            saved = json.load(f)
+        self.assertEqual(saved["processes"], 1)
+        self.assertEqual(saved["regions"]["children"][0]["name"], "work")
+
+        fname = os.path.join(self.dir, "trace.json")
+        qr.profiler.save_chrome_trace(fname)
+        with open(fname) as f:
+            trace = json.load(f)
+        events = trace["traceEvents"]
+        self.assertTrue(all(ev["ph"] == "X" for ev in events))
+        self.assertIn("AggregateBase.build", [ev["name"] for ev in events])
+        self.assertTrue(all(ev["dur"] >= 0.0 for ev in events))
+
+
+if __name__ == '__main__':
+    unittest.main()
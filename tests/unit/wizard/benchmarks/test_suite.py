@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+import tempfile
+import os
+
+"""
+*******************************************************************************
+
+
+    Tests of the quantarhei.wizard.benchmarks.suite module
+
+
+*******************************************************************************
+"""
+
+import quantarhei.wizard.benchmarks.suite as suite
+
+
+class TestBenchmarkSuite(unittest.TestCase):
+    """Tests of the benchmark suite
+
+
+    """
+
+    def test_run_and_compare(self):
+        """Testing running of benchmarks and comparison with baselines
+
+        """
+        names = ["aggregate_build", "saveable_io"]
+        res = suite.run_benchmarks(names=names, repeat=2, verbose=False)
+
+        self.assertEqual(list(res["results"].keys()), names)
+        for name in names:
+            rs = res["results"][name]
+            self.assertEqual(len(rs["times"]), 2)
+            self.assertEqual(rs["time"], min(rs["times"]))
+            self.assertTrue(rs["peak_memory"] > 0)
+            self.assertTrue(rs["throughput"] > 0.0)
+
+        with tempfile.TemporaryDirectory() as tdir:
+            fname = os.path.join(tdir, "baseline.json")
+            suite.save_results(res, fname)
+            base = suite.load_results(fname)
+
+        self.assertEqual(suite.compare_with_baseline(res, base), [])
+
+        # slower benchmark is reported
+        base["results"]["saveable_io"]["time"] /= 2.0
+        regs = suite.compare_with_baseline(res, base, tolerance=0.5)
+        self.assertEqual(len(regs), 1)
+        self.assertEqual(regs[0][0:2], ("saveable_io", "time"))
+
+        with self.assertRaises(Exception):
+            suite.run_benchmarks(names=["no_such_benchmark"])
+
+        base["scale"] = 2
+        with self.assertRaises(Exception):
+            suite.compare_with_baseline(res, base)
+
+
+    def test_bench_command_exit_status(self):
+        """Testing exit status of the bench command with a baseline
+
+        """
+        import argparse
+        from quantarhei.scripts.qrhei import do_command_bench
+
+        res = suite.run_benchmarks(names=["saveable_io"], repeat=1,
+                                   memory=False, verbose=False)
+
+        with tempfile.TemporaryDirectory() as tdir:
+            fname = os.path.join(tdir, "baseline.json")
+            args = argparse.Namespace(list=False, names=["saveable_io"],
+                                      scale=1, repeat=1, no_memory=True,
+                                      output="", baseline=fname,
+                                      tolerance=1.0e6)
+
+            # no regression
+            suite.save_results(res, fname)
+            do_command_bench(args)
+
+            # regression exits with nonzero status
+            res["results"]["saveable_io"]["time"] = 1.0e-12
+            suite.save_results(res, fname)
+            args.tolerance = 0.2
+            with self.assertRaises(SystemExit) as ctx:
+                do_command_bench(args)
+            self.assertEqual(ctx.exception.code, 1)
+
+
+    def test_all_benchmarks(self):
+        """Testing that all benchmarks run
+
+        """
+        for name in suite.available_benchmarks():
+            (func, unit, desc) = suite._benchmarks[name]
+            (run, work) = func(1)
+            self.assertTrue(work > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()